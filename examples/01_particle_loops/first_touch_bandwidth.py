@@ -0,0 +1,73 @@
+# Benchmark of the memory bandwidth of a streaming ParticleLoopOMP with and
+# without first touch of the particle storage by the OpenMP threads. On
+# multi-socket nodes pin the threads to see the effect, e.g.
+#   PPMD_OMP_PROC_BIND=close PPMD_OMP_PLACES=cores OMP_NUM_THREADS=32 \
+#       python first_touch_bandwidth.py
+# or:
+#   mpirun -n 2 python first_touch_bandwidth.py
+
+from ctypes import *
+from ppmd import *
+
+State = state.State
+PositionDat = data.PositionDat
+ParticleDat = data.ParticleDat
+Kernel = kernel.Kernel
+
+
+N = 2**22
+E = 64.0
+NCALL = 20
+NWARM = 2
+
+# bytes moved per particle, three components read from a and b and written to c
+NBYTES = 9 * sizeof(c_double)
+
+triad_kernel = Kernel('first_touch_triad', '''
+c.i[0] = a.i[0] + 0.5 * b.i[0];
+c.i[1] = a.i[1] + 0.5 * b.i[1];
+c.i[2] = a.i[2] + 0.5 * b.i[2];
+''')
+
+
+def bandwidth(first_touch):
+    runtime.NUMA_FIRST_TOUCH = first_touch
+
+    A = State()
+    A.npart = N
+    A.domain = domain.BaseDomainHalo(extent=(E, E, E))
+    A.domain.boundary_condition = domain.BoundaryTypePeriodic()
+    A.pos = PositionDat(ncomp=3)
+    A.a = ParticleDat(ncomp=3)
+    A.b = ParticleDat(ncomp=3)
+    A.c = ParticleDat(ncomp=3)
+
+    # resizes the dats, the new storage is placed by first touch if enabled
+    A.npart_local = N // mpi.MPI.COMM_WORLD.Get_size()
+    # write the inputs so that reads do not hit untouched zero pages
+    A.a[:A.npart_local:, :] = 1.0
+    A.b[:A.npart_local:, :] = 2.0
+
+    lx = loop.ParticleLoopOMP(triad_kernel, {
+        'a': A.a(access.READ),
+        'b': A.b(access.READ),
+        'c': A.c(access.WRITE)
+    })
+
+    for cx in range(NWARM):
+        lx.execute()
+
+    i0 = lx.loop_timer.time
+    for cx in range(NCALL):
+        lx.execute()
+    t = (lx.loop_timer.time - i0) / NCALL
+
+    return 1.0E-9 * NBYTES * A.npart_local / t
+
+
+first_touch_orig = runtime.NUMA_FIRST_TOUCH
+for name, ft in (('main thread touch', False), ('first touch', True)):
+    bw = bandwidth(ft)
+    if mpi.MPI.COMM_WORLD.Get_rank() == 0:
+        print('{:20s} {:10.2f} GB/s per rank'.format(name, bw))
+runtime.NUMA_FIRST_TOUCH = first_touch_orig
@@ -0,0 +1,83 @@
+# Benchmark of the Python overhead of launching loops. Each loop is executed
+# many times on a small system with a trivial kernel and the wall time per
+# call outside of the generated library is reported in microseconds.
+# run with:
+#   python launch_overhead.py
+# or:
+#   mpirun -n 4 python launch_overhead.py
+
+import time
+import numpy as np
+from ctypes import *
+from ppmd import *
+
+State = state.State
+PositionDat = data.PositionDat
+ParticleDat = data.ParticleDat
+GlobalArray = data.GlobalArray
+ScalarArray = data.ScalarArray
+Kernel = kernel.Kernel
+
+
+N = 64
+E = 8.0
+NCALL = 2000
+NWARM = 50
+
+A = State()
+A.npart = N
+A.domain = domain.BaseDomainHalo(extent=(E, E, E))
+A.domain.boundary_condition = domain.BoundaryTypePeriodic()
+A.pos = PositionDat(ncomp=3)
+A.vel = ParticleDat(ncomp=3)
+A.force = ParticleDat(ncomp=3)
+A.u = GlobalArray(size=1)
+
+dt = ScalarArray(ncomp=1)
+dt[0] = 0.001
+
+A.pos[:] = np.random.uniform(low=-.5*E, high=.5*E, size=(N, 3))
+A.vel[:] = 0.0
+A.scatter_data_from(0)
+
+update_kernel = Kernel('overhead_update', '''
+vel.i[0] += dt[0] * force.i[0];
+vel.i[1] += dt[0] * force.i[1];
+vel.i[2] += dt[0] * force.i[2];
+''')
+update_dats = {
+    'vel': A.vel(access.INC),
+    'force': A.force(access.READ),
+    'dt': dt(access.READ)
+}
+
+pair_kernel = Kernel('overhead_pair', '''
+u[0] += P.j[0] - P.i[0];
+''')
+pair_dats = {
+    'P': A.pos(access.READ),
+    'u': A.u(access.INC_ZERO)
+}
+
+loops = (
+    ('ParticleLoop', loop.ParticleLoop(update_kernel, update_dats)),
+    ('ParticleLoopOMP', loop.ParticleLoopOMP(update_kernel, update_dats)),
+    ('CellByCellOMP', pairloop.CellByCellOMP(pair_kernel, pair_dats,
+                                             shell_cutoff=E/4.))
+)
+
+for name, lx in loops:
+    for cx in range(NWARM):
+        lx.execute()
+
+    i0 = lx.loop_timer.time
+    t0 = time.time()
+    for cx in range(NCALL):
+        lx.execute()
+    t1 = time.time()
+
+    total = 1.0E6 * (t1 - t0) / NCALL
+    internal = 1.0E6 * (lx.loop_timer.time - i0) / NCALL
+    if mpi.MPI.COMM_WORLD.Get_rank() == 0:
+        print('{:20s} {:10.2f} us per call {:10.2f} us overhead'.format(
+            name, total, total - internal))
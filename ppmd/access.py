@@ -204,7 +204,8 @@ class DatArgStore(object):
                 mode,
                 type(obj),
                 obj.dtype,
-                obj.ncomp
+                obj.ncomp,
+                getattr(obj, 'soa', False)
             )
             dats.append(ax)
 
@@ -259,6 +260,12 @@ class DatArgStore(object):
                 "incompatible dat data type"+err_str
             assert obj.ncomp == self.register[symbol][3],\
                 "incompatible dat ncomp"+err_str
+            assert getattr(obj, 'soa', False) == self.register[symbol][4],\
+                "incompatible dat layout"+err_str
+
+    def uses_soa(self):
+        """return True if any registered dat uses the SoA layout"""
+        return any(rx[4] for rx in self.register.values())
 
     def items(self, new_dats=None):
         """return the dats in a consistent order"""
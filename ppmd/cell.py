@@ -148,7 +148,8 @@ class CellList(object):
 
         self._cell_sort_lib = ppmd.lib.build.lib_from_file_source(
             _LIB_SOURCES + 'CellLinkedList', 'CellLinkedList',
-            {'SUB_REAL': 'double', 'SUB_INT': 'int', 'SUB_LONG': 'long'})[
+            {'SUB_REAL': 'double', 'SUB_INT': 'int', 'SUB_LONG': 'long',
+             'SUB_POS_REAL': self._positions.ctype})[
             'CellLinkedList'
         ]
         self._halo_cell_sort_lib = ppmd.lib.build.lib_from_file_source(
@@ -275,7 +276,7 @@ class CellList(object):
         """
         assert self._init, "cell list not intialised"
         assert ct.c_double == self._domain.boundary.dtype
-        assert ct.c_double == self._positions.dtype
+        assert self._positions.dtype in (ct.c_double, ct.c_float)
         assert ct.c_double == self._domain.cell_edge_lengths.dtype
         assert ct.c_int == self._domain.cell_array.dtype
         assert ct.c_int == self._cell_list.dtype
@@ -46,6 +46,22 @@ if 'PPMD_CC_OMP' in os.environ:
 else:
     cc_omp = 'GCC'
 
+fmm_cache = 1
+if 'PPMD_FMM_CACHE' in os.environ:
+    fmm_cache = int(os.environ['PPMD_FMM_CACHE'])
+
+first_touch = 1
+if 'PPMD_FIRST_TOUCH' in os.environ:
+    first_touch = int(os.environ['PPMD_FIRST_TOUCH'])
+
+omp_proc_bind = ''
+if 'PPMD_OMP_PROC_BIND' in os.environ:
+    omp_proc_bind = os.environ['PPMD_OMP_PROC_BIND']
+
+omp_places = ''
+if 'PPMD_OMP_PLACES' in os.environ:
+    omp_places = os.environ['PPMD_OMP_PLACES']
+
 if 'PPMD_EXTRA_COMPILERS' in os.environ:
     extra_compiler_dir = os.path.abspath(os.environ['PPMD_EXTRA_COMPILERS'])
 else:
@@ -56,6 +72,10 @@ MAIN_CFG['build-dir'] = (str, build_dir)
 MAIN_CFG['cc-main'] = (str, cc_main)
 MAIN_CFG['cc-openmp'] = (str, cc_omp)
 MAIN_CFG['cc-mpi'] = (str, 'MPI4PY')
+MAIN_CFG['fmm-cache'] = (int, fmm_cache)
+MAIN_CFG['first-touch'] = (int, first_touch)
+MAIN_CFG['omp-proc-bind'] = (str, omp_proc_bind)
+MAIN_CFG['omp-places'] = (str, omp_places)
 
 
 def load_config(dir=None):
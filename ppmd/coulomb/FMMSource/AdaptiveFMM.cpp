@@ -0,0 +1,671 @@
+
+
+static inline void cplx_mul_add(
+    const REAL a,
+    const REAL b,
+    const REAL x,
+    const REAL y,
+    REAL * RESTRICT g,
+    REAL * RESTRICT h
+){
+    *g += a * x - b * y;
+    *h += x * b + a * y;
+}
+
+static inline bool isbad(const REAL x){
+    return (std::isnan(x) || std::isinf(x));
+}
+
+
+// Spherical harmonic terms of the vector (dx, dy, dz) for l < nterms. The
+// Legendre part sqrt((l-|m|)!/(l+|m|)!) P_l^|m|(cos(theta)) is written at
+// CUBE_IND(l, m) of theta_data and exp(i m phi) at EXP_RE_IND(2*nlevel, m),
+// EXP_IM_IND(2*nlevel, m) of phi_data, which is the layout of the interaction
+// tables. Returns the length of the vector.
+static inline REAL spherical_terms(
+    const INT64             nlevel,
+    const INT64             nterms,
+    const REAL * RESTRICT   ycoeff,
+    const REAL              dx,
+    const REAL              dy,
+    const REAL              dz,
+    REAL * RESTRICT         theta_data,
+    REAL * RESTRICT         phi_data
+){
+    const REAL dx2_p_dy2 = dx*dx + dy*dy;
+    const REAL radius = sqrt(dx2_p_dy2 + dz*dz);
+    const REAL ctheta = cos(atan2(sqrt(dx2_p_dy2), dz));
+    const REAL phi = atan2(dy, dx);
+    const REAL sqrt_1m2lx = sqrt(1.0 - ctheta*ctheta);
+
+    // P_l^m for m >= 0 at P_SPACE[l*nterms + m]
+    REAL P_SPACE[nterms*nterms];
+    P_SPACE[0] = 1.0;
+    for( INT64 lx=0 ; lx<nterms-1 ; lx++ ){
+        P_SPACE[(lx+1)*nterms + lx+1] = (-1.0 - 2.0*lx) * sqrt_1m2lx * \
+            P_SPACE[lx*nterms + lx];
+        P_SPACE[(lx+1)*nterms + lx] = ctheta * (2*lx + 1) * \
+            P_SPACE[lx*nterms + lx];
+        for( INT64 mx=0 ; mx<lx ; mx++ ){
+            P_SPACE[(lx+1)*nterms + mx] = \
+                (ctheta * (2.0*lx+1.0) * P_SPACE[lx*nterms + mx] - \
+                (lx+mx)*P_SPACE[(lx-1)*nterms + mx]) / (lx - mx + 1);
+        }
+    }
+
+    for( INT64 lx=0 ; lx<nterms ; lx++ ){
+        for( INT64 mx=-1*lx ; mx<=lx ; mx++ ){
+            theta_data[CUBE_IND(lx, mx)] = ycoeff[CUBE_IND(lx, mx)] * \
+                P_SPACE[lx*nterms + ABS(mx)];
+        }
+    }
+
+    const REAL cphi = cos(phi);
+    const REAL sphi = sin(phi);
+    const INT64 nl2 = 2*nlevel;
+    phi_data[EXP_RE_IND(nl2, 0)] = 1.0;
+    phi_data[EXP_IM_IND(nl2, 0)] = 0.0;
+    for( INT64 mx=1 ; mx<nterms ; mx++ ){
+        const REAL re = phi_data[EXP_RE_IND(nl2, mx-1)];
+        const REAL im = phi_data[EXP_IM_IND(nl2, mx-1)];
+        phi_data[EXP_RE_IND(nl2, mx)] = re*cphi - im*sphi;
+        phi_data[EXP_IM_IND(nl2, mx)] = re*sphi + im*cphi;
+        phi_data[EXP_RE_IND(nl2, -1*mx)] = re*cphi - im*sphi;
+        phi_data[EXP_IM_IND(nl2, -1*mx)] = -1.0*(re*sphi + im*cphi);
+    }
+
+    return radius;
+}
+
+
+// Multipole to local translation of the terms n < nsrc of odata onto the
+// terms j < ntgt of ldata. The spherical harmonic terms are of the vector
+// from the local expansion to the multipole expansion.
+static inline void mtl(
+    const INT64             nlevel,
+    const INT64             nsrc,
+    const INT64             ntgt,
+    const REAL              radius,
+    const REAL * RESTRICT   odata,
+    const REAL * RESTRICT   phi_data,
+    const REAL * RESTRICT   theta_data,
+    const REAL * RESTRICT   a_array,
+    const REAL * RESTRICT   ar_array,
+    const REAL * RESTRICT   i_array,
+    REAL * RESTRICT         ldata
+){
+    const INT64 ASTRIDE1 = 4*nlevel + 1;
+    const INT64 ASTRIDE2 = 2*nlevel;
+    const INT64 im_offset = nlevel*nlevel;
+
+    const INT64 nblk = nsrc + ntgt + 1;
+    REAL iradius_n[nblk];
+    const REAL iradius = 1./radius;
+    iradius_n[0] = 1.0;
+    for(INT64 nx=1 ; nx<nblk ; nx++){ iradius_n[nx] = iradius_n[nx-1] * iradius; }
+
+    for(INT64 jx=0     ; jx<ntgt ; jx++ ){
+    for(INT64 kx=-1*jx ; kx<=jx  ; kx++){
+        const REAL ajk = a_array[jx * ASTRIDE1 + ASTRIDE2 + kx];
+        REAL contrib_re = 0.0;
+        REAL contrib_im = 0.0;
+
+        for(INT64 nx=0     ; nx<nsrc ; nx++){
+            const REAL m1tn = 1.0 - 2.0*((REAL)(nx & 1));
+            const INT64 jxpnx = jx + nx;
+            const REAL rr_jn1 = iradius_n[jxpnx + 1];
+
+            for(INT64 mx=-1*nx ; mx<=nx ; mx++){
+                const INT64 mxmkx = mx - kx;
+                const REAL y_coeff = theta_data[CUBE_IND(jxpnx, mxmkx)];
+                const REAL y_re = y_coeff * \
+                    phi_data[EXP_RE_IND(2*nlevel, mxmkx)];
+                const REAL y_im = y_coeff * \
+                    phi_data[EXP_IM_IND(2*nlevel, mxmkx)];
+
+                const REAL anm = a_array[nx*ASTRIDE1 + ASTRIDE2 + mx];
+                const REAL ra_jn_mk = \
+                    ar_array[(jxpnx)*ASTRIDE1 + ASTRIDE2 + mxmkx];
+
+                const REAL coeff_re = \
+                    i_array[(nlevel+kx)*(nlevel*2 + 1) + nlevel + mx] * \
+                    m1tn * anm * ajk * ra_jn_mk * rr_jn1;
+
+                const INT64 oind = CUBE_IND(nx, mx);
+                cplx_mul_add(y_re, y_im,
+                    odata[oind] * coeff_re, odata[oind + im_offset] * coeff_re,
+                    &contrib_re, &contrib_im);
+            }
+        }
+
+        ldata[CUBE_IND(jx, kx)] += contrib_re;
+        ldata[CUBE_IND(jx, kx) + im_offset] += contrib_im;
+    }}
+}
+
+
+// As mtl for all terms with the 1/A_{j+n}^{m-k} coefficients included in
+// theta_data, as in the interaction tables.
+static inline void mtl_no_ar(
+    const INT64             nlevel,
+    const REAL              radius,
+    const REAL * RESTRICT   odata,
+    const REAL * RESTRICT   phi_data,
+    const REAL * RESTRICT   theta_data,
+    const REAL * RESTRICT   a_array,
+    const REAL * RESTRICT   i_array,
+    REAL * RESTRICT         ldata
+){
+    const INT64 ASTRIDE1 = 4*nlevel + 1;
+    const INT64 ASTRIDE2 = 2*nlevel;
+    const INT64 im_offset = nlevel*nlevel;
+
+    const INT64 nblk = 2*nlevel+2;
+    REAL iradius_n[nblk];
+    const REAL iradius = 1./radius;
+    iradius_n[0] = 1.0;
+    for(INT64 nx=1 ; nx<nblk ; nx++){ iradius_n[nx] = iradius_n[nx-1] * iradius; }
+
+    for(INT64 jx=0     ; jx<nlevel ; jx++ ){
+    for(INT64 kx=-1*jx ; kx<=jx    ; kx++){
+        const REAL ajk = a_array[jx * ASTRIDE1 + ASTRIDE2 + kx];
+        REAL contrib_re = 0.0;
+        REAL contrib_im = 0.0;
+
+        for(INT64 nx=0     ; nx<nlevel ; nx++){
+            const REAL m1tn = 1.0 - 2.0*((REAL)(nx & 1));
+            const INT64 jxpnx = jx + nx;
+            const REAL rr_jn1 = iradius_n[jxpnx + 1];
+
+            for(INT64 mx=-1*nx ; mx<=nx ; mx++){
+                const INT64 mxmkx = mx - kx;
+                const REAL y_coeff = theta_data[CUBE_IND(jxpnx, mxmkx)];
+                const REAL y_re = y_coeff * \
+                    phi_data[EXP_RE_IND(2*nlevel, mxmkx)];
+                const REAL y_im = y_coeff * \
+                    phi_data[EXP_IM_IND(2*nlevel, mxmkx)];
+
+                const REAL anm = a_array[nx*ASTRIDE1 + ASTRIDE2 + mx];
+
+                const REAL coeff_re = \
+                    i_array[(nlevel+kx)*(nlevel*2 + 1) + nlevel + mx] * \
+                    m1tn * anm * ajk * rr_jn1;
+
+                const INT64 oind = CUBE_IND(nx, mx);
+                cplx_mul_add(y_re, y_im,
+                    odata[oind] * coeff_re, odata[oind + im_offset] * coeff_re,
+                    &contrib_re, &contrib_im);
+            }
+        }
+
+        ldata[CUBE_IND(jx, kx)] += contrib_re;
+        ldata[CUBE_IND(jx, kx) + im_offset] += contrib_im;
+    }}
+}
+
+
+// Local to local translation of odata onto the terms j < ntgt of ldata. y_data
+// holds the spherical harmonics of the vector from the new expansion point to
+// the old expansion point, real parts then imaginary parts at 4*nlevel^2.
+static inline void ltl(
+    const INT64             nlevel,
+    const INT64             ntgt,
+    const REAL              radius,
+    const REAL * RESTRICT   odata,
+    const REAL * RESTRICT   y_data,
+    const REAL * RESTRICT   a_array,
+    const REAL * RESTRICT   ar_array,
+    const REAL * RESTRICT   i_array,
+    REAL * RESTRICT         ldata
+){
+    const INT64 ASTRIDE1 = 4*nlevel + 1;
+    const INT64 ASTRIDE2 = 2*nlevel;
+    const INT64 im_offset = nlevel*nlevel;
+    const INT64 im_offset2 = nlevel*nlevel*4;
+
+    const INT64 nblk = nlevel+1;
+    REAL radius_n[nblk];
+    radius_n[0] = 1.0;
+    for(INT64 nx=1 ; nx<nblk ; nx++){ radius_n[nx] = radius_n[nx-1] * radius; }
+
+    for(INT64 jx=0     ; jx<ntgt ; jx++ ){
+    for(INT64 kx=-1*jx ; kx<=jx  ; kx++){
+        const REAL ajk = a_array[jx * ASTRIDE1 + ASTRIDE2 + kx];
+        REAL contrib_re = 0.0;
+        REAL contrib_im = 0.0;
+
+        for(INT64 nx=jx ; nx<nlevel ; nx++){
+            const REAL m1tnpj = 1.0 - 2.0*((REAL)((nx+jx) & 1));
+            const INT64 nxmjx = nx - jx;
+            const REAL r_n_j = radius_n[nxmjx];
+
+            for(INT64 mx=-1*nx ; mx<=nx ; mx++){
+                const INT64 mxmkx = mx - kx;
+                if (ABS(mxmkx) > nxmjx) { continue; }
+
+                const REAL y_re = y_data[CUBE_IND(nxmjx, mxmkx)];
+                const REAL y_im = y_data[im_offset2 + CUBE_IND(nxmjx, mxmkx)];
+
+                const REAL a_nj_mk = a_array[nxmjx*ASTRIDE1 + ASTRIDE2 + mxmkx];
+                const REAL ra_n_m = ar_array[nx*ASTRIDE1 + ASTRIDE2 + mx];
+
+                const REAL coeff_re = i_array[(nlevel+kx)*(nlevel*2 + 1)+\
+                    nlevel + mx] * m1tnpj * a_nj_mk * ajk * ra_n_m * r_n_j;
+
+                const INT64 oind = CUBE_IND(nx, mx);
+                cplx_mul_add(y_re, y_im,
+                    odata[oind] * coeff_re, odata[oind + im_offset] * coeff_re,
+                    &contrib_re, &contrib_im);
+            }
+        }
+
+        ldata[CUBE_IND(jx, kx)] += contrib_re;
+        ldata[CUBE_IND(jx, kx) + im_offset] += contrib_im;
+    }}
+}
+
+
+// Multipole to multipole translation of a child expansion onto its parent.
+// ylm holds the spherical harmonics of the child octant.
+static inline void mtm(
+    const INT64             nlevel,
+    const REAL * RESTRICT   radius_n,
+    const REAL * RESTRICT   cdata,
+    const REAL * RESTRICT   ylm,
+    const REAL * RESTRICT   alm,
+    const REAL * RESTRICT   almr,
+    const REAL * RESTRICT   i_array,
+    REAL * RESTRICT         pdata
+){
+    const INT64 ASTRIDE1 = 4*nlevel + 1;
+    const INT64 ASTRIDE2 = 2*nlevel;
+    const INT64 im_offset = nlevel*nlevel;
+    const INT64 im_offset2 = 4*nlevel*nlevel;
+
+    for(INT64 jx=0     ; jx<nlevel ; jx++ ){
+    for(INT64 kx=-1*jx ; kx<=jx    ; kx++){
+        const REAL ajkr = almr[jx*ASTRIDE1 + ASTRIDE2 + kx];
+        REAL jk_re = 0.0;
+        REAL jk_im = 0.0;
+
+        for(INT64 nx=0     ; nx<=jx ; nx++){
+        for(INT64 mx=-1*nx ; mx<=nx ; mx++){
+            if (ABS(kx - mx) > (jx - nx)) { continue; }
+
+            const REAL coeff = ajkr * radius_n[nx] * \
+                alm[nx*ASTRIDE1 + ASTRIDE2 + mx] * \
+                alm[(jx - nx)*ASTRIDE1 + ASTRIDE2 + kx - mx] * \
+                i_array[(nlevel+kx)*(nlevel*2 + 1) + nlevel + mx];
+
+            const INT64 child_ind = CUBE_IND(jx - nx, kx - mx);
+            const INT64 ychild_ind = CUBE_IND(nx, -1*mx);
+
+            REAL child_re = 0.0;
+            REAL child_im = 0.0;
+            cplx_mul_add(cdata[child_ind], cdata[child_ind + im_offset],
+                ylm[ychild_ind], ylm[ychild_ind + im_offset2],
+                &child_re, &child_im);
+
+            jk_re += coeff * child_re;
+            jk_im += coeff * child_im;
+        }}
+
+        pdata[CUBE_IND(jx, kx)] += jk_re;
+        pdata[CUBE_IND(jx, kx) + im_offset] += jk_im;
+    }}
+}
+
+
+// Potential and gradient of the potential at the expansion point of a local
+// expansion.
+static inline REAL local_gradient(
+    const INT64             nlevel,
+    const REAL * RESTRICT   ldata,
+    REAL * RESTRICT         grad
+){
+    const INT64 im_offset = nlevel*nlevel;
+    const REAL rs2 = 1.0/sqrt(2.0);
+    grad[0] = -1.0 * rs2 * (ldata[CUBE_IND(1, 1)] + ldata[CUBE_IND(1, -1)]);
+    grad[1] = rs2 * (ldata[CUBE_IND(1, 1) + im_offset] -
+        ldata[CUBE_IND(1, -1) + im_offset]);
+    grad[2] = ldata[CUBE_IND(1, 0)];
+    return ldata[CUBE_IND(0, 0)];
+}
+
+
+// Multipole expansions of groups of particles about the passed centres.
+extern "C"
+int adaptive_p2m(
+    const INT64 nlevel,
+    const INT64 ngroup,
+    const INT64 * RESTRICT group_start,
+    const INT64 * RESTRICT group_particles,
+    const REAL * RESTRICT centres,
+    const REAL * RESTRICT position,
+    const REAL * RESTRICT charge,
+    const REAL * RESTRICT ycoeff,
+    REAL * RESTRICT moments
+){
+    const INT64 ncomp = nlevel*nlevel*2;
+    const INT64 im_offset = nlevel*nlevel;
+
+#pragma omp parallel for default(none) schedule(dynamic) \
+shared(group_start, group_particles, centres, position, charge, ycoeff, moments)
+    for(INT64 gx=0 ; gx<ngroup ; gx++){
+        REAL theta_data[4*nlevel*nlevel];
+        REAL phi_data[8*nlevel + 2];
+        REAL * RESTRICT mom = &moments[gx*ncomp];
+
+        for(INT64 px=group_start[gx] ; px<group_start[gx+1] ; px++){
+            const INT64 ix = group_particles[px];
+            const REAL radius = spherical_terms(nlevel, nlevel, ycoeff,
+                position[ix*3]     - centres[gx*3],
+                position[ix*3 + 1] - centres[gx*3 + 1],
+                position[ix*3 + 2] - centres[gx*3 + 2],
+                theta_data, phi_data);
+
+            REAL rhol = charge[ix];
+            for(INT64 lx=0 ; lx<nlevel ; lx++){
+                for(INT64 mx=-1*lx ; mx<=lx ; mx++){
+                    const REAL coeff = rhol * theta_data[CUBE_IND(lx, mx)];
+                    mom[CUBE_IND(lx, mx)] += coeff * \
+                        phi_data[EXP_RE_IND(2*nlevel, -1*mx)];
+                    mom[CUBE_IND(lx, mx) + im_offset] += coeff * \
+                        phi_data[EXP_IM_IND(2*nlevel, -1*mx)];
+                }
+                rhol *= radius;
+            }
+        }
+    }
+    return 0;
+}
+
+
+// Multipole to multipole translations of the children of each parent, the
+// children of parent px are child_index[parent_start[px]:parent_start[px+1]].
+extern "C"
+int adaptive_mtm(
+    const INT64 nlevel,
+    const INT64 nparent,
+    const INT64 * RESTRICT parent_start,
+    const INT64 * RESTRICT child_index,
+    const INT64 * RESTRICT child_octant,
+    const REAL * RESTRICT moments_child,
+    REAL * RESTRICT moments_parent,
+    const REAL * RESTRICT ylm,
+    const REAL * RESTRICT alm,
+    const REAL * RESTRICT almr,
+    const REAL * RESTRICT i_array,
+    const REAL radius
+){
+    const INT64 ncomp = nlevel*nlevel*2;
+    const INT64 ncomp2 = nlevel*nlevel*8;
+
+    REAL radius_n[nlevel];
+    radius_n[0] = 1.0;
+    for(INT64 nx=1 ; nx<nlevel ; nx++){ radius_n[nx] = radius_n[nx-1] * radius; }
+
+#pragma omp parallel for default(none) schedule(dynamic) \
+shared(parent_start, child_index, child_octant, moments_child, \
+moments_parent, ylm, alm, almr, i_array, radius_n)
+    for(INT64 px=0 ; px<nparent ; px++){
+        for(INT64 cx=parent_start[px] ; cx<parent_start[px+1] ; cx++){
+            mtm(nlevel, radius_n, &moments_child[child_index[cx]*ncomp],
+                &ylm[child_octant[cx]*ncomp2], alm, almr, i_array,
+                &moments_parent[px*ncomp]);
+        }
+    }
+    return 0;
+}
+
+
+// Multipole to local translations from the cells of the V lists. The
+// sources of target tx are source_index[target_start[tx]:target_start[tx+1]]
+// at the offsets (oz+3)*49 + (oy+3)*7 + ox+3 in cells of width width.
+extern "C"
+int adaptive_mtl(
+    const INT64 nlevel,
+    const INT64 ntarget,
+    const INT64 * RESTRICT target_start,
+    const INT64 * RESTRICT source_index,
+    const INT64 * RESTRICT source_offset,
+    const REAL * RESTRICT moments,
+    REAL * RESTRICT local_moments,
+    const REAL * RESTRICT phi_data,
+    const REAL * RESTRICT theta_data,
+    const REAL * RESTRICT alm,
+    const REAL * RESTRICT i_array,
+    const REAL width
+){
+    const INT64 ncomp = nlevel*nlevel*2;
+    const INT64 phi_stride = 8*nlevel + 2;
+    const INT64 theta_stride = 4*nlevel*nlevel;
+
+#pragma omp parallel for default(none) schedule(dynamic) \
+shared(target_start, source_index, source_offset, moments, local_moments, \
+phi_data, theta_data, alm, i_array)
+    for(INT64 tx=0 ; tx<ntarget ; tx++){
+        for(INT64 sx=target_start[tx] ; sx<target_start[tx+1] ; sx++){
+            const INT64 t_lookup = source_offset[sx];
+            const INT64 p_lookup = t_lookup % 49;
+            const REAL ox = (REAL) (t_lookup % 7 - 3);
+            const REAL oy = (REAL) ((t_lookup / 7) % 7 - 3);
+            const REAL oz = (REAL) (t_lookup / 49 - 3);
+            const REAL radius = width * sqrt(ox*ox + oy*oy + oz*oz);
+
+            mtl_no_ar(nlevel, radius, &moments[source_index[sx]*ncomp],
+                &phi_data[p_lookup*phi_stride],
+                &theta_data[t_lookup*theta_stride],
+                alm, i_array, &local_moments[tx*ncomp]);
+        }
+    }
+    return 0;
+}
+
+
+// Local to local translations of the parent expansions onto their children.
+extern "C"
+int adaptive_ltl(
+    const INT64 nlevel,
+    const INT64 nchild,
+    const INT64 * RESTRICT parent_index,
+    const INT64 * RESTRICT child_octant,
+    const REAL * RESTRICT moments_parent,
+    REAL * RESTRICT moments_child,
+    const REAL * RESTRICT ylm,
+    const REAL * RESTRICT alm,
+    const REAL * RESTRICT almr,
+    const REAL * RESTRICT i_array,
+    const REAL radius
+){
+    const INT64 ncomp = nlevel*nlevel*2;
+    const INT64 ncomp2 = nlevel*nlevel*8;
+
+#pragma omp parallel for default(none) schedule(dynamic) \
+shared(parent_index, child_octant, moments_parent, moments_child, ylm, \
+alm, almr, i_array)
+    for(INT64 cx=0 ; cx<nchild ; cx++){
+        // the harmonics of the opposite octant point from child to parent
+        ltl(nlevel, nlevel, radius, &moments_parent[parent_index[cx]*ncomp],
+            &ylm[(7 - child_octant[cx])*ncomp2], alm, almr, i_array,
+            &moments_child[cx*ncomp]);
+    }
+    return 0;
+}
+
+
+// Evaluate the local expansions of the leaves at their particles.
+extern "C"
+int adaptive_l2p(
+    const INT64 nlevel,
+    const INT64 ngroup,
+    const INT64 * RESTRICT group_start,
+    const INT64 * RESTRICT group_particles,
+    const REAL * RESTRICT centres,
+    const REAL * RESTRICT local_moments,
+    const REAL * RESTRICT position,
+    const REAL * RESTRICT charge,
+    REAL * RESTRICT force,
+    const REAL * RESTRICT ycoeff,
+    const REAL * RESTRICT alm,
+    const REAL * RESTRICT almr,
+    const REAL * RESTRICT i_array,
+    const INT64 compute_potential,
+    REAL * RESTRICT potential_array,
+    REAL * RESTRICT energy
+){
+    int err = 0;
+    const INT64 ncomp = nlevel*nlevel*2;
+    const INT64 im_offset2 = nlevel*nlevel*4;
+    REAL potential_energy = 0.0;
+
+#pragma omp parallel for default(none) schedule(dynamic) \
+shared(group_start, group_particles, centres, local_moments, position, \
+charge, force, ycoeff, alm, almr, i_array, potential_array) \
+reduction(+: potential_energy) reduction(min: err)
+    for(INT64 gx=0 ; gx<ngroup ; gx++){
+        REAL theta_space[4*nlevel*nlevel];
+        REAL exp_space[8*nlevel + 2];
+        REAL y_data[8*nlevel*nlevel];
+        REAL L_SPACE[ncomp];
+
+        for(INT64 px=group_start[gx] ; px<group_start[gx+1] ; px++){
+            const INT64 ix = group_particles[px];
+
+            // translate the expansion to the particle
+            const REAL radius = spherical_terms(nlevel, nlevel, ycoeff,
+                centres[gx*3]     - position[ix*3],
+                centres[gx*3 + 1] - position[ix*3 + 1],
+                centres[gx*3 + 2] - position[ix*3 + 2],
+                theta_space, exp_space);
+            for(INT64 lx=0 ; lx<nlevel ; lx++){
+                for(INT64 mx=-1*lx ; mx<=lx ; mx++){
+                    const REAL y = theta_space[CUBE_IND(lx, mx)];
+                    y_data[CUBE_IND(lx, mx)] = y * \
+                        exp_space[EXP_RE_IND(2*nlevel, mx)];
+                    y_data[CUBE_IND(lx, mx) + im_offset2] = y * \
+                        exp_space[EXP_IM_IND(2*nlevel, mx)];
+                }
+            }
+            for(INT64 cx=0 ; cx<ncomp ; cx++){ L_SPACE[cx] = 0.0; }
+            ltl(nlevel, 2, radius, &local_moments[gx*ncomp], y_data, alm,
+                almr, i_array, L_SPACE);
+
+            REAL grad[3];
+            const REAL phi = local_gradient(nlevel, L_SPACE, grad);
+            const REAL q = charge[ix];
+
+            force[ix*3    ] -= FORCE_UNIT * q * grad[0];
+            force[ix*3 + 1] -= FORCE_UNIT * q * grad[1];
+            force[ix*3 + 2] -= FORCE_UNIT * q * grad[2];
+
+            const REAL local_pe = ENERGY_UNIT * q * phi;
+            potential_energy += 0.5 * local_pe;
+            if (compute_potential > 0){
+                potential_array[ix] += local_pe;
+            }
+
+            if (isbad(phi) || isbad(grad[0]) || isbad(grad[1]) || isbad(grad[2])){
+                err = -5;
+            }
+        }
+    }
+
+    *energy = potential_energy;
+    return err;
+}
+
+
+// The W and X list interactions of the pairs (C, B) of a cell C and a leaf
+// B. The multipole expansion of C is evaluated at the particles of B and the
+// particles of B are formed into a local expansion about the centre of C.
+// The pairs run_start[rx]:run_start[rx+1] share the leaf group of their
+// first pair, such that the particles of a group are written by one thread.
+extern "C"
+int adaptive_m2p_p2l(
+    const INT64 nlevel,
+    const INT64 nrun,
+    const INT64 * RESTRICT run_start,
+    const INT64 * RESTRICT pair_group,
+    const INT64 * RESTRICT group_start,
+    const INT64 * RESTRICT group_particles,
+    const REAL * RESTRICT centres,
+    const REAL * RESTRICT moments,
+    REAL * RESTRICT local_moments,
+    const REAL * RESTRICT position,
+    const REAL * RESTRICT charge,
+    REAL * RESTRICT force,
+    const REAL * RESTRICT ycoeff,
+    const REAL * RESTRICT alm,
+    const REAL * RESTRICT almr,
+    const REAL * RESTRICT i_array,
+    const INT64 compute_potential,
+    REAL * RESTRICT potential_array,
+    REAL * RESTRICT energy
+){
+    int err = 0;
+    const INT64 ncomp = nlevel*nlevel*2;
+    REAL potential_energy = 0.0;
+
+#pragma omp parallel for default(none) schedule(dynamic) \
+shared(run_start, pair_group, group_start, group_particles, centres, \
+moments, local_moments, position, charge, force, ycoeff, alm, almr, \
+i_array, potential_array) \
+reduction(+: potential_energy) reduction(min: err)
+    for(INT64 rx=0 ; rx<nrun ; rx++){
+        REAL theta_space[4*nlevel*nlevel];
+        REAL exp_space[8*nlevel + 2];
+        REAL L_SPACE[ncomp];
+        REAL Q_SPACE[ncomp];
+        for(INT64 cx=0 ; cx<ncomp ; cx++){ Q_SPACE[cx] = 0.0; }
+
+        for(INT64 pairx=run_start[rx] ; pairx<run_start[rx+1] ; pairx++){
+            const INT64 gx = pair_group[pairx];
+            const REAL * RESTRICT centre = &centres[pairx*3];
+
+            for(INT64 px=group_start[gx] ; px<group_start[gx+1] ; px++){
+                const INT64 ix = group_particles[px];
+                const REAL q = charge[ix];
+                const REAL dx = centre[0] - position[ix*3];
+                const REAL dy = centre[1] - position[ix*3 + 1];
+                const REAL dz = centre[2] - position[ix*3 + 2];
+
+                // W list, the multipole expansion at the particle
+                REAL radius = spherical_terms(nlevel, nlevel + 1, ycoeff,
+                    dx, dy, dz, theta_space, exp_space);
+                for(INT64 cx=0 ; cx<ncomp ; cx++){ L_SPACE[cx] = 0.0; }
+                mtl(nlevel, nlevel, 2, radius, &moments[pairx*ncomp],
+                    exp_space, theta_space, alm, almr, i_array, L_SPACE);
+
+                REAL grad[3];
+                const REAL phi = local_gradient(nlevel, L_SPACE, grad);
+
+                force[ix*3    ] -= FORCE_UNIT * q * grad[0];
+                force[ix*3 + 1] -= FORCE_UNIT * q * grad[1];
+                force[ix*3 + 2] -= FORCE_UNIT * q * grad[2];
+
+                const REAL local_pe = ENERGY_UNIT * q * phi;
+                potential_energy += 0.5 * local_pe;
+                if (compute_potential > 0){
+                    potential_array[ix] += local_pe;
+                }
+
+                if (isbad(phi) || isbad(grad[0]) || isbad(grad[1]) || isbad(grad[2])){
+                    err = -5;
+                }
+
+                // X list, the particle as a multipole expansion of one term
+                radius = spherical_terms(nlevel, nlevel, ycoeff,
+                    -1.0*dx, -1.0*dy, -1.0*dz, theta_space, exp_space);
+                Q_SPACE[0] = q;
+                mtl(nlevel, 1, nlevel, radius, Q_SPACE, exp_space,
+                    theta_space, alm, almr, i_array,
+                    &local_moments[pairx*ncomp]);
+            }
+        }
+    }
+
+    *energy = potential_energy;
+    return err;
+}
+
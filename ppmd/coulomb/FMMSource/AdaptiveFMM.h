@@ -0,0 +1,37 @@
+
+
+#include <stdint.h>
+#include <omp.h>
+#include <stdio.h>
+#include <math.h>
+#include <cmath>
+
+#define REAL double
+#define INT64 int64_t
+
+using namespace std;
+
+#define _LM_TO_IND(L, M) ((L)+(M))
+
+#define EXP_RE_IND(L, M) (_LM_TO_IND((L), (M)))
+#define EXP_IM_IND(L, M) ((2*(L))+1 + EXP_RE_IND((L),(M)))
+
+#define CUBE_IND(L, M) ((L) * ( (L) + 1 ) + (M) )
+
+#define ABS(x) ((x) > 0 ? (x) : -1*(x))
+
+/*
+Layout of memory used by above macros.
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+| -L | - - - - | -1 | 0 | 1 | - - - - | L |
+
+and
+
+| Re coeffs for all l | Im coeffs for all l |
+
+*/
+
+#define ENERGY_UNIT (%(SUB_ENERGY_UNIT)s)
+#define FORCE_UNIT (%(SUB_FORCE_UNIT)s)
+
@@ -130,69 +130,30 @@ reduction(+:fz) //\
 
 
 
-extern "C"
-int local_cell_by_cell(
-    const INT64 free_space,
+// Builds the linked list of particles over the padded global cell grid.
+// Halo particles copied over a periodic boundary are placed in the periodic
+// padding cells. Returns a negative value on error.
+static inline int build_cell_list(
     const REAL * RESTRICT extent,
     const INT64 * RESTRICT global_size,
-    const INT64 * RESTRICT local_size,
-    const INT64 * RESTRICT local_offset,
-    const INT64 num_threads,
     const INT64 nlocal,
     const INT64 ntotal,
     const REAL * RESTRICT P,
-    const REAL * RESTRICT Q,
     const INT64 * RESTRICT C,
-    REAL * RESTRICT F,
-    REAL * RESTRICT U,
     INT64 * RESTRICT ll_array,
-    INT64 * RESTRICT ll_ccc_array,
-    INT64 * RESTRICT * RESTRICT tmp_int_i,
-    INT64 * RESTRICT * RESTRICT tmp_int_j,
-    REAL * RESTRICT * RESTRICT tmp_real_pi,
-    REAL * RESTRICT * RESTRICT tmp_real_pj,
-    REAL * RESTRICT * RESTRICT tmp_real_qi,
-    REAL * RESTRICT * RESTRICT tmp_real_qj,
-    REAL * RESTRICT * RESTRICT tmp_real_fi,
-    REAL * RESTRICT * RESTRICT tmp_real_ui,
-    const INT64 compute_potential,
-    REAL * RESTRICT potential_array,
-    INT64 * RESTRICT exec_count
+    INT64 * RESTRICT ll_ccc_array
 ){
-
-    omp_set_num_threads(num_threads);
     int err = 0;
-    REAL energy = 0.0;
-    INT64 part_count = 0;
-    
-    // pad global and pad local
     const INT64 padg = 3;
-    const INT64 padl = 1;
-
-    const INT64 plsx = local_size[2] + 2*padl;
-    const INT64 plsy = local_size[1] + 2*padl;
-    const INT64 plsz = local_size[0] + 2*padl;
 
     const INT64 pgsx = global_size[2] + 2*padg;
     const INT64 pgsy = global_size[1] + 2*padg;
     const INT64 pgsz = global_size[0] + 2*padg;
-
-    const INT64 ncells_local = plsx*plsy*plsz;
-
-    const INT64 ncells_global = global_size[0]*global_size[1]*global_size[2];
     const INT64 ncells_padded = pgsx * pgsy * pgsz;
 
-    // padded by one cell to include particles that are allowed to drift out
-    // of this domain due to cell list rebuilding.
-
     const INT64 ll_cend   = ncells_padded + ntotal;
     const INT64 ll_cstart = ntotal;
 
-
-    const INT64 shift_x = 1;
-    const INT64 shift_y = pgsx;
-    const INT64 shift_z = pgsx*pgsy;
-    
     const INT64 hshift_x = global_size[2];
     const INT64 hshift_y = global_size[1];
     const INT64 hshift_z = global_size[0];
@@ -207,27 +168,13 @@ int local_cell_by_cell(
     const REAL CWX = extent[0] / ((REAL) global_size[2]);
     const REAL CWY = extent[1] / ((REAL) global_size[1]);
     const REAL CWZ = extent[2] / ((REAL) global_size[0]);
-    
-    INT64 _exec_count = 0;
-
 
-    /*
-    for( INT64 nx=0 ; nx<ntotal ; nx++){
-        INT64 tcell = C[nx];
-        if (tcell<0){
-            printf("err: Negative cell: %d, Particle %d\n", tcell, nx);
-            return -1;
-        }
-    }
-    */
-    
     // initalise the linked list
     for(INT64 llx=ll_cstart ; llx<ll_cend ; llx++){ 
         ll_array[llx] = -1; 
         ll_ccc_array[llx-ll_cstart] = 0;
     }
 
-    // build linked list based on global cell of particle
 #pragma omp parallel for default(none) reduction(min:err) \
 shared(ll_array, ll_ccc_array, C, P, global_size)
     for(INT64 nx=0 ; nx<ntotal ; nx++ ){
@@ -349,6 +296,104 @@ shared(ll_array, ll_ccc_array, C, P, global_size)
         }
     }
     
+    return err;
+}
+
+
+extern "C"
+int local_cell_by_cell(
+    const INT64 free_space,
+    const REAL * RESTRICT extent,
+    const INT64 * RESTRICT global_size,
+    const INT64 * RESTRICT local_size,
+    const INT64 * RESTRICT local_offset,
+    const INT64 num_threads,
+    const INT64 nlocal,
+    const INT64 ntotal,
+    const REAL * RESTRICT P,
+    const REAL * RESTRICT Q,
+    const INT64 * RESTRICT C,
+    REAL * RESTRICT F,
+    REAL * RESTRICT U,
+    INT64 * RESTRICT ll_array,
+    INT64 * RESTRICT ll_ccc_array,
+    INT64 * RESTRICT * RESTRICT tmp_int_i,
+    INT64 * RESTRICT * RESTRICT tmp_int_j,
+    REAL * RESTRICT * RESTRICT tmp_real_pi,
+    REAL * RESTRICT * RESTRICT tmp_real_pj,
+    REAL * RESTRICT * RESTRICT tmp_real_qi,
+    REAL * RESTRICT * RESTRICT tmp_real_qj,
+    REAL * RESTRICT * RESTRICT tmp_real_fi,
+    REAL * RESTRICT * RESTRICT tmp_real_ui,
+    const INT64 compute_potential,
+    REAL * RESTRICT potential_array,
+    INT64 * RESTRICT exec_count
+){
+
+    omp_set_num_threads(num_threads);
+    int err = 0;
+    REAL energy = 0.0;
+    INT64 part_count = 0;
+    
+    // pad global and pad local
+    const INT64 padg = 3;
+    const INT64 padl = 1;
+
+    const INT64 plsx = local_size[2] + 2*padl;
+    const INT64 plsy = local_size[1] + 2*padl;
+    const INT64 plsz = local_size[0] + 2*padl;
+
+    const INT64 pgsx = global_size[2] + 2*padg;
+    const INT64 pgsy = global_size[1] + 2*padg;
+    const INT64 pgsz = global_size[0] + 2*padg;
+
+    const INT64 ncells_local = plsx*plsy*plsz;
+
+    const INT64 ncells_global = global_size[0]*global_size[1]*global_size[2];
+    const INT64 ncells_padded = pgsx * pgsy * pgsz;
+
+    // padded by one cell to include particles that are allowed to drift out
+    // of this domain due to cell list rebuilding.
+
+    const INT64 ll_cend   = ncells_padded + ntotal;
+    const INT64 ll_cstart = ntotal;
+
+
+    const INT64 shift_x = 1;
+    const INT64 shift_y = pgsx;
+    const INT64 shift_z = pgsx*pgsy;
+    
+    const INT64 hshift_x = global_size[2];
+    const INT64 hshift_y = global_size[1];
+    const INT64 hshift_z = global_size[0];
+
+    const REAL ex = extent[0];
+    const REAL ey = extent[1];
+    const REAL ez = extent[2];
+    const REAL hex = ex*0.5;
+    const REAL hey = ey*0.5;
+    const REAL hez = ez*0.5;
+
+    const REAL CWX = extent[0] / ((REAL) global_size[2]);
+    const REAL CWY = extent[1] / ((REAL) global_size[1]);
+    const REAL CWZ = extent[2] / ((REAL) global_size[0]);
+    
+    INT64 _exec_count = 0;
+
+
+    /*
+    for( INT64 nx=0 ; nx<ntotal ; nx++){
+        INT64 tcell = C[nx];
+        if (tcell<0){
+            printf("err: Negative cell: %d, Particle %d\n", tcell, nx);
+            return -1;
+        }
+    }
+    */
+    
+    // build linked list based on global cell of particle
+    err = build_cell_list(extent, global_size, nlocal, ntotal, P, C,
+        ll_array, ll_ccc_array);
     if (err < 0) { return err; }
 
 #pragma omp parallel for default(none) reduction(min:err) reduction(+:energy) reduction(+:part_count) \
@@ -567,6 +612,144 @@ tmp_real_qj, tmp_real_fi, tmp_real_ui, HMAP, potential_array) schedule(dynamic)
 }
 
 
+// Direct interactions between the leaves of an adaptive tree. Each leaf
+// instance holds the particles leaf_particles[leaf_start[lx]:leaf_start[lx+1]]
+// and the local particles of target leaf target_leaf[tx] interact with all
+// particles of the leaves source_leaf[target_start[tx]:target_start[tx+1]].
+extern "C"
+int local_leaf_by_leaf(
+    const INT64 num_threads,
+    const INT64 nlocal,
+    const INT64 ntarget,
+    const INT64 * RESTRICT target_leaf,
+    const INT64 * RESTRICT target_start,
+    const INT64 * RESTRICT source_leaf,
+    const INT64 * RESTRICT leaf_start,
+    const INT64 * RESTRICT leaf_particles,
+    const REAL * RESTRICT P,
+    const REAL * RESTRICT Q,
+    REAL * RESTRICT F,
+    REAL * RESTRICT U,
+    INT64 * RESTRICT * RESTRICT tmp_int_i,
+    INT64 * RESTRICT * RESTRICT tmp_int_j,
+    REAL * RESTRICT * RESTRICT tmp_real_pi,
+    REAL * RESTRICT * RESTRICT tmp_real_pj,
+    REAL * RESTRICT * RESTRICT tmp_real_qi,
+    REAL * RESTRICT * RESTRICT tmp_real_qj,
+    REAL * RESTRICT * RESTRICT tmp_real_fi,
+    REAL * RESTRICT * RESTRICT tmp_real_ui,
+    const INT64 compute_potential,
+    REAL * RESTRICT potential_array,
+    INT64 * RESTRICT exec_count
+){
+
+    omp_set_num_threads(num_threads);
+    int err = 0;
+    REAL energy = 0.0;
+    INT64 part_count = 0;
+    INT64 _exec_count = 0;
+
+#pragma omp parallel for default(none) reduction(min:err) reduction(+:energy) reduction(+:part_count) \
+reduction(+:_exec_count) \
+shared(target_leaf, target_start, source_leaf, leaf_start, leaf_particles, \
+P, Q, F, tmp_int_i, tmp_int_j, tmp_real_pi, tmp_real_pj, tmp_real_qi, \
+tmp_real_qj, tmp_real_fi, tmp_real_ui, potential_array) schedule(dynamic)
+    for(INT64 tx=0 ; tx<ntarget ; tx++){
+
+        const INT64 threadid = omp_get_thread_num();
+
+        INT64 * RESTRICT tmp_i    = tmp_int_i[threadid];
+        INT64 * RESTRICT tmp_j    = tmp_int_j[threadid];
+        REAL * RESTRICT  tmp_pi = tmp_real_pi[threadid];
+        REAL * RESTRICT  tmp_pj = tmp_real_pj[threadid];
+        REAL * RESTRICT  tmp_qi = tmp_real_qi[threadid];
+        REAL * RESTRICT  tmp_qj = tmp_real_qj[threadid];
+        REAL * RESTRICT  tmp_fi = tmp_real_fi[threadid];
+        REAL * RESTRICT  tmp_ui = tmp_real_ui[threadid];
+
+        // populate temporary arrays with the local particles of the target
+        const INT64 lt = target_leaf[tx];
+        const INT64 ci_n = leaf_start[lt+1] - leaf_start[lt];
+        INT64 ci_nt = 0;
+        for(INT64 px=leaf_start[lt] ; px<leaf_start[lt+1] ; px++){
+            const INT64 ci_tx = leaf_particles[px];
+            if (ci_tx < nlocal){
+                tmp_pi[ci_n*0 + ci_nt] = P[3*ci_tx + 0];
+                tmp_pi[ci_n*1 + ci_nt] = P[3*ci_tx + 1];
+                tmp_pi[ci_n*2 + ci_nt] = P[3*ci_tx + 2];
+                tmp_qi[ci_nt] = Q[ci_tx];
+                tmp_fi[ci_n*0 + ci_nt] = 0.0;
+                tmp_fi[ci_n*1 + ci_nt] = 0.0;
+                tmp_fi[ci_n*2 + ci_nt] = 0.0;
+                tmp_ui[ci_nt] = 0.0;
+                tmp_i[ci_nt] = ci_tx;
+                ci_nt++;
+            }
+        }
+
+        // if leaf contains no local particles continue
+        if (ci_nt == 0) {continue;}
+
+        for(INT64 sx=target_start[tx] ; sx<target_start[tx+1] ; sx++){
+            const INT64 ls = source_leaf[sx];
+            const INT64 cj_n = leaf_start[ls+1] - leaf_start[ls];
+            if (cj_n == 0) { continue; }
+
+            INT64 cj_nt = 0;
+            for(INT64 px=leaf_start[ls] ; px<leaf_start[ls+1] ; px++){
+                const INT64 cj_tx = leaf_particles[px];
+                tmp_pj[cj_n*0 + cj_nt] = P[3*cj_tx + 0];
+                tmp_pj[cj_n*1 + cj_nt] = P[3*cj_tx + 1];
+                tmp_pj[cj_n*2 + cj_nt] = P[3*cj_tx + 2];
+                tmp_qj[cj_nt] = Q[cj_tx];
+                tmp_j[cj_nt] = cj_tx;
+                cj_nt++;
+            }
+
+            if (ls != lt){
+                energy += compute_interactions(
+                    ci_n, cj_n, ci_nt, cj_nt, tmp_pi, tmp_pj, tmp_qi, tmp_qj, tmp_fi, tmp_ui);
+            } else {
+                energy += compute_interactions_same_cell(
+                    ci_n, cj_n, ci_nt, cj_nt, tmp_pi, tmp_pj, tmp_qi, tmp_qj, tmp_fi, tmp_ui, tmp_i, tmp_j);
+            }
+            _exec_count += ci_nt*cj_nt;
+        }
+
+        // write back the new forces
+        for(INT64 px=0 ; px<ci_nt ; px++){
+            const INT64 idx = tmp_i[px];
+            F[3*idx + 0] += FORCE_UNIT * tmp_fi[0*ci_n + px];
+            F[3*idx + 1] += FORCE_UNIT * tmp_fi[1*ci_n + px];
+            F[3*idx + 2] += FORCE_UNIT * tmp_fi[2*ci_n + px];
+            part_count++;
+        }
+
+        if (compute_potential>0){
+            for(INT64 px=0 ; px<ci_nt ; px++){
+                const INT64 idx = tmp_i[px];
+                potential_array[idx] += ENERGY_UNIT * tmp_ui[px];
+            }
+        }
+    }
+
+    if (err<0) {return err;}
+
+    if (part_count != nlocal) {
+        err=-6;
+        printf("Err -6: one or more particles missed: %d, %d\n", part_count, nlocal);
+    }
+
+    U[0] = energy;
+    *exec_count = _exec_count;
+
+    return err;
+}
+
+
+
+
+
 
 
 
@@ -581,4 +764,295 @@ tmp_real_qj, tmp_real_fi, tmp_real_ui, HMAP, potential_array) schedule(dynamic)
 
 
 
+// Symmetric interactions between the particles [i0, i0+ni) and the particles
+// [j0, j0+nj) of the cell sorted SoA arrays. Forces and potentials are
+// accumulated on both particles of each pair. If same_cell is non-zero the
+// second range starts after each first particle such that each pair within
+// a cell is computed once.
+static inline void compute_interactions_symmetric(
+    const INT64 s,
+    const INT64 i0,
+    const INT64 ni,
+    const INT64 j0,
+    const INT64 nj,
+    const INT64 same_cell,
+    const REAL *  RESTRICT p,
+    const REAL *  RESTRICT q,
+    REAL *  RESTRICT f,
+    REAL *  RESTRICT u
+){
+    const REAL * RESTRICT py = &p[s];
+    const REAL * RESTRICT pz = &p[2*s];
+    REAL * RESTRICT fy = &f[s];
+    REAL * RESTRICT fz = &f[2*s];
+    const INT64 jend = j0 + nj;
 
+    for(INT64 pxi=i0 ; pxi<i0+ni ; pxi++ ){
+        REAL fx = 0.0;
+        REAL fyi = 0.0;
+        REAL fzi = 0.0;
+        REAL energyi = 0.0;
+
+        const REAL px = p[pxi];
+        const REAL pyi = py[pxi];
+        const REAL pzi = pz[pxi];
+        const REAL qi = q[pxi];
+        const INT64 jstart = (same_cell) ? pxi + 1 : j0;
+
+#pragma omp simd \
+reduction(+:energyi) \
+reduction(+:fx) \
+reduction(+:fyi) \
+reduction(+:fzi)
+        for(INT64 pxj=jstart ; pxj<jend ; pxj++){
+            const REAL dx = p[pxj] - px;
+            const REAL dy = py[pxj] - pyi;
+            const REAL dz = pz[pxj] - pzi;
+
+            const REAL r2 = dx*dx + dy*dy + dz*dz;
+            const REAL ir = 1.0/sqrt(r2);
+            const REAL term1 = qi * q[pxj] * ir;
+            energyi += term1;
+            u[pxj] += term1;
+            const REAL fcoeff = ir * ir * term1;
+            fx  -= fcoeff * dx;
+            fyi -= fcoeff * dy;
+            fzi -= fcoeff * dz;
+            f [pxj] += fcoeff * dx;
+            fy[pxj] += fcoeff * dy;
+            fz[pxj] += fcoeff * dz;
+        }
+
+        f [pxi] += fx;
+        fy[pxi] += fyi;
+        fz[pxi] += fzi;
+        u[pxi] += energyi;
+    }
+}
+
+
+// Near field evaluation that computes each pair once. Particles of the local
+// cells, padded by two cells, are gathered into contiguous per cell blocks of
+// SoA positions and charges with the local particles of each cell first.
+// Neighbouring cell pairs are visited through the half stencil HMAP_HALF and
+// cells are coloured with a period of three in each dimension, the cells
+// of one colour never share a neighbour and are processed in parallel
+// without races.
+extern "C"
+int local_cell_by_cell_symmetric(
+    const INT64 free_space,
+    const REAL * RESTRICT extent,
+    const INT64 * RESTRICT global_size,
+    const INT64 * RESTRICT local_size,
+    const INT64 * RESTRICT local_offset,
+    const INT64 num_threads,
+    const INT64 nlocal,
+    const INT64 ntotal,
+    const REAL * RESTRICT P,
+    const REAL * RESTRICT Q,
+    const INT64 * RESTRICT C,
+    REAL * RESTRICT F,
+    REAL * RESTRICT U,
+    INT64 * RESTRICT ll_array,
+    INT64 * RESTRICT ll_ccc_array,
+    INT64 * RESTRICT cell_start,
+    INT64 * RESTRICT cell_nlocal,
+    INT64 * RESTRICT soa_id,
+    REAL * RESTRICT soa_p,
+    REAL * RESTRICT soa_q,
+    REAL * RESTRICT soa_f,
+    REAL * RESTRICT soa_u,
+    const INT64 compute_potential,
+    REAL * RESTRICT potential_array,
+    INT64 * RESTRICT exec_count
+){
+
+    omp_set_num_threads(num_threads);
+    int err = 0;
+    REAL energy = 0.0;
+    INT64 part_count = 0;
+    INT64 _exec_count = 0;
+
+    // pad global and pad the local cells by two, the local cells padded by
+    // one may contain local particles, the second layer only halo particles
+    const INT64 padg = 3;
+    const INT64 pade = 2;
+
+    const INT64 esx = local_size[2] + 2*pade;
+    const INT64 esy = local_size[1] + 2*pade;
+    const INT64 esz = local_size[0] + 2*pade;
+    const INT64 ncells_ext = esx*esy*esz;
+
+    const INT64 pgsx = global_size[2] + 2*padg;
+    const INT64 pgsy = global_size[1] + 2*padg;
+    const INT64 pgsz = global_size[0] + 2*padg;
+
+    const INT64 ll_cstart = ntotal;
+    const INT64 s = ntotal;
+
+    err = build_cell_list(extent, global_size, nlocal, ntotal, P, C,
+        ll_array, ll_ccc_array);
+    if (err < 0) { return err; }
+
+    // count the particles in each cell, halo particles that cannot interact
+    // in free space are not gathered
+#pragma omp parallel for default(none) reduction(min:err) \
+reduction(+:part_count) \
+shared(local_offset, ll_array, ll_ccc_array, cell_start, cell_nlocal)
+    for(INT64 cx=0 ; cx<ncells_ext ; cx++){
+        const INT64 cxx = cx % esx;
+        const INT64 cxy = ((cx - cxx) / esx) % esy;
+        const INT64 cxz = (cx - cxx - cxy*esx) / (esx*esy);
+        const INT64 gxt[3] = {  cxx + local_offset[2] - pade + padg,
+                                cxy + local_offset[1] - pade + padg,
+                                cxz + local_offset[0] - pade + padg};
+        const INT64 gx = gxt[0] + pgsx*(gxt[1] + gxt[2]*pgsy);
+
+        const INT64 discard_halo = (free_space > 0) && (
+            (gxt[0] < 3) || (gxt[1] < 3) || (gxt[2] < 3) ||
+            (gxt[0] > pgsx - 4) || (gxt[1] > pgsy - 4) || (gxt[2] > pgsz - 4));
+
+        INT64 nl = 0;
+        INT64 nh = 0;
+        INT64 tx = ll_array[ll_cstart+gx];
+        while(tx>-1){
+            if (tx < nlocal) { nl++; } else { nh++; }
+            tx = ll_array[tx];
+        }
+        if (nl + nh != ll_ccc_array[gx]) {
+            err=-1; printf("Err -1: Bad particle count: %d != %d\n",
+                nl + nh, ll_ccc_array[gx]);
+        }
+
+        const INT64 owned = (cxx > 0) && (cxx < esx - 1) &&
+                            (cxy > 0) && (cxy < esy - 1) &&
+                            (cxz > 0) && (cxz < esz - 1);
+        if (owned) { part_count += nl; }
+
+        cell_nlocal[cx] = nl;
+        cell_start[cx+1] = nl + ((discard_halo) ? 0 : nh);
+    }
+
+    if (err < 0) { return err; }
+    if (part_count != nlocal) {
+        printf("Err -6: one or more particles missed: %d, %d\n", part_count, nlocal);
+        return -6;
+    }
+
+    cell_start[0] = 0;
+    for(INT64 cx=0 ; cx<ncells_ext ; cx++){
+        cell_start[cx+1] += cell_start[cx];
+    }
+
+    // gather the cells into contiguous blocks, local particles first
+#pragma omp parallel for default(none) \
+shared(local_offset, ll_array, cell_start, cell_nlocal, soa_id, soa_p, soa_q, \
+soa_f, soa_u, P, Q) schedule(dynamic)
+    for(INT64 cx=0 ; cx<ncells_ext ; cx++){
+        const INT64 cxx = cx % esx;
+        const INT64 cxy = ((cx - cxx) / esx) % esy;
+        const INT64 cxz = (cx - cxx - cxy*esx) / (esx*esy);
+        const INT64 gx = (cxx + local_offset[2] - pade + padg) + pgsx*(
+                         (cxy + local_offset[1] - pade + padg) +
+                         (cxz + local_offset[0] - pade + padg)*pgsy);
+
+        const INT64 start = cell_start[cx];
+        const INT64 end = cell_start[cx+1];
+        INT64 il = start;
+        INT64 ih = start + cell_nlocal[cx];
+        INT64 tx = ll_array[ll_cstart+gx];
+        while(tx>-1){
+            INT64 ix = -1;
+            if (tx < nlocal) { ix = il++; }
+            else if (ih < end) { ix = ih++; }
+
+            if (ix > -1){
+                soa_p[      ix] = P[3*tx + 0];
+                soa_p[  s + ix] = P[3*tx + 1];
+                soa_p[2*s + ix] = P[3*tx + 2];
+                soa_q[ix] = Q[tx];
+                soa_f[      ix] = 0.0;
+                soa_f[  s + ix] = 0.0;
+                soa_f[2*s + ix] = 0.0;
+                soa_u[ix] = 0.0;
+                soa_id[ix] = tx;
+            }
+            tx = ll_array[tx];
+        }
+    }
+
+#pragma omp parallel default(none) reduction(+:_exec_count) \
+shared(cell_start, cell_nlocal, soa_p, soa_q, soa_f, soa_u, HMAP_HALF)
+    {
+        for(INT64 colour=0 ; colour<27 ; colour++){
+            const INT64 ox = colour % 3;
+            const INT64 oy = (colour / 3) % 3;
+            const INT64 oz = colour / 9;
+            const INT64 nx = (esx - ox + 2) / 3;
+            const INT64 ny = (esy - oy + 2) / 3;
+            const INT64 nz = (esz - oz + 2) / 3;
+
+#pragma omp for schedule(dynamic)
+            for(INT64 ix=0 ; ix<nx*ny*nz ; ix++){
+                const INT64 cxx = ox + 3*(ix % nx);
+                const INT64 cxy = oy + 3*((ix / nx) % ny);
+                const INT64 cxz = oz + 3*(ix / (nx*ny));
+                const INT64 ca = cxx + esx*(cxy + esy*cxz);
+
+                const INT64 a0 = cell_start[ca];
+                const INT64 anl = cell_nlocal[ca];
+                const INT64 an = cell_start[ca+1] - a0;
+                if (an == 0) { continue; }
+
+                // pairs within the cell, halo-halo pairs are not needed
+                compute_interactions_symmetric(s, a0, anl, a0, an, 1,
+                    soa_p, soa_q, soa_f, soa_u);
+                _exec_count += anl*an - (anl*(anl+1))/2;
+
+                for(INT64 hx=0 ; hx<13 ; hx++){
+                    const INT64 bxx = cxx + HMAP_HALF[hx][0];
+                    const INT64 bxy = cxy + HMAP_HALF[hx][1];
+                    const INT64 bxz = cxz + HMAP_HALF[hx][2];
+                    if ((bxx < 0) || (bxx >= esx) || (bxy < 0) ||
+                        (bxy >= esy) || (bxz >= esz)) { continue; }
+                    const INT64 cb = bxx + esx*(bxy + esy*bxz);
+
+                    const INT64 b0 = cell_start[cb];
+                    const INT64 bnl = cell_nlocal[cb];
+                    const INT64 bn = cell_start[cb+1] - b0;
+
+                    // local particles of a with all particles of b and halo
+                    // particles of a with local particles of b
+                    compute_interactions_symmetric(s, a0, anl, b0, bn, 0,
+                        soa_p, soa_q, soa_f, soa_u);
+                    compute_interactions_symmetric(s, a0 + anl, an - anl,
+                        b0, bnl, 0, soa_p, soa_q, soa_f, soa_u);
+                    _exec_count += anl*bn + (an - anl)*bnl;
+                }
+            }
+        }
+    }
+
+    // write back the forces and potentials of the local particles
+#pragma omp parallel for default(none) reduction(+:energy) \
+shared(cell_start, cell_nlocal, soa_id, soa_f, soa_u, F, potential_array) \
+schedule(dynamic)
+    for(INT64 cx=0 ; cx<ncells_ext ; cx++){
+        const INT64 start = cell_start[cx];
+        for(INT64 ix=start ; ix<start+cell_nlocal[cx] ; ix++){
+            const INT64 idx = soa_id[ix];
+            F[3*idx + 0] += FORCE_UNIT * soa_f[      ix];
+            F[3*idx + 1] += FORCE_UNIT * soa_f[  s + ix];
+            F[3*idx + 2] += FORCE_UNIT * soa_f[2*s + ix];
+            energy += soa_u[ix];
+            if (compute_potential>0){
+                potential_array[idx] += ENERGY_UNIT * soa_u[ix];
+            }
+        }
+    }
+
+    U[0] = energy * 0.5 * ENERGY_UNIT;
+    *exec_count = _exec_count;
+
+    return err;
+}
@@ -65,5 +65,22 @@ const INT64 HMAP[27][3] = {
         {1,-1,1}        // 26
 };
 
-
+// Half of the neighbour stencil, the offsets that follow (0,0,0) in
+// lexicographic zyx order. Every unordered pair of neighbouring cells (a, b)
+// is visited once as (a, a + offset).
+const INT64 HMAP_HALF[13][3] = {
+        {1,0,0},
+        {-1,1,0},
+        {0,1,0},
+        {1,1,0},
+        {-1,-1,1},
+        {0,-1,1},
+        {1,-1,1},
+        {-1,0,1},
+        {0,0,1},
+        {1,0,1},
+        {-1,1,1},
+        {0,1,1},
+        {1,1,1}
+};
 
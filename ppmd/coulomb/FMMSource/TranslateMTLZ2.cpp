@@ -1008,8 +1008,7 @@ int wrapper_blocked_mtl_z(
     return 0;
 }
 
-extern "C"
-int translate_mtl(
+static inline int translate_mtl_impl(
     const INT64 * RESTRICT dim_child,      // slowest to fastest
     const REAL * RESTRICT multipole_moments,
     REAL * RESTRICT local_moments,
@@ -1026,10 +1025,13 @@ int translate_mtl(
     const INT64 * RESTRICT int_tlookup,
     const INT64 * RESTRICT int_plookup,
     const double * RESTRICT int_radius,
-    REAL * RESTRICT * RESTRICT gthread_space
+    REAL * RESTRICT * RESTRICT gthread_space,
+    const INT64 ncells_in,
+    const INT64 * RESTRICT cells
     ){
     int err = 0;
-    const INT64 ncells = dim_child[0] * dim_child[1] * dim_child[2];
+    // cells is NULL to translate all cells
+    const INT64 ncells = ncells_in;
 
     const INT64 ncomp = nlevel*nlevel*2;
     const INT64 ncomp2 = nlevel*nlevel*8;
@@ -1056,7 +1058,7 @@ int translate_mtl(
     shared(dim_child, multipole_moments, local_moments, \
     alm, almr, i_array, int_list, int_tlookup, \
     int_plookup, int_radius, dim_eight, dim_halo, \
-    wig_forw, wig_back, exp_re, exp_im, gthread_space)
+    wig_forw, wig_back, exp_re, exp_im, gthread_space, cells)
     for( INT64 blk=0 ; blk<block_end ; blk+=block_size ){
 
         const int tid = omp_get_thread_num();
@@ -1082,8 +1084,9 @@ int translate_mtl(
             
             INT64 tblk = 0;
             for( INT64 pcx=blk ; pcx<(blk+block_size) ; pcx++ ){
+                const INT64 lcx = (cells == NULL) ? pcx : cells[pcx];
                 INT64 cx, cy, cz;
-                lin_to_xyz(dim_child, pcx, &cx, &cy, &cz);
+                lin_to_xyz(dim_child, lcx, &cx, &cy, &cz);
                 // multipole moments are in a halo type
                 const INT64 ccx = cx + 2;
                 const INT64 ccy = cy + 2;
@@ -1113,7 +1116,8 @@ int translate_mtl(
         // append new moments to output cell moments
         INT64 tblk = 0;
         for( INT64 pcx=blk ; pcx<(blk+block_size) ; pcx++ ){
-            REAL * out_moments = &local_moments[ncomp * pcx];
+            const INT64 lcx = (cells == NULL) ? pcx : cells[pcx];
+            REAL * out_moments = &local_moments[ncomp * lcx];
             for( INT64 ncx=0 ; ncx<im_offset ; ncx++){
                 out_moments[ncx] += blk_out[tblk*im_offset + ncx];
                 out_moments[im_offset+ncx] += blk_out[im_offset*block_size+tblk*im_offset + ncx];
@@ -1131,10 +1135,11 @@ int translate_mtl(
     shared(dim_child, multipole_moments, local_moments, \
     alm, almr, i_array, int_list, int_tlookup, \
     int_plookup, int_radius, dim_eight, dim_halo, \
-    wig_forw, wig_back, exp_re, exp_im, gthread_space)
+    wig_forw, wig_back, exp_re, exp_im, gthread_space, cells)
     for( INT64 pcx=0 ; pcx<ncells ; pcx++ ){
+        const INT64 lcx = (cells == NULL) ? pcx : cells[pcx];
         INT64 cx, cy, cz;
-        lin_to_xyz(dim_child, pcx, &cx, &cy, &cz);
+        lin_to_xyz(dim_child, lcx, &cx, &cy, &cz);
 
         const int tid = omp_get_thread_num();
         REAL * RESTRICT thread_space = gthread_space[tid];
@@ -1152,7 +1157,7 @@ int translate_mtl(
         INT64 cstart = octal_ind*189;
         if (pcx < block_end) { cstart += 98; }
         
-        REAL * out_moments = &local_moments[ncomp * pcx];
+        REAL * out_moments = &local_moments[ncomp * lcx];
         // loop over contributing nearby cells.
 		
         for( INT64 conx=cstart ; conx<(octal_ind+1)*189 ; conx++ ){
@@ -1181,4 +1186,59 @@ int translate_mtl(
 }
 
 
+extern "C"
+int translate_mtl(
+    const INT64 * RESTRICT dim_child,      // slowest to fastest
+    const REAL * RESTRICT multipole_moments,
+    REAL * RESTRICT local_moments,
+    const REAL * RESTRICT const * RESTRICT const * RESTRICT wig_forw,
+    const REAL * RESTRICT const * RESTRICT const * RESTRICT wig_back,
+    const REAL * RESTRICT const * RESTRICT exp_re,
+    const REAL * RESTRICT const * RESTRICT exp_im,
+    const REAL * RESTRICT alm,
+    const REAL * RESTRICT almr,
+    const REAL * RESTRICT i_array,
+    const REAL radius,
+    const INT64 nlevel,
+    const INT64 * RESTRICT int_list,
+    const INT64 * RESTRICT int_tlookup,
+    const INT64 * RESTRICT int_plookup,
+    const double * RESTRICT int_radius,
+    REAL * RESTRICT * RESTRICT gthread_space
+    ){
+    return translate_mtl_impl(dim_child, multipole_moments, local_moments,
+        wig_forw, wig_back, exp_re, exp_im, alm, almr, i_array, radius,
+        nlevel, int_list, int_tlookup, int_plookup, int_radius, gthread_space,
+        dim_child[0] * dim_child[1] * dim_child[2], NULL);
+}
+
 
+// translate the cells listed in cells only, e.g. the interior cells of the
+// local domain while the halo exchange is in progress
+extern "C"
+int translate_mtl_cells(
+    const INT64 * RESTRICT dim_child,      // slowest to fastest
+    const REAL * RESTRICT multipole_moments,
+    REAL * RESTRICT local_moments,
+    const REAL * RESTRICT const * RESTRICT const * RESTRICT wig_forw,
+    const REAL * RESTRICT const * RESTRICT const * RESTRICT wig_back,
+    const REAL * RESTRICT const * RESTRICT exp_re,
+    const REAL * RESTRICT const * RESTRICT exp_im,
+    const REAL * RESTRICT alm,
+    const REAL * RESTRICT almr,
+    const REAL * RESTRICT i_array,
+    const REAL radius,
+    const INT64 nlevel,
+    const INT64 * RESTRICT int_list,
+    const INT64 * RESTRICT int_tlookup,
+    const INT64 * RESTRICT int_plookup,
+    const double * RESTRICT int_radius,
+    REAL * RESTRICT * RESTRICT gthread_space,
+    const INT64 ncells,
+    const INT64 * RESTRICT cells
+    ){
+    return translate_mtl_impl(dim_child, multipole_moments, local_moments,
+        wig_forw, wig_back, exp_re, exp_im, alm, almr, i_array, radius,
+        nlevel, int_list, int_tlookup, int_plookup, int_radius, gthread_space,
+        ncells, cells);
+}
@@ -19,6 +19,7 @@ import sys
 
 
 from ppmd import kernel, loop, data, access, opt, host, pairloop
+from ppmd.coulomb.incremental import EwaldIncremental, IncrementalMixin
 
 
 _charge_coulomb = scipy.constants.physical_constants['atomic unit of charge'][0]
@@ -46,7 +47,9 @@ def compute_rc_nc_cutoff(alpha, L, eps=10.**-6):
     return rc, nc
 
 
-class EwaldOrthoganal(object):
+class EwaldOrthoganal(IncrementalMixin):
+
+    _incremental_type = EwaldIncremental
 
     def __init__(self, domain, eps=10.**-6, real_cutoff=None, alpha=None,
                  recip_cutoff=None, recip_nmax=None, shared_memory=False,
@@ -215,6 +218,9 @@ class EwaldOrthoganal(object):
 
         self.shared_memory = shared_memory
 
+        self.energy_unit = float(energy_unit)
+        """Multiplicative factor applied to energies."""
+        self._incremental = None
         #self._vars['recip_vec_kernel'] = data.ScalarArray(np.zeros(3, dtype=ctypes.c_double))
         #self._vars['recip_vec_kernel'][0] = gx[0]
         #self._vars['recip_vec_kernel'][1] = gy[1]
@@ -637,8 +643,6 @@ class EwaldOrthoganal(object):
         return e
 
 
-
-
     @staticmethod
     def internal_to_ev():
         """
@@ -22,6 +22,8 @@ from ppmd.cuda import CUDA_IMPORT
 from ppmd.coulomb.wigner import Rzyz_set, Ry_set
 from ppmd.coulomb.fmm_pbc import FMMPbc, DipoleCorrector
 from ppmd.coulomb.fmm_local import FMMLocal
+from ppmd.coulomb.fmm_cache import FMMCache
+from ppmd.coulomb.incremental import FMMIncremental, IncrementalMixin
 
 def red(input):
     try:
@@ -87,10 +89,241 @@ def internal_to_ev():
     l0 = 10.**-10
     return c0 / (4.*pi*epsilon_0*l0)    
 
-class PyFMM(object):
+def _re_lm(l, m): return (l**2) + l + m
+
+def _mtlz_cost_per_cell(L):
+    """
+    Number of floating point operations for one multipole to local
+    translation by rotation to the z axis with L expansion terms.
+    """
+    t = 0
+    for mx in range(L):
+        n = 2*(mx+1)+1
+        t += (2*(n**2))*2
+        t += n*8
+
+    t *= 2
+
+    for jx in range(L):
+        for nx in range(L):
+            kmax = min(nx, jx)
+            t += 2
+            for kx in range(-kmax, kmax+1):
+                t += 7
+
+    return t
+
+def _compute_tables(L, dtype):
+    """
+    Compute the tables of coefficients which only depend on the number of
+    expansion terms L.
+    """
+    ASTRIDE1 = (L*4)+1
+    ASTRIDE2 = L*2
+
+    # pre compute A_n^m and 1/(A_n^m)
+    a = np.zeros(shape=(ASTRIDE2, ASTRIDE1), dtype=dtype)
+    ar = np.zeros(shape=(ASTRIDE2, ASTRIDE1), dtype=dtype)
+
+    for lx in range(L*2):
+        for mx in range(-1*lx, lx+1):
+            a_l_m = ((-1.) ** lx)/ \
+                    (math.sqrt(math.factorial(lx-mx)) * \
+                     math.sqrt(math.factorial(lx+mx)))
+
+            a[lx, L*2 + mx] = a_l_m
+            # the array below is used directly in the precomputation of
+            # Y_{j+n}^{m-k}
+            ar[lx, L*2 + mx] = 1.0/a_l_m
+
+    arn0 = np.zeros(L*2, dtype=dtype)
+    for lx in range(2*L):
+        a_l0 = ((-1.0)**(lx)) / float(math.factorial(lx))
+        arn0[lx] = 1./a_l0
+
+    # pre compute the powers of i
+    ipower_mtm = np.zeros(shape=(2*L+1, 2*L+1), dtype=dtype)
+    ipower_mtl = np.zeros(shape=(2*L+1, 2*L+1), dtype=dtype)
+    ipower_ltl = np.zeros(shape=(2*L+1, 2*L+1), dtype=dtype)
+
+    for kxi, kx in enumerate(range(-1*L, L+1)):
+        for mxi, mx in enumerate(range(-1*L, L+1)):
+
+            ipower_mtm[kxi, mxi] = \
+                ((1.j) ** (abs(kx) - abs(mx) - abs(kx - mx))).real
+
+            ipower_mtl[kxi, mxi] = \
+                ((1.j) ** (abs(kx - mx) - abs(kx) - abs(mx))).real
+
+            ipower_ltl[kxi, mxi] = \
+                ((1.j) ** (abs(mx) - abs(mx - kx) - abs(kx))).real
+
+    # pre compute the coefficients needed to compute spherical harmonics.
+    ycoeff = np.zeros(shape=(L*2)**2, dtype=dtype)
+
+    for nx in range(L*2):
+        for mx in range(-1*nx, nx+1):
+            ycoeff[_re_lm(nx, mx)] = math.sqrt(
+                float(math.factorial(nx - abs(mx))) /
+                float(math.factorial(nx + abs(mx)))
+            )
+
+    # create array for j/k lookup incides
+    j_array = np.zeros(L**2, dtype=INT64)
+    k_array = np.zeros(L**2, dtype=INT64)
+    a_inorder = np.zeros(L**2, dtype=dtype)
+    for jx in range(L):
+        for kx in range(-1*jx, jx+1):
+            j_array[_re_lm(jx,kx)] = jx
+            k_array[_re_lm(jx,kx)] = kx
+            a_inorder[_re_lm(jx,kx)] = \
+                ((-1.) ** jx)/math.sqrt(math.factorial(jx - kx) *\
+                math.factorial(jx+kx))
+
+    # As we have a "uniform" octal tree the values Y_l^m(\alpha, \beta)
+    # can be pre-computed for the 8 children of a parent cell. Indexed
+    # lexicographically.
+    pi = math.pi
+
+    alpha_beta = (
+        (1.25 * pi, -1./math.sqrt(3.)),
+        (1.75 * pi, -1./math.sqrt(3.)),
+        (0.75 * pi, -1./math.sqrt(3.)),
+        (0.25 * pi, -1./math.sqrt(3.)),
+        (1.25 * pi, 1./math.sqrt(3.)),
+        (1.75 * pi, 1./math.sqrt(3.)),
+        (0.75 * pi, 1./math.sqrt(3.)),
+        (0.25 * pi, 1./math.sqrt(3.))
+    )
+
+    yab = np.zeros(shape=(8, ((L*2)**2)*2), dtype=dtype)
+    for cx, child in enumerate(alpha_beta):
+        for lx in range(L*2):
+            mval = list(range(-1*lx, 1)) + list(range(1, lx+1))
+            mxval = [abs(mx) for mx in mval]
+
+            scipy_p = lpmv(mxval, lx, child[1])
+            for mxi, mx in enumerate(mval):
+                val = math.sqrt(float(math.factorial(
+                    lx - abs(mx)))/math.factorial(lx + abs(mx)))
+                re_exp = np.cos(mx*child[0]) * val
+                im_exp = np.sin(mx*child[0]) * val
+
+                assert abs(scipy_p[mxi].imag) < 10.**-16
+
+                yab[cx, _re_lm(lx, mx)] = \
+                    scipy_p[mxi].real * re_exp
+                yab[cx, (L*2)**2 + _re_lm(lx, mx)] = \
+                    scipy_p[mxi].real * im_exp
+
+    # pre-compute spherical harmonics for interaction lists.
+    # P_n^m and coefficient, 7*7*7*ncomp as offsets are in -3,3
+    interaction_p = np.zeros((7, 7, 7, (L * 2)**2), dtype=dtype)
+
+    # exp(m\phi) \phi is the longitudinal angle.
+    interaction_e = np.zeros((7, 7, 8*L + 2), dtype=dtype)
+
+    # compute the lengendre polynomial coefficients
+    for iz, pz in enumerate(range(-3, 4)):
+        for iy, py in enumerate(range(-3, 4)):
+            for ix, px in enumerate(range(-3, 4)):
+                # get spherical coord of box
+                # r, phi, theta
+                sph = PyFMM._cart_to_sph((px, py, pz))
+
+                for lx in range(L*2):
+                    mact_range = list(range(-1*lx, 1)) +\
+                                 list(range(1, lx+1))
+
+                    msci_range = [abs(mx) for mx in mact_range]
+
+                    scipy_p = lpmv(msci_range, lx, math.cos(sph[2]))
+                    for mxi, mx in enumerate(mact_range):
+                        val = math.sqrt(float(math.factorial(
+                            lx - abs(mx)))/math.factorial(lx + abs(mx)))
+
+                        val *= scipy_p[mxi].real
+                        # pre compute the 1./A_{j+n}^{m-k}
+                        val *= ar[lx, L*2 + mx]
+
+                        if abs(scipy_p[mxi].imag) > 10.**-15:
+                            raise RuntimeError('unexpected imag part')
+                        interaction_p[iz, iy, ix, _re_lm(lx, mx)] = val
+
+    # compute the exponential part (not needed for rotated mtl)
+    for iy, py in enumerate(range(-3, 4)):
+        for ix, px in enumerate(range(-3, 4)):
+            # get spherical coord of box
+            sph = PyFMM._cart_to_sph((px, py, 0))
+            for mxi, mx in enumerate(range(-2*L, 2*L+1)):
+                interaction_e[iy, ix, mxi] = math.cos(mx*sph[1])
+                interaction_e[iy, ix, (4*L + 1) + mxi] = \
+                    math.sin(mx*sph[1])
+
+    return {
+        'a': a,
+        'ar': ar,
+        'arn0': arn0,
+        'ipower_mtm': ipower_mtm,
+        'ipower_mtl': ipower_mtl,
+        'ipower_ltl': ipower_ltl,
+        'ycoeff': ycoeff,
+        'j_array': j_array,
+        'k_array': k_array,
+        'a_inorder': a_inorder,
+        'yab': yab,
+        'interaction_p': interaction_p,
+        'interaction_e': interaction_e
+    }
+
+def _compute_wigner(L, dtype):
+    """
+    Compute the Wigner matrices that rotate the expansions about the y axis
+    for the polar angle of each interaction list offset. Forward and backward
+    matrices for offset (pz, py, px) are stored contiguously, as returned by
+    Ry_set, in forward[iz, iy, ix, :] and backward[iz, iy, ix, :].
+    """
+    forward = None
+    backward = None
+    for iz, pz in enumerate(range(-3, 4)):
+        for iy, py in enumerate(range(-3, 4)):
+            for ix, px in enumerate(range(-3, 4)):
+                # r, phi, theta
+                beta = PyFMM._cart_to_sph((px, py, pz))[2]
+
+                ptrs, mats = Ry_set(L, beta, dtype)
+                if forward is None:
+                    forward = np.zeros((7, 7, 7, mats[-1].shape[0]),
+                                       dtype=dtype)
+                    backward = np.zeros_like(forward)
+                forward[iz, iy, ix, :] = mats[-1]
+
+                ptrs, mats = Ry_set(L, -beta, dtype)
+                backward[iz, iy, ix, :] = mats[-1]
+
+    return {'forward': forward, 'backward': backward}
+
+def _wigner_pointers(L, mat):
+    """
+    Array of pointers to the matrices for each j in a contiguous block of
+    Wigner matrices computed by _compute_wigner.
+    """
+    ptrs = np.zeros(L, dtype=ctypes.c_void_p)
+    s = 0
+    for jx in range(L):
+        ptrs[jx] = mat.ctypes.data + s * mat.itemsize
+        p = 2*jx + 1
+        s += p*p
+    return ptrs
+
+class PyFMM(IncrementalMixin):
+
+    _incremental_type = FMMIncremental
+
     def __init__(self, domain, N=None, eps=None,
         free_space=False, r=None, shell_width=0.0, cuda=False, cuda_levels=1,
-        force_unit=1.0, energy_unit=1.0, _debug=False, l=None, cuda_local=False):
+        force_unit=1.0, energy_unit=1.0, _debug=False, l=None, cuda_local=False,
+        local_symmetric=False):
 
         self._debug = _debug
 
@@ -121,6 +354,9 @@ class PyFMM(object):
 
         self.free_space = free_space
 
+        self.energy_unit = float(energy_unit)
+        """Multiplicative factor applied to energies."""
+        self._incremental = None
 
         ncomp = (self.L**2) * 2
         # define the octal tree and attach data to the tree.
@@ -136,112 +372,28 @@ class PyFMM(object):
         self._thread_allocation = np.zeros(1, dtype=INT64)
         self._tmp_cell = np.zeros(1, dtype=INT64)
 
-        # pre compute A_n^m and 1/(A_n^m)
-
         ASTRIDE1 = (self.L*4)+1
         ASTRIDE2 = self.L*2
 
-        self._a = np.zeros(shape=(ASTRIDE2, ASTRIDE1), dtype=dtype)
-        self._ar = np.zeros(shape=(ASTRIDE2, ASTRIDE1), dtype=dtype)
-
-        for lx in range(self.L*2):
-            for mx in range(-1*lx, lx+1):
-                a_l_m = ((-1.) ** lx)/ \
-                        (math.sqrt(math.factorial(lx-mx)) * \
-                         math.sqrt(math.factorial(lx+mx)))
+        # pre compute A_n^m, 1/(A_n^m), the powers of i and the coefficients
+        # of the spherical harmonics. These only depend on L and are cached
+        # on disk along with the Wigner matrices and periodic boundary terms.
+        self._cache = FMMCache(domain.comm)
+        _tables = self._cache.get('tables', (self.L, str(dtype)),
+                                  lambda: _compute_tables(self.L, dtype))
+
+        self._a = _tables['a']
+        self._ar = _tables['ar']
+        self._arn0 = _tables['arn0']
+        self._ipower_mtm = _tables['ipower_mtm']
+        self._ipower_mtl = _tables['ipower_mtl']
+        self._ipower_ltl = _tables['ipower_ltl']
+        self._ycoeff = _tables['ycoeff']
+        self._j_array = _tables['j_array']
+        self._k_array = _tables['k_array']
+        self._a_inorder = _tables['a_inorder']
+        self._yab = _tables['yab']
 
-                self._a[lx, self.L*2 + mx] = a_l_m
-                # the array below is used directly in the precomputation of
-                # Y_{j+n}^{m-k}
-                self._ar[lx, self.L*2 + mx] = 1.0/a_l_m
-
-        self._arn0 = np.zeros(self.L*2, dtype=dtype)
-        for lx in range(2*self.L):
-            a_l0 = ((-1.0)**(lx)) / float(math.factorial(lx))
-            self._arn0[lx] = 1./a_l0
-
-
-        # pre compute the powers of i
-        self._ipower_mtm = np.zeros(shape=(2*self.L+1, 2*self.L+1),
-                                    dtype=dtype)
-        self._ipower_mtl = np.zeros(shape=(2*self.L+1, 2*self.L+1),
-                                    dtype=dtype)
-        self._ipower_ltl = np.zeros(shape=(2*self.L+1, 2*self.L+1),
-                                    dtype=dtype)
-
-        for kxi, kx in enumerate(range(-1*self.L, self.L+1)):
-            for mxi, mx in enumerate(range(-1*self.L, self.L+1)):
-
-                self._ipower_mtm[kxi, mxi] = \
-                    ((1.j) ** (abs(kx) - abs(mx) - abs(kx - mx))).real
-
-                self._ipower_mtl[kxi, mxi] = \
-                    ((1.j) ** (abs(kx - mx) - abs(kx) - abs(mx))).real
-                
-
-                self._ipower_ltl[kxi, mxi] = \
-                    ((1.j) ** (abs(mx) - abs(mx - kx) - abs(kx))).real
-
-
-        # pre compute the coefficients needed to compute spherical harmonics.
-        self._ycoeff = np.zeros(shape=(self.L*2)**2,
-                                dtype=dtype)
-
-        for nx in range(self.L*2):
-            for mx in range(-1*nx, nx+1):
-                self._ycoeff[self.re_lm(nx, mx)] = math.sqrt(
-                    float(math.factorial(nx - abs(mx))) /
-                    float(math.factorial(nx + abs(mx)))
-                )
-        
-        # create array for j/k lookup incides
-        self._j_array = np.zeros(self.L**2, dtype=INT64)
-        self._k_array = np.zeros(self.L**2, dtype=INT64)
-        self._a_inorder = np.zeros(self.L**2, dtype=dtype) 
-        for jx in range(self.L):
-            for kx in range(-1*jx, jx+1):
-                self._j_array[self.re_lm(jx,kx)] = jx
-                self._k_array[self.re_lm(jx,kx)] = kx
-                self._a_inorder[self.re_lm(jx,kx)] = \
-                    ((-1.) ** jx)/math.sqrt(math.factorial(jx - kx) *\
-                    math.factorial(jx+kx))
-
-        # As we have a "uniform" octal tree the values Y_l^m(\alpha, \beta)
-        # can be pre-computed for the 8 children of a parent cell. Indexed
-        # lexicographically.
-        pi = math.pi
-        #     (1.25 * pi, 0.75 * pi),
-
-        alpha_beta = (
-            (1.25 * pi, -1./math.sqrt(3.)),
-            (1.75 * pi, -1./math.sqrt(3.)),
-            (0.75 * pi, -1./math.sqrt(3.)),
-            (0.25 * pi, -1./math.sqrt(3.)),
-            (1.25 * pi, 1./math.sqrt(3.)),
-            (1.75 * pi, 1./math.sqrt(3.)),
-            (0.75 * pi, 1./math.sqrt(3.)),
-            (0.25 * pi, 1./math.sqrt(3.))
-        )
-
-        self._yab = np.zeros(shape=(8, ((self.L*2)**2)*2), dtype=dtype)
-        for cx, child in enumerate(alpha_beta):
-            for lx in range(self.L*2):
-                mval = list(range(-1*lx, 1)) + list(range(1, lx+1))
-                mxval = [abs(mx) for mx in mval]
-
-                scipy_p = lpmv(mxval, lx, child[1])
-                for mxi, mx in enumerate(mval):
-                    val = math.sqrt(float(math.factorial(
-                        lx - abs(mx)))/math.factorial(lx + abs(mx)))
-                    re_exp = np.cos(mx*child[0]) * val
-                    im_exp = np.sin(mx*child[0]) * val
-
-                    assert abs(scipy_p[mxi].imag) < 10.**-16
-
-                    self._yab[cx, self.re_lm(lx, mx)] = \
-                        scipy_p[mxi].real * re_exp
-                    self._yab[cx, (self.L*2)**2 + self.re_lm(lx, mx)] = \
-                        scipy_p[mxi].real * im_exp
 
         # load multipole to multipole translation library
         with open(str(_SRC_DIR) + \
@@ -352,7 +504,8 @@ class PyFMM(object):
 
         self._pbc_tool = FMMPbc(self.L, teps, domain, dtype)
         if free_space == False:
-            self._boundary_terms = self._pbc_tool.compute_f() + self._pbc_tool.compute_g()
+            self._boundary_terms = self._pbc_tool.cached_boundary_terms(
+                self._cache)
             #self._boundary_terms = np.zeros((self.L * 2)**2, dtype=dtype)
 
         # create a vectors with ones for real part and zeros for imaginary part
@@ -365,10 +518,10 @@ class PyFMM(object):
 
         # pre-compute spherical harmonics for interaction lists.
         # P_n^m and coefficient, 7*7*7*ncomp as offsets are in -3,3
-        self._interaction_p = np.zeros((7, 7, 7, (self.L * 2)**2), dtype=dtype)
+        self._interaction_p = _tables['interaction_p']
 
         # exp(m\phi) \phi is the longitudinal angle. 
-        self._interaction_e = np.zeros((7, 7, 8*self.L + 2), dtype=dtype)
+        self._interaction_e = _tables['interaction_e']
 
         self._wigner_real = np.zeros((7,7,7), dtype=ctypes.c_void_p)
         self._wigner_imag = np.zeros((7,7,7), dtype=ctypes.c_void_p)
@@ -383,81 +536,6 @@ class PyFMM(object):
         self._wigner_imag_pointers = []
         
 
-        # compute the lengendre polynomial coefficients
-        for iz, pz in enumerate(range(-3, 4)):
-            for iy, py in enumerate(range(-3, 4)):
-                for ix, px in enumerate(range(-3, 4)):
-                    # get spherical coord of box
-                    # r, phi, theta
-                    sph = self._cart_to_sph((px, py, pz))
-                    
-                    for lx in range(self.L*2):
-                        mact_range = list(range(-1*lx, 1)) +\
-                                     list(range(1, lx+1))
-
-                        msci_range = [abs(mx) for mx in mact_range]
-
-                        scipy_p = lpmv(msci_range, lx, math.cos(sph[2]))
-                        for mxi, mx in enumerate(mact_range):
-                            val = math.sqrt(float(math.factorial(
-                                lx - abs(mx)))/math.factorial(lx + abs(mx)))
-
-                            val *= scipy_p[mxi].real
-                            # pre compute the 1./A_{j+n}^{m-k}
-                            val *= self._ar[lx, self.L*2 + mx]
-
-                            if abs(scipy_p[mxi].imag) > 10.**-15:
-                                raise RuntimeError('unexpected imag part')
-                            self._interaction_p[iz, iy, ix, 
-                                self.re_lm(lx, mx)] = val
-                    
-                    continue
-                    # sph = self._cart_to_sph((px, py, pz))
-                    # forward rotate
-                    
-                    pointers_real, pointers_imag, matrices = Rzyz_set(
-                        p=self.L,
-                        alpha=sph[1], beta=sph[2], gamma=0.0,
-                        dtype=self.dtype)
-                    
-                    # between here breaks efence?
-                    # store the temporaries
-                    self._wigner_matrices_f[(pz, py, px)] = matrices
-                    self._wigner_real_pointers.append(pointers_real)
-                    self._wigner_imag_pointers.append(pointers_imag)
-                    # pointers
-                    self._wigner_real[iz, iy, ix] = \
-                        pointers_real.ctypes.data
-                    self._wigner_imag[iz, iy, ix] = \
-                        pointers_imag.ctypes.data
-
-                    # backward rotate
-                    pointers_real, pointers_imag, matrices = Rzyz_set(
-                        p=self.L,
-                        alpha=0.0, beta=-1.*sph[2], gamma=-1.*sph[1],
-                        dtype=self.dtype)
-                    # store the temporaries
-                    self._wigner_matrices_b[(pz, py, px)] = matrices
-                    self._wigner_real_pointers.append(pointers_real)
-                    self._wigner_imag_pointers.append(pointers_imag)
-                    # pointers
-                    self._wigner_b_real[iz, iy, ix] = \
-                        pointers_real.ctypes.data
-                    self._wigner_b_imag[iz, iy, ix] = \
-                        pointers_imag.ctypes.data
-
-        # compute the exponential part (not needed for rotated mtl)
-        for iy, py in enumerate(range(-3, 4)):
-            for ix, px in enumerate(range(-3, 4)):
-                # get spherical coord of box
-                sph = self._cart_to_sph((px, py, 0))
-                for mxi, mx in enumerate(range(-2*self.L, 2*self.L+1)):
-                    self._interaction_e[iy, ix, mxi] = math.cos(mx*sph[1])
-                    self._interaction_e[iy, ix, (4*self.L + 1) + mxi] = \
-                        math.sin(mx*sph[1])
-
-
-
         # --------------------------
         # serious optimisation mode time
 
@@ -482,6 +560,9 @@ class PyFMM(object):
                 tmp_ptr_exp_re[iy, ix] = self._str_exp_re[-1].ctypes.data
                 tmp_ptr_exp_im[iy, ix] = self._str_exp_im[-1].ctypes.data
         
+        _wigner = self._cache.get('wigner', (self.L, str(dtype)),
+                                  lambda: _compute_wigner(self.L, dtype))
+        self._wigner_matrices = _wigner
         self._str_wigner = []
 
         self._ptr_exp_re = np.zeros((7,7,7), dtype=ctypes.c_void_p)
@@ -496,28 +577,20 @@ class PyFMM(object):
                     self._ptr_exp_re[iz, iy, ix] = tmp_ptr_exp_re[iy, ix]
                     self._ptr_exp_im[iz, iy, ix] = tmp_ptr_exp_im[iy, ix]
 
-                    # r, phi, theta
-                    sph = self._cart_to_sph((px, py, pz))
-                    
-                    beta = sph[2]
-
-                    ptrs, mats = Ry_set(self.L, beta, self.dtype)
-                    
-                    self._str_wigner.append(mats)
-                    self._str_wigner.append(ptrs)
+                    self._str_wigner.append(_wigner_pointers(
+                        self.L, _wigner['forward'][iz, iy, ix, :]))
                     self._ptr_wigner[iz, iy, ix] = \
                         self._str_wigner[-1].ctypes.data
 
-                    ptrs, mats = Ry_set(self.L, -beta, self.dtype)
-
-                    self._str_wigner.append(mats)
-                    self._str_wigner.append(ptrs)
+                    self._str_wigner.append(_wigner_pointers(
+                        self.L, _wigner['backward'][iz, iy, ix, :]))
                     self._ptr_wignerb[iz, iy, ix] = \
                         self._str_wigner[-1].ctypes.data
 
         # --------------------------
 
 
+
         # create a pairloop for finest level part
         P = data.ParticleDat(ncomp=3, dtype=dtype)
         F = data.ParticleDat(ncomp=3, dtype=dtype)
@@ -579,7 +652,7 @@ class PyFMM(object):
         self._fmm_local = FMMLocal(width=max_radius, domain=self.domain,
                 entry_data=self.entry_data, entry_map=self.tree.entry_map, 
                 free_space=self.free_space, dtype=self.dtype, force_unit=force_unit,
-                energy_unit=energy_unit)
+                energy_unit=energy_unit, symmetric=local_symmetric)
 
 
         self._pair_loop = PL(
@@ -602,6 +675,15 @@ class PyFMM(object):
                 self._int_list[lvlx] = compute_interaction_lists(tsize)
             else: self._int_list[lvlx] = None
          
+        # cells that can be translated during the halo exchange
+        self._mtl_cells = list(range(self.R))
+        self._mtl_cells[0] = None
+        for lvlx in range(1, self.R):
+            lsize = self.tree[lvlx].local_grid_cube_size
+            if lsize is not None:
+                self._mtl_cells[lvlx] = compute_interior_cells(lsize)
+            else: self._mtl_cells[lvlx] = None
+
         self._int_tlookup = compute_interaction_tlookup()
         self._int_plookup = compute_interaction_plookup()
         self._int_radius = compute_interaction_radius()
@@ -874,12 +956,26 @@ class PyFMM(object):
 
         for level in range(self.R - 1, 0, -1):
 
-            self._level_call_async(self._translate_m_to_m, level, execute_async)
-            self._halo_exchange(level)
-            
-            if self.cuda and (self.R - level -1 < self.cuda_levels):
-                self._cuda_translate_m_t_l(level)
+            level_cuda = self.cuda and (self.R - level -1 < self.cuda_levels)
+
+            if level_cuda or execute_async:
+                self._level_call_async(self._translate_m_to_m, level,
+                                       execute_async)
+                self._halo_exchange(level)
             else:
+                # the multipole expansions of this level are complete, the
+                # halo exchange runs while the multipole to multipole
+                # translation and the multipole to local translations of the
+                # interior cells are computed.
+                self._halo_exchange_start(level)
+                self._translate_m_to_m(level)
+                self._translate_m_to_l_cells(level, 0)
+                self._halo_exchange_finish(level)
+                self._translate_m_to_l_cells(level, 1)
+
+            if level_cuda:
+                self._cuda_translate_m_t_l(level)
+            elif execute_async:
                 self._level_call_async(self._translate_m_to_l,
                                        level, execute_async)
 
@@ -955,22 +1051,7 @@ class PyFMM(object):
             func(level)
 
     def _mtlz_cost_per_cell(self):
-        t = 0
-        for mx in range(self.L):
-            n = 2*(mx+1)+1
-            t += (2*(n**2))*2
-            t += n*8
-
-        t *= 2
-
-        for jx in range(self.L):
-            for nx in range(self.L):
-                kmax = min(nx, jx)
-                t += 2
-                for kx in range(-kmax, kmax+1):
-                    t += 7
-
-        return t
+        return _mtlz_cost_per_cell(self.L)
 
 
     def flop_rate_mtl(self):
@@ -1247,7 +1328,21 @@ class PyFMM(object):
     def _halo_exchange(self, level):
         self.timer_halo.start()
         self.tree_halo.halo_exchange_level(level)
+        self._zero_free_space_halo(level)
+        self.timer_halo.pause()
+
+    def _halo_exchange_start(self, level):
+        self.timer_halo.start()
+        self.tree_halo.halo_exchange_level_start(level)
+        self.timer_halo.pause()
 
+    def _halo_exchange_finish(self, level):
+        self.timer_halo.start()
+        self.tree_halo.halo_exchange_level_finish(level)
+        self._zero_free_space_halo(level)
+        self.timer_halo.pause()
+
+    def _zero_free_space_halo(self, level):
         if self.tree[level].local_grid_cube_size is None:
             return
 
@@ -1272,9 +1367,6 @@ class PyFMM(object):
             if lo[0] + ls[0] == gs:
                 self.tree_halo[level][-2::,:,:,:] = 0.0
 
-
-        self.timer_halo.pause()
-
     def _translate_m_to_l(self, level):
 
         if self.tree[level].local_grid_cube_size is None:
@@ -1309,6 +1401,48 @@ class PyFMM(object):
         self.timer_mtl.pause()
 
 
+    def _translate_m_to_l_cells(self, level, part):
+        """
+        Multipole to local translations of the interior cells (part=0),
+        which only read local cells, or of the boundary cells (part=1), which
+        require the halo exchange to have completed.
+        """
+        if self.tree[level].local_grid_cube_size is None:
+            return
+
+        self.timer_mtl.start()
+        if part == 0:
+            self.tree_plain[level][:] = 0.0
+
+        cells = self._mtl_cells[level][part]
+        radius = self.domain.extent[0] / \
+                 self.tree[level].ncubes_side_global
+
+        err = self._translate_mtlz2_lib['translate_mtl_cells'](
+            _check_dtype(self.tree[level].local_grid_cube_size, INT64),
+            _check_dtype(self.tree_halo[level], REAL),
+            _check_dtype(self.tree_plain[level], REAL),
+            self._ptr_wigner.ctypes.get_as_parameter(),
+            self._ptr_wignerb.ctypes.get_as_parameter(),
+            self._ptr_exp_re.ctypes.get_as_parameter(),
+            self._ptr_exp_im.ctypes.get_as_parameter(),
+            _check_dtype(self._a, REAL),
+            _check_dtype(self._arn0, REAL),
+            _check_dtype(self._ipower_mtl, REAL),
+            REAL(radius),
+            INT64(self.L),
+            _check_dtype(self._int_list[level], INT64),
+            _check_dtype(self._int_tlookup, INT64),
+            _check_dtype(self._int_plookup, INT64),
+            _check_dtype(self._int_radius, ctypes.c_double),
+            self._thread_space.ctypes_data,
+            INT64(cells.shape[0]),
+            _check_dtype(cells, INT64)
+        )
+        if err < 0: raise RuntimeError('Negative return code: {}'.format(err))
+        self.timer_mtl.pause()
+
+
     def _translate_m_to_l_z_1(self, level):
 
         if self.tree[level].local_grid_cube_size is None:
@@ -0,0 +1,578 @@
+"""
+Fast multipole method on an adaptive octal tree. Cells are only refined while
+they hold more than a maximum number of particles, such that strongly
+inhomogeneous systems, e.g. clusters, interfaces or systems with large vacuum
+regions, do not pay for the storage, the translations and the communication
+of empty cells.
+
+The tree is a sparse AdaptiveOctalTree over the cell ownership of the
+distributed OctalTree of PyFMM. Each rank only holds the expansions of the
+cells of the adaptive tree it owns, the multipole to multipole and local to
+local translations run along the occupied parent-child links and only cells
+of the adaptive tree are exchanged. The interactions are split with the
+interaction lists of the adaptive method:
+
+* U: the adjacent leaves of a leaf, direct interactions computed by
+  FMMLocalLeaves from the particles and the particle halo.
+* V: multipole to local translations between the cells of a level.
+* W: the multipole expansions of the cells in the W list of a leaf are
+  evaluated at its particles, multipole to particle.
+* X: the particles of the leaves in the X list of a cell are formed into a
+  local expansion of the cell, particle to local.
+
+W and X are dual, both are computed on the ranks holding the particles of the
+leaves.
+"""
+
+from __future__ import division, print_function, absolute_import
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+import math
+import ctypes
+import os
+import numpy as np
+from mpi4py import MPI
+
+from ppmd import opt, runtime, data, access
+from ppmd.lib import build
+from ppmd.coulomb.fmm import _compute_tables, _check_dtype, extern_numpy_ptr
+from ppmd.coulomb.fmm_cache import FMMCache
+from ppmd.coulomb.fmm_pbc import FMMPbc, DipoleCorrector
+from ppmd.coulomb.fmm_local import FMMLocalLeaves
+from ppmd.coulomb.octal import OctalTree, AdaptiveOctalTree, RowExchange, \
+    _expand
+
+_SRC_DIR = os.path.dirname(os.path.realpath(__file__))
+
+REAL = ctypes.c_double
+INT64 = ctypes.c_int64
+
+
+def _tree_id(level, key):
+    # index of a cell over all levels of the tree
+    return (np.left_shift(1, 3*level) - 1) // 7 + key
+
+
+def _centres(level, key, extent):
+    # (x, y, z) centres of the cells with global linear indices key on level
+    n = np.left_shift(1, level)
+    zyx = np.stack((key // (n*n), (key // n) % n, key % n), axis=1)
+    return (zyx[:, ::-1] + 0.5) * (extent / n).reshape(-1, 1) - 0.5*extent
+
+
+def _gather(arrays, level, index, shape):
+    # the rows index of the per level arrays
+    out = np.zeros((level.shape[0],) + shape, dtype=arrays[0].dtype)
+    for lx in np.unique(level):
+        s = level == lx
+        out[s, ...] = arrays[lx][index[s], ...]
+    return out
+
+
+def _scatter_add(arrays, level, index, rows):
+    for lx in np.unique(level):
+        s = level == lx
+        np.add.at(arrays[lx], index[s], rows[s, ...])
+
+
+def _check_err(err):
+    if err < 0: raise RuntimeError('Negative return code: {}'.format(err))
+
+
+class AdaptiveFMM(object):
+    """
+    Fast multipole method on an adaptive octal tree, see the module
+    documentation. Cells are refined to at most the finest level of the
+    uniform tree of r levels.
+
+    :param domain: Cubic domain.
+    :param N: Number of particles, used to choose r if r is None.
+    :param eps: Required accuracy, used to choose l if l is None.
+    :param free_space: True, '27' or False as for PyFMM.
+    :param r: Number of levels in the octal tree.
+    :param l: Number of expansion terms.
+    :param max_leaf: Maximum number of particles in a leaf.
+    :param force_unit: Multiplicative factor applied to forces.
+    :param energy_unit: Multiplicative factor applied to energies.
+    """
+    def __init__(self, domain, N=None, eps=None, free_space=False, r=None,
+                 l=None, max_leaf=32, force_unit=1.0, energy_unit=1.0):
+
+        if l is None:
+            assert eps is not None
+            self.L = int(-1*math.log(eps, 2))
+            """Number of multipole expansion coefficients"""
+        else:
+            self.L = int(l)
+
+        if r is None: self.R = max(int(math.log(N, 8)), 3)
+        else: self.R = int(r)
+        """Number of levels in octal tree."""
+
+        assert self.R > 2
+
+        self.dtype = REAL
+        self.domain = domain
+
+        _e = domain.extent
+        if (abs(_e[0] - _e[1]) > 10.**-8) or (abs(_e[0] - _e[2]) > 10.**-8):
+            raise RuntimeError('domain passed to constructor is not cubic')
+
+        self.eps = eps
+        self.free_space = free_space
+        self.max_leaf = max(int(max_leaf), 1)
+        """Maximum number of particles in a leaf."""
+        self.force_unit = float(force_unit)
+        """Multiplicative factor applied to forces."""
+        self.energy_unit = float(energy_unit)
+        """Multiplicative factor applied to energies."""
+
+        self.tree = OctalTree(self.R, domain.comm)
+        self.comm = self.tree.cart_comm
+
+        self._cache = FMMCache(domain.comm)
+        _tables = self._cache.get('tables', (self.L, str(self.dtype)),
+                                  lambda: _compute_tables(self.L, self.dtype))
+        self._a = _tables['a']
+        self._ar = _tables['ar']
+        self._ipower_mtm = _tables['ipower_mtm']
+        self._ipower_mtl = _tables['ipower_mtl']
+        self._ipower_ltl = _tables['ipower_ltl']
+        self._ycoeff = _tables['ycoeff']
+        self._yab = _tables['yab']
+        self._interaction_p = _tables['interaction_p']
+        self._interaction_e = _tables['interaction_e']
+
+        with open(str(_SRC_DIR) + '/FMMSource/AdaptiveFMM.cpp') as fh:
+            cpp = fh.read()
+        with open(str(_SRC_DIR) + '/FMMSource/AdaptiveFMM.h') as fh:
+            hpp = fh.read()
+        hpp = hpp % {
+            'SUB_FORCE_UNIT': self.force_unit,
+            'SUB_ENERGY_UNIT': self.energy_unit
+        }
+        self._lib = build.simple_lib_creator(hpp, cpp, 'fmm_adaptive')
+
+        # lattice sum and dipole correction of the periodic boundaries as in
+        # PyFMM
+        if free_space == False:
+            with open(str(_SRC_DIR) + '/FMMSource/TranslateMTL.cpp') as fh:
+                cpp = fh.read()
+            with open(str(_SRC_DIR) + '/FMMSource/TranslateMTL.h') as fh:
+                hpp = fh.read()
+            self._translate_mtl_lib = build.simple_lib_creator(hpp, cpp,
+                'fmm_translate_mtl')
+
+            teps = self.eps if self.eps is not None else 10.**-12
+            self._pbc_tool = FMMPbc(self.L, teps, domain, self.dtype)
+            self._boundary_terms = self._pbc_tool.cached_boundary_terms(
+                self._cache)
+            self._boundary_ident = np.zeros(8*self.L + 2, dtype=self.dtype)
+            self._boundary_ident[:4*self.L+1:] = 1.0
+            self.dipole_corrector = DipoleCorrector(self.L, domain.extent,
+                                                    self._lr_mtl_func)
+
+        # the particle halo of the direct interactions is two leaf widths of
+        # the coarsest leaves deep and may not be deeper than a subdomain
+        b = domain.boundary
+        w = self.comm.allreduce(min(b[1] - b[0], b[3] - b[2], b[5] - b[4]),
+                                op=MPI.MIN)
+        e = domain.extent[0]
+        self.min_level = max(1, int(math.ceil(math.log(2.*e/w, 2) - 10.**-8)))
+        """Coarsest level of a leaf."""
+        if self.min_level > self.R - 1:
+            raise RuntimeError('Subdomains are too small for {} levels, use '
+                               'more levels or fewer MPI ranks.'.format(self.R))
+
+        self.adaptive_tree = AdaptiveOctalTree(self.tree, self.max_leaf,
+                                               free_space == True)
+        self.leaf_level = np.zeros(0, dtype=np.int64)
+        """Leaf level of each local particle in the last call."""
+
+        self._fmm_local = FMMLocalLeaves(width=2.*e/(2**self.min_level),
+            domain=domain, num_levels=self.R, free_space=free_space,
+            dtype=self.dtype, force_unit=self.force_unit,
+            energy_unit=self.energy_unit)
+
+        self._groups = None
+        self._leaves = None
+        self._wx = None
+
+        self.timer_tree = opt.Timer(runtime.TIMER)
+        self.timer_contrib = opt.Timer(runtime.TIMER)
+        self.timer_extract = opt.Timer(runtime.TIMER)
+        self.timer_mtm = opt.Timer(runtime.TIMER)
+        self.timer_mtl = opt.Timer(runtime.TIMER)
+        self.timer_ltl = opt.Timer(runtime.TIMER)
+        self.timer_wx = opt.Timer(runtime.TIMER)
+        self.timer_local = opt.Timer(runtime.TIMER)
+        self.timer_halo = opt.Timer(runtime.TIMER)
+
+        self.execution_count = 0
+
+    def free(self):
+        self.tree.free()
+
+    def _lr_mtl_func(self, M, L):
+        self._translate_mtl_lib['mtl_test_wrapper'](
+            ctypes.c_int64(self.L),
+            ctypes.c_double(1.),            #radius=1
+            extern_numpy_ptr(M),
+            extern_numpy_ptr(self._boundary_ident),
+            extern_numpy_ptr(self._boundary_terms),
+            extern_numpy_ptr(self._a),
+            extern_numpy_ptr(self._ar),
+            extern_numpy_ptr(self._ipower_mtl),
+            extern_numpy_ptr(L)
+        )
+
+    def _check_aux_dat(self, positions):
+        if not hasattr(positions.group, '_fmm_cell'):
+            positions.group._fmm_cell = data.ParticleDat(ncomp=1, dtype=INT64)
+            positions.group._fmm_cell.npart_local = positions.npart_local
+        if not hasattr(positions.group, '_fmm_leaf'):
+            positions.group._fmm_leaf = data.ParticleDat(ncomp=1, dtype=INT64)
+            positions.group._fmm_leaf.npart_local = positions.npart_local
+
+    def __call__(self, positions, charges, forces=None, potential=None):
+
+        self._check_aux_dat(positions)
+        n = positions.npart_local
+        if forces is None:
+            forces = data.ParticleDat(ncomp=3, npart=positions.npart_total,
+                                      dtype=self.dtype)
+
+        ns = 2 ** (self.R - 1)
+        e = self.domain.extent[0]
+        cells = np.clip(np.floor((positions[:n:, :] + 0.5*e)*ns/e), 0,
+                        ns - 1).astype(np.int64)
+        cells = (cells[:, 2]*ns + cells[:, 1])*ns + cells[:, 0]
+
+        self.timer_tree.start()
+        self.leaf_level = self.adaptive_tree.update(cells, self.min_level)
+        self._update_leaves(cells)
+        self.timer_tree.pause()
+
+        fmm_cell = positions.group._fmm_cell
+        fmm_cell[:n:, 0] = cells
+        fmm_cell.ctypes_data_post(access.WRITE)
+        fmm_leaf = positions.group._fmm_leaf
+        fmm_leaf[:n:, 0] = self.leaf_level
+        fmm_leaf.ctypes_data_post(access.WRITE)
+
+        self.timer_local.start()
+        phi_near = self._fmm_local(positions, charges, forces, fmm_cell,
+                                   fmm_leaf, potential)
+        self.timer_local.pause()
+
+        M = self._compute_multipoles(positions, charges)
+        L = [np.zeros_like(mx) for mx in M]
+        self._translate_up(M, L)
+        phi_wx = self._compute_wx(positions, charges, forces, potential, M, L)
+        self._compute_periodic_boundary(M[0], L[0])
+        self._translate_down(L)
+        phi_extract = self._compute_extraction(positions, charges, forces,
+                                               potential, L)
+
+        self._update_opt()
+        self.execution_count += 1
+
+        forces.ctypes_data_post(access.WRITE)
+        if potential is not None: potential.ctypes_data_post(access.WRITE)
+        return self.comm.allreduce(phi_near + phi_wx + phi_extract,
+                                   op=MPI.SUM)
+
+    def _update_leaves(self, cells):
+        # Group the local particles by leaf, register the leaves with their
+        # owners and route the W and X list pairs to the ranks holding the
+        # particles of the leaves.
+        comm = self.comm
+        tree = self.adaptive_tree
+        e = self.domain.extent[0]
+        ns = 2 ** (self.R - 1)
+
+        level = self.leaf_level
+        s = self.R - 1 - level
+        key = np.right_shift(cells // (ns*ns), s)
+        key = np.left_shift(key, level) + np.right_shift((cells // ns) % ns, s)
+        key = np.left_shift(key, level) + np.right_shift(cells % ns, s)
+
+        ids, inv = np.unique(_tree_id(level, key), return_inverse=True)
+        inv = inv.ravel()
+        order = np.array(np.argsort(inv, kind='stable'), dtype=np.int64)
+        start = np.array(np.searchsorted(inv[order],
+            np.arange(ids.shape[0] + 1)), dtype=np.int64)
+        group_level = level[order[start[:-1]]]
+        group_key = key[order[start[:-1]]]
+        self._groups = (ids, start, order,
+                        _centres(group_level, group_key, e))
+
+        # register the leaves with the owners of the leaf cells
+        owner = np.zeros(ids.shape[0], dtype=np.int64)
+        for lx in np.unique(group_level):
+            sx = group_level == lx
+            owner[sx] = self.tree[lx].owners.ravel()[group_key[sx]]
+        reg = RowExchange(comm, owner)
+        reg_level = reg(group_level)
+        reg_key = reg(group_key)
+        reg_index = np.zeros(reg_level.shape[0], dtype=np.int64)
+        for lx in np.unique(reg_level):
+            sx = reg_level == lx
+            reg_index[sx] = np.searchsorted(tree.cells[lx], reg_key[sx])
+        self._leaves = (reg, reg_level, reg_index)
+
+        # the owners of the cells C of the pairs send them to the owners of
+        # the leaves B, which send them on to the ranks holding particles of B
+        owner = np.zeros(tree.x_level.shape[0], dtype=np.int64)
+        for lx in np.unique(tree.x_leaf_level):
+            sx = tree.x_leaf_level == lx
+            owner[sx] = self.tree[lx].owners.ravel()[tree.x_leaf_key[sx]]
+        pairs = np.concatenate((
+            np.arange(tree.x_level.shape[0], dtype=np.int64).reshape(-1, 1),
+            tree.x_level.reshape(-1, 1),
+            _gather(tree.cells, tree.x_level, tree.x_index, ()).reshape(-1, 1),
+            tree.x_leaf_level.reshape(-1, 1),
+            tree.x_leaf_key.reshape(-1, 1),
+            tree.x_shift), axis=1)
+        ex = RowExchange(comm, owner)
+        pairs = np.concatenate((ex(pairs), ex.src.reshape(-1, 1)), axis=1)
+
+        reg_id = _tree_id(reg_level, reg_key)
+        reg_order = np.argsort(reg_id, kind='stable')
+        reg_id = reg_id[reg_order]
+        b_id = _tree_id(pairs[:, 3], pairs[:, 4])
+        ix, row = _expand(np.searchsorted(reg_id, b_id),
+                          np.searchsorted(reg_id, b_id, side='right'))
+        ex = RowExchange(comm, reg.src[reg_order[ix]])
+        pairs = ex(pairs[row, :])
+
+        # the pairs are computed in runs of the same leaf and the local
+        # expansions are returned to the owners of C
+        group = np.searchsorted(ids, _tree_id(pairs[:, 3], pairs[:, 4]))
+        ex = RowExchange(comm, pairs[:, 8])
+        recv_pair = ex(pairs[:, 0])
+        perm = np.argsort(group, kind='stable')
+        group = np.array(group[perm], dtype=np.int64)
+        run_start = np.concatenate((
+            np.flatnonzero(np.diff(group, prepend=-1)),
+            (group.shape[0],))).astype(np.int64)
+        centres = _centres(pairs[perm, 1], pairs[perm, 2], e) - \
+            pairs[perm, 5:8] * e
+        self._wx = (ex, recv_pair, perm, group, run_start, centres)
+
+    def _compute_multipoles(self, positions, charges):
+        # multipole expansions of the leaves from the local particles summed
+        # on the owners of the leaves
+        self.timer_contrib.start()
+        ncomp = 2 * self.L * self.L
+        ids, start, order, centres = self._groups
+
+        moments = np.zeros((ids.shape[0], ncomp), dtype=REAL)
+        _check_err(self._lib['adaptive_p2m'](
+            INT64(self.L),
+            INT64(ids.shape[0]),
+            extern_numpy_ptr(start),
+            extern_numpy_ptr(order),
+            extern_numpy_ptr(centres),
+            _check_dtype(positions, REAL),
+            _check_dtype(charges, REAL),
+            extern_numpy_ptr(self._ycoeff),
+            extern_numpy_ptr(moments)
+        ))
+
+        M = [np.zeros((cx.shape[0], ncomp), dtype=REAL) for cx in
+             self.adaptive_tree.cells]
+        reg, reg_level, reg_index = self._leaves
+        _scatter_add(M, reg_level, reg_index, reg(moments))
+        self.timer_contrib.pause()
+        return M
+
+    def _translate_up(self, M, L):
+        # V list multipole to local translations on each level and the
+        # multipole to multipole translations onto the parents
+        tree = self.adaptive_tree
+        e = self.domain.extent[0]
+        for lx in range(self.R - 1, 0, -1):
+
+            self.timer_halo.start()
+            ex, send = tree.halo[lx]
+            halo = np.concatenate((M[lx], ex(M[lx][send, :])))
+            self.timer_halo.pause()
+
+            self.timer_mtl.start()
+            start, source, offset = tree.v_lists[lx]
+            _check_err(self._lib['adaptive_mtl'](
+                INT64(self.L),
+                INT64(M[lx].shape[0]),
+                extern_numpy_ptr(start),
+                extern_numpy_ptr(source),
+                extern_numpy_ptr(offset),
+                extern_numpy_ptr(halo),
+                extern_numpy_ptr(L[lx]),
+                extern_numpy_ptr(self._interaction_e),
+                extern_numpy_ptr(self._interaction_p),
+                extern_numpy_ptr(self._a),
+                extern_numpy_ptr(self._ipower_mtl),
+                REAL(e / 2**lx)
+            ))
+            self.timer_mtl.pause()
+
+            self.timer_mtm.start()
+            ex, parent_index, octant = tree.links[lx]
+            children = ex(M[lx])
+            order = np.array(np.argsort(parent_index, kind='stable'),
+                             dtype=np.int64)
+            start = np.array(np.searchsorted(parent_index[order],
+                np.arange(M[lx-1].shape[0] + 1)), dtype=np.int64)
+            _check_err(self._lib['adaptive_mtm'](
+                INT64(self.L),
+                INT64(M[lx-1].shape[0]),
+                extern_numpy_ptr(start),
+                extern_numpy_ptr(order),
+                extern_numpy_ptr(np.array(octant[order], dtype=np.int64)),
+                extern_numpy_ptr(children),
+                extern_numpy_ptr(M[lx-1]),
+                extern_numpy_ptr(self._yab),
+                extern_numpy_ptr(self._a),
+                extern_numpy_ptr(self._ar),
+                extern_numpy_ptr(self._ipower_mtm),
+                REAL(math.sqrt(3.) * 0.5 * e / 2**lx)
+            ))
+            self.timer_mtm.pause()
+
+    def _compute_wx(self, positions, charges, forces, potential, M, L):
+        # W and X lists, the multipole expansions of the cells C are sent to
+        # the ranks holding the particles of the leaves B and the local
+        # expansions formed from these particles are returned
+        self.timer_wx.start()
+        tree = self.adaptive_tree
+        ex, recv_pair, perm, group, run_start, centres = self._wx
+        ids, start, order, group_centres = self._groups
+
+        x_level = tree.x_level[recv_pair]
+        x_index = tree.x_index[recv_pair]
+        moments = ex.reverse(_gather(M, x_level, x_index, M[0].shape[1:]))
+        moments = np.ascontiguousarray(moments[perm, :])
+        local_moments = np.zeros_like(moments)
+
+        compute_pot = INT64(0) if potential is None else INT64(1)
+        pot_ptr = ctypes.byref(REAL(0)) if potential is None else \
+            _check_dtype(potential, REAL)
+        phi = REAL(0)
+
+        _check_err(self._lib['adaptive_m2p_p2l'](
+            INT64(self.L),
+            INT64(run_start.shape[0] - 1),
+            extern_numpy_ptr(run_start),
+            extern_numpy_ptr(group),
+            extern_numpy_ptr(start),
+            extern_numpy_ptr(order),
+            extern_numpy_ptr(centres),
+            extern_numpy_ptr(moments),
+            extern_numpy_ptr(local_moments),
+            _check_dtype(positions, REAL),
+            _check_dtype(charges, REAL),
+            _check_dtype(forces, REAL),
+            extern_numpy_ptr(self._ycoeff),
+            extern_numpy_ptr(self._a),
+            extern_numpy_ptr(self._ar),
+            extern_numpy_ptr(self._ipower_mtl),
+            compute_pot,
+            pot_ptr,
+            ctypes.byref(phi)
+        ))
+
+        rows = np.zeros_like(local_moments)
+        rows[perm, :] = local_moments
+        _scatter_add(L, x_level, x_index, ex(rows))
+        self.timer_wx.pause()
+        return phi.value
+
+    def _compute_periodic_boundary(self, M, L):
+        # lattice sum and dipole correction on the root cell
+        if self.free_space == '27' or self.free_space == True:
+            return
+        if M.shape[0] == 0:
+            return
+        moments = np.copy(M[0, :])
+        lexp = np.zeros_like(moments)
+        self._lr_mtl_func(moments, lexp)
+        self.dipole_corrector(moments, lexp)
+        L[0, :] += lexp
+
+    def _translate_down(self, L):
+        # local to local translations of the cells onto their children
+        self.timer_ltl.start()
+        tree = self.adaptive_tree
+        e = self.domain.extent[0]
+        for lx in range(1, self.R):
+            ex, parent_index, octant = tree.links[lx]
+            children = np.zeros((ex.nrecv,) + L[lx].shape[1:], dtype=REAL)
+            _check_err(self._lib['adaptive_ltl'](
+                INT64(self.L),
+                INT64(ex.nrecv),
+                extern_numpy_ptr(np.array(parent_index, dtype=np.int64)),
+                extern_numpy_ptr(np.array(octant, dtype=np.int64)),
+                extern_numpy_ptr(L[lx-1]),
+                extern_numpy_ptr(children),
+                extern_numpy_ptr(self._yab),
+                extern_numpy_ptr(self._a),
+                extern_numpy_ptr(self._ar),
+                extern_numpy_ptr(self._ipower_ltl),
+                REAL(math.sqrt(3.) * 0.5 * e / 2**lx)
+            ))
+            L[lx] += ex.reverse(children)
+        self.timer_ltl.pause()
+
+    def _compute_extraction(self, positions, charges, forces, potential, L):
+        # evaluate the local expansions of the leaves at the local particles
+        self.timer_extract.start()
+        ids, start, order, centres = self._groups
+        reg, reg_level, reg_index = self._leaves
+        local_moments = reg.reverse(_gather(L, reg_level, reg_index,
+                                            L[0].shape[1:]))
+
+        compute_pot = INT64(0) if potential is None else INT64(1)
+        pot_ptr = ctypes.byref(REAL(0)) if potential is None else \
+            _check_dtype(potential, REAL)
+        phi = REAL(0)
+
+        _check_err(self._lib['adaptive_l2p'](
+            INT64(self.L),
+            INT64(ids.shape[0]),
+            extern_numpy_ptr(start),
+            extern_numpy_ptr(order),
+            extern_numpy_ptr(centres),
+            extern_numpy_ptr(local_moments),
+            _check_dtype(positions, REAL),
+            _check_dtype(charges, REAL),
+            _check_dtype(forces, REAL),
+            extern_numpy_ptr(self._ycoeff),
+            extern_numpy_ptr(self._a),
+            extern_numpy_ptr(self._ar),
+            extern_numpy_ptr(self._ipower_ltl),
+            compute_pot,
+            pot_ptr,
+            ctypes.byref(phi)
+        ))
+        self.timer_extract.pause()
+        return phi.value
+
+    def _update_opt(self):
+        p = opt.PROFILE
+        b = self.__class__.__name__ + ':'
+        p[b+'num_levels'] = self.R
+        p[b+'num_terms'] = self.L
+        p[b+'num_cells'] = sum(cx.shape[0] for cx in self.adaptive_tree.cells)
+        p[b+'tree'] = self.timer_tree.time()
+        p[b+'contrib'] = self.timer_contrib.time()
+        p[b+'extract'] = self.timer_extract.time()
+        p[b+'mtm'] = self.timer_mtm.time()
+        p[b+'mtl'] = self.timer_mtl.time()
+        p[b+'ltl'] = self.timer_ltl.time()
+        p[b+'wx'] = self.timer_wx.time()
+        p[b+'local'] = self.timer_local.time()
+        p[b+'halo'] = self.timer_halo.time()
+        p[b+'exec_count'] = self.execution_count
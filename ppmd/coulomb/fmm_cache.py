@@ -0,0 +1,169 @@
+"""
+Persistent on-disk cache for FMM precomputation. Arrays are stored as ``.npy``
+files in the build directory and loaded as memory maps, hence a second
+construction with the same parameters avoids the Python loops, Wigner matrix
+computation and periodic lattice sums.
+"""
+
+from __future__ import division, print_function, absolute_import
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+import os
+import hashlib
+import shutil
+import numpy as np
+
+from ppmd import runtime, mpi, opt
+
+FMM_CACHE_VERSION = 1
+"""Increment when the cached quantities change to invalidate old entries."""
+
+_KEY_FILE = 'key.txt'
+
+
+class FMMCache(object):
+    """
+    Cache of named groups of numpy arrays keyed by the parameters they are
+    computed from. Rank 0 loads the group or computes and stores it, other
+    ranks then memory map the stored files. If the files are not visible to
+    every rank the arrays are broadcast from rank 0.
+
+    :arg comm: MPI communicator, all ranks must call :meth:`get` collectively.
+    :arg str directory: Cache directory, default ``fmm_cache`` in the build
+    directory.
+    :arg bool enabled: Use the disk cache, default runtime.FMM_CACHE. If False
+    the arrays are computed on each rank.
+    """
+
+    def __init__(self, comm=None, directory=None, enabled=None):
+        self.comm = comm if comm is not None else mpi.MPI.COMM_WORLD
+        if directory is None:
+            directory = os.path.join(runtime.BUILD_DIR, 'fmm_cache')
+        self.directory = directory
+        self.enabled = runtime.FMM_CACHE if enabled is None else enabled
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key_str(name, key):
+        return repr((FMM_CACHE_VERSION, str(name), tuple(key)))
+
+    def path(self, name, key):
+        """
+        :return: Directory that holds the arrays of group name with key.
+        """
+        h = hashlib.md5(self._key_str(name, key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, str(name) + '_' + h)
+
+    def _load(self, name, key):
+        path = self.path(name, key)
+        try:
+            with open(os.path.join(path, _KEY_FILE)) as fh:
+                if fh.read() != self._key_str(name, key):
+                    return None
+            arrays = {}
+            for fx in os.listdir(path):
+                if fx.endswith('.npy'):
+                    # copy on write such that the files are never modified
+                    arrays[fx[:-4]] = np.load(os.path.join(path, fx),
+                                              mmap_mode='c')
+            return arrays
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _store(self, name, key, arrays):
+        path = self.path(name, key)
+        tmp_path = path + '.tmp' + str(os.getpid())
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            os.mkdir(tmp_path)
+            for kx, vx in arrays.items():
+                np.save(os.path.join(tmp_path, kx + '.npy'),
+                        np.ascontiguousarray(vx))
+            # the key file marks the entry as complete
+            with open(os.path.join(tmp_path, _KEY_FILE), 'w') as fh:
+                fh.write(self._key_str(name, key))
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            # e.g. another process stored the entry first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def get(self, name, key, compute, collective=False):
+        """
+        Get a group of arrays, computing and storing them if required.
+
+        :arg str name: Name of the group.
+        :arg tuple key: Python scalars that determine the arrays.
+        :arg compute: Callable with no arguments returning a dict from str to
+        numpy array. Called on rank 0 only and must not be collective.
+        :arg bool collective: If True compute is called on all ranks on a
+        miss, e.g. for measurements, and the result of rank 0 is used.
+        :return: dict from str to numpy array, arrays loaded from disk are
+        memory maps which are copied on write.
+        """
+        if not self.enabled:
+            return compute()
+
+        t = opt.Timer(runtime.TIMER)
+        t.start()
+
+        rank = self.comm.Get_rank()
+
+        if collective:
+            arrays = self._load(name, key) if rank == 0 else None
+            if self.comm.bcast(arrays is None, root=0):
+                computed = compute()
+                if rank == 0:
+                    self.misses += 1
+                    self._store(name, key, computed)
+                    arrays = computed
+            elif rank == 0:
+                self.hits += 1
+            arrays = self.comm.bcast(
+                dict((kx, np.array(vx)) for kx, vx in arrays.items())
+                if rank == 0 else None, root=0
+            )
+            t.pause()
+            opt.PROFILE[self.__class__.__name__ + ':' + str(name) + ':get'] = \
+                t.time()
+            return arrays
+
+        arrays = None
+        if rank == 0:
+            arrays = self._load(name, key)
+            if arrays is None:
+                self.misses += 1
+                arrays = compute()
+                self._store(name, key, arrays)
+                # use the stored files such that all ranks share the pages
+                loaded = self._load(name, key)
+                if loaded is not None:
+                    arrays = loaded
+            else:
+                self.hits += 1
+            stored = os.path.exists(
+                os.path.join(self.path(name, key), _KEY_FILE))
+        else:
+            stored = None
+
+        stored = self.comm.bcast(stored, root=0)
+        if rank != 0 and stored:
+            arrays = self._load(name, key)
+
+        ok = 1 if arrays is not None else 0
+        if self.comm.allreduce(ok, op=mpi.MPI.MIN) == 0:
+            bcast_arrays = self.comm.bcast(
+                dict((kx, np.array(vx)) for kx, vx in arrays.items())
+                if rank == 0 else None, root=0
+            )
+            if arrays is None:
+                arrays = bcast_arrays
+
+        t.pause()
+        opt.PROFILE[self.__class__.__name__ + ':' + str(name) + ':get'] = \
+            t.time()
+
+        return arrays
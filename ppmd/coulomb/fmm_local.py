@@ -10,6 +10,7 @@ from ppmd.access import *
 from ppmd.data import ParticleDat
 
 import ctypes
+import itertools
 import os
 import numpy as np
 
@@ -32,9 +33,13 @@ def _check_dtype(arr, dtype):
 class FMMLocal(object):
     """
     Class to perform local part of fmm
+
+    :arg bool symmetric: If True each pair of particles is computed once and
+    the result applied to both particles. Neighbouring cells are processed
+    with a half stencil in a race free colouring of the cells under OpenMP.
     """
     def __init__(self, width, domain, entry_data, entry_map, free_space,
-            dtype, force_unit, energy_unit):
+            dtype, force_unit, energy_unit, symmetric=False):
 
         self.width = width
         self.domain = domain
@@ -42,6 +47,7 @@ class FMMLocal(object):
         self.entry_map = entry_map
         self.free_space = free_space
         self.dtype = dtype
+        self.symmetric = symmetric
 
         self.sh = pairloop.state_handler.StateHandler(state=None, shell_cutoff=width)
 
@@ -64,18 +70,31 @@ class FMMLocal(object):
         self._ll_array = np.zeros(1, dtype=INT64)
         self._ll_ccc_array = np.zeros(self._ncells, dtype=INT64)
 
-        bn = 10
-        self._tmp_n = bn
+        # per cell blocks for the symmetric mode, local cells padded by two
+        self._ncells_ext = int(np.prod(self._local_size + 4))
+        self._cell_start = np.zeros(self._ncells_ext + 1, dtype=INT64)
+        self._cell_nlocal = np.zeros(self._ncells_ext, dtype=INT64)
+        self._soa_n = 0
+        self._soa_id = np.zeros(1, dtype=INT64)
+        self._soa_p = np.zeros(3, dtype=REAL)
+        self._soa_q = np.zeros(1, dtype=REAL)
+        self._soa_f = np.zeros(3, dtype=REAL)
+        self._soa_u = np.zeros(1, dtype=REAL)
+
+        self._alloc_tmp(10)
+
+        self.exec_count = 0
+
+    def _alloc_tmp(self, bn):
         self._tmp_int_i = host.ThreadSpace(n=bn, dtype=INT64)
         self._tmp_int_j = host.ThreadSpace(n=bn, dtype=INT64)
-        self._tmp_real_pi = host.ThreadSpace(n=bn, dtype=REAL)
-        self._tmp_real_pj = host.ThreadSpace(n=bn, dtype=REAL)
+        self._tmp_real_pi = host.ThreadSpace(n=3*bn, dtype=REAL)
+        self._tmp_real_pj = host.ThreadSpace(n=3*bn, dtype=REAL)
         self._tmp_real_qi = host.ThreadSpace(n=bn, dtype=REAL)
         self._tmp_real_qj = host.ThreadSpace(n=bn, dtype=REAL)
-        self._tmp_real_fi = host.ThreadSpace(n=bn, dtype=REAL)
+        self._tmp_real_fi = host.ThreadSpace(n=3*bn, dtype=REAL)
         self._tmp_real_ui = host.ThreadSpace(n=bn, dtype=REAL)
-
-        self.exec_count = 0
+        self._tmp_n = bn
     
     def _build_lib(self, force_unit, energy_unit):
 
@@ -89,7 +108,10 @@ class FMMLocal(object):
             'SUB_ENERGY_UNIT': str(energy_unit)
         }
 
-        self._lib = build.simple_lib_creator(hpp, cpp, 'fmm_local')['local_cell_by_cell']       
+        lib = build.simple_lib_creator(hpp, cpp, 'fmm_local')
+        self._lib = lib['local_cell_by_cell']
+        self._lib_symmetric = lib['local_cell_by_cell_symmetric']
+        self._lib_leaf = lib['local_leaf_by_leaf']
 
 
     def __call__(self, positions, charges, forces, cells, potential=None):
@@ -151,16 +173,7 @@ class FMMLocal(object):
         
 
         if self._tmp_n < ncell*15:
-            bn = ncell*15 + 100
-            self._tmp_int_i = host.ThreadSpace(n=bn, dtype=INT64)
-            self._tmp_int_j = host.ThreadSpace(n=bn, dtype=INT64)
-            self._tmp_real_pi = host.ThreadSpace(n=3*bn, dtype=REAL)
-            self._tmp_real_pj = host.ThreadSpace(n=3*bn, dtype=REAL)
-            self._tmp_real_qi = host.ThreadSpace(n=bn, dtype=REAL)
-            self._tmp_real_qj = host.ThreadSpace(n=bn, dtype=REAL)
-            self._tmp_real_fi = host.ThreadSpace(n=3*bn, dtype=REAL)
-            self._tmp_real_ui = host.ThreadSpace(n=bn, dtype=REAL)
-            self._tmp_n = bn
+            self._alloc_tmp(ncell*15 + 100)
  
 
         #print("\ttmp_n", self._tmp_n, "nlocal", nlocal, "nhalo", nhalo, "max_cell", ncell)
@@ -179,8 +192,26 @@ class FMMLocal(object):
             free_space = 0
 
         exec_count = INT64(0)
-        
-        err = self._lib(
+
+        if self.symmetric:
+            err = self._call_symmetric(free_space, nlocal, ntotal, positions,
+                charges, forces, cells, compute_pot, pot_ptr, exec_count)
+        else:
+            err = self._call_cell_by_cell(free_space, nlocal, ntotal,
+                positions, charges, forces, cells, compute_pot, pot_ptr,
+                exec_count)
+
+        self.exec_count += exec_count.value
+
+        self.sh.post_execute(dats=dats)
+        if err < 0:
+            raise RuntimeError("Negative error code: {}".format(err))
+    
+        return self._u[0]
+
+    def _call_cell_by_cell(self, free_space, nlocal, ntotal, positions,
+            charges, forces, cells, compute_pot, pot_ptr, exec_count):
+        return self._lib(
             INT64(free_space),
             self.domain.extent.ctypes_data,
             self._global_size.ctypes.get_as_parameter(),
@@ -208,14 +239,228 @@ class FMMLocal(object):
             pot_ptr,
             ctypes.byref(exec_count)
         )
-        
+
+    def _call_symmetric(self, free_space, nlocal, ntotal, positions,
+            charges, forces, cells, compute_pot, pot_ptr, exec_count):
+        if self._soa_n < ntotal:
+            n = ntotal + 100
+            self._soa_id = np.zeros(n, dtype=INT64)
+            self._soa_p = np.zeros(3*n, dtype=REAL)
+            self._soa_q = np.zeros(n, dtype=REAL)
+            self._soa_f = np.zeros(3*n, dtype=REAL)
+            self._soa_u = np.zeros(n, dtype=REAL)
+            self._soa_n = n
+
+        return self._lib_symmetric(
+            INT64(free_space),
+            self.domain.extent.ctypes_data,
+            self._global_size.ctypes.get_as_parameter(),
+            self._local_size.ctypes.get_as_parameter(),
+            self._local_offset.ctypes.get_as_parameter(),
+            INT64(runtime.NUM_THREADS),
+            INT64(nlocal),
+            INT64(ntotal),
+            self.sh.get_pointer(positions(READ)),
+            self.sh.get_pointer(charges(READ)),
+            self.sh.get_pointer(cells(READ)),
+            self.sh.get_pointer(forces(INC)),
+            self._u.ctypes.get_as_parameter(),
+            self._ll_array.ctypes.get_as_parameter(),
+            self._ll_ccc_array.ctypes.get_as_parameter(),
+            self._cell_start.ctypes.get_as_parameter(),
+            self._cell_nlocal.ctypes.get_as_parameter(),
+            self._soa_id.ctypes.get_as_parameter(),
+            self._soa_p.ctypes.get_as_parameter(),
+            self._soa_q.ctypes.get_as_parameter(),
+            self._soa_f.ctypes.get_as_parameter(),
+            self._soa_u.ctypes.get_as_parameter(),
+            compute_pot,
+            pot_ptr,
+            ctypes.byref(exec_count)
+        )
+
+
+_OFFSETS = np.array(list(itertools.product((-1, 0, 1), repeat=3)),
+                    dtype=INT64)
+
+
+class FMMLocalLeaves(FMMLocal):
+    """
+    Class to perform the direct interactions between the adjacent leaves of
+    an adaptive octal tree, the U lists of the adaptive fmm. The leaf of a
+    particle is given by its finest level cell and its leaf level, the halo
+    particles form the leaves of the neighbouring subdomains and of the
+    periodic images.
+
+    :arg width: Halo width, at least the sum of the widths of two adjacent
+    leaves.
+    :arg int num_levels: Number of levels in the octal tree.
+    """
+    def __init__(self, width, domain, num_levels, free_space, dtype,
+            force_unit, energy_unit):
+
+        self.width = width
+        self.domain = domain
+        self.num_levels = num_levels
+        self.free_space = free_space
+        self.dtype = dtype
+        self.symmetric = False
+
+        self.sh = pairloop.state_handler.StateHandler(state=None,
+                                                      shell_cutoff=width)
+        self._build_lib(force_unit, energy_unit)
+
+        self._u = np.zeros(1, dtype=self.dtype)
+        self._alloc_tmp(10)
+
+        self.exec_count = 0
+
+    def __call__(self, positions, charges, forces, cells, leaves,
+                 potential=None):
+        """
+        :arg cells: ParticleDat of the finest level cells of the particles.
+        :arg leaves: ParticleDat of the leaf levels of the particles.
+        """
+        dats = {
+            'p': positions(READ),
+            'q': charges(READ),
+            'f': forces(INC),
+            'c': cells(READ),
+            'l': leaves(READ)
+        }
+        if potential is not None and \
+                issubclass(type(potential), ParticleDat):
+            dats['u'] = potential(INC_ZERO)
+            assert potential[:].shape[0] >= positions.npart_local
+        elif potential is not None:
+            assert potential.shape[0] * potential.shape[1] >= \
+                    positions.npart_local
+
+        self._u[0] = 0.0
+
+        nlocal, nhalo, ncell = self.sh.pre_execute(dats=dats)
+        ntotal = nlocal + nhalo
+
+        compute_pot = INT64(0)
+        dummy_real = REAL(0)
+        pot_ptr = ctypes.byref(dummy_real)
+        if potential is not None:
+            compute_pot.value = 1
+            pot_ptr = potential.ctypes_data
+
+        target_leaf, target_start, source_leaf, leaf_start, \
+            leaf_particles = self._leaf_lists(nlocal, ntotal, positions,
+                                              cells, leaves)
+
+        nmax = int(np.max(np.diff(leaf_start), initial=0))
+        if self._tmp_n < nmax:
+            self._alloc_tmp(nmax + 100)
+
+        exec_count = INT64(0)
+        err = self._lib_leaf(
+            INT64(runtime.NUM_THREADS),
+            INT64(nlocal),
+            INT64(target_leaf.shape[0]),
+            target_leaf.ctypes.get_as_parameter(),
+            target_start.ctypes.get_as_parameter(),
+            source_leaf.ctypes.get_as_parameter(),
+            leaf_start.ctypes.get_as_parameter(),
+            leaf_particles.ctypes.get_as_parameter(),
+            self.sh.get_pointer(positions(READ)),
+            self.sh.get_pointer(charges(READ)),
+            self.sh.get_pointer(forces(INC)),
+            self._u.ctypes.get_as_parameter(),
+            self._tmp_int_i.ctypes_data,
+            self._tmp_int_j.ctypes_data,
+            self._tmp_real_pi.ctypes_data,
+            self._tmp_real_pj.ctypes_data,
+            self._tmp_real_qi.ctypes_data,
+            self._tmp_real_qj.ctypes_data,
+            self._tmp_real_fi.ctypes_data,
+            self._tmp_real_ui.ctypes_data,
+            compute_pot,
+            pot_ptr,
+            ctypes.byref(exec_count)
+        )
+
         self.exec_count += exec_count.value
 
         self.sh.post_execute(dats=dats)
         if err < 0:
             raise RuntimeError("Negative error code: {}".format(err))
-    
-        return self._u[0]
-
 
+        return self._u[0]
 
+    def _leaf_lists(self, nlocal, ntotal, positions, cells, leaves):
+        # Group the particles by leaf and find the pairs of adjacent leaves.
+        # Halo particles are placed in the leaves of their periodic image.
+        R = self.num_levels
+        ns = 2 ** (R - 1)
+        e = self.domain.extent[0]
+
+        c = cells[:ntotal:, 0]
+        level = np.array(leaves[:ntotal:, 0], dtype=INT64)
+        cell = np.stack((c // (ns*ns), (c // ns) % ns, c % ns), axis=1)
+        centre = (cell[:, ::-1] + 0.5) * (e / ns) - 0.5 * e
+        shift = np.array(np.rint((positions[:ntotal:, :] - centre) / e),
+                         dtype=INT64)[:, ::-1]
+        shift[:nlocal:, :] = 0
+
+        keep = np.ones(ntotal, dtype=np.bool_)
+        if self.free_space == True:
+            keep = np.all(shift == 0, axis=1)
+        p = np.flatnonzero(keep)
+        b = np.right_shift(cell[p, :] + ns * shift[p, :],
+                           (R - 1 - level[p]).reshape(-1, 1))
+        key = self._leaf_key(level[p], b)
+
+        order = np.argsort(key, kind='stable')
+        leaf_particles = np.array(p[order], dtype=INT64)
+        keys, first = np.unique(key[order], return_index=True)
+        leaf_start = np.append(first, p.shape[0]).astype(INT64)
+        leaf_level = level[leaf_particles[first]]
+        leaf_cell = b[order[first], :]
+
+        counts = np.diff(leaf_start)
+        is_local = np.zeros(keys.shape[0], dtype=np.bool_)
+        is_local[np.repeat(np.arange(keys.shape[0]), counts)[
+            leaf_particles < nlocal]] = True
+
+        # adjacent leaves, the coarser leaf is found from the 27 cells around
+        # the ancestor of the finer leaf on its level
+        pairs = [np.zeros(0, dtype=INT64)]
+        nleaf = keys.shape[0]
+        for lx in np.unique(leaf_level):
+            fine = np.flatnonzero(leaf_level >= lx)
+            s = (leaf_level[fine] - lx).reshape(-1, 1)
+            a = np.right_shift(leaf_cell[fine, :], s).reshape(-1, 1, 3) + \
+                _OFFSETS.reshape(1, -1, 3)
+            a = a.reshape(-1, 3)
+            s = np.repeat(s, _OFFSETS.shape[0], axis=0)
+            f = np.repeat(fine, _OFFSETS.shape[0])
+            k = self._leaf_key(np.zeros(a.shape[0], dtype=INT64) + lx, a)
+            ix = np.minimum(np.searchsorted(keys, k), nleaf - 1)
+            found = (keys[ix] == k) & np.all(
+                (np.left_shift(a, s) - 1 <= leaf_cell[f, :]) &
+                (leaf_cell[f, :] <= np.left_shift(a + 1, s)), axis=1)
+            pairs.append(ix[found] * nleaf + f[found])
+            pairs.append(f[found] * nleaf + ix[found])
+
+        pairs = np.unique(np.concatenate(pairs))
+        target = pairs // nleaf
+        pairs = pairs[is_local[target]]
+        target = pairs // nleaf
+
+        target_leaf, first = np.unique(target, return_index=True)
+        target_start = np.append(first, pairs.shape[0]).astype(INT64)
+        source_leaf = np.array(pairs % nleaf, dtype=INT64)
+
+        return np.array(target_leaf, dtype=INT64), target_start, \
+            source_leaf, leaf_start, leaf_particles
+
+    def _leaf_key(self, level, b):
+        # unique key of the leaf on level with (z, y, x) cell b, the cells of
+        # periodic images are in [-n, 2n) on a level with n cells per side
+        n3 = 3 * 2 ** (self.num_levels - 1)
+        b = b + 2 ** level.reshape(-1, 1)
+        return ((level*n3 + b[:, 0])*n3 + b[:, 1])*n3 + b[:, 2]
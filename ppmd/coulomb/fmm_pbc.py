@@ -10,6 +10,7 @@ from ppmd import runtime
 from ppmd.lib import build
 from ppmd.coulomb.octal import shell_iterator
 from ppmd.coulomb.sph_harm import SphGen, LocalExpEval
+from ppmd.coulomb.fmm_cache import FMMCache
 
 import ctypes
 import os
@@ -81,7 +82,7 @@ class LongRangeMTL:
         self.domain = domain
 
         _pbc_tool = FMMPbc(self.L, 10.**-10, domain, REAL, exclude_tuples)
-        _rvec = _pbc_tool.compute_f() + _pbc_tool.compute_g()
+        _rvec = _pbc_tool.cached_boundary_terms()
 
         self.ncomp = 2*(L**2)
         self.half_ncomp = L**2
@@ -293,6 +294,30 @@ class FMMPbc(object):
     def im_lm(self, l,m): return (l**2) + l +  m + self.L**2
 
 
+    def cached_boundary_terms(self, cache=None):
+        """
+        Return compute_f() + compute_g() from the on-disk FMM cache, the
+        lattice sums are only evaluated if the terms have not been stored
+        for this L, eps, extent and set of excluded images. Collective on the
+        communicator of the domain.
+
+        :arg cache: FMMCache instance to use, by default a new instance.
+        """
+        if cache is None:
+            cache = FMMCache(getattr(self.domain, 'comm', None))
+        key = (
+            self.L,
+            float(self.eps),
+            tuple(float(ex) for ex in self.domain.extent),
+            repr(sorted(tuple(tx) for tx in self.exclude_tuples)),
+            str(self.dtype)
+        )
+        return cache.get(
+            'pbc', key,
+            lambda: {'terms': self.compute_f() + self.compute_g()}
+        )['terms']
+
+
     @staticmethod
     def _cart_to_sph(xyz):
         dx = xyz[0]; dy = xyz[1]; dz = xyz[2]
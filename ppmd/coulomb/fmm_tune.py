@@ -0,0 +1,294 @@
+"""
+Cost model based selection of the number of octal tree levels R, the number
+of expansion terms L and the number of levels translated on a CUDA device
+for PyFMM. The cost of each stage is measured once on the current machine
+with a small calibration problem, cached on disk with FMMCache, and used to
+predict the time per call of candidate configurations.
+"""
+
+from __future__ import division, print_function, absolute_import
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+import ctypes
+import socket
+from math import log, ceil
+import numpy as np
+
+from ppmd import runtime, opt, mpi, state, domain, data
+from ppmd.cuda import CUDA_IMPORT
+from ppmd.coulomb.fmm import PyFMM, _mtlz_cost_per_cell
+from ppmd.coulomb.fmm_cache import FMMCache
+
+FMM_TUNE_VERSION = 1
+"""Increment when the cost model changes to discard old calibrations."""
+
+_COSTS = ('p2p', 'p2m', 'm2m', 'm2l', 'comm', 'm2l_cuda')
+
+_TIMERS = ('timer_contrib', 'timer_contrib_mpi', 'timer_extract',
+           'timer_extract_mpi', 'timer_mtm', 'timer_mtl', 'timer_ltl',
+           'timer_local', 'timer_halo', 'timer_down', 'timer_up')
+
+
+class FMMCostModel(object):
+    """
+    Per operation costs of the FMM stages on this machine. The time of a call
+    is modelled as
+
+    * near field: ``p2p`` per pair of particles in neighbouring cells,
+    * particle to multipole and local to particle: ``p2m`` per particle per
+      expansion term,
+    * multipole to multipole and local to local: ``m2m`` per cell per L^4,
+    * multipole to local: ``m2l`` per floating point operation of the
+      rotation based translation, 189 translations per cell,
+    * halo exchange and tree redistribution: ``comm`` per expansion term per
+      surface cell of each level.
+
+    Levels computed on a CUDA device use ``m2l_cuda`` and overlap with the
+    host translations.
+
+    The relative error of a configuration is modelled as ``(R - 2) * 2^-L``,
+    the worst case sum over the levels with multipole to local translations
+    of the truncation error PyFMM assumes when it derives L from eps.
+
+    :arg comm: MPI communicator the FMM will use.
+    :arg int n: Number of particles per rank in the calibration problem.
+    :arg int r: Number of levels of the calibration problem.
+    :arg int l: Number of expansion terms of the calibration problem.
+    :arg int ncall: Number of timed calls, after one untimed call.
+    :arg cache: FMMCache used to store calibrations, by default a new
+    instance, pass an instance with enabled=False to always measure.
+    """
+
+    def __init__(self, comm=None, n=4000, r=4, l=12, ncall=2, cache=None):
+        self.comm = comm if comm is not None else mpi.MPI.COMM_WORLD
+        self.nproc = self.comm.Get_size()
+        self.nthreads = runtime.NUM_THREADS
+        self._calib = (int(n), int(r), int(l), int(ncall))
+        self._cache = cache if cache is not None else FMMCache(self.comm)
+        self.costs = None
+        """dict from stage name to cost per operation in seconds."""
+
+    def _key(self):
+        return (FMM_TUNE_VERSION, socket.gethostname(), self.nproc,
+                self.nthreads, bool(CUDA_IMPORT)) + self._calib
+
+    def calibrate(self):
+        """
+        Load the calibration for this machine, rank count and thread count,
+        measuring it if required. Collective on the communicator.
+
+        :return: dict from stage name to cost per operation.
+        """
+        arrays = self._cache.get('calibration', self._key(), self._measure,
+                                 collective=True)
+        self.costs = dict(zip(_COSTS, (float(cx) for cx in arrays['costs'])))
+        return self.costs
+
+    def _local_cells(self, r):
+        # cells of levels 1, .., r-1 owned by a rank
+        return [int(ceil(8.**lx / self.nproc)) for lx in range(1, r)]
+
+    def _counts(self, n, r, l):
+        """
+        Operation counts of each stage per rank for n particles in total.
+        """
+        cells = self._local_cells(r)
+        nlocal = float(n) / self.nproc
+        per_cell = float(n) / (8.**(r - 1))
+        return {
+            'p2p': nlocal * (27. * per_cell),
+            'p2m': nlocal * (l**2),
+            'm2m': float(sum(cells)) * (l**4),
+            'm2l': [189. * _mtlz_cost_per_cell(l) * cx for cx in cells],
+            'comm': float(sum(cx**(2./3.) for cx in cells)) * (l**2)
+        }
+
+    def _measure(self):
+        n, r, l, ncall = self._calib
+        N = n * self.nproc
+        E = 10.
+
+        A = state.State()
+        A.domain = domain.BaseDomainHalo(extent=(E, E, E), comm=self.comm)
+        A.domain.boundary_condition = domain.BoundaryTypePeriodic()
+        A.npart = N
+        A.P = data.PositionDat(ncomp=3)
+        A.Q = data.ParticleDat(ncomp=1)
+        A.F = data.ParticleDat(ncomp=3)
+
+        rng = np.random.RandomState(seed=9184)
+        A.P[:] = rng.uniform(low=-0.4999*E, high=0.4999*E, size=(N, 3))
+        A.Q[:] = rng.uniform(low=-1.0, high=1.0, size=(N, 1))
+        A.npart_local = N
+        A.filter_on_domain_boundary()
+
+        fmm = PyFMM(domain=A.domain, r=r, l=l, free_space=False)
+        # the calibration is timed regardless of the runtime timer level
+        for tx in _TIMERS:
+            setattr(fmm, tx, opt.Timer(1))
+
+        fmm(A.P, A.Q, forces=A.F)
+        t0 = dict((tx, getattr(fmm, tx).time()) for tx in _TIMERS)
+        for cx in range(ncall):
+            fmm(A.P, A.Q, forces=A.F)
+        t = dict((tx, (getattr(fmm, tx).time() - t0[tx]) / ncall)
+                 for tx in _TIMERS)
+
+        fmm.free()
+
+        cuda_time = 0.0
+        if CUDA_IMPORT:
+            # translate every level on the device
+            fmm = PyFMM(domain=A.domain, r=r, l=l, free_space=False,
+                        cuda=True, cuda_levels=r-1)
+            fmm._cuda_mtl.timer_mtl = opt.Timer(1)
+            fmm(A.P, A.Q, forces=A.F)
+            c0 = fmm._cuda_mtl.timer_mtl.time()
+            for cx in range(ncall):
+                fmm(A.P, A.Q, forces=A.F)
+            cuda_time = (fmm._cuda_mtl.timer_mtl.time() - c0) / ncall
+            fmm.free()
+
+        times = np.array((
+            t['timer_local'],
+            t['timer_contrib'] + t['timer_extract'],
+            t['timer_mtm'] + t['timer_ltl'],
+            t['timer_mtl'],
+            t['timer_halo'] + t['timer_up'] + t['timer_down'] +
+            t['timer_contrib_mpi'] + t['timer_extract_mpi'],
+            cuda_time
+        ))
+        # the slowest rank determines the time of a call
+        times_max = np.zeros_like(times)
+        self.comm.Allreduce(times, times_max, mpi.MPI.MAX)
+        times = times_max
+
+        counts = self._counts(N, r, l)
+        costs = np.zeros(len(_COSTS), dtype=ctypes.c_double)
+        costs[0] = times[0] / counts['p2p']
+        costs[1] = times[1] / counts['p2m']
+        costs[2] = times[2] / counts['m2m']
+        costs[3] = times[3] / sum(counts['m2l'])
+        costs[4] = times[4] / counts['comm']
+        # without a device assume device translations cost as much as host
+        # translations, such configurations are only selected with cuda=True
+        costs[5] = times[5] / sum(counts['m2l']) if times[5] > 0.0 else \
+            costs[3]
+        return {'costs': costs}
+
+    def predict(self, n, r, l, cuda_levels=0):
+        """
+        Predict the time per call in seconds.
+
+        :arg int n: Total number of particles.
+        :arg int r: Number of levels in the octal tree.
+        :arg int l: Number of expansion terms.
+        :arg int cuda_levels: Number of finest levels translated on a CUDA
+        device.
+        :return: dict from stage name to predicted time and 'total'.
+        """
+        if self.costs is None:
+            self.calibrate()
+        c = self.costs
+        counts = self._counts(n, r, l)
+
+        # counts['m2l'] is ordered from level 1 to level r-1
+        host_levels = r - 1 - cuda_levels
+        m2l_host = c['m2l'] * sum(counts['m2l'][:host_levels])
+        m2l_cuda = c['m2l_cuda'] * sum(counts['m2l'][host_levels:])
+
+        t = {
+            'p2p': c['p2p'] * counts['p2p'],
+            'p2m': c['p2m'] * counts['p2m'],
+            'm2m': c['m2m'] * counts['m2m'],
+            'm2l': max(m2l_host, m2l_cuda),
+            'comm': c['comm'] * counts['comm']
+        }
+        t['total'] = sum(t.values())
+        return t
+
+    @staticmethod
+    def error(r, l):
+        """
+        Predict the relative error.
+
+        :arg int r: Number of levels in the octal tree.
+        :arg int l: Number of expansion terms.
+        :return: Predicted relative error.
+        """
+        return (r - 2) * 2.**(-1*l)
+
+    def select(self, n, eps=None, l=None, cuda=False, r_range=None,
+               l_range=None):
+        """
+        Select the cheapest configuration for the requested accuracy.
+
+        :arg int n: Total number of particles.
+        :arg float eps: Requested relative accuracy, candidates with a larger
+        predicted error are rejected.
+        :arg int l: Number of expansion terms, overrides eps.
+        :arg bool cuda: Consider translating levels on a CUDA device.
+        :arg r_range: Iterable of candidate numbers of levels.
+        :arg l_range: Iterable of candidate numbers of expansion terms.
+        :return: Tuple (R, L, cuda_levels, predicted time per call).
+        """
+        if r_range is None:
+            r_range = range(3, max(int(log(n, 8)), 3) + 3)
+
+        if l is not None:
+            l_range = (int(l),)
+        else:
+            assert eps is not None
+            if l_range is None:
+                l_range = range(2, int(ceil(-1*log(eps, 2) +
+                                            log(max(r_range), 2))) + 2)
+
+        best = None
+        for rx in r_range:
+            for lx in l_range:
+                if l is None and self.error(rx, lx) > eps:
+                    continue
+                cuda_range = range(1, rx) if cuda else (0,)
+                for cx in cuda_range:
+                    tx = self.predict(n, rx, lx, cx)['total']
+                    if best is None or tx < best[3]:
+                        best = (rx, lx, cx, tx)
+
+        if best is None:
+            raise RuntimeError('No candidate configuration meets the ' +
+                               'requested accuracy.')
+        return best
+
+
+def tuned_fmm(domain, N, eps=None, l=None, model=None, cuda=False, **kwargs):
+    """
+    Construct the PyFMM instance the cost model predicts to be the fastest
+    for N particles. Collective on the communicator of the domain.
+
+    :arg domain: Cubic domain as passed to PyFMM.
+    :arg int N: Total number of particles.
+    :arg float eps: Requested relative accuracy.
+    :arg int l: Number of expansion terms, overrides eps.
+    :arg model: FMMCostModel to use, by default a calibrated model for the
+    communicator of the domain.
+    :arg bool cuda: Allow translations on a CUDA device.
+    :return: PyFMM instance, the prediction is stored as the attribute
+    ``predicted_time``.
+    """
+    if model is None:
+        model = FMMCostModel(domain.comm)
+    R, L, cuda_levels, t = model.select(N, eps=eps, l=l, cuda=cuda)
+
+    fmm = PyFMM(domain=domain, N=N, eps=eps, r=R, l=L, cuda=cuda,
+                cuda_levels=max(cuda_levels, 1), **kwargs)
+    fmm.predicted_time = t
+
+    p = opt.PROFILE
+    b = 'tuned_fmm:'
+    p[b+'num_levels'] = R
+    p[b+'num_terms'] = L
+    p[b+'cuda_levels'] = cuda_levels
+    p[b+'predicted_time'] = t
+    return fmm
@@ -0,0 +1,555 @@
+"""
+Electrostatic energy differences for single particle moves, e.g. for Monte
+Carlo, with the Ewald and fast multipole methods. The state required to
+evaluate a proposed move, the structure factors (Ewald) or the multipole
+expansions of the cells of the octal tree (FMM), is computed once and
+updated when a move is accepted.
+
+No particle data is gathered. Each rank holds copies of its local particles
+and, for the FMM, updates the multipole expansions of the cells it owns in
+the PyFMM octal tree. The methods propose, accept and reject are collective
+over the communicator of the domain and must be called with the same
+arguments on every rank. Particle indices refer to the ordering of the local
+particles of rank 0 followed by the local particles of rank 1 etc. On one
+rank this is the local ordering.
+"""
+
+from __future__ import division, print_function, absolute_import
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+import itertools
+from math import sqrt, factorial
+import numpy as np
+from scipy.special import erfc
+
+from ppmd import opt, runtime
+
+
+class CellBins(object):
+    """
+    Particles binned into a regular grid of cells over a domain centred on
+    the origin, for lookups of the particles in the 27 cells around a point.
+
+    :arg extent: Domain extent.
+    :arg int ncell: Number of cells per side.
+    :arg positions: Array (N, 3) of positions, a copy is held.
+    :arg bool periodic: Wrap neighbouring cells periodically.
+    """
+
+    def __init__(self, extent, ncell, positions, periodic=True):
+        self.extent = np.array(extent[:3], dtype=np.float64)
+        self.ncell = max(int(ncell), 1)
+        self.periodic = periodic
+        self.positions = np.array(positions, dtype=np.float64).reshape(-1, 3)
+        """Array (N, 3) of current positions."""
+
+        self._cells = {}
+        self._cell_of = np.zeros(self.positions.shape[0], dtype=np.int64)
+        for ix in range(self.positions.shape[0]):
+            cx = self._flat(self.cell(self.positions[ix, :]))
+            self._cell_of[ix] = cx
+            self._cells.setdefault(cx, []).append(ix)
+
+        self._offsets = np.array(
+            tuple(itertools.product((-1, 0, 1), repeat=3)), dtype=np.int64)
+
+    def cell(self, x, ncell=None):
+        """
+        :return: Cell index tuple of the point x.
+        """
+        ncell = self.ncell if ncell is None else ncell
+        c = np.floor((np.array(x) + 0.5*self.extent) * ncell / self.extent)
+        return np.clip(c.astype(np.int64), 0, ncell - 1)
+
+    def _flat(self, c):
+        return int((c[2]*self.ncell + c[1])*self.ncell + c[0])
+
+    def neighbours(self, x):
+        """
+        Particles in the cells around the point x. For fewer than three
+        cells per side the periodic images of a cell are distinct
+        neighbours.
+
+        :return: Tuple (indices, shifts), the particle positions plus shifts
+        are the images in the cells around x.
+        """
+        src = self.cell(x) + self._offsets
+        if self.periodic:
+            wrap = np.floor_divide(src, self.ncell)
+            src -= wrap * self.ncell
+        else:
+            keep = np.all((src >= 0) & (src < self.ncell), axis=1)
+            src = src[keep, :]
+            wrap = np.zeros_like(src)
+
+        idx = []
+        shift = []
+        for sx, wx in zip(src, wrap):
+            members = self._cells.get(self._flat(sx), ())
+            idx.extend(members)
+            shift.extend([wx * self.extent] * len(members))
+        return np.array(idx, dtype=np.int64), \
+            np.array(shift, dtype=np.float64).reshape(len(idx), 3)
+
+    def move(self, i, x):
+        """
+        Move particle i to the point x.
+        """
+        cx = self._flat(self.cell(x))
+        if cx != self._cell_of[i]:
+            self._cells[self._cell_of[i]].remove(i)
+            self._cells.setdefault(cx, []).append(i)
+            self._cell_of[i] = cx
+        self.positions[i, :] = x
+
+    def wrap(self, x):
+        """
+        :return: The point x mapped into the domain if periodic.
+        """
+        x = np.array(x, dtype=np.float64)
+        if self.periodic:
+            x = np.mod(x + 0.5*self.extent, self.extent) - 0.5*self.extent
+        elif np.any(np.abs(x) > 0.5*self.extent):
+            raise RuntimeError('Position outside the domain.')
+        return x
+
+
+class _Harmonics(object):
+    """
+    Vectorised multipole and local expansions with the conventions of
+    PyFMM, coefficients are indexed with (l**2) + l + m for the real part
+    and offset by L**2 for the imaginary part.
+    """
+
+    def __init__(self, L):
+        self.L = L
+        nm = [(nx, mx) for nx in range(L) for mx in range(-nx, nx+1)]
+        self._n = np.array([nx for nx, mx in nm], dtype=np.float64)
+        self._m = np.array([mx for nx, mx in nm], dtype=np.float64)
+        self._h = np.array([sqrt(float(factorial(nx - abs(mx))) /
+                                 factorial(nx + abs(mx))) for nx, mx in nm])
+
+    def _legendre(self, ct):
+        # P_n^{|m|}(ct) with the Condon-Shortley phase of scipy.special.lpmv
+        L = self.L
+        st = np.sqrt(np.maximum(1.0 - ct*ct, 0.0))
+        out = np.zeros((ct.shape[0], L*L))
+        pmm = np.ones_like(ct)
+        for mx in range(L):
+            if mx > 0:
+                pmm = -(2*mx - 1) * st * pmm
+            p2 = pmm
+            p1 = ct * (2*mx + 1) * pmm
+            for nx in range(mx, L):
+                if nx == mx:
+                    p = pmm
+                elif nx == mx + 1:
+                    p = p1
+                else:
+                    p = ((2*nx - 1) * ct * p1 - (nx + mx - 1) * p2) / (nx - mx)
+                    p2 = p1
+                    p1 = p
+                out[:, nx*nx + nx + mx] = p
+                out[:, nx*nx + nx - mx] = p
+        return out
+
+    def _sph(self, d):
+        d = np.atleast_2d(d)
+        r = np.linalg.norm(d, axis=1)
+        ct = np.where(r > 0.0, d[:, 2] / np.where(r > 0.0, r, 1.0), 1.0)
+        phi = np.arctan2(d[:, 1], d[:, 0])
+        return r, self._legendre(ct) * self._h, phi
+
+    def p2m(self, d, q):
+        """
+        :return: Array (n, 2L^2) of the multipole expansions about the origin
+        of the charges q at the points d.
+        """
+        r, hp, phi = self._sph(d)
+        c = np.atleast_1d(q)[:, None] * (r[:, None] ** self._n) * hp
+        mphi = self._m * phi[:, None]
+        return np.hstack((c * np.cos(mphi), -1.0 * c * np.sin(mphi)))
+
+    def m2p(self, M, d):
+        """
+        :return: Potential at the points d of the multipole expansions M
+        (n, 2L^2) about the origin, summed over the points.
+        """
+        r, hp, phi = self._sph(d)
+        c = (r[:, None] ** (-1.0 - self._n)) * hp
+        mphi = self._m * phi[:, None]
+        L2 = self.L * self.L
+        return np.sum(M[:, :L2] * c * np.cos(mphi) -
+                      M[:, L2:] * c * np.sin(mphi))
+
+    def l2p(self, M, d):
+        """
+        :return: Potential at the point d of the local expansion M about the
+        origin.
+        """
+        r, hp, phi = self._sph(d)
+        c = (r[:, None] ** self._n) * hp
+        mphi = self._m * phi[:, None]
+        L2 = self.L * self.L
+        return np.sum(M[:L2] * c * np.cos(mphi) - M[L2:] * c * np.sin(mphi))
+
+
+class _Incremental(object):
+    """
+    Common propose/accept bookkeeping. Subclasses create self._bins from the
+    local positions and implement _propose and _accept, which return and
+    apply the contribution of this rank.
+    """
+
+    def __init__(self, comm, positions, charges):
+        self.comm = comm
+        n = positions.npart_local
+        self.positions = np.array(positions[:n:, :], dtype=np.float64)
+        """Current positions (n, 3) of the local particles."""
+        self.charges = np.array(charges[:n:, 0], dtype=np.float64)
+        """Charges (n,) of the local particles."""
+        self.offsets = np.cumsum([0] + comm.allgather(n))
+        """Index of the first particle of each rank, the last entry is the
+        total number of particles."""
+        self._rank = comm.Get_rank()
+        self._proposal = None
+        self.timer_propose = opt.Timer(runtime.TIMER)
+        self.timer_accept = opt.Timer(runtime.TIMER)
+
+    def _owner(self, i):
+        if i < 0 or i >= self.offsets[-1]:
+            raise RuntimeError('Particle index {} out of range.'.format(i))
+        rank = int(np.searchsorted(self.offsets, i, side='right')) - 1
+        return rank, i - int(self.offsets[rank])
+
+    def _broadcast_particle(self, i):
+        rank, ix = self._owner(i)
+        xq = np.zeros(4, dtype=np.float64)
+        if rank == self._rank:
+            xq[:3] = self.positions[ix, :]
+            xq[3] = self.charges[ix]
+        self.comm.Bcast(xq, root=rank)
+        # local index of the particle, -1 on the other ranks
+        ix = ix if rank == self._rank else -1
+        return ix, xq[:3], xq[3]
+
+    def get_position(self, i):
+        """
+        Current position of particle i, collective.
+
+        :arg int i: Particle index.
+        :return: Array (3,) on all ranks.
+        """
+        return self._broadcast_particle(int(i))[1]
+
+    def propose(self, i, position):
+        """
+        Energy difference if particle i is moved to position, collective.
+
+        :arg int i: Particle index.
+        :arg position: New position, wrapped into periodic domains.
+        :return: Energy difference.
+        """
+        self.timer_propose.start()
+        y = self._bins.wrap(position)
+        ix, x, q = self._broadcast_particle(int(i))
+        de, state = self._propose(ix, x, q, y)
+        self._proposal = (ix, x, q, y, state)
+        de = self.comm.allreduce(de)
+        self.timer_propose.pause()
+        opt.PROFILE[self.__class__.__name__ + ':propose'] = \
+            self.timer_propose.time()
+        return de
+
+    def accept(self):
+        """
+        Apply the last proposed move to the cached state, collective.
+        """
+        if self._proposal is None:
+            raise RuntimeError('No move has been proposed.')
+        self.timer_accept.start()
+        ix, x, q, y, state = self._proposal
+        self._accept(x, q, y, state)
+        if ix > -1:
+            self._bins.move(ix, y)
+        self._proposal = None
+        self.timer_accept.pause()
+        opt.PROFILE[self.__class__.__name__ + ':accept'] = \
+            self.timer_accept.time()
+
+    def reject(self):
+        """
+        Discard the last proposed move.
+        """
+        self._proposal = None
+
+
+class EwaldIncremental(_Incremental):
+    """
+    Energy differences of single particle moves for EwaldOrthoganal. The
+    structure factors of the reciprocal vectors in a half space are reduced
+    over all ranks and held on each rank, a proposal costs O(k^3) plus the
+    real space sum over the local particles in the neighbouring cells, an
+    accepted move O(k^3).
+
+    :arg ewald: EwaldOrthoganal instance.
+    :arg positions: PositionDat.
+    :arg charges: ParticleDat of charges.
+    """
+
+    def __init__(self, ewald, positions, charges):
+        _Incremental.__init__(self, ewald.domain.comm, positions, charges)
+
+        extent = ewald.domain.extent
+        nmax = ewald.kmax
+        g = np.array([ewald.recip_vectors[dx][dx] for dx in range(3)])
+        max_recip2 = ewald.recip_cutoff ** 2
+
+        # reciprocal vectors in a half space
+        kk = np.array(tuple(itertools.product(
+            range(-nmax[0], nmax[0]+1),
+            range(-nmax[1], nmax[1]+1),
+            range(0, nmax[2]+1)
+        )), dtype=np.float64)
+        half = (kk[:, 2] > 0) | ((kk[:, 2] == 0) & (kk[:, 1] > 0)) | \
+               ((kk[:, 2] == 0) & (kk[:, 1] == 0) & (kk[:, 0] > 0))
+        kk = kk[half, :] * g
+        k2 = np.sum(kk*kk, axis=1)
+        keep = k2 <= max_recip2
+        self._k = kk[keep, :]
+        k2 = k2[keep]
+        self._coeff = (4. * np.pi * ewald.ivolume / k2) * \
+            np.exp(-1.0 * k2 / (4. * ewald.alpha))
+
+        s = np.zeros((2, self._k.shape[0]), dtype=np.float64)
+        for sx in range(0, self.positions.shape[0], 256):
+            kx = np.einsum('ij,kj->ik', self.positions[sx:sx+256:, :],
+                           self._k)
+            q = self.charges[sx:sx+256:]
+            s[0, :] += np.dot(q, np.cos(kx))
+            s[1, :] += np.dot(q, np.sin(kx))
+        s_sum = np.zeros_like(s)
+        self.comm.Allreduce(s, s_sum)
+        self._s = s_sum[0, :] + 1.j * s_sum[1, :]
+
+        self._sqrt_alpha = sqrt(ewald.alpha)
+        self._rc = ewald.real_cutoff
+        self.energy_unit = ewald.energy_unit
+        self._bins = CellBins(extent, int(min(extent[:3]) // self._rc),
+                              self.positions, periodic=True)
+        self.positions = self._bins.positions
+
+    def _real_phi(self, ix, y):
+        idx, shift = self._bins.neighbours(y)
+        keep = idx != ix
+        d = y - (self._bins.positions[idx[keep], :] + shift[keep, :])
+        r = np.linalg.norm(d, axis=1)
+        inside = r < self._rc
+        r = r[inside]
+        return np.sum(self.charges[idx[keep]][inside] *
+                      erfc(self._sqrt_alpha * r) / r)
+
+    def _propose(self, ix, x, q, y):
+        ds = q * (np.exp(1.j * np.dot(self._k, y)) -
+                  np.exp(1.j * np.dot(self._k, x)))
+        de = q * (self._real_phi(ix, y) - self._real_phi(ix, x))
+        if self._rank == 0:
+            # the structure factors are replicated, count them once
+            s1 = self._s + ds
+            de += np.sum(self._coeff * (
+                (s1.real*s1.real + s1.imag*s1.imag) -
+                (self._s.real*self._s.real + self._s.imag*self._s.imag)))
+        return self.energy_unit * de, ds
+
+    def _accept(self, x, q, y, ds):
+        self._s += ds
+
+
+class FMMIncremental(_Incremental):
+    """
+    Energy differences of single particle moves for PyFMM. The multipole
+    expansions computed by PyFMM in its octal tree are used and updated in
+    place, each rank reads and updates only the cells it owns. The far field
+    potential at a point is the sum over levels of the multipole expansions
+    of the interaction list evaluated at the point, plus the periodic
+    boundary and dipole terms of the root expansion, the near field is
+    summed directly over the local particles in the 27 neighbouring leaf
+    cells. A proposal costs O(189 * L^2 * R + L^4) summed over the ranks, an
+    accepted move O(L^2 * R).
+
+    Setting up runs the FMM on the positions and charges. After moves are
+    accepted the local expansions held by PyFMM are stale until the next
+    call of the PyFMM instance, which recomputes the tree.
+
+    :arg fmm: PyFMM instance.
+    :arg positions: PositionDat.
+    :arg charges: ParticleDat of charges.
+    """
+
+    def __init__(self, fmm, positions, charges):
+        _Incremental.__init__(self, fmm.domain.comm, positions, charges)
+        fmm(positions, charges)
+
+        self.fmm = fmm
+        self.L = fmm.L
+        self.R = fmm.R
+        self.energy_unit = fmm.energy_unit
+        self.periodic = not (fmm.free_space == True)
+        self.lattice = fmm.free_space == False
+
+        self._extent = np.array(fmm.domain.extent[:3], dtype=np.float64)
+        self._harm = _Harmonics(self.L)
+        self._bins = CellBins(self._extent, 2**(self.R - 1), self.positions,
+                              periodic=self.periodic)
+        self.positions = self._bins.positions
+
+        # owned cells of each level in (z, y, x) order, None if this rank
+        # does not hold the level
+        self._lo = []
+        self._lt = []
+        for lx in range(self.R):
+            if fmm.tree[lx].local_grid_cube_size is None:
+                self._lo.append(None)
+                self._lt.append(None)
+            else:
+                self._lo.append(np.array(fmm.tree[lx].local_grid_offset))
+                self._lt.append(np.array(fmm.tree[lx].local_grid_cube_size))
+
+        # interaction lists for each position of a cell in its parent
+        self._ilist = {}
+        for px in itertools.product((0, 1), repeat=3):
+            offsets = []
+            for dx in itertools.product((-1, 0, 1), repeat=3):
+                for ex in itertools.product((0, 1), repeat=3):
+                    ox = [2*dd + ee - pp for dd, ee, pp in zip(dx, ex, px)]
+                    if max(abs(oo) for oo in ox) > 1:
+                        offsets.append(ox)
+            self._ilist[px] = np.array(offsets, dtype=np.int64)
+
+    def _centre(self, c, n):
+        return -0.5 * self._extent + (c + 0.5) * (self._extent / n)
+
+    def _owned(self, lx, c):
+        # mask of the cells c (x, y, z) owned by this rank and their indices
+        # in the halo tree
+        zyx = c[:, ::-1] - self._lo[lx]
+        mask = np.all((zyx >= 0) & (zyx < self._lt[lx]), axis=1)
+        return mask, zyx[mask, :] + 2
+
+    def _add(self, y, q):
+        # the root, level 0, is the single cell centred on the origin
+        for lx in range(self.R):
+            if self._lo[lx] is None:
+                continue
+            n = 2**lx
+            c = self._bins.cell(y, n).reshape(1, 3)
+            mask, hx = self._owned(lx, c)
+            if mask[0]:
+                self.fmm.tree_halo[lx][hx[0, 0], hx[0, 1], hx[0, 2], :] += \
+                    self._harm.p2m(y - self._centre(c[0, :], n), q)[0, :]
+
+    def _far(self, y):
+        phi = 0.0
+        for lx in range(1, self.R):
+            if self._lo[lx] is None:
+                continue
+            n = 2**lx
+            c = self._bins.cell(y, n)
+            src = c + self._ilist[tuple(c % 2)]
+            if not self.periodic:
+                src = src[np.all((src >= 0) & (src < n), axis=1), :]
+            mask, hx = self._owned(lx, np.mod(src, n))
+            if not np.any(mask):
+                continue
+            centres = self._centre(src[mask, :], n)
+            m = self.fmm.tree_halo[lx][hx[:, 0], hx[:, 1], hx[:, 2], :]
+            phi += self._harm.m2p(m, y - centres)
+
+        if self.lattice and self._lo[0] is not None:
+            root = self.fmm.tree_halo[0][2, 2, 2, :]
+            lexp = np.zeros_like(root)
+            self.fmm._lr_mtl_func(root, lexp)
+            self.fmm.dipole_corrector(root, lexp)
+            phi += self._harm.l2p(lexp, y)
+        return phi
+
+    def _near(self, ix, y):
+        idx, shift = self._bins.neighbours(y)
+        keep = idx != ix
+        d = y - (self._bins.positions[idx[keep], :] + shift[keep, :])
+        return np.sum(self.charges[idx[keep]] / np.linalg.norm(d, axis=1))
+
+    def _energy_terms(self, ix, q, y):
+        # interaction of a charge at y with all particles other than ix, plus
+        # half the interaction with its own images and boundary terms
+        far_without = self._far(y)
+        self._add(y, q)
+        far_with = self._far(y)
+        self._add(y, -1.0 * q)
+        return q * (self._near(ix, y) + 0.5 * (far_without + far_with))
+
+    def _propose(self, ix, x, q, y):
+        self._add(x, -1.0 * q)
+        try:
+            de = self._energy_terms(ix, q, y) - self._energy_terms(ix, q, x)
+        finally:
+            self._add(x, q)
+        return self.energy_unit * de, None
+
+    def _accept(self, x, q, y, state):
+        self._add(x, -1.0 * q)
+        self._add(y, q)
+
+
+class IncrementalMixin(object):
+    """
+    Energy differences of single particle moves for the electrostatic
+    solvers. Classes set _incremental_type to the class holding the cached
+    state, which is constructed with (solver, positions, charges).
+    """
+
+    _incremental_type = None
+
+    def setup_incremental(self, positions, charges):
+        """
+        Set up the cached state for energy differences of single particle
+        moves with :meth:`propose` and :meth:`accept`. Collective, see
+        ppmd.coulomb.incremental.
+
+        :arg positions: PositionDat.
+        :arg charges: ParticleDat of charges.
+        :return: Instance holding the cached state.
+        """
+        self._incremental = self._incremental_type(self, positions, charges)
+        return self._incremental
+
+    def _get_incremental(self):
+        if getattr(self, '_incremental', None) is None:
+            raise RuntimeError('setup_incremental must be called first.')
+        return self._incremental
+
+    def propose(self, i, position):
+        """
+        Energy difference if particle i is moved to position, the cached
+        state is not modified. Collective.
+
+        :arg int i: Index of the particle in the ordering of
+        setup_incremental.
+        :arg position: New position of the particle.
+        :return: Energy difference.
+        """
+        return self._get_incremental().propose(i, position)
+
+    def accept(self):
+        """
+        Update the cached state with the last proposed move. Collective.
+        """
+        self._get_incremental().accept()
+
+    def reject(self):
+        """
+        Discard the last proposed move.
+        """
+        self._get_incremental().reject()
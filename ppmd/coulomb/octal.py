@@ -371,6 +371,33 @@ def compute_interaction_lists(local_size):
     return ro
 
 
+def compute_interior_cells(local_size):
+    """
+    Split the cubes of a local domain into the cubes whose interaction lists
+    only contain local cubes and the cubes whose interaction lists contain
+    halo cubes. The translations of the former can be computed while the halo
+    exchange is in progress.
+    :param local_size: tuple of local cube domain dimensions (slow to fast).
+    :return: Tuple (interior, boundary) of INT64 arrays of lexicographic
+    local cube indices.
+    """
+    lo = np.zeros(shape=(2, 2, 2, 3), dtype=INT64)
+    hi = np.zeros(shape=(2, 2, 2, 3), dtype=INT64)
+    for ix in itertools.product((0, 1), repeat=3):
+        o = compute_interaction_offsets(ix)
+        lo[ix] = np.min(o, axis=0)
+        hi[ix] = np.max(o, axis=0)
+
+    nz, ny, nx = (int(sx) for sx in local_size)
+    cz, cy, cx = np.meshgrid(range(nz), range(ny), range(nx), indexing='ij')
+    c = np.stack((cx.ravel(), cy.ravel(), cz.ravel()), axis=1)
+    octant = (c[:, 0] % 2, c[:, 1] % 2, c[:, 2] % 2)
+    n = np.array((nx, ny, nz))
+    interior = np.all((c + lo[octant] >= 0) & (c + hi[octant] < n), axis=1)
+    lin = np.arange(c.shape[0], dtype=INT64)
+    return lin[interior], lin[np.logical_not(interior)]
+
+
 def cube_tuple_to_lin_xyz(ii, n):
     """
     convert xyz tuple ii to linear index in cube of side length n.
@@ -600,6 +627,23 @@ class OctalGridLevel(object):
         if self.comm != MPI.COMM_NULL:
             self._halo_exchange_method.exchange(arr)
 
+    def halo_exchange_start(self, arr):
+        """
+        Start a non-blocking halo exchange of the passed numpy array of shape
+        self.grid_cube_size, the halo cells are written by
+        halo_exchange_finish.
+        :param arr: numpy array to exchange.
+        """
+        if self.comm != MPI.COMM_NULL:
+            self._halo_exchange_method.exchange_start(arr)
+
+    def halo_exchange_finish(self):
+        """
+        Complete the halo exchange started by halo_exchange_start.
+        """
+        if self.comm != MPI.COMM_NULL:
+            self._halo_exchange_method.exchange_finish()
+
 
 class OctalTree(object):
     def __init__(self, num_levels, cart_comm):
@@ -916,6 +960,26 @@ class OctalDataTree(object):
 
 
     def halo_exchange_level(self, level):
+        self._check_halo_level(level)
+        self.tree.levels[level].halo_exchange(self.data[level])
+
+    def halo_exchange_level_start(self, level):
+        """
+        Start a non-blocking halo exchange of a level, see
+        halo_exchange_level_finish.
+        """
+        self._check_halo_level(level)
+        self.tree.levels[level].halo_exchange_start(self.data[level])
+
+    def halo_exchange_level_finish(self, level):
+        """
+        Complete the halo exchange of a level started by
+        halo_exchange_level_start.
+        """
+        self._check_halo_level(level)
+        self.tree.levels[level].halo_exchange_finish()
+
+    def _check_halo_level(self, level):
         if level < 1:
             raise RuntimeError('Cannot exchange levels < 1')
         elif level >= self.tree.num_levels:
@@ -924,8 +988,6 @@ class OctalDataTree(object):
         elif self.mode != 'halo':
             raise RuntimeError("Can only halo exchange if mode == halo")
 
-        self.tree.levels[level].halo_exchange(self.data[level])
-
     def __getitem__(self, item):
         return self.data[item]
 
@@ -1137,6 +1199,433 @@ def shell_iterator(width):
     s += [(width, bx[0], bx[1]) for bx in itertools.product(b2,b2)]
     return s
 
+
+class RowExchange(object):
+    """
+    Exchange of the rows of arrays between the ranks of a communicator. The
+    rows are received ordered by source rank and, for each source, in the
+    order they were passed. Collective on the communicator.
+
+    :param comm: Communicator.
+    :param dst: Destination rank of each row.
+    """
+    def __init__(self, comm, dst):
+        dst = np.array(dst, dtype=np.int64).ravel()
+        size = comm.Get_size()
+        self.comm = comm
+        self.nsend = dst.shape[0]
+        """Number of rows sent."""
+        self._order = np.argsort(dst, kind='stable')
+        self._send_counts = np.bincount(dst, minlength=size).astype(np.int64)
+        self._recv_counts = np.zeros(size, dtype=np.int64)
+        comm.Alltoall(self._send_counts, self._recv_counts)
+        self.nrecv = int(np.sum(self._recv_counts))
+        """Number of rows received."""
+        self.src = np.repeat(np.arange(size, dtype=np.int64),
+                             self._recv_counts)
+        """Source rank of each received row."""
+
+    def _alltoallv(self, a, send_counts, recv_counts, nrecv):
+        a = np.ascontiguousarray(a)
+        w = int(np.prod(a.shape[1:], dtype=np.int64))
+        b = np.zeros((nrecv,) + a.shape[1:], dtype=a.dtype)
+        sc = send_counts * w
+        rc = recv_counts * w
+        sd = np.cumsum(sc) - sc
+        rd = np.cumsum(rc) - rc
+        self.comm.Alltoallv([a, (sc, sd)], [b, (rc, rd)])
+        return b
+
+    def __call__(self, a):
+        """
+        Send the rows of a to their destinations.
+
+        :param a: Array with one row for each destination.
+        :return: Array of the received rows.
+        """
+        return self._alltoallv(a[self._order], self._send_counts,
+                               self._recv_counts, self.nrecv)
+
+    def reverse(self, b):
+        """
+        Send one row for each received row back to its source.
+
+        :param b: Array with one row for each received row.
+        :return: Array of the returned rows in the order of the rows of the
+        forward exchange.
+        """
+        r = self._alltoallv(b, self._recv_counts, self._send_counts,
+                            self.nsend)
+        a = np.zeros_like(r)
+        a[self._order] = r
+        return a
+
+
+def _key_to_zyx(keys, n):
+    # (z, y, x) tuples of global linear indices on a level with n cells per
+    # side
+    return np.stack((keys // (n*n), (keys // n) % n, keys % n), axis=1)
+
+
+def _zyx_to_key(c, n):
+    return (c[:, 0]*n + c[:, 1])*n + c[:, 2]
+
+
+def _parent_key(keys, n):
+    # global linear indices of the parents of cells on a level with n cells
+    # per side
+    return _zyx_to_key(_key_to_zyx(keys, n) // 2, n // 2)
+
+
+def _reduce(keys, values):
+    # sum the values of equal keys, returns the unique keys, the sums and the
+    # index of each key in the unique keys
+    u, inv = np.unique(keys, return_inverse=True)
+    inv = inv.ravel()
+    return u, np.bincount(inv, weights=values, minlength=u.shape[0]).astype(
+        np.int64), inv
+
+
+def _find(keys, rows, q):
+    # rows of the entries of the sorted keys equal to q, -1 if not found
+    if keys.shape[0] == 0:
+        return np.zeros(q.shape, dtype=np.int64) - 1
+    ix = np.minimum(np.searchsorted(keys, q), keys.shape[0] - 1)
+    return np.where(keys[ix] == q, rows[ix], -1)
+
+
+def _expand(starts, ends):
+    # concatenation of the ranges starts[i]:ends[i] and the index i of each
+    n = ends - starts
+    owner = np.repeat(np.arange(n.shape[0], dtype=np.int64), n)
+    offset = np.arange(owner.shape[0], dtype=np.int64) - \
+        np.repeat(np.cumsum(n) - n, n)
+    return np.repeat(starts, n) + offset, owner
+
+
+def _touches(c, level, b, b_level):
+    # True if the cells with (z, y, x) tuples c on level are adjacent to the
+    # coarser cells b on the levels b_level
+    s = (level - b_level).reshape(-1, 1)
+    return np.all((np.left_shift(b, s) - 1 <= c) &
+                  (c <= np.left_shift(b + 1, s)), axis=1)
+
+
+_COLLEAGUES = np.array([ox for ox in itertools.product((-1, 0, 1), repeat=3)
+                        if ox != (0, 0, 0)], dtype=np.int64)
+_HALO = np.array(list(itertools.product(range(-2, 3), repeat=3)),
+                 dtype=np.int64)
+_IMAGES = np.array(list(itertools.product((-1, 0, 1), repeat=3)),
+                   dtype=np.int64)
+
+
+class AdaptiveOctalTree(object):
+    """
+    Sparse adaptive octal tree over the levels of an OctalTree. Only occupied
+    cells whose parent is refined are cells of the adaptive tree. Occupied
+    cells on levels coarser than min_level are always refined, the other
+    cells are refined while they hold more than max_leaf particles and cells
+    on the finest level are leaves.
+
+    Each rank holds the cells of the adaptive tree it owns in the OctalTree as
+    sorted arrays of global linear (z, y, x) indices, along with:
+
+    * links: the children of the owned cells, to translate along the
+      occupied parent-child links only.
+    * halo: the cells of the adaptive tree in the halo of the owned block of
+      cells, exchanged by their owners.
+    * V lists: cells of the same level that are children of the colleagues
+      of the parent and are not adjacent, as rows of the owned and halo cells
+      with an index into the interaction tables.
+    * X lists: leaves B on coarser levels that are adjacent to the parent of
+      a cell C but not to C. C is in the W list of B.
+
+    The U lists, the adjacent leaves of a leaf, are formed from the particles
+    of the leaves, see FMMLocalLeaves.
+
+    :param tree: OctalTree to refine.
+    :param max_leaf: Maximum number of particles in a leaf.
+    :param free_space: True if there are no cells outside the domain.
+    """
+    def __init__(self, tree, max_leaf=32, free_space=False):
+        self.tree = tree
+        self.comm = tree.cart_comm
+        self.num_levels = tree.num_levels
+        self.max_leaf = max(int(max_leaf), 1)
+        self.free_space = free_space
+        self.min_level = 1
+
+        R = self.num_levels
+        self.cells = [np.zeros(0, dtype=np.int64) for lx in range(R)]
+        """Global linear indices of the owned cells of the adaptive tree."""
+        self.leaf = [np.zeros(0, dtype=np.bool_) for lx in range(R)]
+        """Leaf flags of the owned cells."""
+        self.counts = [np.zeros(0, dtype=np.int64) for lx in range(R)]
+        """Number of particles in the owned cells."""
+
+        self.links = [None for lx in range(R)]
+        """Exchange of rows of the cells of each level to the owners of
+        their parents, with the parent index and octant of each received
+        row, as (exchange, parent_index, octant)."""
+        self.halo = [None for lx in range(R)]
+        """Exchange of rows of the owned cells of each level to the ranks
+        holding them in their halo, with the indices of the cells sent, as
+        (exchange, cells)."""
+        self.v_lists = [None for lx in range(R)]
+        """V lists of the owned cells as (start, source, offset). The
+        sources are rows of the owned cells followed by the received halo
+        cells and the offsets (oz+3)*49 + (oy+3)*7 + ox+3 index the
+        interaction tables."""
+
+        self.x_level = np.zeros(0, dtype=np.int64)
+        """Level of the cells C of the X list pairs."""
+        self.x_index = np.zeros(0, dtype=np.int64)
+        """Index of C in the owned cells of its level."""
+        self.x_leaf_level = np.zeros(0, dtype=np.int64)
+        """Level of the leaves B."""
+        self.x_leaf_key = np.zeros(0, dtype=np.int64)
+        """Global linear index of B."""
+        self.x_shift = np.zeros((0, 3), dtype=np.int64)
+        """Periodic image (x, y, z) of B adjacent to the parent of C."""
+
+    def _owners(self, level, keys):
+        return self.tree[level].owners.ravel()[keys]
+
+    def update(self, cells, min_level):
+        """
+        Rebuild the adaptive tree for the particles in the passed cells.
+        Collective on the comm of the tree.
+
+        :param cells: Global linear (z, y, x) indices of the finest level
+        cells of the local particles.
+        :param min_level: Coarsest level of a leaf.
+        :return: Array of the leaf level of each local particle.
+        """
+        comm = self.comm
+        R = self.num_levels
+        self.min_level = int(min_level)
+
+        # reduce the particle counts of the occupied cells up the tree
+        keys, counts, inv = _reduce(np.array(cells, dtype=np.int64).ravel(),
+                                    None)
+        entry = RowExchange(comm, self._owners(R - 1, keys))
+        occupied = [None for lx in range(R)]
+        occupied_counts = [None for lx in range(R)]
+        up = [None for lx in range(R)]
+        occupied[R-1], occupied_counts[R-1], entry_inv = _reduce(
+            entry(keys), entry(counts))
+
+        for lx in range(R - 1, 0, -1):
+            parents, parent_counts, parent_inv = _reduce(
+                _parent_key(occupied[lx], 2**lx), occupied_counts[lx])
+            ex = RowExchange(comm, self._owners(lx - 1, parents))
+            occupied[lx-1], occupied_counts[lx-1], recv_inv = _reduce(
+                ex(parents), ex(parent_counts))
+            up[lx] = (ex, parent_inv, recv_inv)
+
+        # leaf level of the leaf at or above each occupied cell, -1 for cells
+        # of the adaptive tree that are refined
+        status = [None for lx in range(R)]
+        for lx in range(R):
+            if lx == 0:
+                parent_status = np.zeros(occupied[0].shape[0],
+                                         dtype=np.int64) - 1
+            else:
+                ex, parent_inv, recv_inv = up[lx]
+                parent_status = ex.reverse(
+                    status[lx-1][recv_inv])[parent_inv]
+
+            in_tree = parent_status < 0
+            leaf = in_tree & ((lx == R - 1) | ((lx >= self.min_level) &
+                              (occupied_counts[lx] <= self.max_leaf)))
+            status[lx] = np.where(leaf, lx, parent_status)
+
+            self.cells[lx] = occupied[lx][in_tree]
+            self.leaf[lx] = leaf[in_tree]
+            self.counts[lx] = occupied_counts[lx][in_tree]
+
+        for lx in range(1, R):
+            self.links[lx] = self._compute_links(lx)
+
+        # no leaves are adjacent to the parent of the cells of level one
+        k = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+             np.zeros((0, 3), dtype=np.int64))
+        x = [[np.zeros(0, dtype=np.int64)] for ix in range(3)] + \
+            [[np.zeros((0, 3), dtype=np.int64)]]
+        for lx in range(1, R):
+            self.halo[lx], lookup = self._compute_halo(lx)
+            self.v_lists[lx] = self._compute_v_lists(lx, lookup)
+            k = self._compute_x_lists(lx, lookup, k, x)
+
+        self.x_level, self.x_index, self.x_leaf_level = \
+            (np.concatenate(ix) for ix in x[:3])
+        b = np.concatenate(x[3])
+        n = np.left_shift(1, self.x_leaf_level).reshape(-1, 1)
+        w = b % n
+        self.x_leaf_key = _zyx_to_key(w, n[:, 0])
+        self.x_shift = np.array((b - w) // n, dtype=np.int64)[:, ::-1]
+
+        return entry.reverse(status[R-1][entry_inv])[inv]
+
+    def _compute_links(self, level):
+        # exchange of the cells of the level to the owners of their parents
+        n = 2 ** level
+        c = self.cells[level]
+        parents = _parent_key(c, n)
+        zyx = _key_to_zyx(c, n) % 2
+        ex = RowExchange(self.comm, self._owners(level - 1, parents))
+        parent_index = np.searchsorted(self.cells[level - 1], ex(parents))
+        octant = ex(zyx[:, 2] + 2*zyx[:, 1] + 4*zyx[:, 0])
+        return ex, parent_index, octant
+
+    def _compute_halo(self, level):
+        # send the owned cells to the ranks that hold them in the halo of
+        # their block of cells, the halo is two cells deep.
+        comm = self.comm
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+        lvl = self.tree[level]
+        n = 2 ** level
+        c = self.cells[level]
+
+        u = _key_to_zyx(c, n).reshape(-1, 1, 3) + _HALO.reshape(1, -1, 3)
+        w = u % n
+        wrapped = np.any(u != w, axis=2)
+        dst = lvl.owners[w[:, :, 0], w[:, :, 1], w[:, :, 2]]
+        keep = wrapped | (dst != rank)
+        if self.free_space:
+            keep &= np.logical_not(wrapped)
+        cell_index = np.repeat(np.arange(c.shape[0], dtype=np.int64),
+                               _HALO.shape[0]).reshape(keep.shape)
+        pairs = np.unique(cell_index[keep]*size + dst[keep])
+        send = pairs // size
+        ex = RowExchange(comm, pairs % size)
+        recv_keys = ex(c[send])
+        recv_leaf = ex(self.leaf[level][send].astype(np.int64)) > 0
+
+        # sorted lookup from the linear indices of the halo block of cells
+        # to the rows of the owned cells and the received cells
+        if lvl.local_grid_cube_size is None:
+            lookup = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                      np.zeros(0, dtype=np.bool_), None, None)
+            return (ex, send), lookup
+
+        lo = np.array(lvl.local_grid_offset, dtype=np.int64)
+        lt = np.array(lvl.local_grid_cube_size, dtype=np.int64)
+
+        r = _key_to_zyx(recv_keys, n).reshape(-1, 1, 3) + \
+            n*_IMAGES.reshape(1, -1, 3)
+        inside = np.all((r >= lo - 2) & (r < lo + lt + 2), axis=2)
+        inside &= np.logical_not(np.all((r >= lo) & (r < lo + lt), axis=2))
+        if self.free_space:
+            inside &= np.all(_IMAGES == 0, axis=1).reshape(1, -1)
+        rows = np.repeat(np.arange(recv_keys.shape[0], dtype=np.int64),
+                         _IMAGES.shape[0]).reshape(inside.shape)
+
+        box = np.concatenate((_key_to_zyx(c, n), r[inside]))
+        rows = np.concatenate((np.arange(c.shape[0], dtype=np.int64),
+                               c.shape[0] + rows[inside]))
+        box = _zyx_to_box(box, lo, lt)
+        order = np.argsort(box)
+        leaf = np.concatenate((self.leaf[level], recv_leaf))
+        return (ex, send), (box[order], rows[order], leaf, lo, lt)
+
+    def _compute_v_lists(self, level, lookup):
+        n = 2 ** level
+        c = _key_to_zyx(self.cells[level], n)
+        box, rows, leaf, lo, lt = lookup
+        targets = []
+        sources = []
+        offsets = []
+        for parity in itertools.product((0, 1), repeat=3):
+            # offsets are (x, y, z) for the (x, y, z) parity
+            o = compute_interaction_offsets(parity)[:, ::-1]
+            t = np.flatnonzero(np.all(c % 2 == np.array(parity[::-1]),
+                                      axis=1))
+            if t.shape[0] == 0:
+                continue
+            u = c[t].reshape(-1, 1, 3) + o.reshape(1, -1, 3)
+            s = _find(box, rows, _zyx_to_box(u.reshape(-1, 3), lo, lt))
+            found = s > -1
+            targets.append(np.repeat(t, o.shape[0])[found])
+            sources.append(s[found])
+            lin = (o[:, 0] + 3)*49 + (o[:, 1] + 3)*7 + o[:, 2] + 3
+            offsets.append(np.tile(lin, t.shape[0])[found])
+
+        targets = np.concatenate([np.zeros(0, dtype=np.int64)] + targets)
+        order = np.argsort(targets, kind='stable')
+        start = np.searchsorted(targets[order],
+                                np.arange(c.shape[0] + 1, dtype=np.int64))
+        source = np.concatenate([np.zeros(0, dtype=np.int64)] + sources)
+        offset = np.concatenate([np.zeros(0, dtype=np.int64)] + offsets)
+        return (np.array(start, dtype=np.int64), source[order], offset[order])
+
+    def _compute_x_lists(self, level, lookup, k, x):
+        # The leaves on coarser levels adjacent to the parent of each cell
+        # are received from the owner of the parent as k. Those that are not
+        # adjacent to the cell are appended to the X lists x, the others are
+        # sent on to the children along with the leaf colleagues.
+        comm = self.comm
+        size = comm.Get_size()
+        n = 2 ** level
+        c = _key_to_zyx(self.cells[level], n)
+        cell, b_level, b = k
+
+        adjacent = _touches(c[cell], level, b, b_level)
+        nx = np.logical_not(adjacent)
+        x[0].append(np.zeros(np.count_nonzero(nx), dtype=np.int64) + level)
+        x[1].append(cell[nx])
+        x[2].append(b_level[nx])
+        x[3].append(b[nx])
+
+        if level == self.num_levels - 1:
+            return None
+
+        # leaf colleagues of the refined cells
+        refined = np.logical_not(self.leaf[level])
+        box, rows, leaf, lo, lt = lookup
+        t = np.flatnonzero(refined)
+        u = (c[t].reshape(-1, 1, 3) + _COLLEAGUES.reshape(1, -1, 3)).reshape(
+            -1, 3)
+        s = _find(box, rows, _zyx_to_box(u, lo, lt))
+        found = np.flatnonzero(s > -1)
+        found = found[leaf[s[found]]]
+
+        kx = adjacent & refined[cell]
+        k_cell = np.concatenate((cell[kx], t[found // _COLLEAGUES.shape[0]]))
+        k_level = np.concatenate((b_level[kx], np.zeros(
+            found.shape[0], dtype=np.int64) + level))
+        k_b = np.concatenate((b[kx], u[found]))
+
+        # send to the owners of the children of each refined cell
+        ex, parent_index, octant = self.links[level + 1]
+        pairs = np.unique(parent_index*size + ex.src)
+        p = pairs // size
+        pair_index, e = _expand(np.searchsorted(p, k_cell),
+                                np.searchsorted(p, k_cell, side='right'))
+        out = RowExchange(comm, pairs[pair_index] % size)
+        parent_key = out(self.cells[level][k_cell[e]])
+        k_level = out(k_level[e])
+        k_b = out(k_b[e])
+
+        # the cells of the next level whose parent is each received row
+        children = _parent_key(self.cells[level + 1], 2 * n)
+        order = np.argsort(children, kind='stable')
+        children = children[order]
+        ix, row = _expand(np.searchsorted(children, parent_key),
+                          np.searchsorted(children, parent_key, side='right'))
+        return order[ix], k_level[row], k_b[row]
+
+
+def _zyx_to_box(u, lo, lt):
+    # linear index of (z, y, x) tuples in the block of cells with offset lo
+    # and size lt padded by two cells
+    if lo is None:
+        return np.zeros(u.shape[0], dtype=np.int64) - 1
+    b = u - lo + 2
+    return (b[:, 0]*(lt[1] + 4) + b[:, 1])*(lt[2] + 4) + b[:, 2]
+
+
 # ---- CUDA ----
 
 from ppmd.cuda import CUDA_IMPORT
@@ -2,8 +2,10 @@
 __all__ = [
     'global_array',
     'particle_dat',
-    'scalar_array'
+    'scalar_array',
+    'multi_halo_exchange'
 ]
 from ppmd.data.global_array import *
 from ppmd.data.particle_dat import *
-from ppmd.data.scalar_array import *
\ No newline at end of file
+from ppmd.data.scalar_array import *
+from ppmd.data.multi_halo_exchange import *
\ No newline at end of file
@@ -0,0 +1,276 @@
+from __future__ import print_function, division, absolute_import
+
+import ppmd.opt
+
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+# system level
+import ctypes
+
+# package level
+from ppmd import host, opt
+from ppmd.lib import build
+from ppmd.data.particle_dat import PositionDat
+
+
+class MultiHaloExchange(object):
+    """
+    Halo exchange of several ParticleDats of the same state. The boundary
+    particles of all dats are packed into one buffer per direction such that
+    one message is sent per direction instead of one message per dat and
+    direction.
+
+    The shared window exchange of runtime.HALO_SHARED_MEM is not used here,
+    partners on the same node also receive messages. The windows belong to
+    each ParticleDat and are sized for its own records, an aggregated window
+    would be allocated collectively on the node for every combination of dats
+    and node local MPI messages already use shared memory transport.
+
+    :arg dats: ParticleDats to exchange, all dats must belong to the same
+    state.
+    """
+    def __init__(self, dats):
+        self.dats = tuple(dats)
+        self.group = self.dats[0].group
+        for dx in self.dats:
+            if dx.group is not self.group:
+                raise RuntimeError('ParticleDats belong to different states.')
+
+        self._record = sum(dx.ncomp * ctypes.sizeof(dx.dtype)
+                           for dx in self.dats)
+        self._send = host.Array(ncomp=1, dtype=ctypes.c_char)
+        self._recv = host.Array(ncomp=1, dtype=ctypes.c_char)
+
+        self._timer = ppmd.opt.Timer()
+        self._exchange_count = 0
+        self._lib = self._build_lib()
+
+    def _build_lib(self):
+        args = []
+        pack = []
+        unpack = []
+        offset = 0
+        for dx, datx in enumerate(self.dats):
+            ctype = host.ctypes_map[datx.dtype]
+            args.append('%s * RESTRICT DAT_%d' % (ctype, dx))
+            args.append('const long STRIDE_%d' % dx)
+            if datx.soa:
+                idx = '(row) + (comp)*STRIDE_%d' % dx
+            else:
+                idx = '(row)*%d + (comp)' % datx.ncomp
+            shift = ' + SHIFT[dir*3 + iy]' if type(datx) is PositionDat \
+                else ''
+            pack.append('''
+                for( int iy=0 ; iy<%(NCOMP)s ; iy++ ){
+                    const int row = ix;
+                    const int comp = iy;
+                    const %(DTYPE)s v = DAT_%(DX)s[%(IDX)s]%(SHIFT)s;
+                    memcpy(&b_tmp[p_index*RECORD + %(OFFSET)s + iy*sizeof(%(DTYPE)s)], &v, sizeof(%(DTYPE)s));
+                }''' % {'NCOMP': datx.ncomp, 'DTYPE': ctype, 'DX': dx,
+                        'IDX': idx, 'SHIFT': shift, 'OFFSET': offset})
+            unpack.append('''
+                for( int iy=0 ; iy<%(NCOMP)s ; iy++ ){
+                    const int row = DAT_START + px;
+                    const int comp = iy;
+                    memcpy(&DAT_%(DX)s[%(IDX)s], &b_recv[px*RECORD + %(OFFSET)s + iy*sizeof(%(DTYPE)s)], sizeof(%(DTYPE)s));
+                }''' % {'NCOMP': datx.ncomp, 'DTYPE': ctype, 'DX': dx,
+                        'IDX': idx, 'OFFSET': offset})
+            offset += datx.ncomp * ctypes.sizeof(datx.dtype)
+
+        _args = '''
+            const int f_MPI_COMM,             // F90 comm from mpi4py
+            int DAT_END,                      // end of dats.
+            const double * RESTRICT SHIFT,    // position shifts
+            const int * RESTRICT SEND_RANKS,  // send directions
+            const int * RESTRICT RECV_RANKS,  // recv directions
+            const int * RESTRICT h_ind,       // halo indices
+            const int * RESTRICT b_ind,       // local b indices
+            const int * RESTRICT h_arr,       // h cell indices
+            const int * RESTRICT b_arr,       // b cell indices
+            const int * RESTRICT dir_counts,  // expected recv counts
+            const int cell_offset,            // offset for cell list
+            const int sort_flag,              // does the cl require updating
+            int * RESTRICT ccc,               // cell contents count
+            int * RESTRICT crl,               // cell reverse lookup
+            int * RESTRICT cell_linked_list,  // cell list
+            char * RESTRICT b_tmp,            // tmp space for sending
+            char * RESTRICT b_recv,           // tmp space for recving
+            const int trim,                   // halos are trimmed
+            const int * RESTRICT SEND_MASK,   // directions to send particles
+            ''' + ',\n'.join(args)
+
+        _header = '''
+        #include <generic.h>
+        #include <mpi.h>
+        #include <string.h>
+        #define RESTRICT %(RESTRICT)s
+        #define RECORD %(RECORD)s
+
+        extern "C" void MULTI_HALO_EXCHANGE(%(ARGS)s);
+        '''
+
+        _code = '''
+        void MULTI_HALO_EXCHANGE(%(ARGS)s){
+
+            MPI_Comm MPI_COMM = MPI_Comm_f2c(f_MPI_COMM);
+            int rank = -1; MPI_Comm_rank( MPI_COMM, &rank );
+            MPI_Request sr;
+            MPI_Request rr;
+            const int NLOCAL = DAT_END;
+
+            for( int dir=0 ; dir<6 ; dir++ ){
+
+                const int b_s = b_ind[dir];
+                const int b_e = b_ind[dir+1];
+                const int b_c = b_e - b_s;
+
+                const int h_s = h_ind[dir];
+                const int h_e = h_ind[dir+1];
+
+                // pack the boundary particles of all dats into one record
+                // per particle
+                int p_index = -1;
+                for( int cx=0 ; cx<b_c ; cx++ ){
+                    const int ci = b_arr[b_s + cx];
+                    int ix = cell_linked_list[cell_offset + ci];
+                    while(ix > -1){
+                        // skip local particles out of range of the
+                        // neighbouring subdomain
+                        if (trim && (ix < NLOCAL) && !((SEND_MASK[ix] >> dir) & 1)){
+                            ix = cell_linked_list[ix];
+                            continue;
+                        }
+                        p_index++;
+                        %(PACK)s
+                        ix = cell_linked_list[ix];
+                    }
+                }
+
+                if (( SEND_RANKS[dir] > -1 ) && ( p_index > -1 ) ){
+                    MPI_Isend((void *) b_tmp, (p_index + 1) * RECORD, MPI_BYTE,
+                              SEND_RANKS[dir], rank, MPI_COMM, &sr);
+                }
+                if (( RECV_RANKS[dir] > -1 ) && ( dir_counts[dir] > 0 ) ){
+                    MPI_Irecv((void *) b_recv, dir_counts[dir] * RECORD, MPI_BYTE,
+                              RECV_RANKS[dir], RECV_RANKS[dir], MPI_COMM, &rr);
+                }
+
+                const int DAT_START = DAT_END;
+                int DAT_END_T = DAT_END;
+                DAT_END += dir_counts[dir];
+
+                // build halo part of cell list whilst exchange occuring.
+                if (sort_flag > 0){
+                    for( int hxi=h_s ; hxi<h_e ; hxi++ ){
+                        const int hx = h_arr[ hxi ];
+                        const int hx_count = ccc[ hx ];
+                        if (hx_count > 0) {
+                            cell_linked_list[cell_offset + hx] = DAT_END_T;
+                            for( int iy=0 ; iy<(hx_count-1) ; iy++ ){
+                                cell_linked_list[ DAT_END_T+iy ] = DAT_END_T + iy + 1;
+                                crl[ DAT_END_T+iy ] = hx;
+                            }
+                            cell_linked_list[ DAT_END_T + hx_count - 1 ] = -1;
+                            crl[ DAT_END_T + hx_count -1 ] = hx;
+                            DAT_END_T += hx_count;
+                        }
+                    }
+                }
+
+                if (( SEND_RANKS[dir] > -1 ) && ( p_index > -1 ) ){
+                    MPI_Wait(&sr, MPI_STATUS_IGNORE);
+                }
+                if (( RECV_RANKS[dir] > -1 ) && ( dir_counts[dir] > 0 ) ){
+                    MPI_Wait(&rr, MPI_STATUS_IGNORE);
+                    for( int px=0 ; px<dir_counts[dir] ; px++ ){
+                        %(UNPACK)s
+                    }
+                }
+            }
+
+            return;
+        }
+        '''
+
+        _dict = {
+            'ARGS': _args,
+            'RESTRICT': build.MPI_CC.restrict_keyword,
+            'RECORD': self._record,
+            'PACK': '\n'.join(pack),
+            'UNPACK': '\n'.join(unpack)
+        }
+        return build.simple_lib_creator(
+            _header % _dict, _code % _dict, 'MULTI_HALO_EXCHANGE',
+            CC=build.MPI_CC)['MULTI_HALO_EXCHANGE']
+
+    def exchange(self):
+        """
+        Exchange the halos of all dats and mark the halos as current.
+        """
+        self._timer.start()
+        group = self.group
+        celllist = group.get_cell_to_particle_map()
+        halo_manager = group._halo_manager
+
+        for dx in self.dats:
+            dx.halo_start_reset()
+
+        _halo_sizes = group._halo_update_exchange_sizes()
+        if self._send.ncomp < self._record * _halo_sizes[1]:
+            self._send.realloc(_halo_sizes[1] * self._record)
+        if self._recv.ncomp < self._record * _halo_sizes[1]:
+            self._recv.realloc(_halo_sizes[1] * self._record)
+
+        if celllist.version_id > celllist.halo_version_id:
+            _sort_flag = ctypes.c_int(1)
+        else:
+            _sort_flag = ctypes.c_int(-1)
+
+        _trim, _send_mask = halo_manager.get_send_mask()
+        _h = halo_manager.get_halo_cell_groups()
+        _b = halo_manager.get_boundary_cell_groups()
+
+        args = [
+            ctypes.c_int(group.domain.comm.py2f()),
+            ctypes.c_int(group.npart_local),
+            halo_manager.get_position_shifts().ctypes_data,
+            halo_manager.get_send_ranks().ctypes_data,
+            halo_manager.get_recv_ranks().ctypes_data,
+            _h[1].ctypes_data,
+            _b[1].ctypes_data,
+            _h[0].ctypes_data,
+            _b[0].ctypes_data,
+            halo_manager.get_dir_counts().ctypes_data,
+            celllist.offset,
+            _sort_flag,
+            celllist.cell_contents_count.ctypes_data,
+            celllist.cell_reverse_lookup.ctypes_data,
+            celllist.cell_list.ctypes_data,
+            self._send.ctypes_data,
+            self._recv.ctypes_data,
+            _trim,
+            _send_mask.ctypes_data
+        ]
+        for dx in self.dats:
+            args.append(dx.ctypes_data)
+            args.append(ctypes.c_long(dx.soa_stride))
+
+        self._lib(*args)
+
+        group._halo_update_post_exchange()
+
+        for dx in self.dats:
+            dx.halo_start_shift(_halo_sizes[0])
+            dx._vid_halo = dx._vid_int
+            dx.vid_halo_cell_list = celllist.version_id
+
+        self._timer.pause()
+        self._exchange_count += 1
+        opt.PROFILE[
+            self.__class__.__name__ + ':halo_exchange'
+        ] = (self._timer.time())
+        opt.PROFILE[
+            self.__class__.__name__ + ':halo_exchange:count'
+        ] = (self._exchange_count)
@@ -28,6 +28,48 @@ from ppmd.data.data_movement import ParticleDatModifier
 
 SUM = mpi.MPI.SUM
 
+SOA_ALIGNMENT = 64
+"""Alignment in bytes of each component array of a SoA ParticleDat."""
+
+# Data types the cell list, neighbour list and boundary condition
+# libraries accept for positions.
+POSITION_DTYPES = (ctypes.c_double, ctypes.c_float)
+
+# Data types accepted for the species ParticleDat of a TypedDat.
+TYPE_DTYPES = (ctypes.c_int, ctypes.c_int32, ctypes.c_int64, ctypes.c_long,
+               ctypes.c_longlong)
+
+# Parameters of the generated halo exchange library of a ParticleDat.
+HALO_EXCHANGE_ARGS = '''
+            %(DTYPE)s * RESTRICT DAT,         // DAT pointer
+            int DAT_END,                      // end of dat.
+            const double * RESTRICT SHIFT,    // position shifts
+            const int f_MPI_COMM,             // F90 comm from mpi4py
+            const int * RESTRICT SEND_RANKS,  // send directions
+            const int * RESTRICT RECV_RANKS,  // recv directions
+            const int * RESTRICT h_ind,       // halo indices
+            const int * RESTRICT b_ind,       // local b indices
+            const int * RESTRICT h_arr,       // h cell indices
+            const int * RESTRICT b_arr,       // b cell indices
+            const int * RESTRICT dir_counts,  // expected recv counts
+            const int cell_offset,            // offset for cell list
+            const int sort_flag,              // does the cl require updating
+            int * RESTRICT ccc,               // cell contents count
+            int * RESTRICT crl,               // cell reverse lookup
+            int * RESTRICT cell_linked_list,  // cell list
+            %(DTYPE)s * RESTRICT b_tmp,       // tmp space for sending
+            const long STRIDE,                // component stride (SoA)
+            %(DTYPE)s * RESTRICT b_recv,      // tmp space for recving (SoA)
+            const int shm,                    // use the shared memory path
+            const int f_MPI_WIN,              // F90 shared window
+            const int f_NODE_COMM,            // F90 node local comm
+            const int * RESTRICT SHM_SEND,    // node rank of send rank or -1
+            const int * RESTRICT SHM_RECV,    // node rank of recv rank or -1
+            long * RESTRICT SHM_NEED,         // values packed for node ranks
+            const int trim,                   // halos are trimmed
+            const int * RESTRICT SEND_MASK    // directions to send particles
+            '''
+
 ##"""
 ##rst_doc{
 ##
@@ -82,13 +124,19 @@ class ParticleDat(host.Matrix):
     :arg int ncol: Dimension of property to store per particle (Number of columns in matrix).
     :arg initial_value: Value to initialise array with, default zeros.
     :arg str name: Collective name of stored vars eg positions.
+    :arg bool soa: Store the components in structure of arrays layout, each
+        component is stored in a padded and aligned contiguous array.
     """
 
-    def __init__(self, npart=0, ncomp=1, initial_value=None, name=None, dtype=ctypes.c_double):
+    def __init__(self, npart=0, ncomp=1, initial_value=None, name=None, dtype=ctypes.c_double,
+                 soa=False):
         # version ids. Internal then halo.
 
         assert ncomp > 0, "Negative number of components is not supported."
 
+        self.soa = bool(soa)
+        """:return: True if the components are stored in structure of arrays layout."""
+
         self._vid_int = 0
         self._vid_halo = -1
         self.vid_halo_cell_list = -1
@@ -114,6 +162,12 @@ class ParticleDat(host.Matrix):
             nrow=npart,
             ncol=ncomp
         )
+        _nrow = self._dat.shape[0]
+
+        if self.soa:
+            self._dat = self._soa_copy(self._dat, _nrow)
+        # capacity managed storage that _dat is a view onto
+        self._buf = self._dat
 
         self._ptr = None
         self._ptr_count = 0
@@ -121,7 +175,7 @@ class ParticleDat(host.Matrix):
         self.max_npart = self._dat.shape[0]
         """:return: The maximum number of particles which can be stored within this particle dat."""
 
-        self.npart_local = self._dat.shape[0]
+        self.npart_local = _nrow
         """:return: The number of particles with properties stored in the particle dat."""
 
         self.ncomp = self.ncol
@@ -138,6 +192,14 @@ class ParticleDat(host.Matrix):
 
         self._exchange_lib = None
         self._tmp_halo_space = host.Array(ncomp=1, dtype=self.dtype)
+        # SoA dats cannot recv directly into the dat
+        self._tmp_halo_recv_space = host.Array(ncomp=1, dtype=self.dtype)
+        # packed boundary particles in a node shared window
+        self._shm_halo_space = None
+        # values packed into the window by the last exchange, the same copied
+        # for the non-blocking reduction over the node and the reduced value
+        self._shm_need = host.Array(ncomp=3, dtype=ctypes.c_long)
+        self._shm_need_req = None
 
         # tmp space for norms/maxes etc
         self._norm_tmp = ScalarArray(ncomp=1, dtype=self.dtype)
@@ -148,6 +210,49 @@ class ParticleDat(host.Matrix):
 
         self._particle_dat_modifier = ParticleDatModifier(self, type(self) == PositionDat)
 
+    def _soa_alloc(self, nrow):
+        """
+        Allocate zeroed SoA storage for at least nrow particles. The returned
+        array is a (nrow_padded, ncomp) view onto (ncomp, nrow_padded) storage.
+        """
+        pad = max(SOA_ALIGNMENT // ctypes.sizeof(self.dtype), 1)
+        stride = max(pad * ((int(nrow) + pad - 1) // pad), pad)
+        return host._create_aligned_zeros(
+            (self._dat.shape[1], stride), self.dtype, SOA_ALIGNMENT,
+            row_axis=1).T
+
+    def _soa_copy(self, src, nrow):
+        """
+        Copy the first nrow rows of an array of particle data into new SoA
+        storage.
+        """
+        new = self._soa_alloc(nrow)
+        n = min(nrow, src.shape[0])
+        new[:n:, :] = src[:n:, :]
+        return new
+
+    @property
+    def soa_stride(self):
+        """
+        :return: The number of elements between consecutive components of a
+        particle, i.e. the stride of the component arrays.
+        """
+        if self.soa:
+            return self._dat.strides[1] // ctypes.sizeof(self.dtype)
+        else:
+            return 1
+
+    def realloc(self, nrow, ncol):
+        if not self.soa:
+            return super().realloc(nrow, ncol)
+
+        assert ncol == self.ncomp, "cannot change the number of components"
+
+        if nrow != self._dat.shape[0]:
+            self._buf, self._dat = host._realloc_rows(
+                self._buf, self._dat, nrow, self._soa_alloc)
+            self._ptr = None
+
 
     def zero(self, n=None):
         if n is None:
@@ -205,6 +310,8 @@ class ParticleDat(host.Matrix):
     @data.setter
     def data(self, value):
         self.mark_halos_old()
+        if self.soa:
+            value = self._soa_copy(value, value.shape[0])
         self._dat = value
         self._ptr = None
 
@@ -233,7 +340,8 @@ class ParticleDat(host.Matrix):
         return ParticleDat(initial_value=self._dat[0:self.npart_local:],
                            ncomp=self.ncomp,
                            npart=self.npart_local,
-                           dtype=self.dtype)
+                           dtype=self.dtype,
+                           soa=self.soa)
 
     def broadcast_data_from(self, rank=0, _resize_callback=True):
         # in terms of MPI_COMM_WORLD
@@ -245,7 +353,37 @@ class ParticleDat(host.Matrix):
             s = np.array([self._dat.shape[0]], dtype=ctypes.c_int)
             self.comm.Bcast(s, root=rank)
             self.resize(s[0], _callback=_resize_callback)
-            self.comm.Bcast(self._dat, root=rank)
+            if self.soa:
+                tmp = np.ascontiguousarray(self._dat[:s[0]:, :])
+                self.comm.Bcast(tmp, root=rank)
+                self._dat[:s[0]:, :] = tmp
+            else:
+                self.comm.Bcast(self._dat, root=rank)
+
+    def scatter_data_from(self, rank, nrecv, offset, counts=None, rows=None):
+        """
+        Collectively send rows of this dat held on a rank to the other ranks.
+        :arg rank: Rank that holds the data.
+        :arg nrecv: Number of rows this rank receives.
+        :arg offset: Row the received rows are placed at, the dat must be
+        large enough.
+        :arg counts: On the root, the number of rows sent to each rank.
+        :arg rows: On the root, the indices of the rows to send ordered by
+        destination rank.
+        """
+        assert (rank > -1) and (rank < self.comm.Get_size()), "Invalid mpi rank"
+
+        sendbuf = None
+        if self.comm.Get_rank() == rank:
+            counts = self.ncomp * np.array(counts, dtype=ctypes.c_int64)
+            disp = np.zeros_like(counts)
+            disp[1:] = np.cumsum(counts)[:-1:]
+            sendbuf = (np.ascontiguousarray(self._dat[rows, :]),
+                       tuple(counts), tuple(disp), None)
+
+        tmp = np.zeros([nrecv, self.ncomp], dtype=self.dtype)
+        self.comm.Scatterv(sendbuf=sendbuf, recvbuf=tmp, root=rank)
+        self._dat[offset:offset + nrecv:, :] = tmp
 
     def gather_data_on(self, rank=0, _resize_callback=False):
 
@@ -274,12 +412,14 @@ class ParticleDat(host.Matrix):
                 tmp = np.zeros([self.npart_local, self.ncomp], dtype=self.dtype)
 
             self.comm.Gatherv(
-                sendbuf=self._dat[:send_size:, ::],
+                sendbuf=np.ascontiguousarray(self._dat[:send_size:, ::]),
                 recvbuf=(tmp, counts, disp, None),
                 root=rank
             )
 
             if self.comm.Get_rank() == rank:
+                if self.soa:
+                    tmp = self._soa_copy(tmp, tmp.shape[0])
                 self._dat = tmp
                 self._ptr = None
 
@@ -304,28 +444,12 @@ class ParticleDat(host.Matrix):
             else:
                 self.data[local_ids, :] = 0
 
-        exchange = False
-
-        if mode.halo and pair:
-            if self.group is not None:
-                celllist = self.group.get_cell_to_particle_map()
-
-                if celllist.halos_exist is True and \
-                        (
-                            self._vid_int > self._vid_halo or
-                            self.vid_halo_cell_list < celllist.version_id
-                        ):
-
-                    exchange = True
-            else:
-                # halo exchanges are currently not functional wihout a group
-                exchange = False
-
-        if exchange:
+        if mode.halo and pair and self.halo_required():
             self.halo_exchange()
 
             self._vid_halo = self._vid_int
-            self.vid_halo_cell_list = celllist.version_id
+            self.vid_halo_cell_list = \
+                self.group.get_cell_to_particle_map().version_id
         
         if self._ptr is None:
             #self._ptr = self._dat.ctypes.data_as(ctypes.POINTER(self.dtype))
@@ -355,6 +479,21 @@ class ParticleDat(host.Matrix):
         if mode.write:
             self.mark_halos_old()
 
+    def halo_required(self):
+        """
+        :return: True if the halo of the particle dat is out of date.
+        """
+        if self.group is None:
+            # halo exchanges are currently not functional wihout a group
+            return False
+
+        celllist = self.group.get_cell_to_particle_map()
+        return celllist.halos_exist is True and \
+            (
+                self._vid_int > self._vid_halo or
+                self.vid_halo_cell_list < celllist.version_id
+            )
+
     def halo_start_shift(self, shift):
         """
         Shift the starting point of the halo in the particle dat by the
@@ -417,9 +556,13 @@ class ParticleDat(host.Matrix):
         _halo_sizes = self.group._halo_update_exchange_sizes()
         if self._tmp_halo_space.ncomp < (self.ncomp * _halo_sizes[1]):
             # print "\t\t\tresizing temp halo space", _halo_sizes[1]
-            self._tmp_halo_space.realloc(int(1.1 * _halo_sizes[1] * self.ncomp))
+            self._tmp_halo_space.realloc(_halo_sizes[1] * self.ncomp)
+        if self.soa and self._tmp_halo_recv_space.ncomp < (self.ncomp * _halo_sizes[1]):
+            self._tmp_halo_recv_space.realloc(_halo_sizes[1] * self.ncomp)
+        self._shm_halo_update(_halo_sizes[1])
 
         self._transfer_unpack()
+        self._shm_halo_reduce()
         self.halo_start_shift(_halo_sizes[0])
 
         self.group._halo_update_post_exchange()
@@ -435,31 +578,53 @@ class ParticleDat(host.Matrix):
             self.__class__.__name__ + ':' + self.name + ':halo_exchange:count'
         ] = (self._halo_exchange_count)
 
+    def _shm_halo_update(self, nsend):
+        """
+        Create or grow the shared window used to exchange with ranks on the
+        same node. The window size is agreed by the reduction started after
+        the previous exchange, the window is only reallocated, collectively
+        on the node communicator, if a rank packed more values than fit.
+        Directions that do not fit the window are exchanged with messages.
+        """
+        node_comm = self.group._halo_manager.get_node_comm()
+        if self._shm_need_req is not None:
+            self._shm_need_req.Wait()
+            self._shm_need_req = None
+        if node_comm is None:
+            if self._shm_halo_space is not None:
+                self._shm_halo_space.free()
+                self._shm_halo_space = None
+            return
+
+        if self._shm_halo_space is None:
+            self._shm_need[2] = self.ncomp * nsend
+            node_comm.Allreduce(mpi.MPI.IN_PLACE, self._shm_need.data[2:],
+                                mpi.MPI.MAX)
+        elif self._shm_halo_space.array.shape[1] >= self._shm_need[2]:
+            return
+        else:
+            self._shm_halo_space.free()
+        self._shm_halo_space = mpi.SharedMem(
+            (2, int(1.1 * self._shm_need[2]) + 1), self.dtype, node_comm)
+
+    def _shm_halo_reduce(self):
+        """
+        Start the reduction over the node of the number of values packed into
+        the shared window by the last exchange.
+        """
+        if self._shm_halo_space is None:
+            return
+        self._shm_need[1] = self._shm_need[0]
+        self._shm_need_req = self.group._halo_manager.get_node_comm().Iallreduce(
+            self._shm_need.data[1:2], self._shm_need.data[2:], mpi.MPI.MAX)
+
     def _transfer_unpack(self):
         """
         pack and transfer the particle dat, rebuild cell list if needed
         """
         if self._exchange_lib is None:
 
-            _ex_args = '''
-            %(DTYPE)s * RESTRICT DAT,         // DAT pointer
-            int DAT_END,                      // end of dat.
-            const double * RESTRICT SHIFT,    // position shifts
-            const int f_MPI_COMM,             // F90 comm from mpi4py
-            const int * RESTRICT SEND_RANKS,  // send directions
-            const int * RESTRICT RECV_RANKS,  // recv directions
-            const int * RESTRICT h_ind,       // halo indices
-            const int * RESTRICT b_ind,       // local b indices
-            const int * RESTRICT h_arr,       // h cell indices
-            const int * RESTRICT b_arr,       // b cell indices
-            const int * RESTRICT dir_counts,  // expected recv counts
-            const int cell_offset,            // offset for cell list
-            const int sort_flag,              // does the cl require updating
-            int * RESTRICT ccc,               // cell contents count
-            int * RESTRICT crl,               // cell reverse lookup
-            int * RESTRICT cell_linked_list,  // cell list
-            %(DTYPE)s * RESTRICT b_tmp        // tmp space for sending
-            ''' % {'DTYPE': host.ctypes_map[self.dtype]}
+            _ex_args = HALO_EXCHANGE_ARGS % {'DTYPE': host.ctypes_map[self.dtype]}
 
             _ex_header = '''
             #include <generic.h>
@@ -469,6 +634,8 @@ class ParticleDat(host.Matrix):
             #define RESTRICT %(RESTRICT)s
 
             %(POS_ENABLE)s
+            %(SOA_ENABLE)s
+            #define DAT_IDX(row, comp) %(DAT_IDX)s
 
             extern "C" void HALO_EXCHANGE_PD(%(ARGS)s);
             '''
@@ -483,6 +650,34 @@ class ParticleDat(host.Matrix):
                 MPI_Status MPI_STATUS;
                 MPI_Request sr;
                 MPI_Request rr;
+                const int NLOCAL = DAT_END;
+
+                // Ranks on the same node read the packed boundary particles
+                // directly from the shared window of the sender. The window
+                // holds two buffers that are used for alternate directions.
+                // Per direction the sender tells the receiver on NODE_COMM
+                // if the particles are in the window or follow as a message,
+                // the receiver acknowledges reading the window with a zero
+                // byte message before the sender reuses the buffer.
+                MPI_Win SHM_WIN = MPI_WIN_NULL;
+                MPI_Comm NODE_COMM = MPI_COMM_NULL;
+                long shm_half = 0;
+                %(DTYPE)s * RESTRICT b_base = NULL;
+                int shm_flag[6];
+                MPI_Request shm_ack[6];
+                for( int dir=0 ; dir<6 ; dir++ ){ shm_ack[dir] = MPI_REQUEST_NULL; }
+                SHM_NEED[0] = 0;
+                if (shm) {
+                    SHM_WIN = MPI_Win_f2c(f_MPI_WIN);
+                    NODE_COMM = MPI_Comm_f2c(f_NODE_COMM);
+                    int node_rank = -1;
+                    MPI_Comm_rank(NODE_COMM, &node_rank);
+                    MPI_Aint shm_size;
+                    int shm_disp;
+                    MPI_Win_shared_query(SHM_WIN, node_rank, &shm_size, &shm_disp, &b_base);
+                    shm_half = shm_size / (2 * sizeof(%(DTYPE)s));
+                    MPI_Win_lock_all(MPI_MODE_NOCHECK, SHM_WIN);
+                }
 
                 //for( int dir=0 ; dir<6 ; dir++ ){
                 //    cout << "dir: " << dir << " count: " << dir_counts[dir] << endl;;
@@ -504,6 +699,26 @@ class ParticleDat(host.Matrix):
                     //packing index;
                     int p_index = -1;
 
+                    const int shm_send = shm && (SHM_SEND[dir] > -1);
+                    const int shm_recv = shm && (SHM_RECV[dir] > -1);
+
+                    // the cell counts bound the number of packed particles
+                    int win_send = 0;
+                    %(DTYPE)s * RESTRICT b_pack = b_tmp;
+                    if (shm_send) {
+                        long n_pack = 0;
+                        for( int cx=0 ; cx<b_c ; cx++ ){ n_pack += ccc[b_arr[b_s + cx]]; }
+                        n_pack *= %(NCOMP)s;
+                        if (n_pack > SHM_NEED[0]) { SHM_NEED[0] = n_pack; }
+                        win_send = n_pack <= shm_half;
+                    }
+                    if (win_send) {
+                        // wait for the reader of this half of the window
+                        if (dir > 1) { MPI_Wait(&shm_ack[dir - 2], MPI_STATUS_IGNORE); }
+                        MPI_Win_sync(SHM_WIN);
+                        b_pack = b_base + (dir %% 2) * shm_half;
+                    }
+
                     // packing loop
                     for( int cx=0 ; cx<b_c ; cx++ ){
 
@@ -514,15 +729,22 @@ class ParticleDat(host.Matrix):
                         int ix = cell_linked_list[cell_offset + ci];
                         while(ix > -1){
 
+                            // skip local particles out of range of the
+                            // neighbouring subdomain
+                            if (trim && (ix < NLOCAL) && !((SEND_MASK[ix] >> dir) & 1)){
+                                ix = cell_linked_list[ix];
+                                continue;
+                            }
+
                             p_index ++;
                             for( int iy=0 ; iy<%(NCOMP)s ; iy++ ){
 
-                                b_tmp[p_index * %(NCOMP)s + iy] = DAT[ix*%(NCOMP)s + iy];
+                                b_pack[p_index * %(NCOMP)s + iy] = DAT[DAT_IDX(ix, iy)];
 
-                                //cout << "packed: " << b_tmp[p_index * %(NCOMP)s +iy];
+                                //cout << "packed: " << b_pack[p_index * %(NCOMP)s +iy];
 
                                 #ifdef POS
-                                    b_tmp[p_index * %(NCOMP)s + iy] += SHIFT[dir*%(NCOMP)s + iy];
+                                    b_pack[p_index * %(NCOMP)s + iy] += SHIFT[dir*%(NCOMP)s + iy];
                                 #endif
 
                                 //cout << " p_shifted: " << b_tmp[p_index * %(NCOMP)s +iy] << endl;
@@ -539,24 +761,64 @@ class ParticleDat(host.Matrix):
                     cout << endl;
                     */
 
+                    // tell a node local receiver where the particles are
+                    MPI_Request fr = MPI_REQUEST_NULL;
+                    if (shm_send && ( p_index > -1 )){
+                        shm_flag[dir] = win_send;
+                        if (win_send) {
+                            MPI_Win_sync(SHM_WIN);
+                            MPI_Irecv(NULL, 0, MPI_INT, SHM_SEND[dir], 6 + dir, NODE_COMM, &shm_ack[dir]);
+                        }
+                        MPI_Isend(&shm_flag[dir], 1, MPI_INT, SHM_SEND[dir], dir, NODE_COMM, &fr);
+                    }
+                    const int send_msg = ( SEND_RANKS[dir] > -1 ) && ( p_index > -1 ) && ( !win_send );
+
+                    int win_recv = 0;
+                    if (shm_recv && ( dir_counts[dir] > 0 )){
+                        MPI_Recv(&win_recv, 1, MPI_INT, SHM_RECV[dir], dir, NODE_COMM, MPI_STATUS_IGNORE);
+                    }
+                    const int recv_msg = ( RECV_RANKS[dir] > -1 ) && ( dir_counts[dir] > 0 ) && ( !win_recv );
+
                     // start the sendrecv as non blocking.
-                    if (( SEND_RANKS[dir] > -1 ) && ( p_index > -1 ) ){
+                    if (send_msg){
                     MPI_Isend((void *) b_tmp, (p_index + 1) * %(NCOMP)s, %(MPI_DTYPE)s,
                              SEND_RANKS[dir], rank, MPI_COMM, &sr);
                     }
 
-                    if (( RECV_RANKS[dir] > -1 ) && ( dir_counts[dir] > 0 ) ){
+                    if (recv_msg){
+                    #ifdef SOA
+                    MPI_Irecv((void *) b_recv, %(NCOMP)s * dir_counts[dir],
+                              %(MPI_DTYPE)s, RECV_RANKS[dir], RECV_RANKS[dir], MPI_COMM, &rr);
+                    #else
                     MPI_Irecv((void *) &DAT[DAT_END * %(NCOMP)s], %(NCOMP)s * dir_counts[dir],
                               %(MPI_DTYPE)s, RECV_RANKS[dir], RECV_RANKS[dir], MPI_COMM, &rr);
+                    #endif
                     }
 
                     //cout << "DAT_END: " << DAT_END << endl;
 
 
-
+                    const int DAT_START = DAT_END;
                     int DAT_END_T = DAT_END;
                     DAT_END += dir_counts[dir];
 
+                    if (win_recv){
+                        MPI_Win_sync(SHM_WIN);
+                        MPI_Aint r_size;
+                        int r_disp;
+                        %(DTYPE)s * r_base;
+                        MPI_Win_shared_query(SHM_WIN, SHM_RECV[dir], &r_size, &r_disp, &r_base);
+                        const long r_half = r_size / (2 * sizeof(%(DTYPE)s));
+                        const %(DTYPE)s * RESTRICT r_tmp = r_base + (dir %% 2) * r_half;
+                        for( int px=0 ; px<dir_counts[dir] ; px++ ){
+                            for( int iy=0 ; iy<%(NCOMP)s ; iy++ ){
+                                DAT[DAT_IDX(DAT_START + px, iy)] = r_tmp[px * %(NCOMP)s + iy];
+                            }
+                        }
+                        MPI_Win_sync(SHM_WIN);
+                        MPI_Send(NULL, 0, MPI_INT, SHM_RECV[dir], 6 + dir, NODE_COMM);
+                    }
+
                     // build halo part of cell list whilst exchange occuring.
 
                     //#ifdef POS
@@ -593,12 +855,20 @@ class ParticleDat(host.Matrix):
                     //#endif
 
                     // after send has completed move to next direction.
-                    if (( SEND_RANKS[dir] > -1 ) && ( p_index > -1 ) ){
+                    MPI_Wait(&fr, MPI_STATUS_IGNORE);
+                    if (send_msg){
                         MPI_Wait(&sr, MPI_STATUS_IGNORE);
                     }
 
-                    if (( RECV_RANKS[dir] > -1 ) && ( dir_counts[dir] > 0 ) ){
+                    if (recv_msg){
                         MPI_Wait(&rr, MPI_STATUS_IGNORE);
+                        #ifdef SOA
+                        for( int px=0 ; px<dir_counts[dir] ; px++ ){
+                            for( int iy=0 ; iy<%(NCOMP)s ; iy++ ){
+                                DAT[DAT_IDX(DAT_START + px, iy)] = b_recv[px * %(NCOMP)s + iy];
+                            }
+                        }
+                        #endif
                     }
 
                     //MPI_Barrier(MPI_COMM);
@@ -608,6 +878,12 @@ class ParticleDat(host.Matrix):
 
                 }
 
+                if (shm) {
+                    // the window may be rewritten by the next exchange
+                    MPI_Waitall(6, shm_ack, MPI_STATUSES_IGNORE);
+                    MPI_Win_unlock_all(SHM_WIN);
+                }
+
                 return;
             }
             '''
@@ -617,10 +893,19 @@ class ParticleDat(host.Matrix):
             else:
                 _pos_enable = ''
 
+            if self.soa:
+                _soa_enable = '#define SOA'
+                _dat_idx = '((row) + (comp)*STRIDE)'
+            else:
+                _soa_enable = ''
+                _dat_idx = '((row)*%(NCOMP)s + (comp))' % {'NCOMP': self.ncomp}
+
             _ex_dict = {'ARGS': _ex_args,
                         'RESTRICT': build.MPI_CC.restrict_keyword,
                         'DTYPE': host.ctypes_map[self.dtype],
                         'POS_ENABLE': _pos_enable,
+                        'SOA_ENABLE': _soa_enable,
+                        'DAT_IDX': _dat_idx,
                         'NCOMP': self.ncomp,
                         'MPI_DTYPE': host.mpi_type_map[self.dtype]}
 
@@ -635,33 +920,58 @@ class ParticleDat(host.Matrix):
 
         # End of creation code -----------------------------------------
 
+        self._exchange_lib(*self._exchange_args())
+
+    def _exchange_args(self, sort_flag=None):
+        """
+        Arguments of the halo exchange library for the current cell list and
+        halo. If sort_flag is None the halo part of the cell list is sorted
+        when the cell list is newer than the halo.
+        """
         comm = self.group.domain.comm
         _h = self.group._halo_manager.get_halo_cell_groups()
         _b = self.group._halo_manager.get_boundary_cell_groups()
 
-        if self.group._cell_to_particle_map.version_id > self.group._cell_to_particle_map.halo_version_id:
+        if sort_flag is not None:
+            _sort_flag = ctypes.c_int(sort_flag)
+        elif self.group._cell_to_particle_map.version_id > self.group._cell_to_particle_map.halo_version_id:
             _sort_flag = ctypes.c_int(1)
         else:
             _sort_flag = ctypes.c_int(-1)
 
-        self._exchange_lib(self.ctypes_data,
-                           ctypes.c_int(self.npart_local),
-                           self.group._halo_manager.get_position_shifts().ctypes_data,
-                           ctypes.c_int(comm.py2f()),
-                           self.group._halo_manager.get_send_ranks().ctypes_data,
-                           self.group._halo_manager.get_recv_ranks().ctypes_data,
-                           _h[1].ctypes_data,
-                           _b[1].ctypes_data,
-                           _h[0].ctypes_data,
-                           _b[0].ctypes_data,
-                           self.group._halo_manager.get_dir_counts().ctypes_data,
-                           self.group._cell_to_particle_map.offset,
-                           _sort_flag,
-                           self.group._cell_to_particle_map.cell_contents_count.ctypes_data,
-                           self.group._cell_to_particle_map.cell_reverse_lookup.ctypes_data,
-                           self.group._cell_to_particle_map.cell_list.ctypes_data,
-                           self._tmp_halo_space.ctypes_data
-                           )
+        _trim, _send_mask = self.group._halo_manager.get_send_mask()
+
+        _shm = self._shm_halo_space
+        _shm_send, _shm_recv = self.group._halo_manager.get_shared_ranks()
+        if _shm is not None:
+            _shm_args = [ctypes.c_int(1),
+                         ctypes.c_int(_shm.win.py2f()),
+                         ctypes.c_int(self.group._halo_manager.get_node_comm().py2f())]
+        else:
+            _shm_args = [ctypes.c_int(0), ctypes.c_int(0), ctypes.c_int(0)]
+
+        return [self.ctypes_data,
+                ctypes.c_int(self.npart_local),
+                self.group._halo_manager.get_position_shifts().ctypes_data,
+                ctypes.c_int(comm.py2f()),
+                self.group._halo_manager.get_send_ranks().ctypes_data,
+                self.group._halo_manager.get_recv_ranks().ctypes_data,
+                _h[1].ctypes_data,
+                _b[1].ctypes_data,
+                _h[0].ctypes_data,
+                _b[0].ctypes_data,
+                self.group._halo_manager.get_dir_counts().ctypes_data,
+                self.group._cell_to_particle_map.offset,
+                _sort_flag,
+                self.group._cell_to_particle_map.cell_contents_count.ctypes_data,
+                self.group._cell_to_particle_map.cell_reverse_lookup.ctypes_data,
+                self.group._cell_to_particle_map.cell_list.ctypes_data,
+                self._tmp_halo_space.ctypes_data,
+                ctypes.c_long(self.soa_stride),
+                self._tmp_halo_recv_space.ctypes_data] + _shm_args + \
+               [_shm_send.ctypes_data, _shm_recv.ctypes_data,
+                self._shm_need.ctypes_data,
+                _trim, _send_mask.ctypes_data]
 
 #########################################################################
 # PositionDat.
@@ -669,13 +979,90 @@ class ParticleDat(host.Matrix):
 
 
 class PositionDat(ParticleDat):
-    def __init__(self, npart=0, ncomp=3, initial_value=None, name=None, dtype=ctypes.c_double):
+    def __init__(self, npart=0, ncomp=3, initial_value=None, name=None, dtype=ctypes.c_double,
+                 soa=False):
         if ncomp != 3: raise RuntimeError('ncomp must be 3 for PositionDat')
-        if dtype != ctypes.c_double: raise RuntimeError('dtype must be ctypes.c_double for PositionDat')
-        super().__init__(npart=npart, ncomp=3, dtype=ctypes.c_double)
+        # cell lists, neighbour lists and boundary conditions read positions
+        # as packed triples.
+        if soa: raise RuntimeError('SoA layout is not supported for PositionDat')
+        if dtype not in POSITION_DTYPES:
+            raise RuntimeError('dtype must be ctypes.c_double or ctypes.c_float for PositionDat')
+        super().__init__(npart=npart, ncomp=3, dtype=dtype)
 
-# this needs deleting after cell by cell is updated
-class TypedDat(object):
-    pass
+#########################################################################
+# TypedDat.
+#########################################################################
+
+
+class TypedDat(ScalarArray):
+    r"""
+    Table of parameters for each pair of particle species, e.g. the
+    :math:`\epsilon` and :math:`\sigma` of a Lennard-Jones mixture. The
+    species of each particle is held in an integer ParticleDat and the table
+    holds ``nparam`` values for each of the ``ntypes x ntypes`` ordered
+    pairs of species.
+
+    Pair loops pass the table to kernels as a read-only pointer to the
+    ``nparam`` values for the current pair, i.e. for symbol ``PARAM`` the
+    kernel reads ``PARAM[k]`` which is ``table[type_i, type_j, k]``. The
+    species ParticleDat must also be passed to the pair loop, with READ
+    access, such that it is available for halo particles.
+
+    :arg types: ParticleDat with ncomp=1 and integer dtype holding the
+    species of each particle, values in ``[0, ntypes)``.
+    :arg int ntypes: Number of species.
+    :arg int nparam: Number of parameters per pair of species.
+    :arg initial_value: Optional initial value with shape
+    ``(ntypes, ntypes, nparam)`` or ``(ntypes, ntypes)`` if nparam is 1.
+    :arg str name: Name of the table.
+    :arg dtype: Data type of the parameters.
+    """
+
+    def __init__(self, types, ntypes, nparam=1, initial_value=None, name=None,
+                 dtype=ctypes.c_double):
+
+        if not issubclass(type(types), ParticleDat) or types.ncomp != 1 or \
+                types.dtype not in TYPE_DTYPES:
+            raise RuntimeError('types must be a ParticleDat with ncomp=1 and '
+                               'an integer dtype')
+        assert ntypes > 0, "require at least one species"
+        assert nparam > 0, "require at least one parameter"
+
+        self.types = types
+        """ParticleDat holding the species of each particle."""
+        self.ntypes = int(ntypes)
+        """Number of species."""
+        self.nparam = int(nparam)
+        """Number of parameters per pair of species."""
+
+        super(TypedDat, self).__init__(
+            ncomp=self.ntypes * self.ntypes * self.nparam,
+            name=name,
+            dtype=dtype
+        )
+        if initial_value is not None:
+            self.table[:] = np.array(initial_value, dtype=dtype).reshape(
+                (self.ntypes, self.ntypes, self.nparam))
+
+    @property
+    def table(self):
+        """
+        :return: View of the parameters with shape (ntypes, ntypes, nparam).
+        """
+        return self.data.view().reshape(
+            (self.ntypes, self.ntypes, self.nparam))
+
+    def set_pair(self, type_a, type_b, value, symmetric=True):
+        """
+        Set the parameters for a pair of species.
+
+        :arg int type_a: First species.
+        :arg int type_b: Second species.
+        :arg value: nparam values for the pair.
+        :arg bool symmetric: Also set the parameters for (type_b, type_a).
+        """
+        self.table[type_a, type_b, :] = value
+        if symmetric:
+            self.table[type_b, type_a, :] = value
 
 
@@ -472,10 +472,15 @@ class BoundaryTypePeriodic(object):
     Class to hold and perform periodic boundary conditions.
 
     :arg state_in: State on which to apply periodic boundaries to.
+    :arg image_dat: Optional integer ParticleDat with 3 components of the
+    state. It counts the box lengths each particle was wrapped by, such that
+    the unwrapped position is P + image_dat * extent.
     """
 
-    def __init__(self, state_in=None):
+    def __init__(self, state_in=None, image_dat=None):
         self.state = state_in
+        self.image_dat = image_dat
+        self._lib_image_dat = None
 
         # Initialise timers
         self.timer_apply = ppmd.opt.Timer(runtime.TIMER, 0)
@@ -506,15 +511,24 @@ class BoundaryTypePeriodic(object):
         self.timer_apply.start()
 
         self._flag.data[0] = 0
+        images = self.image_dat
+        if images is not None:
+            if images.ncomp != 3 or images.soa or \
+                    images.dtype not in (ctypes.c_int, ctypes.c_int64):
+                raise RuntimeError('image_dat must be an AoS integer ' +
+                                   'ParticleDat with 3 components.')
 
         if comm.Get_size() == 1:
-            if self._one_process_pbc_lib is None:
+            if self._one_process_pbc_lib is None or \
+                    self._lib_image_dat is not images:
                 self._init_one_proc_lib()
             self._one_process_pbc_lib(
                 ctypes.c_int(self.state.npart_local),
                 self.state.get_position_dat().ctypes_data,
                 self.state.domain.extent.ctypes_data,
-                self._flag.ctypes_data
+                self._flag.ctypes_data,
+                host.NullIntArray.ctypes_data if images is None else
+                images.ctypes_data
             )
 
         else:
@@ -544,7 +558,8 @@ class BoundaryTypePeriodic(object):
             self.timer_move.start()
             self.state.move_to_neighbour(self._escape_linked_list,
                                          self._escape_count,
-                                         self.state.domain.get_shift())
+                                         self.state.domain.get_shift(),
+                                         images)
             self.timer_move.pause()
 
         self.timer_apply.pause()
@@ -601,27 +616,30 @@ class BoundaryTypePeriodic(object):
 
         self._escape_linked_list = host.Array(-1 * np.ones(26 + 2 * self.state.npart_local), dtype=ctypes.c_int)
 
-        dtype = self.state.get_position_dat().dtype
-        assert self.state.domain.boundary.dtype == dtype
-
         self._escape_guard_lib = ppmd.lib.build.lib_from_file_source(
             _LIB_SOURCES + 'EscapeGuard',
             'EscapeGuard',
             {
-                'SUB_REAL': self.state.get_position_dat().ctype,
+                'SUB_REAL': self.state.domain.boundary.ctype,
+                'SUB_POS_REAL': self.state.get_position_dat().ctype,
                 'SUB_INT': self._bin_to_lin.ctype
             }
         )['EscapeGuard']
 
     def _init_one_proc_lib(self):
 
-        assert self.state.domain.extent.dtype == self.state.get_position_dat().dtype
+        images = self.image_dat
+        self._lib_image_dat = images
         self._one_process_pbc_lib = build.lib_from_file_source(
             _LIB_SOURCES + 'OneRankPBC',
             'OneRankPBC',
             {
-                'SUB_REAL': self.state.get_position_dat().ctype,
-                'SUB_INT': self._flag.ctype
+                'SUB_REAL': self.state.domain.extent.ctype,
+                'SUB_POS_REAL': self.state.get_position_dat().ctype,
+                'SUB_INT': self._flag.ctype,
+                'SUB_IMG_INT': self._flag.ctype if images is None else
+                images.ctype,
+                'SUB_IMAGES': 0 if images is None else 1
             }
         )['OneRankPBC']
 
@@ -97,11 +97,22 @@ def create_halo_pairs_slice_halo(domain_in, slicexyz, direction):
 
 
 class CartesianHaloSix(object):
+    """
+    Halo exchange pattern that exchanges the boundary cells with the six
+    face neighbours, edge and corner halos are filled by forwarding received
+    halo particles in the later directions.
+
+    :arg domain_func: Function that returns the domain.
+    :arg cell_to_particle_map: Cell list of the state.
+    :arg cutoff_func: Function that returns the interaction cutoff plus skin,
+    needed to trim the halos, see trim.
+    """
 
-    def __init__(self, domain_func, cell_to_particle_map):
+    def __init__(self, domain_func, cell_to_particle_map, cutoff_func=None):
         self._timer = ppmd.opt.Timer(runtime.TIMER, 0, start=True)
         
         self._domain_func = domain_func
+        self._cutoff_func = cutoff_func
         self._domain = None
 
         self._cell_to_particle_map = cell_to_particle_map
@@ -131,9 +142,22 @@ class CartesianHaloSix(object):
 
         self.dir_counts = host.Array(ncomp=6, dtype=ctypes.c_int)
 
+        # node local exchange partners for the shared memory halo exchange
+        self._node_comm = None
+        self._shared_send = host.Array(ncomp=6, dtype=ctypes.c_int)
+        self._shared_recv = host.Array(ncomp=6, dtype=ctypes.c_int)
 
         self._halo_shifts = None
 
+        # If trim is set only the local particles of the boundary cells that
+        # are within the cutoff of the face of the neighbouring subdomain are
+        # sent. For each local particle the bits of the send mask record the
+        # directions the particle is sent in. The mask is determined when the
+        # cell counts are exchanged and reused until the cell list changes.
+        self.trim = runtime.HALO_TRIM
+        self._trim_active = False
+        self._send_mask = host.Array(ncomp=1, dtype=ctypes.c_int)
+
         # ensure first update
         self._boundary_cell_groups.inc_version(-1)
         self._boundary_groups_start_end_indices.inc_version(-1)
@@ -231,8 +255,68 @@ class CartesianHaloSix(object):
         # shifts for each direction.
         self._halo_shifts = host.Array(_s, dtype=ctypes.c_double)
 
+        self._setup_shared_ranks()
+
         self._version = self._domain.cell_array.version
 
+    def _setup_shared_ranks(self):
+        """
+        Determine which send and recv ranks share a node with this rank.
+        """
+        self._shared_send[:] = -1
+        self._shared_recv[:] = -1
+        if not (runtime.HALO_SHARED_MEM and runtime.MPI_SHARED_MEM):
+            self._node_comm = None
+            return
+
+        comm = self._domain.comm
+        if self._node_comm is None:
+            self._node_comm = comm.Split_type(mpi.MPI.COMM_TYPE_SHARED)
+        if self._node_comm.size == 1:
+            return
+
+        group = comm.Get_group()
+        node_group = self._node_comm.Get_group()
+        for dx in range(6):
+            if self._send_ranks[dx] > -1:
+                sx = mpi.MPI.Group.Translate_ranks(
+                    group, [int(self._send_ranks[dx])], node_group)[0]
+                if sx != mpi.MPI.UNDEFINED:
+                    self._shared_send[dx] = sx
+            if self._recv_ranks[dx] > -1:
+                rx = mpi.MPI.Group.Translate_ranks(
+                    group, [int(self._recv_ranks[dx])], node_group)[0]
+                if rx != mpi.MPI.UNDEFINED:
+                    self._shared_recv[dx] = rx
+        group.Free()
+        node_group.Free()
+
+    def get_node_comm(self):
+        """
+        Get the node local communicator used for shared memory halo exchange,
+        None if the shared memory exchange is disabled or this rank is the
+        only rank on the node.
+        """
+        self._update_domain()
+        if self._version < self._domain.cell_array.version:
+            self._get_pairs()
+
+        if self._node_comm is None or self._node_comm.size == 1:
+            return None
+        return self._node_comm
+
+    def get_shared_ranks(self):
+        """
+        Get the node local exchange partners. Returns a tuple, for each
+        direction the rank in the node communicator of the send rank and of
+        the recv rank, -1 if the rank is on another node.
+        """
+        self._update_domain()
+        if self._version < self._domain.cell_array.version:
+            self._get_pairs()
+
+        return self._shared_send, self._shared_recv
+
 
     def get_boundary_cell_groups(self):
         """
@@ -318,6 +402,15 @@ class CartesianHaloSix(object):
     def get_dir_counts(self):
         return self.dir_counts
 
+    def get_send_mask(self):
+        """
+        Get the send mask of the local particles for the current cell list.
+        Returns a tuple, a flag that is set if the halos are trimmed and the
+        array of send masks, if the flag is set bit dir of the send mask of a
+        local particle is set if the particle is sent in direction dir.
+        """
+        return ctypes.c_int(int(self._trim_active)), self._send_mask
+
     def exchange_cell_counts(self):
         """
         Exchange the contents count of cells between processes. This is
@@ -341,7 +434,16 @@ class CartesianHaloSix(object):
             int * RESTRICT t_count,           // amount of tmp space needed
             int * RESTRICT h_tmp,             // tmp space for recving
             int * RESTRICT b_tmp,             // tmp space for sending
-            int * RESTRICT dir_counts         // expected recv counts
+            int * RESTRICT dir_counts,        // expected recv counts
+            const int trim,                   // trim the halos
+            const int nlocal,                 // number of local particles
+            const int cell_offset,            // offset for cell list
+            const int * RESTRICT cell_list,   // cell list
+            const int * RESTRICT CA,          // cell array
+            const double * RESTRICT P,        // positions
+            const double * RESTRICT B,        // subdomain boundary
+            const double cutoff,              // cutoff plus skin
+            int * RESTRICT SEND_MASK          // directions to send particles
             '''
 
             _es_header = '''
@@ -365,6 +467,10 @@ class CartesianHaloSix(object):
                 int rank = -1; MPI_Comm_rank( MPI_COMM, &rank );
                 MPI_Status MPI_STATUS;
 
+                if (trim) {
+                    for( int ix=0 ; ix<nlocal ; ix++ ){ SEND_MASK[ix] = 0; }
+                }
+
                 // [W E] [N S] [O I]
                 for( int dir=0 ; dir<6 ; dir++ ){
 
@@ -378,10 +484,37 @@ class CartesianHaloSix(object):
 
                     int tmp_count = 0;
                     for( int ix=0 ; ix<dir_c ; ix++ ){
-                        b_tmp[ix] = ccc[b_arr[dir_s + ix]];    // copy into
+                        const int ci = b_arr[dir_s + ix];
+                        b_tmp[ix] = ccc[ci];                   // copy into
                                                                // send buffer
 
-                        tmp_count += ccc[b_arr[dir_s + ix]];
+                        const int cx = ci %% CA[0];
+                        const int cy = (ci / CA[0]) %% CA[1];
+                        const int cz = ci / (CA[0] * CA[1]);
+                        const int halo_cell = (cx == 0) || (cx == CA[0] - 1) ||
+                                              (cy == 0) || (cy == CA[1] - 1) ||
+                                              (cz == 0) || (cz == CA[2] - 1);
+
+                        // halo cells contain particles that were already
+                        // trimmed in an earlier direction
+                        if (trim && !halo_cell){
+                            const int dim = dir / 2;
+                            int count = 0;
+                            int px = cell_list[cell_offset + ci];
+                            while(px > -1){
+                                const double d = (dir %% 2 == 0) ?
+                                    P[px*3 + dim] - B[2*dim] :
+                                    B[2*dim + 1] - P[px*3 + dim];
+                                if (d < cutoff){
+                                    SEND_MASK[px] |= (1 << dir);
+                                    count++;
+                                }
+                                px = cell_list[px];
+                            }
+                            b_tmp[ix] = count;
+                        }
+
+                        tmp_count += b_tmp[ix];
                     }
 
                     *t_count = MAX(*t_count, tmp_count);
@@ -454,6 +587,19 @@ class CartesianHaloSix(object):
 
         assert ccc_ptr is not None, "No valid Cell Contents Count pointer found."
 
+        _n, _positions, _ = self._cell_to_particle_map.get_setup_parameters()
+        _nlocal = _n()
+        _cutoff = 0.0 if self._cutoff_func is None else self._cutoff_func()
+        self._trim_active = bool(self.trim) and (_cutoff > 0.0) and \
+            (type(ccc) is host.Array) and (_positions.dtype is ctypes.c_double)
+        if self._trim_active:
+            if self._send_mask.ncomp < _nlocal:
+                self._send_mask.realloc(_nlocal)
+            _trim_args = (_positions.ctypes_data,
+                          self._domain.boundary.ctypes_data)
+        else:
+            _trim_args = (None, None)
+
         self._exchange_sizes_lib(ctypes.c_int(self._domain.comm.py2f()),
                                  self._send_ranks.ctypes_data,
                                  self._recv_ranks.ctypes_data,
@@ -466,7 +612,16 @@ class CartesianHaloSix(object):
                                  ctypes.byref(self._t_count),
                                  self._h_tmp.ctypes_data,
                                  self._b_tmp.ctypes_data,
-                                 self.dir_counts.ctypes_data)
+                                 self.dir_counts.ctypes_data,
+                                 ctypes.c_int(int(self._trim_active)),
+                                 ctypes.c_int(_nlocal),
+                                 self._cell_to_particle_map.offset,
+                                 self._cell_to_particle_map.cell_list.ctypes_data,
+                                 self._domain.cell_array.ctypes_data,
+                                 _trim_args[0],
+                                 _trim_args[1],
+                                 ctypes.c_double(_cutoff),
+                                 self._send_mask.ctypes_data)
 
         # copy new sizes back to original array (eg for gpu)
         if type(ccc) is not host.Array:
@@ -9,7 +9,7 @@ import numpy as np
 import collections
 
 # package level
-from ppmd import access, runtime
+from ppmd import access, runtime, opt
 
 from ppmd.lib.common import ctypes_map
 
@@ -29,7 +29,8 @@ double_str = 'double'
 
 
 
-mpi_type_map = {ctypes.c_double: 'MPI_DOUBLE', ctypes.c_int: 'MPI_INT', ctypes.c_long: 'MPI_LONG'}
+mpi_type_map = {ctypes.c_double: 'MPI_DOUBLE', ctypes.c_float: 'MPI_FLOAT',
+                ctypes.c_int: 'MPI_INT', ctypes.c_long: 'MPI_LONG'}
 
 ###############################################################################
 # Get available memory.
@@ -104,6 +105,168 @@ def _create_from_existing(ndarray=None, dtype=None):
     return np.array(ndarray)
 
 
+_FIRST_TOUCH_LIB = None
+
+
+def init_first_touch():
+    """
+    Build the library that zeroes host arrays with the OpenMP threads, see
+    runtime.NUMA_FIRST_TOUCH. Collective on MPI_COMM_WORLD, arrays created
+    before this call are zeroed by the calling thread.
+    """
+    global _FIRST_TOUCH_LIB
+    if _FIRST_TOUCH_LIB is not None or not runtime.NUMA_FIRST_TOUCH:
+        return
+
+    from ppmd.lib import build
+    from ppmd.lib.common import OMP_DECOMP_HEADER
+
+    _header = r'''
+    #include <stdint.h>
+    #include <string.h>
+    #include <omp.h>
+    #define RESTRICT %(RESTRICT)s
+    %(DECOMP)s
+
+    extern "C" int FIRST_TOUCH(
+        char * RESTRICT ptr,
+        const int64_t nblock,
+        const int nrow,
+        const int64_t row_bytes
+    );
+    ''' % {'DECOMP': OMP_DECOMP_HEADER,
+           'RESTRICT': build.TMPCC.restrict_keyword}
+
+    _src = r'''
+    int FIRST_TOUCH(
+        char * RESTRICT ptr,
+        const int64_t nblock,
+        const int nrow,
+        const int64_t row_bytes
+    ){
+        // each thread zeroes the rows it processes in the OpenMP loops
+        #pragma omp parallel
+        {
+            int start, end;
+            get_thread_decomp(nrow, &start, &end);
+            for(int64_t bx=0 ; bx<nblock ; bx++){
+                memset(
+                    ptr + (bx * nrow + start) * row_bytes,
+                    0,
+                    (end - start) * row_bytes
+                );
+            }
+        }
+        return 0;
+    }
+    '''
+    _FIRST_TOUCH_LIB = build.simple_lib_creator(
+        _header, _src, 'FIRST_TOUCH')['FIRST_TOUCH']
+
+
+def _create_aligned_zeros(shape, dtype=ctypes.c_double, alignment=64,
+                          row_axis=0):
+    """
+    Create a C contiguous array of zeros where the first element is aligned to
+    the passed number of bytes. Large arrays are zeroed by the OpenMP threads
+    with the decomposition of the OpenMP loops over the row axis, see
+    init_first_touch.
+    :arg shape: Shape of array to create.
+    :arg dtype: Data type of array.
+    :arg int alignment: Alignment in bytes of the first element.
+    :arg int row_axis: Axis indexed by particles.
+    """
+    shape = tuple(int(sx) for sx in shape)
+    nbytes = int(np.prod(shape)) * ctypes.sizeof(dtype)
+
+    if _FIRST_TOUCH_LIB is not None and runtime.NUMA_FIRST_TOUCH and \
+            nbytes >= runtime.FIRST_TOUCH_MIN_BYTES:
+        buf = np.empty(nbytes + alignment, dtype=ctypes.c_uint8)
+        offset = (-buf.ctypes.data) % alignment
+        buf[:offset:] = 0
+        buf[offset + nbytes::] = 0
+        _FIRST_TOUCH_LIB(
+            ctypes.c_void_p(buf.ctypes.data + offset),
+            ctypes.c_int64(int(np.prod(shape[:row_axis:]))),
+            ctypes.c_int(shape[row_axis]),
+            ctypes.c_int64(int(np.prod(shape[row_axis + 1::])) *
+                           ctypes.sizeof(dtype))
+        )
+        opt.PROFILE['host:first_touch:count'] = \
+            opt.PROFILE.get('host:first_touch:count', 0) + 1
+    else:
+        buf = np.zeros(nbytes + alignment, dtype=ctypes.c_uint8)
+        offset = (-buf.ctypes.data) % alignment
+
+    return buf[offset:offset + nbytes:].view(dtype).reshape(shape)
+
+
+###############################################################################
+# Capacity managed storage.
+###############################################################################
+
+def _realloc_capacity(n, capacity):
+    """
+    Get the number of rows to allocate to hold n rows. Storage grows
+    geometrically by runtime.REALLOC_GROWTH and is only shrunk when less than
+    runtime.REALLOC_SHRINK of the capacity is requested.
+    :arg int n: Number of rows required.
+    :arg int capacity: Number of rows currently allocated.
+    """
+    if n > capacity:
+        return max(n, int(runtime.REALLOC_GROWTH * capacity))
+    elif n < runtime.REALLOC_SHRINK * capacity:
+        return max(n, int(runtime.REALLOC_GROWTH * n))
+    return capacity
+
+
+def _realloc_rows(buf, data, nrow, alloc):
+    """
+    Resize the leading dimension of an array that is a view onto capacity
+    managed storage. New storage is only allocated if the capacity changes,
+    otherwise the returned view shares the pointer of the passed view and
+    rows that become visible are zeroed.
+    :arg buf: Current storage, None if data is not a view onto storage.
+    :arg data: Current view of nrow_old rows.
+    :arg int nrow: New number of rows.
+    :arg alloc: Callable that returns new zeroed storage for at least the
+    passed number of rows.
+    :return: Tuple, the storage and a view of nrow rows onto the storage.
+    """
+    if buf is None or buf.ctypes.data != data.ctypes.data or \
+            buf.strides != data.strides or buf.shape[1:] != data.shape[1:]:
+        buf = data
+
+    nrow = int(nrow)
+    nrow_old = data.shape[0]
+    capacity = _realloc_capacity(nrow, buf.shape[0])
+
+    opt.PROFILE['host:realloc:count'] = \
+        opt.PROFILE.get('host:realloc:count', 0) + 1
+
+    if capacity == buf.shape[0]:
+        if nrow > nrow_old:
+            buf[nrow_old:nrow:, ...] = 0
+        opt.PROFILE['host:realloc:in_place:count'] = \
+            opt.PROFILE.get('host:realloc:in_place:count', 0) + 1
+        return buf, buf[:nrow:, ...]
+
+    nbytes = capacity * (buf.nbytes // max(buf.shape[0], 1))
+    assert nbytes < available_free_memory(), \
+        "host realloc error: Not enough free memory. Requested: " + \
+        str(nbytes) + " have: " + str(available_free_memory())
+
+    new = alloc(capacity)
+    n = min(nrow, nrow_old)
+    new[:n:, ...] = data[:n:, ...]
+
+    opt.PROFILE['host:realloc:copy:count'] = \
+        opt.PROFILE.get('host:realloc:copy:count', 0) + 1
+    opt.PROFILE['host:realloc:copy:bytes'] = \
+        opt.PROFILE.get('host:realloc:copy:bytes', 0) + data[:n:, ...].nbytes
+    return new, new[:nrow:, ...]
+
+
 
 ###############################################################################
 # Array.
@@ -134,6 +297,8 @@ class Array(_Array):
         self.data = _make_array(initial_value=initial_value,
                                     dtype=dtype,
                                     ncol=ncomp)
+        # capacity managed storage that data is a view onto
+        self._buf = self.data
         
         self._ptr = None
         self._ptr_count = 0
@@ -187,13 +352,9 @@ class Array(_Array):
     def realloc(self, length):
 
         if length != self.ncomp:
-
-            assert ctypes.sizeof(self.dtype) * length < available_free_memory(),\
-                "host.Array realloc error: Not enough free memory. Requested: " +\
-                str(ctypes.sizeof(self.dtype) * length) + " have: " +\
-                str(available_free_memory())
-
-            self.data = np.resize(self.data, length)
+            self._buf, self.data = _realloc_rows(
+                getattr(self, '_buf', None), self.data, length,
+                lambda n: _create_aligned_zeros((n,), self.idtype))
             self._ptr = None
 
     def zero(self):
@@ -251,6 +412,8 @@ class Matrix(object):
                                  dtype=dtype,
                                  nrow=nrow,
                                  ncol=ncol)
+        # capacity managed storage that _dat is a view onto
+        self._buf = self._dat
 
         self._version = 0
 
@@ -310,12 +473,20 @@ class Matrix(object):
 
     def realloc(self, nrow, ncol):
 
-        assert ctypes.sizeof(self.dtype) * nrow * ncol < available_free_memory(), "host.Matrix realloc error: Not enough free memory."
-
+        if self.ncol != ncol:
+            assert ctypes.sizeof(self.dtype) * nrow * ncol < available_free_memory(), "host.Matrix realloc error: Not enough free memory."
+            new = _create_aligned_zeros((nrow, ncol), self.idtype)
+            n = min(nrow, self.nrow)
+            m = min(ncol, self.ncol)
+            new[:n:, :m:] = self._dat[:n:, :m:]
+            self._ptr = None
+            self._buf = self._dat = new
 
-        if self.ncol != ncol or self.nrow != nrow:
+        elif self.nrow != nrow:
             self._ptr = None
-            self._dat = np.resize(self.data,[nrow, ncol])
+            self._buf, self._dat = _realloc_rows(
+                getattr(self, '_buf', None), self._dat, nrow,
+                lambda n: _create_aligned_zeros((n, ncol), self.idtype))
 
 
 
@@ -4,7 +4,7 @@ int CellLinkedList(
     const INT end_ix,
     const INT n,
     const REAL * RESTRICT B,  // Inner boundary on local domain (inc halo cells)
-    const REAL * RESTRICT P,  // positions
+    const POS_REAL * RESTRICT P,  // positions
     const REAL * RESTRICT CEL,// cell edge lengths
     const INT * RESTRICT CA,  // local domain cell array
     INT * RESTRICT q,         // cell list
@@ -24,9 +24,9 @@ int CellLinkedList(
     #pragma omp parallel for default(none) shared(err, q, CCC, CRL, B,P,CEL,CA)
     for (INT ix=0; ix<end_ix; ix++) {
 
-        INT C0 = 1 + (INT)((P[ix*3]     - _b0)*_icel0);
-        INT C1 = 1 + (INT)((P[ix*3 + 1] - _b2)*_icel1);
-        INT C2 = 1 + (INT)((P[ix*3 + 2] - _b4)*_icel2);
+        INT C0 = 1 + (INT)(((REAL) P[ix*3]     - _b0)*_icel0);
+        INT C1 = 1 + (INT)(((REAL) P[ix*3 + 1] - _b2)*_icel1);
+        INT C2 = 1 + (INT)(((REAL) P[ix*3 + 2] - _b4)*_icel2);
 
         INT write_ok = 1;
 
@@ -7,6 +7,7 @@
 #define INT %(SUB_INT)s
 #define LONG %(SUB_LONG)s
 #define REAL %(SUB_REAL)s
+#define POS_REAL %(SUB_POS_REAL)s
 
 
 
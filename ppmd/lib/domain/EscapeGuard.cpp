@@ -13,7 +13,7 @@ int EscapeGuard(
     INT * RESTRICT BL, //bin to lin map
     INT * RESTRICT ELL, //escape linked list
     REAL * RESTRICT B, // boundary
-    REAL * RESTRICT P // positions
+    POS_REAL * RESTRICT P // positions
 ){
 
     int ELL_index = 26;
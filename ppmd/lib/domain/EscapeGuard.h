@@ -6,6 +6,7 @@
 #include "generic.h"
 
 #define REAL %(SUB_REAL)s
+#define POS_REAL %(SUB_POS_REAL)s
 #define INT %(SUB_INT)s
 
 
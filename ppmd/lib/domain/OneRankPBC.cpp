@@ -1,12 +1,22 @@
 
 
 
+// Positions may be stored in a lower precision than the extent. A wrapped
+// coordinate that rounds up onto the upper boundary is mapped to the lower
+// boundary.
+static inline POS_REAL pbc_store(const REAL x, const REAL e_2){
+    const POS_REAL px = (POS_REAL) x;
+    return (((REAL) px) >= e_2) ? ((POS_REAL) (-1.0*e_2)) : px;
+}
+
+
 extern "C"
 int OneRankPBC(
     INT _end,
-    REAL *P,
+    POS_REAL *P,
     REAL *E,
-    REAL *F
+    INT *F,
+    IMG_INT *I
 ){
 
     INT _F = 0;
@@ -16,43 +26,61 @@ int OneRankPBC(
         if (abs_md(P[3*_ix]) >= 0.5*E[0]){
             const REAL E0_2 = 0.5*E[0];
             const REAL x = P[3*_ix] + E0_2;
+            const REAL p0 = P[3*_ix];
 
             if (x < 0){
-                P[3*_ix] = (E[0] - fmod(abs_md(x) , E[0])) - E0_2;
+                P[3*_ix] = pbc_store((E[0] - fmod(abs_md(x) , E[0])) - E0_2, E0_2);
                 _F = 1;
             }
             else{
-                P[3*_ix] = fmod( x , E[0] ) - E0_2;
+                P[3*_ix] = pbc_store(fmod( x , E[0] ) - E0_2, E0_2);
                 _F = 1;
             }
+
+            // count the number of box lengths the particle was moved by
+            if (IMAGES) {
+                I[3*_ix] += (IMG_INT) lround((p0 - P[3*_ix]) / E[0]);
+            }
         }
 
         if (abs_md(P[3*_ix+1]) >= 0.5*E[1]){
             const REAL E1_2 = 0.5*E[1];
             const REAL x = P[3*_ix+1] + E1_2;
+            const REAL p0 = P[3*_ix+1];
 
             if (x < 0){
-                P[3*_ix+1] = (E[1] - fmod(abs_md(x) , E[1])) - E1_2;
+                P[3*_ix+1] = pbc_store((E[1] - fmod(abs_md(x) , E[1])) - E1_2, E1_2);
                 _F = 1;
             }
             else{
-                P[3*_ix+1] = fmod( x , E[1] ) - E1_2;
+                P[3*_ix+1] = pbc_store(fmod( x , E[1] ) - E1_2, E1_2);
                 _F = 1;
             }
+
+            // count the number of box lengths the particle was moved by
+            if (IMAGES) {
+                I[3*_ix+1] += (IMG_INT) lround((p0 - P[3*_ix+1]) / E[1]);
+            }
         }
 
         if (abs_md(P[3*_ix+2]) >= 0.5*E[2]){
             const REAL E2_2 = 0.5*E[2];
             const REAL x = P[3*_ix+2] + E2_2;
+            const REAL p0 = P[3*_ix+2];
 
             if (x < 0){
-                P[3*_ix+2] = (E[2] - fmod(abs_md(x) , E[2])) - E2_2;
+                P[3*_ix+2] = pbc_store((E[2] - fmod(abs_md(x) , E[2])) - E2_2, E2_2);
                 _F = 1;
             }
             else{
-                P[3*_ix+2] = fmod( x , E[2] ) - E2_2;
+                P[3*_ix+2] = pbc_store(fmod( x , E[2] ) - E2_2, E2_2);
                 _F = 1;
             }
+
+            // count the number of box lengths the particle was moved by
+            if (IMAGES) {
+                I[3*_ix+2] += (IMG_INT) lround((p0 - P[3*_ix+2]) / E[2]);
+            }
         }
 
     }
@@ -6,6 +6,9 @@
 #include "generic.h"
 
 #define REAL %(SUB_REAL)s
+#define POS_REAL %(SUB_POS_REAL)s
 #define INT %(SUB_INT)s
+#define IMG_INT %(SUB_IMG_INT)s
+#define IMAGES %(SUB_IMAGES)s
 
 
@@ -2,7 +2,7 @@
 
 extern "C"
 int PlainCellList(
-    const REAL * RESTRICT positions,
+    const POS_REAL * RESTRICT positions,
     const INT64 npart,
     const INT64 cell_offset,
     const INT64 * RESTRICT cell_array,
@@ -23,9 +23,9 @@ int PlainCellList(
 shared(positions, crl, inverse_cell_lengths, cell_array,\
 local_boundary) schedule(static, static_size)
     for(INT64 px=0 ; px<npart ; px++){
-        const REAL rx = positions[px*3]   - local_boundary[0];
-        const REAL ry = positions[px*3+1] - local_boundary[1];
-        const REAL rz = positions[px*3+2] - local_boundary[2];
+        const REAL rx = (REAL) positions[px*3]   - local_boundary[0];
+        const REAL ry = (REAL) positions[px*3+1] - local_boundary[1];
+        const REAL rz = (REAL) positions[px*3+2] - local_boundary[2];
         
         INT64 cx = (INT64) (rx * inverse_cell_lengths[0]);
         INT64 cy = (INT64) (ry * inverse_cell_lengths[1]);
@@ -4,6 +4,7 @@
 #include <cstdint>
 
 #define REAL double
+#define POS_REAL %(POS_REAL)s
 #define INT64 int64_t
 
 
@@ -19,6 +19,8 @@ import os
 from ppmd import runtime, host, opt, data, access
 from ppmd.lib import build
 from ppmd.lib.common import ctypes_map
+from ppmd.modules.dsl_soa_comp import DSLSoAComp, soa_stride_symbol
+from ppmd.modules.launch_plan import LaunchPlan
 
 def Restrict(keyword, symbol):
     return str(keyword) + ' ' + str(symbol)
@@ -53,6 +55,13 @@ class ParticleLoop(object):
                                              self._components['LIB_SRC'],
                                              self._kernel.name,
                                              CC=self._cc)
+        self._method = self._lib[self._kernel.name + '_wrapper']
+        self._profile_key = self.__class__.__name__ + ':' + \
+            self._kernel.name + ':execute_internal'
+        self._launch_plan = None
+        self._launch_nhead = 0
+        self._launch_n = ctypes.c_int(0)
+        self._launch_nthreads = ctypes.c_int(runtime.NUM_THREADS)
 
         self._group = None
 
@@ -139,12 +148,16 @@ class ParticleLoop(object):
             elif issubclass(type(dat[1][0]), host.Matrix):
                 # MAKE STRUCT TYPE
                 dtype = dat[1][0].dtype
-                ti = cgen.Pointer(cgen.Value(ctypes_map(dtype),
-                                             Restrict(self._cc.restrict_keyword,'i')))
-                if not dat[1][1].write:
-                    ti = cgen.Const(ti)
                 typename = '_'+dat[0]+'_t'
-                _kernel_structs.append(cgen.Typedef(cgen.Struct('', [ti], typename)))
+                if getattr(dat[1][0], 'soa', False):
+                    soa = DSLSoAComp(dat[0], ctypes_map(dtype), not dat[1][1].write)
+                    _kernel_structs.append(soa.header)
+                else:
+                    ti = cgen.Pointer(cgen.Value(ctypes_map(dtype),
+                                                 Restrict(self._cc.restrict_keyword,'i')))
+                    if not dat[1][1].write:
+                        ti = cgen.Const(ti)
+                    _kernel_structs.append(cgen.Typedef(cgen.Struct('', [ti], typename)))
 
                 # MAKE STRUCT ARG
                 _kernel_arg_decls.append(cgen.Value(typename, dat[0]))
@@ -155,6 +168,9 @@ class ParticleLoop(object):
 
             _kernel_lib_arg_decls.append(kernel_lib_arg)
 
+            if getattr(dat[1][0], 'soa', False):
+                _kernel_lib_arg_decls.append(soa.lib_arg_decl)
+
         self._components['KERNEL_ARG_DECLS'] = _kernel_arg_decls
         self._components['KERNEL_LIB_ARG_DECLS'] = _kernel_lib_arg_decls
         self._components['KERNEL_STRUCT_TYPEDEFS'] = _kernel_structs
@@ -216,9 +232,14 @@ class ParticleLoop(object):
                 kernel_call_symbols.append(call_symbol)
 
                 nc = str(dat[1][0].ncomp)
-                _ishift = '+' + self._components['LIB_PAIR_INDEX_0'] + '*' + nc
+                if getattr(dat[1][0], 'soa', False):
+                    _ishift = '+' + self._components['LIB_PAIR_INDEX_0']
+                    isym = '{ ' + dat[0] + _ishift + ', ' + \
+                        soa_stride_symbol(dat[0]) + ' }'
+                else:
+                    _ishift = '+' + self._components['LIB_PAIR_INDEX_0'] + '*' + nc
+                    isym = dat[0] + _ishift
 
-                isym = dat[0] + _ishift
                 g = cgen.Value('_'+dat[0]+'_t', call_symbol)
                 g = cgen.Initializer(g, '{ ' + isym + '}')
 
@@ -301,53 +322,68 @@ class ParticleLoop(object):
              'LIB_DIR': runtime.LIB_DIR}
         return code % d
 
-    def execute(self, n=None, dat_dict=None, static_args=None):
+    def _get_launch_head(self):
         """
-        C version of the pair_locate: Loop over all cells update forces and
-         potential engery.
+        Loop specific arguments that precede the static arguments.
         """
+        return [self._launch_n, self.loop_timer.get_python_parameters()]
 
-        args = []
-        # Add static arguments to launch command
+    def _get_launch_plan(self, dat_dict):
+        """
+        Return the launch plan for the passed dats, a new plan is created if
+        the dats differ from the dats of the last launch.
+        """
+        plan = self._launch_plan
+        if plan is None or plan.key != LaunchPlan.make_key(dat_dict):
+            head = self._get_launch_head()
+            nstatic = 0
+            if self._kernel.static_args is not None:
+                nstatic = len(self._kernel.static_args.items())
+            plan = self._create_launch_plan(dat_dict, len(head) + nstatic)
+            plan.args[:len(head)] = head
+            self._launch_nhead = len(head)
+            self._launch_plan = plan
+        return plan
+
+    def _create_launch_plan(self, dat_dict, nhead):
+        return LaunchPlan(self._dat_dict, dat_dict, nhead, pair=False,
+                          soa_stride=True)
+
+    def _set_launch_static_args(self, plan, static_args):
         if self._kernel.static_args is not None:
             assert static_args is not None, "Error: static arguments not " \
                                             "passed to loop."
-            args += self._kernel.static_args.get_args(static_args)
+            sargs = self._kernel.static_args.get_args(static_args)
+            s = self._launch_nhead
+            plan.args[s:s + len(sargs)] = sargs
+
+    def execute(self, n=None, dat_dict=None, static_args=None):
+        """
+        C version of the pair_locate: Loop over all cells update forces and
+         potential engery.
+        """
 
+        plan = self._get_launch_plan(dat_dict)
+        # Add static arguments to launch command
+        self._set_launch_static_args(plan, static_args)
         # pointer args
-        for dat in self._dat_dict.items(new_dats=dat_dict):
-            obj = dat[1][0]
-            mode = dat[1][1]
-            args.append(obj.ctypes_data_access(mode, pair=False))
-            if issubclass(type(obj), data.ParticleDat):
-                _N_LOCAL = obj.npart_local
+        args = plan.access()
 
         # get a number of particles
-        if n is None:
-            if self._group is not None:
-                _N_LOCAL = ctypes.c_int(self._group.npart_local)
-
+        if n is not None:
+            self._launch_n.value = n
+        elif self._group is not None:
+            self._launch_n.value = self._group.npart_local
         else:
-            _N_LOCAL = ctypes.c_int(n)
-
-        args2 = [_N_LOCAL]
-
-        args2.append(self.loop_timer.get_python_parameters())
-
-        args = args2 + args
-
-        '''Execute the kernel over all particle pairs.'''
-        method = self._lib[self._kernel.name + '_wrapper']
+            assert plan.npart_local_dat is not None, \
+                "cannot determine number of particles"
+            self._launch_n.value = plan.npart_local_dat.npart_local
 
+        # Execute the kernel over all particle pairs.
         self.wrapper_timer.start()
-        method(*args)
+        self._method(*args)
         self.wrapper_timer.pause()
 
-        opt.PROFILE[
-            self.__class__.__name__+':'+self._kernel.name+':execute_internal'
-        ] = (self.loop_timer.time)
+        opt.PROFILE[self._profile_key] = self.loop_timer.time
 
-        for dat in self._dat_dict.items(new_dats=dat_dict):
-            obj = dat[1][0]
-            mode = dat[1][1]
-            obj.ctypes_data_post(mode)
+        plan.post()
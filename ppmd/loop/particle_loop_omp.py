@@ -12,6 +12,8 @@ import cgen
 from ppmd import runtime, host, opt, data, access
 from ppmd.loop.particle_loop import ParticleLoop
 from ppmd.lib.common import ctypes_map, OMP_DECOMP_HEADER
+from ppmd.modules.dsl_soa_comp import DSLSoAComp, soa_stride_symbol
+from ppmd.modules.launch_plan import LaunchPlan
 
 def Restrict(keyword, symbol):
     return str(keyword) + ' ' + str(symbol)
@@ -89,12 +91,16 @@ class ParticleLoopOMP(ParticleLoop):
             elif issubclass(type(dat[1][0]), host.Matrix):
                 # MAKE STRUCT TYPE
                 dtype = dat[1][0].dtype
-                ti = cgen.Pointer(cgen.Value(ctypes_map(dtype),
-                                             Restrict(self._cc.restrict_keyword,'i')))
-                if not dat[1][1].write:
-                    ti = cgen.Const(ti)
                 typename = '_'+dat[0]+'_t'
-                _kernel_structs.append(cgen.Typedef(cgen.Struct('', [ti], typename)))
+                if getattr(obj, 'soa', False):
+                    soa = DSLSoAComp(symbol, ctypes_map(dtype), not mode.write)
+                    _kernel_structs.append(soa.header)
+                else:
+                    ti = cgen.Pointer(cgen.Value(ctypes_map(dtype),
+                                                 Restrict(self._cc.restrict_keyword,'i')))
+                    if not dat[1][1].write:
+                        ti = cgen.Const(ti)
+                    _kernel_structs.append(cgen.Typedef(cgen.Struct('', [ti], typename)))
 
                 # MAKE STRUCT ARG
                 _kernel_arg_decls.append(cgen.Value(typename, dat[0]))
@@ -105,6 +111,9 @@ class ParticleLoopOMP(ParticleLoop):
 
             _kernel_lib_arg_decls.append(kernel_lib_arg)
 
+            if getattr(obj, 'soa', False):
+                _kernel_lib_arg_decls.append(soa.lib_arg_decl)
+
         self._components['KERNEL_ARG_DECLS'] = _kernel_arg_decls
         self._components['KERNEL_LIB_ARG_DECLS'] = _kernel_lib_arg_decls
         self._components['KERNEL_STRUCT_TYPEDEFS'] = _kernel_structs
@@ -138,9 +147,14 @@ class ParticleLoopOMP(ParticleLoop):
                 kernel_call_symbols.append(call_symbol)
 
                 nc = str(dat[1][0].ncomp)
-                _ishift = '+' + self._components['LIB_PAIR_INDEX_0'] + '*' + nc
+                if getattr(dat[1][0], 'soa', False):
+                    _ishift = '+' + self._components['LIB_PAIR_INDEX_0']
+                    isym = '{ ' + dat[0] + _ishift + ', ' + \
+                        soa_stride_symbol(dat[0]) + ' }'
+                else:
+                    _ishift = '+' + self._components['LIB_PAIR_INDEX_0'] + '*' + nc
+                    isym = dat[0] + _ishift
 
-                isym = dat[0] + _ishift
                 g = cgen.Value('_'+dat[0]+'_t', call_symbol)
                 g = cgen.Initializer(g, '{ ' + isym + '}')
 
@@ -199,64 +213,41 @@ class ParticleLoopOMP(ParticleLoop):
 
 
 
+    def _get_launch_head(self):
+        return [self._launch_nthreads, self._launch_n,
+                self.loop_timer.get_python_parameters()]
+
+    def _create_launch_plan(self, dat_dict, nhead):
+        return LaunchPlan(self._dat_dict, dat_dict, nhead, pair=False,
+                          threaded=True, soa_stride=True)
+
     def execute(self, n=None, dat_dict=None, static_args=None):
         """
         C version of the pair_locate: Loop over all cells update forces and
          potential engery.
         """
 
-        _N_LOCAL = None
-        args = []
+        plan = self._get_launch_plan(dat_dict)
         '''Add static arguments to launch command'''
-        if self._kernel.static_args is not None:
-            assert static_args is not None, "Error: static arguments not " \
-                                            "passed to loop."
-            args += self._kernel.static_args.get_args(static_args)
-
-        for dat in self._dat_dict.items(new_dats=dat_dict):
-            obj = dat[1][0]
-            mode = dat[1][1]
-
-            if issubclass(type(obj), data.GlobalArrayClassic):
-                args.append(obj.ctypes_data_access(mode, pair=False, threaded=True))
-            else:
-                args.append(obj.ctypes_data_access(mode, pair=False))
-
-            if issubclass(type(obj), data.ParticleDat):
-                _N_LOCAL = obj.npart_local
-
+        self._set_launch_static_args(plan, static_args)
+        args = plan.access()
 
         '''Create arg list'''
-        if n is None and _N_LOCAL is None:
-            assert self._group is not None, "cannot determine number of particles"
-            _N_LOCAL = ctypes.c_int(self._group.npart_local)
-
         if n is not None:
-            _N_LOCAL = ctypes.c_int(n)
-
-        assert _N_LOCAL is not None
-        args2 = [ctypes.c_int(runtime.NUM_THREADS), _N_LOCAL]
-
-        args2.append(self.loop_timer.get_python_parameters())
+            self._launch_n.value = n
+        elif plan.npart_local_dat is not None:
+            self._launch_n.value = plan.npart_local_dat.npart_local
+        else:
+            assert self._group is not None, "cannot determine number of particles"
+            self._launch_n.value = self._group.npart_local
 
-        args = args2 + args
+        self._launch_nthreads.value = runtime.NUM_THREADS
 
         '''Execute the kernel over all particle pairs.'''
-        method = self._lib[self._kernel.name + '_wrapper']
-
         self.wrapper_timer.start()
-        method(*args)
+        self._method(*args)
         self.wrapper_timer.pause()
 
-        opt.PROFILE[
-            self.__class__.__name__+':'+self._kernel.name+':execute_internal'
-        ] = (self.loop_timer.time)
-
-        for dat in self._dat_dict.items(new_dats=dat_dict):
-            obj = dat[1][0]
-            mode = dat[1][1]
-            if issubclass(type(obj), data.GlobalArrayClassic):
-                obj.ctypes_data_post(mode, threaded=True)
-            else:
-                obj.ctypes_data_post(mode)
+        opt.PROFILE[self._profile_key] = self.loop_timer.time
 
+        plan.post()
@@ -33,6 +33,9 @@ import numpy as np
 
 # package level
 from ppmd import kernel, data, runtime, pio, mpi, opt, access, pairloop, loop
+from ppmd import host
+from ppmd.lib import build
+from ppmd.data.particle_dat import HALO_EXCHANGE_ARGS
 
 _MPI = mpi.MPI
 _MPIWORLD = mpi.MPI.COMM_WORLD
@@ -241,9 +244,7 @@ class IntegratorRange(object):
 
 
     def __iter__(self):
-        if self._pr is not None:
-            self._pr.enable()
-        self.timer.start()
+        self._start()
         return self
     def __next__(self):
         return self.next()
@@ -253,28 +254,464 @@ class IntegratorRange(object):
             self._ix += 1
             return self._ix
         else:
-            self._g.get_cell_to_particle_map().reset_callbacks()
-            self.timer.pause()
-            if self._pr is not None:
-                self._pr.disable()
-                self._pr.dump_stats(
-                    self._cprof_dump + '.' + str(
-                        _MPIRANK
-                    )
+            self._finalise()
+            raise StopIteration
+
+    def _start(self):
+        if self._pr is not None:
+            self._pr.enable()
+        self.timer.start()
+
+    def _finalise(self):
+        self._g.get_cell_to_particle_map().reset_callbacks()
+        self.timer.pause()
+        if self._pr is not None:
+            self._pr.disable()
+            self._pr.dump_stats(
+                self._cprof_dump + '.' + str(
+                    _MPIRANK
                 )
+            )
 
-            if self.verbose:
-                if _MPIRANK == 0:
-                    print(60*'=')
-                tt = self.timer.stop(str='Integration time:')
-                opt.PROFILE[
-                    self.__class__.__name__+':loop_time'
-                ] = tt
+        if self.verbose:
+            if _MPIRANK == 0:
+                print(60*'=')
+            tt = self.timer.stop(str='Integration time:')
+            opt.PROFILE[
+                self.__class__.__name__+':loop_time'
+            ] = tt
 
 
-                if _MPIRANK == 0:
-                    print(60*'-')
-                    opt.print_profile()
-                    print(60*'=')
+            if _MPIRANK == 0:
+                print(60*'-')
+                opt.print_profile()
+                print(60*'=')
 
-            raise StopIteration
+
+###############################################################################
+# Compiled integrator range class
+###############################################################################
+
+_COMPILED_PAIR_LOOP_TYPES = (pairloop.CellByCellOMP,
+                             pairloop.PairLoopNeighbourListNS,
+                             pairloop.PairLoopNeighbourListNSOMP)
+_COMPILED_LOOP_TYPES = (loop.ParticleLoop, loop.ParticleLoopOMP) + \
+    _COMPILED_PAIR_LOOP_TYPES
+
+
+def _c_parameters(decl):
+    """
+    Return the (type, name) pairs of the parameters of a C function
+    declaration or parameter list.
+    """
+    decl = re.sub(r'//[^\n]*', '', decl)
+    if '(' in decl:
+        decl = decl[decl.index('(') + 1: decl.rindex(')')]
+    params = []
+    for px in decl.split(','):
+        px = px.strip()
+        if len(px) > 0:
+            m = re.match(r'(.*?)(\w+)$', px, re.S)
+            params.append((' '.join(m.group(1).split()), m.group(2)))
+    return params
+
+
+class CompiledIntegratorRange(IntegratorRange):
+    """
+    Integrator range that executes the loops of each timestep itself. Runs of
+    timesteps between cell list rebuilds are executed by a generated driver
+    that calls the libraries of the loops directly, performs the halo
+    exchanges required by the pair loops and evaluates the list update
+    criterion without returning to Python. Timesteps that rebuild the cell
+    list and output steps are executed in Python. Neighbour lists only change
+    with the cell list, hence the list update criterion evaluated before the
+    first pair loop also covers the neighbour lists of the pair loops.
+
+    :arg int n: Number of timesteps.
+    :arg float dt: Timestep size.
+    :arg ParticleDat velocities: Velocities used to determine list updates.
+    :arg loops: Loops executed in order each timestep, each entry is a loop or
+    a tuple (loop, static_args). ParticleLoop, ParticleLoopOMP,
+    CellByCellOMP, PairLoopNeighbourListNS and PairLoopNeighbourListNSOMP
+    loops without GlobalArrays are supported.
+    :arg int list_reuse_count: Maximum number of steps between list rebuilds.
+    :arg float list_reuse_distance: Shell thickness of the pair loops.
+    :arg output_loops: Loops executed after the step loops on output steps,
+    reductions into GlobalArrays belong here.
+    :arg int output_interval: Number of timesteps between output steps, None
+    for no output steps.
+    :arg output: Callable called with the step index on output steps.
+    """
+    def __init__(self,
+                 n,
+                 dt,
+                 velocities,
+                 loops,
+                 list_reuse_count=1,
+                 list_reuse_distance=0.1,
+                 output_loops=(),
+                 output_interval=None,
+                 output=None,
+                 verbose=True,
+                 cprofile_dump=None
+                 ):
+
+        super(CompiledIntegratorRange, self).__init__(
+            n, dt, velocities,
+            list_reuse_count=list_reuse_count,
+            list_reuse_distance=list_reuse_distance,
+            verbose=verbose,
+            cprofile_dump=cprofile_dump
+        )
+
+        self._n = int(n)
+        self._velocities = velocities
+        self._loops = [self._loop_entry(lx) for lx in loops]
+        self._output_loops = [self._loop_entry(lx) for lx in output_loops]
+        self._output_interval = output_interval
+        self._output = output
+
+        self._check_loop = -1
+        for k, lx in enumerate(self._loops):
+            if type(lx[0]) not in _COMPILED_LOOP_TYPES:
+                raise RuntimeError('Unsupported loop type in compiled ' +
+                                   'timestep: ' + type(lx[0]).__name__)
+            for dx in lx[0]._dat_dict.items():
+                if issubclass(type(dx[1][0]), data.GlobalArrayClassic):
+                    raise RuntimeError('GlobalArrays are not supported in ' +
+                                       'compiled timestep loops, use ' +
+                                       'output_loops for reductions.')
+            if self._check_loop < 0 and \
+                    type(lx[0]) in _COMPILED_PAIR_LOOP_TYPES:
+                self._check_loop = k
+
+        self._lib = None
+        self._written = None
+        self._exchanges = None
+        self._zeroed = None
+        self._native_vid = None
+        self._native_npart = None
+
+        self.native_steps = 0
+        self.python_steps = 0
+
+    @staticmethod
+    def _loop_entry(lx):
+        if type(lx) is tuple:
+            return lx
+        return (lx, None)
+
+    def __iter__(self):
+        raise RuntimeError('CompiledIntegratorRange executes the timestep ' +
+                           'loops, use run().')
+
+    def _is_output_step(self, step):
+        return self._output_interval is not None and \
+            (step + 1) % self._output_interval == 0
+
+    def _execute_loops(self, loops, start=0):
+        for lx in loops[start:]:
+            lx[0].execute(static_args=lx[1])
+
+    def _execute_output(self, step):
+        if self._is_output_step(step):
+            self._execute_loops(self._output_loops)
+            if self._output is not None:
+                self._output(step)
+
+    def run(self):
+        """
+        Execute all timesteps.
+        """
+        self._start()
+        cell2part = self._g.get_cell_to_particle_map()
+        step = 0
+        # index of the loop to continue a step from that the native driver
+        # started, None for a new step
+        resume = None
+        while step < self._n:
+            if self._native_possible(cell2part):
+                end = step + 1
+                while end < self._n and not self._is_output_step(end - 1):
+                    end += 1
+                stop = self._native_run(step, end)
+                if stop[0] < 0:
+                    self._execute_output(end - 1)
+                    step = end
+                    continue
+                # a list rebuild is required, the step is finished in Python
+                step += stop[0]
+                resume = stop[1]
+                self._native_vid = None
+
+            if resume is None:
+                self._update_controller.increment_step_count()
+                self._ix = step
+            vid = cell2part.version_id
+            self._execute_loops(self._loops, 0 if resume is None else resume)
+            if resume is None and cell2part.version_id == vid:
+                self._native_vid = vid
+                self._native_npart = self._g.npart_local
+            else:
+                self._native_vid = None
+            resume = None
+            self.python_steps += 1
+            self._execute_output(step)
+            step += 1
+
+        self._finalise()
+
+    def _native_possible(self, cell2part):
+        return self._native_vid is not None and \
+            self._native_vid == cell2part.version_id and \
+            not cell2part.update_required and \
+            self._native_npart == self._g.npart_local
+
+    def _native_run(self, start, end):
+        if self._lib is None:
+            self._lib = self._build_lib()
+
+        suc = self._update_controller
+        vel = self._velocities
+        step_counter = ctypes.c_long(suc._step_counter)
+        moved_distance = ctypes.c_double(suc._moved_distance)
+        test_count = ctypes.c_int(suc._test_count)
+        stop = (ctypes.c_int * 2)(-1, -1)
+
+        args = [
+            ctypes.c_int(end - start),
+            ctypes.c_int(_MPIWORLD.py2f()),
+            ctypes.c_double(suc._dt),
+            ctypes.c_double(suc._delta),
+            ctypes.c_long(suc._step_count),
+            ctypes.c_int(self._g.npart_local),
+            vel.ctypes_data,
+            ctypes.c_long(vel.soa_stride),
+            ctypes.byref(step_counter),
+            ctypes.byref(moved_distance),
+            ctypes.byref(test_count),
+            stop
+        ]
+        funcs = [ctypes.cast(lx[0]._method, ctypes.c_void_p).value
+                 for lx in self._loops]
+        funcs += [ctypes.cast(dx._exchange_lib, ctypes.c_void_p).value
+                  for dx in self._exchanges]
+        funcs = (ctypes.c_void_p * len(funcs))(*funcs)
+        args.append(funcs)
+        for lx in self._loops:
+            args += lx[0]._launch_plan.args
+        for dx in self._exchanges:
+            args += dx._exchange_args(-1)
+        for dx in self._zeroed:
+            args.append(ctypes.c_long(dx.soa_stride))
+
+        if self._lib(*args) != 0:
+            raise RuntimeError('Compiled timestep failed.')
+
+        nsteps = end - start if stop[0] < 0 else stop[0]
+        suc._step_counter = step_counter.value
+        suc._moved_distance = moved_distance.value
+        suc._test_count = test_count.value
+        if nsteps > 0:
+            self._ix = start + nsteps - 1
+            suc._step_index = self._ix
+        if stop[0] >= 0:
+            self._ix = start + stop[0]
+
+        for dx in self._written:
+            dx.mark_halos_old()
+        self.native_steps += nsteps
+
+        return stop[0], stop[1]
+
+    def _build_lib(self):
+        cell2part = self._g.get_cell_to_particle_map()
+        vel = self._velocities
+
+        # dats are exchanged before a pair loop if written since they were
+        # last exchanged, the second pass gives the schedule of every step
+        written = []
+        exchanges = []
+        schedule = [[] for lx in self._loops]
+        stale = []
+        for passx in range(2):
+            for lx, sx in zip(self._loops, schedule):
+                pair = type(lx[0]) in _COMPILED_PAIR_LOOP_TYPES
+                items = lx[0]._launch_plan.dats
+                for dx in items:
+                    obj, mode = dx[1][0], dx[1][1]
+                    if pair and mode.halo and obj in stale and \
+                            cell2part.halos_exist is True:
+                        stale.remove(obj)
+                        if passx == 1:
+                            if obj not in exchanges:
+                                exchanges.append(obj)
+                            sx.append(exchanges.index(obj))
+                for dx in items:
+                    obj, mode = dx[1][0], dx[1][1]
+                    if issubclass(type(obj), data.ParticleDat) and mode.write:
+                        if obj not in stale:
+                            stale.append(obj)
+                        if obj not in written:
+                            written.append(obj)
+
+        args = [
+            'const int nsteps',
+            'const int f_MPI_COMM',
+            'const double dt',
+            'const double delta',
+            'const long reuse_count',
+            'const int npart_local',
+            'const %s * RESTRICT vel' % host.ctypes_map[vel.dtype],
+            'const long vel_stride',
+            'long * RESTRICT step_counter',
+            'double * RESTRICT moved_distance',
+            'int * RESTRICT test_count',
+            'int * RESTRICT stop',
+            'void ** RESTRICT funcs'
+        ]
+        exchange_args = []
+        zero_args = []
+        typedefs = []
+        calls = []
+        step = []
+        zeroed = []
+
+        for ex, dx in enumerate(exchanges):
+            params = _c_parameters(HALO_EXCHANGE_ARGS % {
+                'DTYPE': host.ctypes_map[dx.dtype]})
+            typedefs.append('typedef void (*_ppmd_exchange_%d_t)(%s);' % (
+                ex, ', '.join(px[0] + ' ' + px[1] for px in params)))
+            exchange_args += [px[0] + ' _x%d_%s' % (ex, px[1])
+                              for px in params]
+            calls.append('((_ppmd_exchange_%d_t) funcs[%d])(%s);' % (
+                ex, len(self._loops) + ex,
+                ', '.join('_x%d_%s' % (ex, px[1]) for px in params)))
+
+        if vel.soa:
+            vel_idx = 'ix + cx*vel_stride'
+        else:
+            vel_idx = 'ix*%d + cx' % vel.ncomp
+
+        for k, lx in enumerate(self._loops):
+            plan = lx[0]._launch_plan
+            params = _c_parameters(str(lx[0]._components['LIB_FUNC'].fdecl))
+            if len(params) != len(plan.args):
+                raise RuntimeError('Could not parse loop prototype.')
+            typedefs.append('typedef void (*_ppmd_step_loop_%d_t)(%s);' % (
+                k, ', '.join(px[0] + ' ' + px[1] for px in params)))
+            args += [px[0] + ' _l%d_%s' % (k, px[1]) for px in params]
+
+            if k == self._check_loop:
+                step.append(self._CHECK_CODE % {
+                    'LOOP': k,
+                    'VEL_NCOMP': vel.ncomp,
+                    'VEL_IDX': vel_idx
+                })
+            step += [calls[ex] for ex in schedule[k]]
+            for dx, px in zip(plan.dats, plan.positions):
+                obj, mode = dx[1][0], dx[1][1]
+                if mode is access.INC0 and \
+                        issubclass(type(obj), data.ParticleDat):
+                    code = self._ZERO_SOA_CODE if obj.soa else self._ZERO_CODE
+                    step.append(code % {
+                        'PTR': '_l%d_%s' % (k, params[px][1]),
+                        'NCOMP': obj.ncomp,
+                        'STRIDE': '_z%d_stride' % len(zeroed)
+                    })
+                    zero_args.append('const long _z%d_stride' % len(zeroed))
+                    zeroed.append(obj)
+            step.append('((_ppmd_step_loop_%d_t) funcs[%d])(%s);' % (
+                k, k, ', '.join('_l%d_%s' % (k, px[1]) for px in params)))
+
+        args += exchange_args + zero_args
+        self._written = written
+        self._exchanges = exchanges
+        self._zeroed = zeroed
+
+        header = self._HEADER % {
+            'RESTRICT': build.MPI_CC.restrict_keyword,
+            'TYPEDEFS': '\n'.join(typedefs),
+            'ARGS': ',\n'.join(args)
+        }
+        src = self._SRC % {
+            'ARGS': ',\n'.join(args),
+            'STEP': '\n'.join(step)
+        }
+        return build.simple_lib_creator(header, src, 'compiled_timestep',
+                                        CC=build.MPI_CC)['compiled_timestep']
+
+    _HEADER = """
+    #include <generic.h>
+    #include <mpi.h>
+    #include <string.h>
+    #include <math.h>
+    #define RESTRICT %(RESTRICT)s
+
+    %(TYPEDEFS)s
+
+    extern "C" int compiled_timestep(%(ARGS)s);
+    """
+
+    _SRC = """
+    int compiled_timestep(%(ARGS)s){
+
+        MPI_Comm MPI_COMM = MPI_Comm_f2c(f_MPI_COMM);
+        long _step_counter = step_counter[0];
+        double _moved_distance = moved_distance[0];
+        int _test_count = test_count[0];
+
+        stop[0] = -1;
+        stop[1] = -1;
+
+        for(int _step=0 ; _step<nsteps ; _step++){
+            _step_counter++;
+            %(STEP)s
+        }
+
+        step_counter[0] = _step_counter;
+        moved_distance[0] = _moved_distance;
+        test_count[0] = _test_count;
+        return 0;
+    }
+    """
+
+    # Criterion of ListUpdateController.determine_update_status. If a rebuild
+    # is required the driver returns before the pair loop which evaluates the
+    # criterion again in Python.
+    _CHECK_CODE = """
+    {
+        double _vmax = 0.0;
+        for(int cx=0 ; cx<%(VEL_NCOMP)s ; cx++){
+            for(int ix=0 ; ix<npart_local ; ix++){
+                const double _v = fabs((double) vel[%(VEL_IDX)s]);
+                _vmax = (_v > _vmax) ? _v : _vmax;
+            }
+        }
+        const double _moved = _moved_distance + dt*_vmax;
+        int _flag = ((_moved >= 0.5*delta) ||
+            (_step_counter %% reuse_count == 0)) ? 1 : 0;
+        int _flag_r = 0;
+        MPI_Allreduce(&_flag, &_flag_r, 1, MPI_INT, MPI_LOR, MPI_COMM);
+        if (_flag_r) {
+            step_counter[0] = _step_counter;
+            moved_distance[0] = _moved_distance;
+            test_count[0] = _test_count;
+            stop[0] = _step;
+            stop[1] = %(LOOP)s;
+            return 0;
+        }
+        _moved_distance = _moved;
+        _test_count++;
+    }
+    """
+
+    _ZERO_CODE = """
+    memset(%(PTR)s, 0, npart_local*%(NCOMP)s*sizeof(%(PTR)s[0]));
+    """
+
+    _ZERO_SOA_CODE = """
+    for(int cx=0 ; cx<%(NCOMP)s ; cx++){
+        memset(&%(PTR)s[cx*%(STRIDE)s], 0, npart_local*sizeof(%(PTR)s[0]));
+    }
+    """
@@ -0,0 +1,94 @@
+"""
+Create the C++ classes to access A.i[k] where the components of a ParticleDat
+are stored in structure of arrays (SoA) layout, i.e. A.i[k+1] is offset from
+A.i[k] by the stride of the component arrays.
+"""
+
+from __future__ import division, print_function, absolute_import
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+from cgen import *
+
+
+def soa_stride_symbol(sym):
+    """
+    :param sym: symbol used in kernel e.g. 'P'.
+    :return: Symbol used for the component stride of the passed symbol.
+    """
+    return '_S_' + sym
+
+
+def dat_index(obj, sym, row, comp):
+    """
+    C expression for the index of component comp of particle row in the
+    ParticleDat obj passed under the symbol sym.
+
+    :param obj: ParticleDat instance.
+    :param sym: symbol used in kernel e.g. 'P'.
+    :param row: row (particle) index expression.
+    :param comp: component index expression.
+    """
+    if getattr(obj, 'soa', False):
+        return '({row})+({comp})*{stride}'.format(
+            row=row, comp=comp, stride=soa_stride_symbol(sym))
+    else:
+        return '({row})*{ncomp}+({comp})'.format(
+            row=row, comp=comp, ncomp=obj.ncomp)
+
+
+class DSLSoAComp(object):
+    def __init__(self, sym, ctype, const, pair=False):
+        """
+        Creates the C/C++ required to access A.i[x] (and A.j[x] for pair
+        loops) for a SoA ParticleDat.
+
+        :param sym: symbol used in kernel e.g. 'P'.
+        :param ctype: c datatype to use e.g. 'double'.
+        :param const: bool, True/False to indicate write mode is read only.
+        :param pair: bool, True if the j particle should also be accessible.
+        """
+
+        c = 'const' if const else ''
+        self.accessor = "_{sym}_soa_t".format(sym=sym)
+        self.stride_sym = soa_stride_symbol(sym)
+
+        members = 'i;' if not pair else 'i; {acc} j;'.format(acc=self.accessor)
+
+        self.header = Line(
+            """
+            struct {acc} {{
+                {const} {ctype} * RESTRICT p;
+                int64_t s;
+                inline {const} {ctype}& operator[] (const int64_t ind) const
+                    {{return p[ind*s];}};
+            }};
+            typedef struct {{
+                {acc} {members}
+            }} _{sym}_t;
+            """.format(
+                acc=self.accessor,
+                ctype=ctype,
+                const=c,
+                sym=sym,
+                members=members
+            )
+        )
+        """Returns the class definitions."""
+
+        self.lib_arg_decl = Const(Value('int64_t', self.stride_sym))
+        """Returns the library argument for the component stride."""
+
+    def arg(self, ptr, stride=None):
+        """
+        :param ptr: Pointer expression to the first component of a particle.
+        :param stride: Stride expression, defaults to the dat stride.
+        :return: Initialiser for an accessor.
+        """
+        stride = self.stride_sym if stride is None else stride
+        return '{{ {ptr}, {stride} }}'.format(ptr=ptr, stride=stride)
+
+    def __repr__(self):
+        return str(self.header) + "\n" + str(self.lib_arg_decl)
+
@@ -0,0 +1,113 @@
+from __future__ import print_function, division, absolute_import
+
+import ctypes
+
+from ppmd import data
+
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+
+
+def halo_exchange(dats):
+    """
+    Exchange the out of date halos of the ParticleDats read by a pair loop
+    with one message per direction. Dats with a current halo are skipped, a
+    single out of date dat is left to ctypes_data_access.
+
+    :arg dats: ParticleDats of one state with halo access.
+    """
+    dats = [dx for dx in dats if dx.halo_required()]
+    if len(dats) > 1:
+        dats[0].group.halo_exchange(dats)
+
+
+class LaunchPlan(object):
+    """
+    Persistent argument list for repeated launches of a generated library.
+    The plan records the dats of a loop in launch order with the keyword
+    arguments of their access and post methods. The ctypes argument list is
+    kept between launches and only the entries that may change, pointers,
+    particle counts and SoA strides, are updated in place.
+
+    :arg DatArgStore dat_store: Dat store of the loop.
+    :arg dict dat_dict: Dats passed to execute, None for the initial dats.
+    :arg int nhead: Number of leading loop specific arguments.
+    :arg bool pair: Passed to ctypes_data_access of the dats.
+    :arg bool threaded: Passed to the access and post methods of
+    GlobalArrayClassic dats.
+    :arg bool soa_stride: Append the SoA stride after SoA ParticleDats.
+    """
+    def __init__(self, dat_store, dat_dict, nhead, pair=False, threaded=False,
+                 soa_stride=False):
+        self.key = LaunchPlan.make_key(dat_dict)
+        self.args = [None] * nhead
+        self.dats = dat_store.items(new_dats=dat_dict)
+        self.npart_local_dat = None
+        self.positions = []
+        self.halo_dats = []
+
+        self._access = []
+        self._post = []
+        self._strides = []
+
+        for dx in self.dats:
+            obj = dx[1][0]
+            mode = dx[1][1]
+            kwargs = {'pair': pair}
+            post_kwargs = {}
+            if threaded and issubclass(type(obj), data.GlobalArrayClassic):
+                kwargs['threaded'] = True
+                post_kwargs['threaded'] = True
+
+            self._access.append((len(self.args), obj.ctypes_data_access,
+                                 mode, kwargs))
+            self._post.append((obj.ctypes_data_post, mode, post_kwargs))
+            self.positions.append(len(self.args))
+            self.args.append(None)
+
+            if issubclass(type(obj), data.ParticleDat):
+                self.npart_local_dat = obj
+                if pair and mode.halo and obj.group is not None and \
+                        obj not in self.halo_dats:
+                    self.halo_dats.append(obj)
+                if soa_stride and obj.soa:
+                    self._strides.append(
+                        (obj, ctypes.c_int64(obj.soa_stride)))
+                    self.args.append(self._strides[-1][1])
+
+    @staticmethod
+    def make_key(dat_dict):
+        """
+        Key that identifies the dats passed to execute, None for the initial
+        dats of the loop.
+        """
+        if dat_dict is None:
+            return None
+        return tuple((sx, id(dx[0]), dx[1]) for sx, dx in dat_dict.items())
+
+    def halo_exchange(self):
+        """
+        Exchange the out of date halos of the ParticleDats read by a pair loop
+        with one message per direction.
+        """
+        halo_exchange(self.halo_dats)
+
+    def access(self):
+        """
+        Call ctypes_data_access on each dat and store the returned pointers
+        in the argument list.
+        """
+        args = self.args
+        for ix, func, mode, kwargs in self._access:
+            args[ix] = func(mode, **kwargs)
+        for obj, stride in self._strides:
+            if stride.value != obj.soa_stride:
+                stride.value = obj.soa_stride
+        return args
+
+    def post(self):
+        """
+        Call ctypes_data_post on each dat.
+        """
+        for func, mode, kwargs in self._post:
+            func(mode, **kwargs)
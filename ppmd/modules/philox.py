@@ -0,0 +1,222 @@
+"""
+Counter based random number generation (Philox4x32-10, Salmon et al. 2011)
+for use in generated kernels. Random numbers are a pure function of a seed, a
+particle global id, a step counter and a stream index, hence no generator
+state is stored or shared between threads, and results are independent of
+the domain decomposition and number of threads.
+"""
+
+from __future__ import division, print_function, absolute_import
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+import ctypes
+import time
+import numpy as np
+
+from ppmd import kernel, data, mpi
+
+_M0 = 0xD2511F53
+_M1 = 0xCD9E8D57
+_W0 = 0x9E3779B9
+_W1 = 0xBB67AE85
+_MASK32 = 0xFFFFFFFF
+_ROUNDS = 10
+
+PHILOX_HEADER = r'''
+#ifndef PPMD_PHILOX_H
+#define PPMD_PHILOX_H
+#include <stdint.h>
+#include <math.h>
+
+static inline void philox4x32(
+    const uint32_t * ctr_in,
+    const uint32_t * key_in,
+    uint32_t * out
+){
+    uint32_t c0 = ctr_in[0]; uint32_t c1 = ctr_in[1];
+    uint32_t c2 = ctr_in[2]; uint32_t c3 = ctr_in[3];
+    uint32_t k0 = key_in[0]; uint32_t k1 = key_in[1];
+    for(int rx=0 ; rx<%(ROUNDS)s ; rx++){
+        const uint64_t p0 = ((uint64_t) %(M0)sU) * ((uint64_t) c0);
+        const uint64_t p1 = ((uint64_t) %(M1)sU) * ((uint64_t) c2);
+        const uint32_t t0 = ((uint32_t) (p1 >> 32)) ^ c1 ^ k0;
+        const uint32_t t2 = ((uint32_t) (p0 >> 32)) ^ c3 ^ k1;
+        c1 = (uint32_t) p1;
+        c3 = (uint32_t) p0;
+        c0 = t0;
+        c2 = t2;
+        k0 += %(W0)sU;
+        k1 += %(W1)sU;
+    }
+    out[0] = c0; out[1] = c1; out[2] = c2; out[3] = c3;
+}
+
+// Two uniform deviates in (0, 1) for the particle with global id "id".
+static inline void philox_uniform(
+    const int64_t seed,
+    const int64_t id,
+    const int64_t step,
+    const int64_t stream,
+    double * out
+){
+    const uint32_t ctr[4] = {
+        (uint32_t) id, (uint32_t) (((uint64_t) id) >> 32),
+        (uint32_t) step, (uint32_t) stream
+    };
+    const uint32_t key[2] = {
+        (uint32_t) seed, (uint32_t) (((uint64_t) seed) >> 32)
+    };
+    uint32_t r[4];
+    philox4x32(ctr, key, r);
+    const uint64_t x0 = (((uint64_t) r[0]) << 32) | ((uint64_t) r[1]);
+    const uint64_t x1 = (((uint64_t) r[2]) << 32) | ((uint64_t) r[3]);
+    out[0] = ((double) (x0 >> 11) + 0.5) * 1.1102230246251565e-16;
+    out[1] = ((double) (x1 >> 11) + 0.5) * 1.1102230246251565e-16;
+}
+
+// Two independent standard normal deviates by the Box-Muller method.
+static inline void philox_normal(
+    const int64_t seed,
+    const int64_t id,
+    const int64_t step,
+    const int64_t stream,
+    double * out
+){
+    double u[2];
+    philox_uniform(seed, id, step, stream, u);
+    const double rr = sqrt(-2.0 * log(u[0]));
+    const double theta = 6.283185307179586 * u[1];
+    out[0] = rr * cos(theta);
+    out[1] = rr * sin(theta);
+}
+
+#endif
+''' % {'ROUNDS': _ROUNDS, 'M0': hex(_M0), 'M1': hex(_M1), 'W0': hex(_W0),
+       'W1': hex(_W1)}
+
+
+def philox4x32(ctr, key):
+    """
+    Numpy implementation of the Philox4x32-10 bijection.
+
+    :arg ctr: Array of shape (4, n) of 32 bit counters.
+    :arg key: Array of shape (2, n) or (2,) of 32 bit keys.
+    :return: Array of shape (4, n), dtype uint32.
+    """
+    c = [np.array(cx, dtype=np.uint64) & np.uint64(_MASK32) for cx in ctr]
+    k = [np.array(kx, dtype=np.uint64) & np.uint64(_MASK32) for kx in key]
+    for rx in range(_ROUNDS):
+        p0 = np.uint64(_M0) * c[0]
+        p1 = np.uint64(_M1) * c[2]
+        c = [
+            (p1 >> np.uint64(32)) ^ c[1] ^ k[0],
+            p1 & np.uint64(_MASK32),
+            (p0 >> np.uint64(32)) ^ c[3] ^ k[1],
+            p0 & np.uint64(_MASK32)
+        ]
+        k = [(k[0] + np.uint64(_W0)) & np.uint64(_MASK32),
+             (k[1] + np.uint64(_W1)) & np.uint64(_MASK32)]
+    return np.array(c, dtype=np.uint32)
+
+
+class PhiloxRNG(object):
+    """
+    Counter based random number generator for kernels. Pass the
+    :attr:`counter` ScalarArray to a loop with READ access and include
+    :attr:`header` in the kernel headers, then in the kernel
+
+    .. code-block:: c
+
+        double z[2];
+        philox_normal(RNG[0], GID.i[0], RNG[1], 0, z);
+
+    sets ``z`` to two standard normal deviates for the particle with global
+    id ``GID.i[0]``, here ``RNG`` is the symbol of :attr:`counter`.
+    ``philox_uniform`` returns uniform deviates in (0, 1). Each
+    (seed, id, step, stream) tuple gives independent values, use distinct
+    streams for multiple draws per particle and step and call
+    :meth:`advance` between steps. Only the lower 32 bits of the step and
+    stream are used.
+
+    :arg int seed: Seed (key) of the generator, by default taken from the
+    time on rank 0.
+    :arg int step: Initial value of the step counter.
+    """
+
+    def __init__(self, seed=None, step=0):
+        if seed is None:
+            seed = mpi.MPI.COMM_WORLD.bcast(int(time.time()), root=0)
+
+        self.counter = data.ScalarArray(ncomp=2, dtype=ctypes.c_int64,
+                                        name='philox_counter')
+        """ScalarArray holding the seed and step counter."""
+        self.counter.data[0] = seed
+        self.counter.data[1] = step
+
+        self.header = kernel.Header(block=PHILOX_HEADER)
+        """Kernel header defining philox_uniform and philox_normal."""
+
+    @property
+    def seed(self):
+        """Seed of the generator."""
+        return int(self.counter.data[0])
+
+    @property
+    def step(self):
+        """Current value of the step counter."""
+        return int(self.counter.data[1])
+
+    @step.setter
+    def step(self, value):
+        self.counter.data[1] = value
+
+    def advance(self, n=1):
+        """
+        Increment the step counter.
+
+        :arg int n: Number of steps to advance by.
+        """
+        self.counter.data[1] += n
+
+    def _bits(self, ids, step, stream):
+        ids = np.atleast_1d(np.array(ids, dtype=np.int64)).view(np.uint64)
+        step = self.step if step is None else step
+        seed = np.array(self.seed, dtype=np.int64).view(np.uint64)
+        n = ids.shape[0]
+        ctr = (ids & np.uint64(_MASK32), ids >> np.uint64(32),
+               np.full(n, step & _MASK32, dtype=np.uint64),
+               np.full(n, stream & _MASK32, dtype=np.uint64))
+        key = (seed & np.uint64(_MASK32), seed >> np.uint64(32))
+        r = philox4x32(ctr, key).astype(np.uint64)
+        x0 = (r[0] << np.uint64(32)) | r[1]
+        x1 = (r[2] << np.uint64(32)) | r[3]
+        return x0, x1
+
+    def uniform(self, ids, step=None, stream=0):
+        """
+        Evaluate the values ``philox_uniform`` gives in kernels.
+
+        :arg ids: Global ids of the particles.
+        :arg int step: Step counter, defaults to the current step.
+        :arg int stream: Stream index.
+        :return: Array of shape (n, 2).
+        """
+        x = self._bits(ids, step, stream)
+        return np.array([((xx >> np.uint64(11)).astype(np.float64) + 0.5) *
+                         1.1102230246251565e-16 for xx in x]).T
+
+    def normal(self, ids, step=None, stream=0):
+        """
+        Evaluate the values ``philox_normal`` gives in kernels.
+
+        :arg ids: Global ids of the particles.
+        :arg int step: Step counter, defaults to the current step.
+        :arg int stream: Stream index.
+        :return: Array of shape (n, 2).
+        """
+        u = self.uniform(ids, step, stream)
+        rr = np.sqrt(-2.0 * np.log(u[:, 0]))
+        theta = 2.0 * np.pi * u[:, 1]
+        return np.array((rr * np.cos(theta), rr * np.sin(theta))).T
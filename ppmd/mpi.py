@@ -6,6 +6,11 @@ Auto doc module
     :undoc-members:
     :members:
 
+.. autoclass:: SharedMem
+    :show-inheritance:
+    :undoc-members:
+    :members:
+
 
 """
 
@@ -307,6 +312,42 @@ class AllocMem:
             del self._mpi_alloc_ptr
 
 
+class SharedMem:
+    """
+    SharedMem behaves similarly to AllocMem except the memory is allocated in
+    an MPI-3 shared memory window over a node local communicator. Construction
+    and free are collective over the communicator.
+
+    :arg shape: Shape of the local segment.
+    :arg dtype: ctypes data type.
+    :arg comm: Communicator created with Split_type(COMM_TYPE_SHARED).
+    """
+    def __init__(self, shape, dtype, comm):
+        self._length = reduce(lambda x, y : x * y, shape)
+        self._dtype = dtype
+        self.win = MPI.Win.Allocate_shared(
+            ctypes.sizeof(dtype) * max(self._length, 1), ctypes.sizeof(dtype),
+            comm=comm
+        )
+        """Shared memory window."""
+        buf, _ = self.win.Shared_query(comm.Get_rank())
+        self.array = np.ndarray(buffer=buf, dtype=dtype, shape=shape)
+        """Numpy array formed from the local segment."""
+
+        self.array.fill(0)
+
+    @property
+    def ctypes_data(self):
+        return self.array.ctypes.data_as(ctypes.POINTER(self._dtype))
+
+    def free(self):
+        """
+        Free the window, must be called on all ranks of the communicator.
+        """
+        del self.array
+        self.win.Free()
+
+
 
 
 
@@ -29,6 +29,9 @@ class AllToAllNS(object):
             self._get_allowed_types(),
             dat_dict
         )
+        if self._dat_dict.uses_soa():
+            raise RuntimeError('SoA ParticleDats are not supported by ' +
+                               type(self).__name__)
 
         self._cc = build.TMPCC
 
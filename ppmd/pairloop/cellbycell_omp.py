@@ -14,6 +14,7 @@ from ppmd import data, runtime, host, access, modules, opt
 from ppmd.lib import build
 from ppmd.pairloop.neighbourlist import Restrict, scatter_matrix
 from ppmd.lib.common import ctypes_map
+from ppmd.modules.launch_plan import LaunchPlan
 
 _offsets = (
     (-1,1,-1),
@@ -57,6 +58,9 @@ class CellByCellOMP(object):
             self._get_allowed_types(),
             dat_dict
         )
+        if self._dat_dict.uses_soa():
+            raise RuntimeError('SoA ParticleDats are not supported by ' +
+                               type(self).__name__)
 
         self._cc = build.TMPCC
         self._kernel = kernel
@@ -70,6 +74,7 @@ class CellByCellOMP(object):
         self._generate()
 
         self._offset_list = host.Array(ncomp=27, dtype=ctypes.c_int)
+        self._offset_key = None
 
         self._lib = build.simple_lib_creator(self._generate_header_source(),
                                              self._components['LIB_SRC'],
@@ -91,6 +96,17 @@ class CellByCellOMP(object):
 
         self._jstore = [host.Array(ncomp=100, dtype=ctypes.c_int) for tx in \
                         range(runtime.NUM_THREADS)]
+        self._jptrs = None
+
+        self._method = self._lib[self._kernel.name + '_wrapper']
+        _prefix = self.__class__.__name__ + ':' + self._kernel.name + ':'
+        self._profile_keys = (_prefix + 'list_timer',
+                              _prefix + 'execute_internal',
+                              _prefix + 'kernel_execution_count')
+        self._launch_plan = None
+        self._launch_class_args = [
+            ctypes.c_int(0), ctypes.c_int(0), ctypes.c_int(0), ctypes.c_int(0)
+        ]
 
 
     def _make_cell_list(self, group):
@@ -100,6 +116,11 @@ class CellByCellOMP(object):
 
     def _make_offset_list(self, group):
         ca = group.domain.cell_array
+        # the offsets only change if the cell array changes
+        key = (ca[0], ca[1])
+        if key == self._offset_key:
+            return
+        self._offset_key = key
         for ofi, ofs in enumerate(_offsets):
             self._offset_list[ofi] = ofs[0] + ca[0]*ofs[1] + ca[0]*ca[1]*ofs[2]
 
@@ -282,18 +303,9 @@ class CellByCellOMP(object):
         return code % d
 
     def _update_opt(self):
-        opt.PROFILE[
-            self.__class__.__name__+':'+self._kernel.name+':list_timer'
-        ] = self.list_timer.time()
-
-        opt.PROFILE[
-            self.__class__.__name__+':'+self._kernel.name+':execute_internal'
-        ] = self.loop_timer.time
-
-        opt.PROFILE[
-            self.__class__.__name__+':'+self._kernel.name+\
-                ':kernel_execution_count'
-        ] =  self._kernel_execution_count
+        opt.PROFILE[self._profile_keys[0]] = self.list_timer.time()
+        opt.PROFILE[self._profile_keys[1]] = self.loop_timer.time
+        opt.PROFILE[self._profile_keys[2]] = self._kernel_execution_count
 
     def _generate_kernel_arg_decls(self):
 
@@ -552,15 +564,19 @@ class CellByCellOMP(object):
 
     def _init_jstore(self, cell2part):
         n = cell2part.max_cell_contents_count * 27
-        if self._jstore[0].ncomp < n:
+        if self._jstore[0].ncomp < n or \
+                len(self._jstore) != runtime.NUM_THREADS:
             self._jstore = [host.Array(ncomp=100+n, dtype=ctypes.c_int) for tx\
                             in range(runtime.NUM_THREADS)]
+            self._jptrs = None
 
-        self._jptrs = np.zeros(runtime.NUM_THREADS, ctypes.c_void_p)
-        for tx in range(runtime.NUM_THREADS):
-            self._jptrs[tx] = self._jstore[tx].ctypes_data.value
-        
-        return self._jptrs.ctypes.get_as_parameter()
+        if self._jptrs is None:
+            self._jptrs = np.zeros(runtime.NUM_THREADS, ctypes.c_void_p)
+            for tx in range(runtime.NUM_THREADS):
+                self._jptrs[tx] = self._jstore[tx].ctypes_data.value
+            self._jptrs_param = self._jptrs.ctypes.get_as_parameter()
+
+        return self._jptrs_param
         return (ctypes.POINTER(ctypes.c_int) * runtime.NUM_THREADS)(*[
             ctypes.POINTER(ctypes.c_int)(self._jstore[tx].ctypes_data) for tx in range(runtime.NUM_THREADS)
         ])
@@ -582,11 +598,17 @@ class CellByCellOMP(object):
                 n_start = 0
                 n_end = 0
 
+        nthreads, nstart, nend, noffset = self._launch_class_args
+        nthreads.value = runtime.NUM_THREADS
+        nstart.value = n_start
+        nend.value = n_end
+        noffset.value = offset
+
         return [
-            ctypes.c_int(runtime.NUM_THREADS),
-            ctypes.c_int(n_start),
-            ctypes.c_int(n_end),
-            ctypes.c_int(offset),
+            nthreads,
+            nstart,
+            nend,
+            noffset,
             cell2part.cell_list.ctypes_data,
             cell2part.cell_reverse_lookup.ctypes_data,
             cell2part.cell_contents_count.ctypes_data,
@@ -647,6 +669,55 @@ class CellByCellOMP(object):
         cell2part.check()
         self._make_cell_list(_group)
 
+        if local_id != access._local_id_false:
+            self._execute_local_id(cell2part, dat_dict, static_args, local_id)
+            return
+
+        plan = self._get_launch_plan(dat_dict)
+        args = plan.args
+        # Add static arguments to launch command
+        if self._kernel.static_args is not None:
+            assert static_args is not None, "Error: static arguments not " \
+                                            "passed to loop."
+            sargs = self._kernel.static_args.get_args(static_args)
+            args[10:10 + len(sargs)] = sargs
+
+        # Add pointer arguments to launch command, the first pass may
+        # reallocate dats through halo exchanges
+        plan.halo_exchange()
+        for dat_orig in plan.dats:
+            dat_orig[1][0].ctypes_data_access(dat_orig[1][1], pair=True)
+        plan.access()
+
+        # Rebuild neighbour list potentially
+        self._invocations += 1
+
+        args[:10] = self._get_class_lib_args(cell2part, local_id)
+
+        # Execute the kernel over all particle pairs.
+        self.wrapper_timer.start()
+        self._method(*args)
+        self.wrapper_timer.pause()
+
+        self._update_opt()
+        plan.post()
+
+    def _get_launch_plan(self, dat_dict):
+        """
+        Return the launch plan for the passed dats, a new plan is created if
+        the dats differ from the dats of the last launch.
+        """
+        plan = self._launch_plan
+        if plan is None or plan.key != LaunchPlan.make_key(dat_dict):
+            nstatic = 0
+            if self._kernel.static_args is not None:
+                nstatic = len(self._kernel.static_args.items())
+            plan = LaunchPlan(self._dat_dict, dat_dict, 10 + nstatic,
+                              pair=True, threaded=True)
+            self._launch_plan = plan
+        return plan
+
+    def _execute_local_id(self, cell2part, dat_dict, static_args, local_id):
         args = []
         # Add static arguments to launch command
         if self._kernel.static_args is not None:
@@ -666,12 +737,9 @@ class CellByCellOMP(object):
         args = args2 + args
 
         # Execute the kernel over all particle pairs.
-        method = self._lib[self._kernel.name + '_wrapper']
-
         self.wrapper_timer.start()
-        method(*args)
+        self._method(*args)
         self.wrapper_timer.pause()
-        
 
         self._update_opt()
         self._post_execute_dats(dat_dict, local_id)
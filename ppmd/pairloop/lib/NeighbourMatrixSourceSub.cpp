@@ -3,7 +3,7 @@
 extern "C"
 int OMPNeighbourMatrixSub(
         const INT64 NPART,
-        const REAL * RESTRICT P,
+        const POS_REAL * RESTRICT P,
         const INT64 *qlist,
         const INT64 qoffset,
         const INT64 *CRL,
@@ -38,9 +38,9 @@ reduction(+ : totaln) reduction(min: err)
             INT64 jx = qlist[qoffset + my_cell + tmp_offset[k]]; //get first particle in other cell.
             while(jx > -1){
                 if (px != jx) {
-                    const REAL rj0 = P[jx*3]   - P[px*3    ];
-                    const REAL rj1 = P[jx*3+1] - P[px*3 + 1];
-                    const REAL rj2 = P[jx*3+2] - P[px*3 + 2];
+                    const REAL rj0 = (REAL) P[jx*3]   - (REAL) P[px*3    ];
+                    const REAL rj1 = (REAL) P[jx*3+1] - (REAL) P[px*3 + 1];
+                    const REAL rj2 = (REAL) P[jx*3+2] - (REAL) P[px*3 + 2];
 
                     // check if close enough
                     if ( (rj0*rj0 + rj1*rj1+ rj2*rj2) <= cutoff2 ) {
@@ -3,6 +3,7 @@
 #include <cstdint>
 
 #define REAL double
+#define POS_REAL %(POS_REAL)s
 #define INT64 int64_t
 
 const INT64 h_map[27][3] = {
@@ -13,6 +13,8 @@ import ctypes, os
 
 from ppmd import runtime, opt
 from ppmd.lib import build
+from ppmd.lib.common import ctypes_map
+from ppmd.data.particle_dat import POSITION_DTYPES
 
 INT64 = ctypes.c_int64
 REAL = ctypes.c_double
@@ -39,16 +41,23 @@ class NeighbourListOMPSub(object):
         self.total_num_neighbours = 0
         self.max_size = 0
 
-        bn = os.path.join(os.path.dirname(__file__), 'lib')
-        bn += '/NeighbourMatrixSourceSub'
-        self._lib = build.lib_from_file_source(bn, 'OMPNeighbourMatrixSub')[
-            'OMPNeighbourMatrixSub'
-        ]
+        # libraries keyed by position data type
+        self._libs = {}
 
+    def _get_lib(self, dtype):
+        if dtype not in self._libs.keys():
+            bn = os.path.join(os.path.dirname(__file__), 'lib')
+            bn += '/NeighbourMatrixSourceSub'
+            self._libs[dtype] = build.lib_from_file_source(
+                bn, 'OMPNeighbourMatrixSub', {'POS_REAL': ctypes_map[dtype]})[
+                'OMPNeighbourMatrixSub'
+            ]
+        return self._libs[dtype]
 
     def update(self, npart_local, positions):
-        if positions.dtype is not REAL:
-            raise RuntimeError('positions must have dtype ctypes.c_double')
+        if positions.dtype not in POSITION_DTYPES:
+            raise RuntimeError(
+                'positions must have dtype ctypes.c_double or ctypes.c_float')
 
         self.timer_update.start()
         
@@ -67,7 +76,7 @@ class NeighbourListOMPSub(object):
         assert self.matrix.size >= npart_local * self.stride.value
 
         _nt = INT64(0)
-        ret = self._lib(
+        ret = self._get_lib(positions.dtype)(
             INT64(npart_local),
             positions.ctypes_data,
             self.cell_list.list.ctypes.get_as_parameter(),
@@ -17,14 +17,15 @@ from ppmd import data, runtime, access
 from ppmd.pairloop import neighbourlist_14cell
 from ppmd.pairloop import neighbourlist_27cell
 from ppmd.lib.common import ctypes_map
+from ppmd.modules.dsl_soa_comp import dat_index
+from ppmd.modules.launch_plan import LaunchPlan
 
 
 def gather_matrix(obj, symbol_dat, symbol_tmp, loop_index):
     nc = obj.ncomp
     t = '{'
     for tx in range(nc):
-        t+= '*(' + symbol_dat + '+' + loop_index
-        t+= '*' + str(nc) + '+' + str(tx) + '),'
+        t+= '*(' + symbol_dat + '+' + dat_index(obj, symbol_dat, loop_index, tx) + '),'
     t = t[:-1] + '}'
 
     g = cgen.Value(obj.ctype, symbol_tmp + '['+str(nc)+']')
@@ -33,16 +34,40 @@ def gather_matrix(obj, symbol_dat, symbol_tmp, loop_index):
 def scatter_matrix(obj, symbol_dat, symbol_tmp, loop_index):
     nc = obj.ncomp
 
-    b = cgen.Assign(symbol_dat+'[' + str(nc) + '*' + loop_index + '+_tx]',
+    b = cgen.Assign(symbol_dat+'[' + dat_index(obj, symbol_dat, loop_index, '_tx') + ']',
                     symbol_tmp + '[_tx]')
     g = cgen.For('int _tx=0', '_tx<' + str(nc), '_tx++',
                  cgen.Block([b]))
     return g
 
+def typed_dat_row(obj, symbol_dat, symbol_types, loop_index):
+    """
+    Pointer to the parameters of the TypedDat obj for the species of particle
+    loop_index paired with species 0.
+    """
+    idx = dat_index(obj.types, symbol_types, loop_index, 0)
+    g = cgen.Const(cgen.Pointer(cgen.Value(obj.ctype, symbol_dat + '_r')))
+    return cgen.Initializer(g, symbol_dat + ' + ' +
+                            str(obj.ntypes * obj.nparam) + '*' +
+                            symbol_types + '[' + idx + ']')
+
+def typed_dat_pair(obj, symbol_dat, symbol_types, loop_index):
+    """
+    Pointer to the parameters of the TypedDat obj for the pair of species
+    formed by the row gathered with typed_dat_row and particle loop_index.
+    """
+    idx = dat_index(obj.types, symbol_types, loop_index, 0)
+    g = cgen.Const(cgen.Pointer(cgen.Value(obj.ctype, symbol_dat + '_c')))
+    return cgen.Initializer(g, symbol_dat + '_r + ' + str(obj.nparam) + '*' +
+                            symbol_types + '[' + idx + ']')
+
 
 class PairLoopNeighbourListNS(object):
 
     _neighbour_list_dict_PNLNS = {}
+    _soa_support = False
+    # number of arguments returned by _get_class_lib_args
+    _nclass_args = 4
 
     def __init__(self, kernel=None, dat_dict=None, shell_cutoff=None):
 
@@ -50,6 +75,9 @@ class PairLoopNeighbourListNS(object):
             self._get_allowed_types(),
             dat_dict
         )
+        if self._dat_dict.uses_soa() and not self._soa_support:
+            raise RuntimeError('SoA ParticleDats are not supported by ' +
+                               type(self).__name__)
 
         self._cc = build.TMPCC
 
@@ -72,6 +100,8 @@ class PairLoopNeighbourListNS(object):
                                              self._components['LIB_SRC'],
                                              self._kernel.name,
                                              CC=self._cc)
+        self._method = self._lib[self._kernel.name + '_wrapper']
+        self._launch_plan = None
 
         self._group = None
 
@@ -141,6 +171,7 @@ class PairLoopNeighbourListNS(object):
     def _get_allowed_types():
         return {
             data.ScalarArray: access.all_access_types,
+            data.TypedDat: (access.READ,),
             data.ParticleDat: access.all_access_types,
             data.PositionDat: access.all_access_types,
             data.GlobalArrayClassic: (access.INC_ZERO, access.INC, access.READ),
@@ -156,6 +187,20 @@ class PairLoopNeighbourListNS(object):
          }
 
 
+    def _get_types_symbol(self, obj):
+        """
+        Symbol of the species ParticleDat of the TypedDat obj, which must be
+        passed to the loop with read access.
+        """
+        for dx in self._dat_dict.items():
+            if dx[1][0] is obj.types:
+                if dx[1][1].write:
+                    raise RuntimeError('The species ParticleDat of a TypedDat'
+                                       ' must be passed with READ access')
+                return dx[0]
+        raise RuntimeError('The species ParticleDat of a TypedDat must be '
+                           'passed to the pair loop')
+
     def _generate(self):
         self._init_components()
         self._generate_lib_specific_args()
@@ -320,7 +365,12 @@ class PairLoopNeighbourListNS(object):
         kernel_gather = cgen.Module([cgen.Comment('#### Pre kernel gather ####')])
 
         for i, dat in enumerate(self._dat_dict.items()):
-            if issubclass(type(dat[1][0]), host.Matrix) \
+            if type(dat[1][0]) is data.TypedDat:
+                kernel_gather.append(typed_dat_row(
+                    dat[1][0], dat[0], self._get_types_symbol(dat[1][0]),
+                    self._components['LIB_PAIR_INDEX_0']))
+
+            elif issubclass(type(dat[1][0]), host.Matrix) \
                     and dat[1][1].write \
                     and dat[1][0].ncomp <= self._gather_size_limit:
 
@@ -357,7 +407,12 @@ class PairLoopNeighbourListNS(object):
 
         for i, dat in enumerate(self._dat_dict.items()):
             ast = None
-            if issubclass(type(dat[1][0]), host._Array):
+            if type(dat[1][0]) is data.TypedDat:
+                call_symbol = dat[0] + '_c'
+                ast = typed_dat_pair(dat[1][0], dat[0],
+                                     self._get_types_symbol(dat[1][0]),
+                                     self._components['LIB_PAIR_INDEX_1'])
+            elif issubclass(type(dat[1][0]), host._Array):
                 call_symbol = dat[0]
             elif issubclass(type(dat[1][0]), host.Matrix):
                 call_symbol = dat[0] + '_c'
@@ -505,6 +560,38 @@ class PairLoopNeighbourListNS(object):
                 dat_orig[0].ctypes_data_access(dat_orig[1], pair=True)
 
 
+    def _get_launch_plan(self, dat_dict):
+        """
+        Return the launch plan for the passed dats, a new plan is created if
+        the dats differ from the dats of the last launch.
+        """
+        plan = self._launch_plan
+        if plan is None or plan.key != LaunchPlan.make_key(dat_dict):
+            nstatic = 0
+            if self._kernel.static_args is not None:
+                nstatic = len(self._kernel.static_args.items())
+            plan = self._new_launch_plan(dat_dict,
+                                         self._nclass_args + nstatic)
+            self._launch_plan = plan
+        return plan
+
+    def _new_launch_plan(self, dat_dict, nhead):
+        return LaunchPlan(self._dat_dict, dat_dict, nhead, pair=True)
+
+    def _launch_args(self, plan, static_args):
+        """
+        Add the static arguments to the launch plan and access the dats, the
+        first pass over the dats may reallocate dats through halo exchanges.
+        The leading arguments from _get_class_lib_args are set by the caller.
+        """
+        args = plan.args
+        sargs = self._get_static_lib_args(static_args)
+        args[self._nclass_args:self._nclass_args + len(sargs)] = sargs
+
+        for dat_orig in plan.dats:
+            dat_orig[1][0].ctypes_data_access(dat_orig[1][1], pair=True)
+        return plan.access()
+
     def _get_dat_lib_args(self, dats):
         args = []
         for dat_orig in self._dat_dict.values(dats):
@@ -546,8 +633,9 @@ class PairLoopNeighbourListNS(object):
         cell2part = _group.get_cell_to_particle_map()
         cell2part.check()
 
-        self._init_dat_lib_args(dat_dict)
-        args = self._get_dat_lib_args(dat_dict)
+        plan = self._get_launch_plan(dat_dict)
+        plan.halo_exchange()
+        args = self._launch_args(plan, static_args)
 
         '''Rebuild neighbour list potentially'''
         self._invocations += 1
@@ -557,20 +645,17 @@ class PairLoopNeighbourListNS(object):
         self.list_timer.pause()
 
         '''Create arg list'''
-        args = self._get_class_lib_args(neighbour_list) + \
-               self._get_static_lib_args(static_args) + args
+        args[:self._nclass_args] = self._get_class_lib_args(neighbour_list)
 
         '''Execute the kernel over all particle pairs.'''
-        method = self._lib[self._kernel.name + '_wrapper']
-
         self.wrapper_timer.start()
-        method(*args)
+        self._method(*args)
         self.wrapper_timer.pause()
 
         self._kernel_execution_count += neighbour_list.neighbour_starting_points[neighbour_list.n_local]
 
         self._update_opt()
-        self._post_execute_dats(dat_dict)
+        plan.post()
 
 
 ###############################################################################
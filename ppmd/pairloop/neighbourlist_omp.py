@@ -11,19 +11,29 @@ import ctypes
 
 from ppmd import data, runtime, host, access
 
-from ppmd.pairloop.neighbourlist import PairLoopNeighbourListNS, Restrict
+from ppmd.pairloop.neighbourlist import PairLoopNeighbourListNS, Restrict, \
+    typed_dat_row, typed_dat_pair
 from ppmd.pairloop.neighbour_matrix_omp import NeighbourListOMP
 
 from ppmd.pairloop.list_controller import nlist_controller
+from ppmd.modules.launch_plan import LaunchPlan
 from ppmd.lib.common import ctypes_map
+from ppmd.modules.dsl_soa_comp import DSLSoAComp, dat_index
 
 INT64 = ctypes.c_int64
 REAL = ctypes.c_double
 
+# Data types used to accumulate gathered ParticleDats which the kernel writes,
+# e.g. single precision forces are accumulated in double precision over the
+# neighbours of a particle before being written back.
+ACCUMULATOR_DTYPES = {ctypes.c_float: ctypes.c_double}
+
 
 class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
 
     _neighbour_list_dict_OMP = {}
+    _soa_support = True
+    _nclass_args = 6
 
     @staticmethod
     def _get_n_dict():
@@ -44,6 +54,7 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
     def _get_allowed_types():
         return {
             data.ScalarArray: (access.READ,),
+            data.TypedDat: (access.READ,),
             data.ParticleDat: access.all_access_types,
             data.PositionDat: access.all_access_types,
             data.GlobalArrayClassic: (access.INC_ZERO, access.INC, access.READ),
@@ -128,15 +139,20 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
             elif issubclass(type(dat[1][0]), host.Matrix):
                 # MAKE STRUCT TYPE
                 dtype = dat[1][0].dtype
-                ti = cgen.Pointer(cgen.Value(ctypes_map(dtype),
-                                             Restrict(self._cc.restrict_keyword,'i')))
-                tj = cgen.Pointer(cgen.Value(ctypes_map(dtype),
-                                             Restrict(self._cc.restrict_keyword,'j')))
-                if not dat[1][1].write:
-                    ti = cgen.Const(ti)
-                    tj = cgen.Const(tj)
                 typename = '_'+dat[0]+'_t'
-                _kernel_structs.append(cgen.Typedef(cgen.Struct('', [ti,tj], typename)))
+                if getattr(obj, 'soa', False):
+                    soa = DSLSoAComp(symbol, ctypes_map(dtype), not mode.write,
+                                     pair=True)
+                    _kernel_structs.append(soa.header)
+                else:
+                    ti = cgen.Pointer(cgen.Value(self._gather_ctype(obj, mode),
+                                                 Restrict(self._cc.restrict_keyword,'i')))
+                    tj = cgen.Pointer(cgen.Value(ctypes_map(dtype),
+                                                 Restrict(self._cc.restrict_keyword,'j')))
+                    if not dat[1][1].write:
+                        ti = cgen.Const(ti)
+                        tj = cgen.Const(tj)
+                    _kernel_structs.append(cgen.Typedef(cgen.Struct('', [ti,tj], typename)))
 
 
                 # MAKE STRUCT ARG
@@ -147,11 +163,25 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
 
             _kernel_lib_arg_decls.append(kernel_lib_arg)
 
+            if getattr(obj, 'soa', False):
+                _kernel_lib_arg_decls.append(soa.lib_arg_decl)
+
         self._components['KERNEL_ARG_DECLS'] = _kernel_arg_decls
         self._components['KERNEL_LIB_ARG_DECLS'] = _kernel_lib_arg_decls
         self._components['KERNEL_STRUCT_TYPEDEFS'] = _kernel_structs
 
 
+    def _gather_ctype(self, obj, mode):
+        """
+        C type of the i particle values passed to the kernel for a ParticleDat.
+        Written dats small enough to be gathered are accumulated in the type
+        given by ACCUMULATOR_DTYPES.
+        """
+        if mode.write and obj.ncomp <= self._gather_size_limit and \
+                not getattr(obj, 'soa', False):
+            return ctypes_map(ACCUMULATOR_DTYPES.get(obj.dtype, obj.dtype))
+        return ctypes_map(obj.dtype)
+
     def _generate_kernel_gather(self):
 
         kernel_gather = cgen.Module([
@@ -180,6 +210,11 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
 
                 kernel_gather.append(g)
 
+            elif type(obj) is data.TypedDat:
+                kernel_gather.append(typed_dat_row(
+                    obj, symbol, self._get_types_symbol(obj),
+                    self._components['LIB_PAIR_INDEX_0']))
+
             elif issubclass(type(obj), host.Matrix) \
                     and mode.write \
                     and obj.ncomp <= self._gather_size_limit:
@@ -188,12 +223,13 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
                 isym = symbol+'i'
                 nc = obj.ncomp
                 ncb = '['+str(nc)+']'
-                dtype = host.ctypes_map[obj.dtype]
+                dtype = self._gather_ctype(obj, mode)
 
                 t = '{'
                 for tx in range(nc):
-                    t+= '*(' + symbol + '+' + self._components['LIB_PAIR_INDEX_0']
-                    t+= '*' + str(nc) + '+' + str(tx) + '),'
+                    t+= '*(' + symbol + '+' + dat_index(
+                        obj, symbol, self._components['LIB_PAIR_INDEX_0'], tx)
+                    t+= '),'
                 t = t[:-1] + '}'
 
                 g = cgen.Value(dtype,isym+ncb)
@@ -219,6 +255,11 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
 
             if issubclass(type(obj), data.GlobalArrayClassic):
                 kernel_call_symbols.append(symbol+'_c')
+            elif type(obj) is data.TypedDat:
+                kernel_call_symbols.append(symbol+'_c')
+                kernel_call.append(typed_dat_pair(
+                    obj, symbol, self._get_types_symbol(obj),
+                    self._components['LIB_PAIR_INDEX_1']))
             elif issubclass(type(obj), host._Array):
                 kernel_call_symbols.append(symbol)
             elif issubclass(type(obj), host.Matrix):
@@ -226,14 +267,24 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
                 kernel_call_symbols.append(call_symbol)
 
                 nc = str(obj.ncomp)
-                _ishift = '+' + self._components['LIB_PAIR_INDEX_0'] + '*' + nc
-                _jshift = '+' + self._components['LIB_PAIR_INDEX_1'] + '*' + nc
-
-                if mode.write and obj.ncomp <= self._gather_size_limit:
-                    isym = '&'+ symbol+'i[0]'
+                if obj.soa:
+                    soa = DSLSoAComp(symbol, obj.ctype, not mode.write, pair=True)
+                    _ishift = '+' + self._components['LIB_PAIR_INDEX_0']
+                    _jshift = '+' + self._components['LIB_PAIR_INDEX_1']
+                    if mode.write and obj.ncomp <= self._gather_size_limit:
+                        isym = soa.arg('&'+ symbol+'i[0]', '1')
+                    else:
+                        isym = soa.arg(symbol + _ishift)
+                    jsym = soa.arg(symbol + _jshift)
                 else:
-                    isym = symbol + _ishift
-                jsym = symbol + _jshift
+                    _ishift = '+' + self._components['LIB_PAIR_INDEX_0'] + '*' + nc
+                    _jshift = '+' + self._components['LIB_PAIR_INDEX_1'] + '*' + nc
+
+                    if mode.write and obj.ncomp <= self._gather_size_limit:
+                        isym = '&'+ symbol+'i[0]'
+                    else:
+                        isym = symbol + _ishift
+                    jsym = symbol + _jshift
                 g = cgen.Value('_'+symbol+'_t', call_symbol)
                 g = cgen.Initializer(g, '{ ' + isym + ', ' + jsym + '}')
 
@@ -294,6 +345,10 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
         self._components['LIB_OUTER_LOOP'] = loop
 
 
+    def _new_launch_plan(self, dat_dict, nhead):
+        return LaunchPlan(self._dat_dict, dat_dict, nhead, pair=True,
+                          threaded=True, soa_stride=True)
+
     def _get_class_lib_args(self, neighbour_list):
 
         _N_LOCAL = INT64(neighbour_list.n_local)
@@ -322,6 +377,8 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
                 )
             else:
                 args.append(obj.ctypes_data_access(mode, pair=True))
+                if getattr(obj, 'soa', False):
+                    args.append(INT64(obj.soa_stride))
 
         return args
 
@@ -347,6 +404,11 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
 
         assert _group is not None, "no group"
 
+        # exchange the halos before the neighbour list update exchanges the
+        # positions alone
+        _group.get_cell_to_particle_map().check()
+        plan = self._get_launch_plan(dat_dict)
+        plan.halo_exchange()
 
         #neighbour_list = self._get_neighbour_list(_group)
         neighbour_list = nlist_controller.get_neighbour_list(
@@ -357,18 +419,8 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
         #cell2part = _group.get_cell_to_particle_map()
         #cell2part.check()
 
-        args = []
-        # Add static arguments to launch command
-        if self._kernel.static_args is not None:
-            assert static_args is not None, "Error: static arguments not " \
-                                            "passed to loop."
-            args += self._kernel.static_args.get_args(static_args)
-
-        # Add pointer arguments to launch command
-
-        self._init_dat_lib_args(dat_dict)
-
-        args+=self._get_dat_lib_args(dat_dict)
+        # Add static and pointer arguments to launch command
+        args = self._launch_args(plan, static_args)
 
         # Rebuild neighbour list potentially
         #self._invocations += 1
@@ -377,21 +429,17 @@ class PairLoopNeighbourListNSOMP(PairLoopNeighbourListNS):
         #neighbour_list.update_if_required()
         #self.list_timer.pause()
 
-        args2 = self._get_class_lib_args(neighbour_list)
-
-        args = args2 + args
+        args[:self._nclass_args] = self._get_class_lib_args(neighbour_list)
 
         # Execute the kernel over all particle pairs.
-        method = self._lib[self._kernel.name + '_wrapper']
-
         self.wrapper_timer.start()
-        method(*args)
+        self._method(*args)
         self.wrapper_timer.pause()
 
         self._kernel_execution_count += neighbour_list.total_num_neighbours
 
         self._update_opt()
-        self._post_execute_dats(dat_dict)
+        plan.post()
 
 
 
@@ -72,6 +72,9 @@ class SubCellByCellOMP(object):
             self._get_allowed_types(),
             dat_dict
         )
+        if self._dat_dict.uses_soa():
+            raise RuntimeError('SoA ParticleDats are not supported by ' +
+                               type(self).__name__)
 
         self._cc = build.TMPCC
         self._kernel = kernel
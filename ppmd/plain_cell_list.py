@@ -10,6 +10,7 @@ import os
 
 from ppmd import runtime
 from ppmd.lib.build import lib_from_file_source
+from ppmd.lib.common import ctypes_map
 
 REAL = ctypes.c_double
 INT64 = ctypes.c_int64
@@ -79,15 +80,16 @@ class PlainCellList(object):
         # max cell contents count
         self._max_count = 0
 
+        # libraries keyed by position data type
+        self._libs = {}
 
-        with open(_LIB_SOURCES + 'PlainCellList.h') as fh:
-            hpp = fh.read()
-        with open(_LIB_SOURCES + 'PlainCellList.cpp') as fh:
-            cpp = fh.read()
-
-        self._lib = lib_from_file_source(_LIB_SOURCES + 'PlainCellList', 
+    def _get_lib(self, dtype):
+        if dtype not in self._libs.keys():
+            self._libs[dtype] = lib_from_file_source(
+                _LIB_SOURCES + 'PlainCellList',
                 'PlainCellList',
-                {})['PlainCellList']
+                {'POS_REAL': ctypes_map[dtype]})['PlainCellList']
+        return self._libs[dtype]
 
     def _check_len(self, npart):
         n = npart + self.cell_count
@@ -104,7 +106,7 @@ class PlainCellList(object):
         :param npart: Number of particles to sort.
         """
         self._check_len(npart)
-        err = self._lib(
+        err = self._get_lib(positions.dtype)(
             positions.ctypes_data,
             INT64(npart),
             self.cell_offset,
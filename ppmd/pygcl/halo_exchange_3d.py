@@ -4,8 +4,10 @@ __author__ = "W.R.Saunders"
 __copyright__ = "Copyright 2016, W.R.Saunders"
 
 import collections
+import itertools
 import numpy as np
 from ctypes import c_uint64, c_int64
+from mpi4py import MPI
 
 
 # create a CellSlice object for easier halo definition.
@@ -157,6 +159,43 @@ class HaloExchange3D(object):
         """See self.boundary_starts, cells to unpack into."""
         self.tmp_ncomp = max(tnb, tnh)
 
+        # the non-blocking exchange sends directly to all 26 neighbours, the
+        # corner and edge cells are not forwarded through the faces.
+        self._directions = [dx for dx in
+                            itertools.product((-1, 0, 1), repeat=3)
+                            if dx != (0, 0, 0)]
+        width = (wz, wy, wx)
+
+        def _slices(d, halo):
+            s = []
+            for ax in range(3):
+                w = width[ax]
+                if d[ax] == 0:
+                    s.append(slice(w, dim[ax] - w))
+                elif halo:
+                    s.append(slice(0, w) if d[ax] < 0 else
+                             slice(dim[ax] - w, dim[ax]))
+                else:
+                    s.append(slice(w, 2*w) if d[ax] < 0 else
+                             slice(dim[ax] - 2*w, dim[ax] - w))
+            return tuple(s)
+
+        self._nb = []
+        for tag, dx in enumerate(self._directions):
+            # the halo on side dx holds the boundary cells the neighbour at
+            # offset dx sends towards -dx
+            neg = tuple(-1 * ex for ex in dx)
+            self._nb.append((
+                get_cart_rank_offset(comm, dx),
+                tag,
+                _slices(dx, False),
+                get_cart_rank_offset(comm, dx),
+                self._directions.index(neg),
+                _slices(dx, True)
+            ))
+        self._buffers = {}
+        self._pending = None
+
     def exchange(self, array):
         """
         Halo exchange the passed array using the setup scheme.
@@ -196,7 +235,43 @@ class HaloExchange3D(object):
                   self.halo_starts[dir]: self.halo_starts[dir+1]:], :
             ] = tmp_space[0:n:, :]
 
+    def exchange_start(self, array):
+        """
+        Start a non-blocking halo exchange of the passed array, see exchange.
+        The boundary cells are copied before this call returns, the halo
+        cells are not written until exchange_finish is called.
+        :param array: Array of shape (n2, n1, n0, d).
+        """
+        if self._pending is not None:
+            raise RuntimeError('A halo exchange is already in progress.')
+        if len(array.shape) != 4:
+            raise RuntimeError("unknown array shape passed")
 
-
-
-
+        key = (array.shape[-1], array.dtype)
+        if key not in self._buffers:
+            self._buffers[key] = [
+                (np.zeros(array[bx[2]].shape, dtype=array.dtype),
+                 np.zeros(array[bx[5]].shape, dtype=array.dtype))
+                for bx in self._nb]
+        buffers = self._buffers[key]
+
+        reqs = []
+        for (dst, stag, ss, src, rtag, rs), (sb, rb) in zip(self._nb, buffers):
+            reqs.append(self.comm.Irecv(rb, src, rtag))
+        for (dst, stag, ss, src, rtag, rs), (sb, rb) in zip(self._nb, buffers):
+            sb[:] = array[ss]
+            reqs.append(self.comm.Isend(sb, dst, stag))
+        self._pending = (array, buffers, reqs)
+
+    def exchange_finish(self):
+        """
+        Wait for the halo exchange started with exchange_start and unpack
+        the halo cells.
+        """
+        if self._pending is None:
+            raise RuntimeError('No halo exchange is in progress.')
+        array, buffers, reqs = self._pending
+        self._pending = None
+        MPI.Request.Waitall(reqs)
+        for bx, (sb, rb) in zip(self._nb, buffers):
+            array[bx[5]] = rb
@@ -20,6 +20,7 @@ VERBOSE = config.MAIN_CFG['verbose-level'][1]
 TIMER = config.MAIN_CFG['timer-level'][1]
 BUILD_TIMER = config.MAIN_CFG['build-timer-level'][1]
 ERROR_LEVEL = config.MAIN_CFG['error-level'][1]
+FMM_CACHE = bool(config.MAIN_CFG['fmm-cache'][1])
 
 
 
@@ -40,6 +41,38 @@ BUILD_PER_PROC = False
 
 MPI_SHARED_MEM = True
 
+HALO_TRIM = False
+
+# ParticleDat halo exchanges between ranks on the same node read the packed
+# particles from an MPI-3 shared window of the sender instead of messages.
+HALO_SHARED_MEM = False
+
+# growth factor and shrink threshold of host array storage
+REALLOC_GROWTH = 1.5
+REALLOC_SHRINK = 0.25
+
+# maximum number of particles distributed per collective by
+# State.scatter_data_from
+SCATTER_CHUNK = 2**20
+# default number of particles per chunk of State.gather_data_chunks
+GATHER_CHUNK = 2**20
+
+# Host arrays of at least FIRST_TOUCH_MIN_BYTES are zeroed by the OpenMP
+# threads with the static decomposition of the OpenMP loops such that pages are
+# placed on the NUMA node of the thread that processes them.
+NUMA_FIRST_TOUCH = bool(config.MAIN_CFG['first-touch'][1])
+FIRST_TOUCH_MIN_BYTES = 2**20
+
+# Thread pinning. The OpenMP runtime reads OMP_PROC_BIND and OMP_PLACES when
+# the first OpenMP library is loaded, values set in the environment take
+# precedence.
+OMP_PROC_BIND = config.MAIN_CFG['omp-proc-bind'][1]
+OMP_PLACES = config.MAIN_CFG['omp-places'][1]
+if OMP_PROC_BIND and 'OMP_PROC_BIND' not in os.environ:
+    os.environ['OMP_PROC_BIND'] = OMP_PROC_BIND
+if OMP_PLACES and 'OMP_PLACES' not in os.environ:
+    os.environ['OMP_PLACES'] = OMP_PLACES
+
 try:
     OMP_NUM_THREADS = int(os.environ['OMP_NUM_THREADS'])
 except Exception as e:
@@ -44,6 +44,9 @@ class BaseMDState(object):
 
     def __init__(self, *args, **kwargs):
 
+        # particle storage is first touched by the OpenMP threads
+        host.init_first_touch()
+
         self._domain = None
         self._base_cell_width = 0.0  # no cell structure imposed
 
@@ -68,6 +71,7 @@ class BaseMDState(object):
 
         # halo vars
         self._halo_exchange_sizes = None
+        self._multi_halo_exchanges = {}
 
         self.determine_update_funcs = []
         self.pre_update_funcs = []
@@ -150,7 +154,8 @@ class BaseMDState(object):
             self._cell_to_particle_map.update_required = True
 
             self._halo_manager = halo.CartesianHaloSix(_AsFunc(self, '_domain'),
-                                                       self._cell_to_particle_map)
+                                                       self._cell_to_particle_map,
+                                                       _AsFunc(self, '_base_cell_width'))
 
     def _pre_update_func(self):
         for foo in self.pre_update_funcs:
@@ -338,9 +343,96 @@ class BaseMDState(object):
             _dat = getattr(self, ix)
             _dat.resize(int(value), _callback=False)
 
-    def scatter_data_from(self, rank):
-        self.broadcast_data_from(rank)
-        self.filter_on_domain_boundary()
+    def scatter_data_from(self, rank=0):
+        """
+        Distribute the particles held on a rank to the ranks that own them.
+        The root bins its particles by owning subdomain and each rank only
+        receives its own particles, in chunks of at most runtime.SCATTER_CHUNK
+        particles. Particles outside the domain are lost and raise an error.
+        :arg rank: Rank in the domain communicator that holds all npart
+        particles.
+        """
+        # This is in terms of MPI_COMM_WORLD
+        assert (rank > -1) and (rank < self._ccsize), "Invalid mpi rank"
+
+        if self._ccsize == 1:
+            self.broadcast_data_from(rank)
+            self.filter_on_domain_boundary()
+            return
+
+        comm = self._ccomm
+        is_root = comm.Get_rank() == rank
+        subdomains = self._subdomain_edges(rank)
+        p = self.get_position_dat()
+
+        npart = int(self.npart)
+        n = 0
+        for c0 in range(0, npart, runtime.SCATTER_CHUNK):
+            c1 = min(npart, c0 + runtime.SCATTER_CHUNK)
+            counts = None
+            rows = None
+            if is_root:
+                owner = self._owning_ranks(p._dat[c0:c1:, :], *subdomains)
+                keep = np.nonzero(owner > -1)[0]
+                rows = c0 + keep[np.argsort(owner[keep], kind='stable')]
+                counts = np.bincount(owner[keep], minlength=self._ccsize)
+                counts = counts.astype(ctypes.c_int64)
+
+            nrecv = np.zeros(1, dtype=ctypes.c_int64)
+            comm.Scatter(counts, nrecv, root=rank)
+            nrecv = int(nrecv[0])
+
+            # On the root the received rows never overlap the rows of later
+            # chunks as it can not own more particles than it has read.
+            self._resize_callback(n + nrecv)
+            for px in self.particle_dats:
+                getattr(self, px).scatter_data_from(rank, nrecv, n, counts,
+                                                    rows)
+            n += nrecv
+
+        self.npart_local = n
+        self.check_npart_total()
+
+    def _subdomain_edges(self, rank):
+        """
+        Gather the subdomain boundaries on a rank. Collective on the domain
+        communicator.
+        :return: On the root, the edges of the subdomains in each dimension and
+        an array mapping cart coordinates to ranks.
+        """
+        comm = self._ccomm
+        b = self.domain.boundary
+        top = mpi.cartcomm_top_xyz(comm)
+        r = comm.gather((tuple(top), tuple(b[:])), root=rank)
+        if r is None:
+            return None
+
+        dims = mpi.cartcomm_dims_xyz(comm)
+        edges = [np.zeros(dx + 1, dtype=ctypes.c_double) for dx in dims]
+        ranks = np.zeros(dims, dtype=ctypes.c_int)
+        for rx, (tx, bx) in enumerate(r):
+            ranks[tx[0], tx[1], tx[2]] = rx
+            for dx in range(3):
+                edges[dx][tx[dx]] = bx[2*dx]
+                edges[dx][tx[dx] + 1] = bx[2*dx + 1]
+        return edges, ranks
+
+    @staticmethod
+    def _owning_ranks(pos, edges, ranks):
+        """
+        :return: The owning rank of each position, -1 for positions outside
+        the domain.
+        """
+        n = pos.shape[0]
+        inside = np.ones(n, dtype=bool)
+        cx = []
+        for dx in range(3):
+            c = np.searchsorted(edges[dx], pos[:, dx], side='right') - 1
+            inside &= (c > -1) & (c < edges[dx].shape[0] - 1)
+            cx.append(np.where(inside, c, 0))
+        owner = ranks[cx[0], cx[1], cx[2]]
+        owner[np.logical_not(inside)] = -1
+        return owner
 
     def broadcast_data_from(self, rank=0):
         # This is in terms of MPI_COMM_WORLD
@@ -366,6 +458,98 @@ class BaseMDState(object):
             for px in self.particle_dats:
                 getattr(self, px).gather_data_on(rank)
 
+    def gather_data_chunks(self, dats, rank=0, chunk_size=None, order=None):
+        """
+        Generator that gathers the global values of ParticleDats on a rank in
+        chunks of bounded size. The local storage of the dats is not
+        modified. Must be iterated to completion on all ranks of the domain,
+        only the root yields.
+        :arg dats: Iterable of ParticleDats of this state.
+        :arg rank: Rank in the domain communicator to gather on.
+        :arg chunk_size: Maximum number of particles per chunk, defaults to
+        runtime.GATHER_CHUNK.
+        :arg order: Optional integer ParticleDat of unique global ids, if
+        passed the chunks are sorted by this id.
+        :return: On the root, tuples of numpy arrays with one entry per dat.
+        """
+        assert (rank > -1) and (rank < self._ccsize), "Invalid mpi rank"
+        if chunk_size is None:
+            chunk_size = runtime.GATHER_CHUNK
+        chunk_size = int(chunk_size)
+        assert chunk_size > 0, "bad chunk size"
+
+        dats = tuple(dats)
+        comm = self._ccomm
+        is_root = comm.Get_rank() == rank
+        n = self.npart_local
+
+        if order is None:
+            counts = np.array(comm.allgather(n), dtype=ctypes.c_int64)
+            offsets = np.zeros_like(counts)
+            offsets[1:] = np.cumsum(counts)[:-1:]
+            o = offsets[comm.Get_rank()]
+            for g0 in range(0, int(np.sum(counts)), chunk_size):
+                g1 = g0 + chunk_size
+                # counts of the ranks in [g0, g1)
+                ccounts = np.minimum(offsets + counts, g1) - \
+                    np.maximum(offsets, g0)
+                ccounts = np.maximum(ccounts, 0)
+                rows = slice(max(g0 - o, 0), max(g0 - o, 0) +
+                             ccounts[comm.Get_rank()])
+                chunk = tuple(self._gather_rows(dx, rows, ccounts, rank)
+                              for dx in dats)
+                if is_root:
+                    yield chunk
+            return
+
+        assert order.ncomp == 1, "order dat must have one component"
+        gid = np.array(order[:n:, 0], dtype=ctypes.c_int64)
+        local_order = np.argsort(gid, kind='stable')
+        gid = gid[local_order]
+
+        lims = np.array((np.min(gid, initial=np.iinfo(np.int64).max),
+                         -1 * np.max(gid, initial=np.iinfo(np.int64).min)),
+                        dtype=ctypes.c_int64)
+        comm.Allreduce(mpi.MPI.IN_PLACE, lims, mpi.MPI.MIN)
+        gmin = lims[0]
+        gmax = -1 * lims[1]
+
+        for g0 in range(int(gmin), int(gmax) + 1, chunk_size):
+            i0, i1 = np.searchsorted(gid, (g0, g0 + chunk_size))
+            rows = local_order[i0:i1]
+            ccounts = np.array(comm.allgather(i1 - i0), dtype=ctypes.c_int64)
+            if np.sum(ccounts) == 0:
+                continue
+            chunk = tuple(self._gather_rows(dx, rows, ccounts, rank)
+                          for dx in dats + (order,))
+            if is_root:
+                sort = np.argsort(chunk[-1][:, 0], kind='stable')
+                yield tuple(cx[sort, :] for cx in chunk[:-1])
+
+    def _gather_rows(self, dat, rows, counts, rank):
+        """
+        Gather rows of a ParticleDat on a rank.
+        :arg rows: Slice or indices of the local rows to send.
+        :arg counts: Number of rows sent by each rank.
+        :return: On the root, an array of the rows ordered by rank.
+        """
+        counts = dat.ncomp * np.array(counts, dtype=ctypes.c_int64)
+        recvbuf = None
+        tmp = None
+        if self._ccomm.Get_rank() == rank:
+            disp = np.zeros_like(counts)
+            disp[1:] = np.cumsum(counts)[:-1:]
+            tmp = np.zeros([np.sum(counts) // dat.ncomp, dat.ncomp],
+                           dtype=dat.dtype)
+            recvbuf = (tmp, tuple(counts), tuple(disp), None)
+
+        self._ccomm.Gatherv(
+            sendbuf=np.ascontiguousarray(dat._dat[rows, :]),
+            recvbuf=recvbuf,
+            root=rank
+        )
+        return tmp
+
     def filter_on_domain_boundary(self):
         """
         Remove particles that do not reside in this subdomain. State requires a
@@ -419,11 +603,12 @@ class BaseMDState(object):
         return _t[0]
 
     def move_to_neighbour(self, ids_directions_list=None, dir_send_totals=None,
-                          shifts=None):
+                          shifts=None, image_dat=None):
         self._move_controller.move_to_neighbour(
             ids_directions_list,
             dir_send_totals,
-            shifts
+            shifts,
+            image_dat
         )
 
     def _halo_update_exchange_sizes(self):
@@ -448,6 +633,27 @@ class BaseMDState(object):
         if idi > idh:
             self._cell_to_particle_map.post_halo_exchange()
 
+    def halo_exchange(self, dats):
+        """
+        Exchange the halos of several ParticleDats of the state with one
+        message per direction. The halos of all passed dats are marked as
+        current.
+        :arg dats: Iterable of ParticleDats of this state.
+        """
+        dats = tuple(dats)
+        if len(dats) == 1:
+            dats[0].halo_exchange()
+            dats[0]._vid_halo = dats[0]._vid_int
+            dats[0].vid_halo_cell_list = \
+                self._cell_to_particle_map.version_id
+        elif len(dats) > 1:
+            key = tuple(id(dx) for dx in dats)
+            exchange = self._multi_halo_exchanges.get(key)
+            if exchange is None:
+                exchange = data.MultiHaloExchange(dats)
+                self._multi_halo_exchanges[key] = exchange
+            exchange.exchange()
+
 
 class State(BaseMDState):
     pass
@@ -468,6 +674,7 @@ class _move_controller(object):
 
         self._move_unpacking_lib = None
         self._move_packing_lib = None
+        self._move_image_dat = None
         self._move_empty_slots = host.Array(ncomp=4, dtype=ctypes.c_int)
         self._move_used_free_slot_count = None
 
@@ -508,7 +715,7 @@ class _move_controller(object):
             self._total_ncomp += _dat.ncomp * ctypes.sizeof(_dat.dtype)
 
     def move_to_neighbour(self, ids_directions_list=None,
-                          dir_send_totals=None, shifts=None):
+                          dir_send_totals=None, shifts=None, image_dat=None):
         """
         Move particles using the linked list.
         :arg host.Array ids_directions_list(int): Linked list of ids from
@@ -517,12 +724,18 @@ class _move_controller(object):
         particles traveling in each direction.
         :arg host.Array shifts(double): 73 element array of the shifts to
         apply when moving particles for the 26 directions.
+        :arg image_dat: Optional integer ParticleDat of the state that counts
+        the periodic images, updated with the sign of the shifts.
         """
 
         self.move_timer.start()
 
-        if self._move_packing_lib is None:
-            self._move_packing_lib = _move_controller.build_pack_lib(self.state)
+        image_name = None if image_dat is None else image_dat.name
+        if self._move_packing_lib is None or \
+                self._move_image_dat != image_name:
+            self._move_image_dat = image_name
+            self._move_packing_lib = _move_controller.build_pack_lib(
+                self.state, image_name)
 
         _send_total = dir_send_totals.data.sum()
         # Make/resize send buffer.
@@ -573,7 +786,7 @@ class _move_controller(object):
             shifts.ctypes_data,
             ids_directions_list.ctypes_data,
             self._move_empty_slots.ctypes_data,
-            *[getattr(self.state, n).ctypes_data for n in self.state.particle_dats]
+            *_move_controller.dat_args(self.state)
         )
 
         # sort empty slots.
@@ -594,7 +807,7 @@ class _move_controller(object):
             ctypes.c_int(self.state.npart_local),
             self._move_empty_slots.ctypes_data,
             self._move_recv_buffer.ctypes_data,
-            *[getattr(self.state, n).ctypes_data for n in self.state.particle_dats]
+            *_move_controller.dat_args(self.state)
         )
 
         _recv_rank = np.zeros(26)
@@ -740,7 +953,7 @@ class _move_controller(object):
                 ctypes.c_int(self.state.npart_local),
                 self._move_empty_slots.ctypes_data,
                 _compressing_n_new.ctypes_data,
-                *[getattr(self.state, n).ctypes_data for n in self.state.particle_dats]
+                *_move_controller.dat_args(self.state)
             )
 
             self.state.npart_local = _compressing_n_new[0]
@@ -782,6 +995,31 @@ class _move_controller(object):
     def _ccbarrier(self):
         return self.state.domain.comm.Barrier()
 
+    @staticmethod
+    def dat_args(state):
+        """
+        Pointer arguments for the move libraries, SoA dats are followed by
+        their component stride.
+        """
+        args = []
+        for n in state.particle_dats:
+            dat = getattr(state, n)
+            args.append(dat.ctypes_data)
+            if dat.soa:
+                args.append(ctypes.c_int64(dat.soa_stride))
+        return args
+
+    @staticmethod
+    def _dat_arg_decls(state, const):
+        c = 'const ' if const else ''
+        decls = []
+        for n in state.particle_dats:
+            dat = getattr(state, n)
+            decls.append('{}{} * D_{}'.format(c, dat.ctype, n))
+            if dat.soa:
+                decls.append('const int64_t S_{}'.format(n))
+        return ','.join(decls)
+
     @staticmethod
     def build_unpack_lib(state):
 
@@ -790,17 +1028,30 @@ class _move_controller(object):
         def g(x):
             return getattr(state, x)
 
-        args = ','.join(['{} * D_{}'.format(g(n).ctype, n) for n in dats])
-        mvs = ''.join([
-            '''
+        def mv(n):
+            if g(n).soa:
+                return '''
+               for(int cx=0 ; cx<{1} ; cx++){{
+                   memcpy(&D_{0}[pos + cx * S_{0}], _R_BUF, {3});
+                   _R_BUF += {3};
+               }}
+            '''.format(
+                    str(n),
+                    str(g(n).ncomp),
+                    str(g(n).ncomp * ctypes.sizeof(g(n).dtype)),
+                    str(ctypes.sizeof(g(n).dtype))
+                )
+            return '''
                memcpy(&D_{0}[pos * {1}], _R_BUF, {2});
                _R_BUF += {2};
             '''.format(
                 str(n),
                 str(g(n).ncomp),
                 str(g(n).ncomp * ctypes.sizeof(g(n).dtype))
-            ) for n in dats
-        ])
+            )
+
+        args = _move_controller._dat_arg_decls(state, False)
+        mvs = ''.join([mv(n) for n in dats])
         hsrc = '''
         #include <string.h>
         #include <stdint.h>
@@ -828,14 +1079,14 @@ class _move_controller(object):
             hsrc, src, 'move_unpack')['move_unpack']
 
     @staticmethod
-    def build_pack_lib(state):
+    def build_pack_lib(state, image_name=None):
 
         dats = state.particle_dats
 
         def g(x):
             return getattr(state, x)
 
-        args = ','.join(['const {} * D_{}'.format(g(n).ctype, n) for n in dats])
+        args = _move_controller._dat_arg_decls(state, True)
         _dynamic_dats_shift = ''
         for ix in state.particle_dats:
             dat = g(ix)
@@ -857,6 +1108,26 @@ class _move_controller(object):
                 memcpy(_S_BUF, _pos_tmp, 3*%(DBYTE)s);
                 _S_BUF += %(TBYTE)s;
                 ''' % sub_dict
+            elif ix == image_name:
+                assert dat.ncomp == 3 and not dat.soa, "bad image dat"
+                # a positive shift moves the particle down by one box length
+                _dynamic_dats_shift += '''
+                %(DTYPE)s _img_tmp[3];
+                for(int _cx=0 ; _cx<3 ; _cx++){
+                    const double _s = SHIFT[(_dir*3) + _cx];
+                    _img_tmp[_cx] = D_%(NAME)s[_ix*3 + _cx] +
+                        ((_s > 0.0) ? -1 : ((_s < 0.0) ? 1 : 0));
+                }
+                memcpy(_S_BUF, _img_tmp, %(TBYTE)s);
+                _S_BUF += %(TBYTE)s;
+                ''' % sub_dict
+            elif dat.soa:
+                _dynamic_dats_shift += '''
+                for(int _cx=0 ; _cx<%(NCOMP)s ; _cx++){
+                    memcpy(_S_BUF, &D_%(NAME)s[_ix + _cx * S_%(NAME)s], %(DBYTE)s);
+                    _S_BUF += %(DBYTE)s;
+                }
+                ''' % sub_dict
             else:
                 assert dat.ncomp > 0, "move not defined for 0 component dats"
                 _dynamic_dats_shift += '''
@@ -905,16 +1176,27 @@ class _move_controller(object):
             return getattr(state, x)
 
         hsrc = ''''''
-        args = ','.join(['{} * D_{}'.format(g(n).ctype, n) for n in dats])
-        dyn = '\n'.join(
-            ['''
+        args = _move_controller._dat_arg_decls(state, False)
+
+        def cp(n):
+            if g(n).soa:
+                return '''
+             for(int ix=0 ; ix<{0} ; ix++){{
+             {1}[dest+ix*{2}] = {1}[src+ix*{2}];}}
+             '''.format(
+                    str(g(n).ncomp),
+                    'D_{}'.format(n),
+                    'S_{}'.format(n)
+                )
+            return '''
              for(int ix=0 ; ix<{0} ; ix++){{
              {1}[dest*{0}+ix] = {1}[src*{0}+ix];}}
              '''.format(
                 str(g(n).ncomp),
                 'D_{}'.format(n)
-            ) for n in dats]
-        )
+            )
+
+        dyn = '\n'.join([cp(n) for n in dats])
 
         src = '''
         extern "C"
@@ -4,8 +4,12 @@ __all__ = [
     'lattice',
     'xyz',
     'high_method',
-    'sanitise'
+    'sanitise',
+    'trajectory',
+    'pipeline',
+    'correlator'
 ]
 
-from ppmd.utility import dl_poly, lattice, xyz, high_method, potential, sanitise, dl_monte
+from ppmd.utility import dl_poly, lattice, xyz, high_method, potential, sanitise, dl_monte, \
+    trajectory, pipeline, correlator
 
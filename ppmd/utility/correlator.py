@@ -0,0 +1,278 @@
+"""
+Multiple-tau time correlation of per particle values, e.g. the velocity
+autocorrelation function or the mean squared displacement. The history of
+each particle is held in ParticleDats of the state, such that it moves with
+the particle between ranks, and is updated by a compiled OpenMP loop. The
+correlation sums are only reduced across ranks when the correlation is
+requested.
+"""
+from __future__ import print_function, division, absolute_import
+
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+# system level
+import ctypes
+import numpy as np
+
+# package level
+from ppmd import data, host, opt, runtime
+from ppmd.lib import build
+
+_MODES = {'dot': 0, 'msd': 1}
+
+
+class MultipleTauCorrelator(object):
+    """
+    Multiple-tau correlator (Ramirez et al. J. Chem. Phys. 133, 154103) for a
+    ParticleDat. Level l holds the last p values of the particle at spacing
+    m**l samples, the values passed to the next level are the means of m
+    values (average=True) or every m-th value. Memory per particle and the
+    cost per sample are O(levels * p), the longest lag is p * m**(levels-1)
+    samples.
+
+    Construction is collective as it builds the library and adds the history
+    dats to the state.
+
+    :arg state: State that holds the dat.
+    :arg dat: ParticleDat to correlate.
+    :arg mode: 'dot' correlates <a(t) . a(t+tau)> (e.g. VACF), 'msd' computes
+    <|a(t+tau) - a(t)|^2> (MSD of unwrapped positions).
+    :arg levels: Number of levels.
+    :arg p: Number of values per level.
+    :arg m: Averaging factor between levels, must divide p.
+    :arg average: Pass block averages to the next level, defaults to True for
+    'dot' and False for 'msd'.
+    :arg dt: Time between samples.
+    :arg image_dat: Optional periodic image count dat of the boundary
+    condition, see domain.BoundaryTypePeriodic. If passed, dat must be the
+    PositionDat and the positions are unwrapped before correlation.
+    """
+    def __init__(self, state, dat, mode='dot', levels=8, p=16, m=2,
+                 average=None, dt=1.0, image_dat=None):
+
+        if mode not in _MODES:
+            raise RuntimeError('Unknown correlation mode: {}'.format(mode))
+        if p % m != 0 or m < 2:
+            raise RuntimeError('m must be >1 and divide p.')
+        if average is None:
+            average = mode == 'dot'
+        if image_dat is not None and dat.ncomp != image_dat.ncomp:
+            raise RuntimeError('image_dat does not match the dat.')
+
+        self._state = state
+        self._dat = dat
+        self._mode = mode
+        self._levels = int(levels)
+        self._p = int(p)
+        self._m = int(m)
+        self._dt = float(dt)
+        self._image_dat = image_dat
+        ncomp = dat.ncomp
+
+        # per particle history, moves with the particles
+        name = '_{}_{}_mt'.format(dat.name, mode)
+        setattr(state, name + '_hist', data.ParticleDat(
+            ncomp=self._levels * self._p * ncomp, dtype=ctypes.c_double))
+        setattr(state, name + '_acc', data.ParticleDat(
+            ncomp=self._levels * ncomp, dtype=ctypes.c_double))
+        self._hist = getattr(state, name + '_hist')
+        self._acc = getattr(state, name + '_acc')
+
+        self._nlag = self._levels * self._p
+        self._sums = host.Array(ncomp=self._nlag, dtype=ctypes.c_double)
+        self._counts = np.zeros(self._nlag, dtype=ctypes.c_int64)
+        # push flag, write index and number of valid values per level
+        self._level_info = host.Array(ncomp=3 * self._levels,
+                                      dtype=ctypes.c_int)
+        self._npush = np.zeros(self._levels, dtype=ctypes.c_int64)
+        self._nsample = 0
+
+        self.timer = opt.Timer(runtime.TIMER, 0)
+
+        _header = r'''
+        #include <stdint.h>
+        #include <omp.h>
+        #define RESTRICT %(RESTRICT)s
+        #define L %(L)s
+        #define P %(P)s
+        #define M %(M)s
+        #define JMIN %(JMIN)s
+        #define NCOMP %(NCOMP)s
+        #define MODE %(MODE)s
+        #define AVERAGE %(AVERAGE)s
+        #define IMAGES %(IMAGES)s
+
+        extern "C" int MULTIPLE_TAU(
+            const int N,
+            const %(XTYPE)s * RESTRICT X,
+            const int64_t XS_I,
+            const int64_t XS_K,
+            const %(ITYPE)s * RESTRICT I,
+            const double * RESTRICT E,
+            double * RESTRICT H,
+            double * RESTRICT A,
+            const int * RESTRICT LV,
+            double * RESTRICT C
+        );
+        ''' % {
+            'RESTRICT': build.TMPCC.restrict_keyword,
+            'L': self._levels,
+            'P': self._p,
+            'M': self._m,
+            'JMIN': self._p // self._m,
+            'NCOMP': ncomp,
+            'MODE': _MODES[mode],
+            'AVERAGE': int(bool(average)),
+            'IMAGES': int(image_dat is not None),
+            'XTYPE': host.ctypes_map[dat.dtype],
+            'ITYPE': 'int' if image_dat is None else image_dat.ctype
+        }
+
+        _src = r'''
+        int MULTIPLE_TAU(
+            const int N,
+            const %(XTYPE)s * RESTRICT X,
+            const int64_t XS_I,
+            const int64_t XS_K,
+            const %(ITYPE)s * RESTRICT I,
+            const double * RESTRICT E,
+            double * RESTRICT H,
+            double * RESTRICT A,
+            const int * RESTRICT LV,
+            double * RESTRICT C
+        ){
+            #pragma omp parallel for schedule(static) reduction(+:C[:L*P])
+            for(int ix=0 ; ix<N ; ix++){
+                double * RESTRICT h = H + ((int64_t) ix) * L * P * NCOMP;
+                double * RESTRICT a = A + ((int64_t) ix) * L * NCOMP;
+                double v[NCOMP];
+                for(int k=0 ; k<NCOMP ; k++){
+                    v[k] = (double) X[ix * XS_I + k * XS_K];
+                    // unwrapped position
+                    if (IMAGES) {
+                        v[k] += I[ix * NCOMP + k] * E[k];
+                    }
+                }
+
+                for(int l=0 ; l<L ; l++){
+                    if (LV[3*l] == 0) { break; }
+
+                    // value passed up from the level below
+                    if (l > 0) {
+                        for(int k=0 ; k<NCOMP ; k++){
+                            if (AVERAGE) {
+                                v[k] = a[(l-1)*NCOMP + k] * (1.0 / M);
+                            }
+                            a[(l-1)*NCOMP + k] = 0.0;
+                        }
+                    }
+
+                    const int w = LV[3*l + 1];
+                    const int nvalid = LV[3*l + 2];
+                    double * RESTRICT hl = h + l * P * NCOMP;
+                    for(int k=0 ; k<NCOMP ; k++){
+                        hl[w*NCOMP + k] = v[k];
+                        if (AVERAGE) {
+                            a[l*NCOMP + k] += v[k];
+                        }
+                    }
+
+                    for(int j=((l==0) ? 0 : JMIN) ; j<nvalid ; j++){
+                        const int jx = (w - j + P) %% P;
+                        double c = 0.0;
+                        for(int k=0 ; k<NCOMP ; k++){
+                            if (MODE == 0) {
+                                c += v[k] * hl[jx*NCOMP + k];
+                            } else {
+                                const double d = v[k] - hl[jx*NCOMP + k];
+                                c += d * d;
+                            }
+                        }
+                        C[l*P + j] += c;
+                    }
+                }
+            }
+            return 0;
+        }
+        ''' % {'XTYPE': host.ctypes_map[dat.dtype],
+               'ITYPE': 'int' if image_dat is None else image_dat.ctype}
+
+        self._lib = build.simple_lib_creator(
+            _header, _src, 'MULTIPLE_TAU_{}_{}'.format(mode, ncomp)
+        )['MULTIPLE_TAU']
+
+    def sample(self):
+        """
+        Add the current values of the dat as the next sample.
+        """
+        self.timer.start()
+
+        n = self._state.npart_local
+        t = self._nsample + 1
+        jmin = self._p // self._m
+        for lx in range(self._levels):
+            push = (t % (self._m ** lx)) == 0
+            nvalid = int(min(self._npush[lx] + 1, self._p))
+            self._level_info[3*lx] = int(push)
+            self._level_info[3*lx + 1] = int(self._npush[lx] % self._p)
+            self._level_info[3*lx + 2] = nvalid
+            if push:
+                j0 = 0 if lx == 0 else jmin
+                self._counts[lx*self._p + j0:lx*self._p + nvalid] += n
+                self._npush[lx] += 1
+
+        dat = self._dat
+        xs_i, xs_k = (1, dat.soa_stride) if dat.soa else (dat.ncomp, 1)
+        self._lib(
+            ctypes.c_int(n),
+            dat.ctypes_data,
+            ctypes.c_int64(xs_i),
+            ctypes.c_int64(xs_k),
+            host.NullIntArray.ctypes_data if self._image_dat is None else
+            self._image_dat.ctypes_data,
+            self._state.domain.extent.ctypes_data,
+            self._hist.ctypes_data,
+            self._acc.ctypes_data,
+            self._level_info.ctypes_data,
+            self._sums.ctypes_data
+        )
+        self._nsample += 1
+
+        self.timer.pause()
+        opt.PROFILE[self.__class__.__name__ + ':sample'] = self.timer.time()
+
+    @property
+    def lags(self):
+        """
+        :return: The lag in samples of each entry of the correlation.
+        """
+        lags = []
+        for lx in range(self._levels):
+            j0 = 0 if lx == 0 else self._p // self._m
+            lags.append(np.arange(j0, self._p) * self._m ** lx)
+        return np.concatenate(lags)
+
+    def correlation(self):
+        """
+        Reduce the correlation across ranks, collective over the domain.
+        :return: Tuple of the lag times and the correlation at the lags for
+        which at least one pair of samples exists.
+        """
+        comm = self._state.domain.comm
+        sums = np.zeros(self._nlag, dtype=ctypes.c_double)
+        counts = np.zeros(self._nlag, dtype=ctypes.c_int64)
+        comm.Allreduce(self._sums.data, sums)
+        comm.Allreduce(self._counts, counts)
+
+        index = []
+        for lx in range(self._levels):
+            j0 = 0 if lx == 0 else self._p // self._m
+            index.append(lx * self._p + np.arange(j0, self._p))
+        index = np.concatenate(index)
+
+        lags = self.lags
+        valid = counts[index] > 0
+        index = index[valid]
+        return self._dt * lags[valid], sums[index] / counts[index]
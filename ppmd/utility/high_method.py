@@ -36,6 +36,7 @@ import time
 
 # package level
 from ppmd import kernel, data, runtime, pio, mpi, opt, access
+from ppmd.modules import philox
 
 _MPI = mpi.MPI
 _MPIWORLD = mpi.MPI.COMM_WORLD
@@ -170,6 +171,188 @@ class IntegratorVelocityVerlet(object):
 
 
 
+###############################################################################
+# r-RESPA multiple time step integrator
+###############################################################################
+
+class IntegratorRESPA(object):
+    """
+    Reversible reference system propagator (r-RESPA) multiple time step
+    integrator. The forces are split into a fast group, evaluated every time
+    step, and a slow group, evaluated every slow_step_count time steps. The
+    slow forces are applied as impulses of slow_step_count*dt/2 at the start
+    and end of each block of slow_step_count velocity Verlet steps under the
+    fast forces.
+
+    Each force group is a sequence of objects with an execute method, e.g.
+    pair loops, that write to the force ParticleDat of the group. The first
+    of these should use an INC_ZERO access descriptor on the force dat.
+
+    :arg positions: PositionDat to integrate.
+    :arg velocities: ParticleDat of velocities.
+    :arg masses: ParticleDat of masses.
+    :arg fast_forces: ParticleDat written by the fast force group.
+    :arg fast_updaters: Sequence of objects that compute the fast forces.
+    :arg slow_forces: ParticleDat written by the slow force group.
+    :arg slow_updaters: Sequence of objects that compute the slow forces.
+    :arg int slow_step_count: Number of time steps between slow force
+    evaluations.
+    :arg int list_reuse_count: Maximum number of time steps between cell
+    list rebuilds.
+    :arg float list_reuse_distance: Shell thickness of the neighbour lists.
+    :arg looping_method: Particle loop type used to update the velocities
+    and positions, default ParticleLoop.
+    """
+    def __init__(
+            self,
+            positions,
+            velocities,
+            masses,
+            fast_forces,
+            fast_updaters,
+            slow_forces,
+            slow_updaters,
+            slow_step_count,
+            list_reuse_count=1,
+            list_reuse_distance=0.1,
+            looping_method=None
+        ):
+
+        if int(slow_step_count) < 1:
+            raise RuntimeError('slow_step_count must be a positive integer')
+
+        self._p = positions
+        self._v = velocities
+        self._m = masses
+        self._ff = fast_forces
+        self._fs = slow_forces
+        self._fast_updaters = tuple(fast_updaters)
+        self._slow_updaters = tuple(slow_updaters)
+        self._k = int(slow_step_count)
+        self._list_reuse_count = list_reuse_count
+        self._list_reuse_distance = list_reuse_distance
+
+        self._g = positions.group
+
+        if looping_method is None:
+            self._looping_method = loop.ParticleLoop
+        else:
+            self._looping_method = looping_method
+
+        self._p1 = None
+        self._p2 = None
+        self._ps = None
+
+        self.fast_timer = opt.Timer(runtime.TIMER)
+        self.slow_timer = opt.Timer(runtime.TIMER)
+
+    def _build_libs(self, dt):
+        kernel1_code = '''
+        const double M_tmp = 1.0/M(0);
+        V(0) += dht*F(0)*M_tmp;
+        V(1) += dht*F(1)*M_tmp;
+        V(2) += dht*F(2)*M_tmp;
+        P(0) += dt*V(0);
+        P(1) += dt*V(1);
+        P(2) += dt*V(2);
+        '''
+
+        kernel2_code = '''
+        const double M_tmp = 1.0/M(0);
+        V(0) += dht*F(0)*M_tmp;
+        V(1) += dht*F(1)*M_tmp;
+        V(2) += dht*F(2)*M_tmp;
+        '''
+        constants = [
+            kernel.Constant('dt', dt),
+            kernel.Constant('dht', 0.5*dt),
+        ]
+        slow_constants = [
+            kernel.Constant('dht', 0.5*dt*self._k),
+        ]
+
+        self._p1 = self._looping_method(
+            kernel=kernel.Kernel('respa_vv1', kernel1_code, constants),
+            dat_dict={'P': self._p(access.W),
+                      'V': self._v(access.W),
+                      'F': self._ff(access.R),
+                      'M': self._m(access.R)}
+        )
+
+        self._p2 = self._looping_method(
+            kernel=kernel.Kernel('respa_vv2', kernel2_code, constants),
+            dat_dict={'V': self._v(access.W),
+                      'F': self._ff(access.R),
+                      'M': self._m(access.R)}
+        )
+
+        self._ps = self._looping_method(
+            kernel=kernel.Kernel('respa_slow_kick', kernel2_code,
+                                 slow_constants),
+            dat_dict={'V': self._v(access.W),
+                      'F': self._fs(access.R),
+                      'M': self._m(access.R)}
+        )
+
+    def _update_fast(self):
+        self.fast_timer.start()
+        for fx in self._fast_updaters:
+            fx.execute()
+        self.fast_timer.pause()
+        opt.PROFILE[self.__class__.__name__+':fast_forces'] = \
+            self.fast_timer.time()
+
+    def _update_slow(self):
+        self.slow_timer.start()
+        for fx in self._slow_updaters:
+            fx.execute()
+        self.slow_timer.pause()
+        opt.PROFILE[self.__class__.__name__+':slow_forces'] = \
+            self.slow_timer.time()
+
+    def integrate(self, dt, t, schedule=None):
+        """
+        Integrate the state forward in time.
+
+        :arg float dt: Time step size of the fast forces.
+        :arg float t: Time to integrate for, must be a multiple of
+        slow_step_count*dt.
+        :arg schedule: Optional Schedule to tick each time step.
+        """
+
+        n = int(math.ceil(float(t) / float(dt)))
+        if n % self._k != 0:
+            raise RuntimeError('number of time steps ' + str(n) + ' is not a'
+                               ' multiple of slow_step_count ' + str(self._k))
+
+        self._build_libs(dt)
+
+        integrator = method.IntegratorRange(
+            n, dt, self._v,
+            list_reuse_count=self._list_reuse_count,
+            list_reuse_distance=self._list_reuse_distance,
+            verbose=False
+        )
+
+        self._update_fast()
+        self._update_slow()
+
+        for ix in integrator:
+            if ix % self._k == 0:
+                self._ps.execute(self._g.npart_local)
+
+            self._p1.execute(self._g.npart_local)
+            self._update_fast()
+            self._p2.execute(self._g.npart_local)
+
+            if ix % self._k == self._k - 1:
+                self._update_slow()
+                self._ps.execute(self._g.npart_local)
+
+            if schedule is not None:
+                schedule.tick()
+
+
 ###############################################################################
 # Velocity Verlet Method
 ###############################################################################
@@ -347,13 +530,18 @@ class VelocityVerlet(object):
 
 class VelocityVerletAnderson(VelocityVerlet):
     
-    def integrate_thermostat(self, dt=None, t=None, temp=273.15, nu=1.0):
+    def integrate_thermostat(self, dt=None, t=None, temp=273.15, nu=1.0,
+                             seed=None, global_ids=None):
         """
         Integrate state forward in time.
         
         :arg double dt: Time step size.
         :arg double t: End time.
         :arg double temp: Temperature of heat bath.
+        :arg double nu: Collision frequency of the heat bath.
+        :arg int seed: Seed for the random numbers of the heat bath.
+        :arg global_ids: Integer ParticleDat of particle global ids which key
+        the random numbers, defaults to the global_ids of the state.
         """
         
         self._Temp = temp
@@ -366,29 +554,39 @@ class VelocityVerletAnderson(VelocityVerlet):
             
         self._max_it = int(math.ceil(self._T/self._dt))
 
+        if global_ids is None:
+            global_ids = self._state.global_ids
+        self._rng = philox.PhiloxRNG(seed=seed)
+
         self._constants1 = [kernel.Constant('dt',self._dt), kernel.Constant('dht',0.5*self._dt),]
         self._kernel1 = kernel.Kernel('vv1',self._kernel1_code,self._constants1)
-        self._p1 = loop.ParticleLoop(self._kernel1,{'P':self._P,'V':self._V,'A':self._A, 'M':self._M})
+        self._p1 = loop.ParticleLoop(
+            self._kernel1,
+            {'P':self._P(access.W),
+            'V':self._V(access.W),
+            'A':self._A(access.R),
+            'M':self._M(access.R)}
+        )
 
+        # Random numbers are a function of (seed, global id, step, stream)
+        # hence are independent of the decomposition and thread count.
         self._kernel2_thermostat_code = '''
 
         //Anderson thermostat here.
-        //probably horrific random code.
 
-        const double tmp_rand_max = 1.0/RAND_MAX;
+        double _u[2];
+        philox_uniform(RNG[0], GID(0), RNG[1], 0, _u);
 
-        if (rand()*tmp_rand_max < rate) {
-
-            //Box-Muller method.
+        if (_u[0] < rate) {
 
+            double _z[4];
+            philox_normal(RNG[0], GID(0), RNG[1], 1, _z);
+            philox_normal(RNG[0], GID(0), RNG[1], 2, _z+2);
 
             const double scale = sqrt(temperature/M(0));
-            const double stmp = scale*sqrt(-2.0*log(rand()*tmp_rand_max));
-
-            const double V0 = 2.0*M_PI*rand()*tmp_rand_max;
-            V(0) = stmp*cos(V0);
-            V(1) = stmp*sin(V0);
-            V(2) = scale*sqrt(-2.0*log(rand()*tmp_rand_max))*cos(2.0*M_PI*rand()*tmp_rand_max);
+            V(0) = scale*_z[0];
+            V(1) = scale*_z[1];
+            V(2) = scale*_z[2];
 
         }
         else {
@@ -402,8 +600,20 @@ class VelocityVerletAnderson(VelocityVerlet):
 
         self._constants2_thermostat = [kernel.Constant('rate',self._dt*self._nu), kernel.Constant('dt',self._dt), kernel.Constant('dht',0.5*self._dt), kernel.Constant('temperature',self._Temp),]
 
-        self._kernel2_thermostat = kernel.Kernel('vv2_thermostat',self._kernel2_thermostat_code,self._constants2_thermostat, headers = ['math.h','stdlib.h','time.h','stdio.h'])
-        self._p2_thermostat = loop.ParticleLoop(self._kernel2_thermostat,{'V':self._V,'A':self._A, 'M':self._M})
+        self._kernel2_thermostat = kernel.Kernel(
+            'vv2_thermostat',
+            self._kernel2_thermostat_code,
+            self._constants2_thermostat,
+            headers=[kernel.Header('math.h'), self._rng.header]
+        )
+        self._p2_thermostat = loop.ParticleLoop(
+            self._kernel2_thermostat,
+            {'V':self._V(access.W),
+            'A':self._A(access.R),
+            'M':self._M(access.R),
+            'GID':global_ids(access.R),
+            'RNG':self._rng.counter(access.R)}
+        )
 
         _t = ppmd.opt.Timer(runtime.TIMER, 0, start=True)
         self._velocity_verlet_integration_thermostat()
@@ -426,6 +636,7 @@ class VelocityVerletAnderson(VelocityVerlet):
             self._state.forces_update()
             
             self._p2_thermostat.execute()
+            self._rng.advance()
 
             self._state.kinetic_energy_update()
             self._state.add_time(self._dt)
@@ -0,0 +1,159 @@
+"""
+In-situ analysis of ParticleDats concurrently with the integration. At
+scheduled steps the selected dats are copied into one of two snapshot buffers
+and the analysis stages are run on the snapshot by a background executor
+while the integration continues. Results are reduced across ranks only when
+they are requested.
+"""
+from __future__ import print_function, division, absolute_import
+
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+# system level
+import concurrent.futures
+import numpy as np
+
+# package level
+from ppmd import mpi, opt, runtime
+
+
+def _run_stages(stages, step, snapshot):
+    return step, tuple(sx(step, snapshot) for sx in stages)
+
+
+class AnalysisPipeline(object):
+    """
+    Run analysis stages on snapshots of ParticleDats in the background.
+
+    A stage is a callable ``stage(step, snapshot)`` where snapshot is a dict
+    from dat name to a numpy array of the local particle values. It returns
+    a local result (scalar or numpy array) which is summed, or reduced with
+    reduce_op, across ranks when the results are requested. Stages run in
+    the executor and must not make MPI calls. The snapshot arrays are reused
+    two snapshots later and must not be retained by the stages.
+
+    :arg state: State that holds the dats.
+    :arg dats: Dict from name to ParticleDat of the values to snapshot.
+    :arg stages: Iterable of stage callables.
+    :arg interval: Number of calls to tick between snapshots.
+    :arg executor: Optional concurrent.futures.Executor, defaults to a single
+    background thread. The numpy and compiled code of the stages typically
+    releases the GIL. A process pool requires picklable stages.
+    :arg reduce_op: MPI operation used to reduce the results across ranks.
+    """
+    def __init__(self, state, dats, stages, interval=1, executor=None,
+                 reduce_op=mpi.MPI.SUM):
+        self._state = state
+        self._dats = dict(dats)
+        self._stages = tuple(stages)
+        self._interval = int(interval)
+        assert self._interval > 0, "bad interval"
+        self._reduce_op = reduce_op
+
+        self._own_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._executor = executor
+
+        self._buffers = [{}, {}]
+        self._futures = [None, None]
+        self._slot = 0
+        self._count = 0
+
+        self._steps = []
+        self._local = [[] for sx in self._stages]
+        self._reduced = [[] for sx in self._stages]
+
+        self.timer_snapshot = opt.Timer(runtime.TIMER, 0)
+        self.timer_wait = opt.Timer(runtime.TIMER, 0)
+
+    def tick(self):
+        """
+        Method to call per iteration, e.g. from a Schedule or the loop of an
+        integrator. Takes a snapshot every interval calls.
+        """
+        self._count += 1
+        if self._count % self._interval == 0:
+            self.snapshot(self._count)
+
+    def _wait_slot(self, slot):
+        f = self._futures[slot]
+        if f is not None:
+            self.timer_wait.start()
+            self._store(f.result())
+            self.timer_wait.pause()
+            self._futures[slot] = None
+
+    def _store(self, results):
+        step, results = results
+        self._steps.append(step)
+        for lx, rx in zip(self._local, results):
+            lx.append(rx)
+
+    def snapshot(self, step=None):
+        """
+        Copy the dats into the next free buffer and submit the analysis of
+        the copy. Blocks only if the analysis of the snapshot two snapshots
+        ago has not finished.
+        :arg step: Step number passed to the stages, defaults to the number of
+        ticks.
+        """
+        if step is None:
+            step = self._count
+        slot = self._slot
+        self._wait_slot(slot)
+
+        self.timer_snapshot.start()
+        n = self._state.npart_local
+        buf = self._buffers[slot]
+        snapshot = {}
+        for name, dat in self._dats.items():
+            b = buf.get(name)
+            if b is None or b.shape[0] < n:
+                b = np.empty((int(runtime.REALLOC_GROWTH * n) + 1, dat.ncomp),
+                             dtype=dat.dtype)
+                buf[name] = b
+            b[:n:, :] = dat.view
+            snapshot[name] = b[:n:, :]
+        self.timer_snapshot.pause()
+
+        self._futures[slot] = self._executor.submit(_run_stages, self._stages,
+                                                    step, snapshot)
+        self._slot = 1 - slot
+
+    def wait(self):
+        """
+        Wait for all submitted analysis to complete.
+        """
+        # the older snapshot is in the slot that is written next
+        self._wait_slot(self._slot)
+        self._wait_slot(1 - self._slot)
+
+    def results(self, stage=0):
+        """
+        Reduce and return the results of a stage, collective over the domain
+        of the state. Waits for outstanding analysis.
+        :arg stage: Index of the stage.
+        :return: List of (step, result) tuples.
+        """
+        self.wait()
+        comm = self._state.domain.comm
+        reduced = self._reduced[stage]
+        local = self._local[stage]
+        nnew = len(local) - len(reduced)
+        if nnew > 0:
+            new = np.array(local[len(reduced):])
+            out = np.zeros_like(new)
+            comm.Allreduce(new, out, self._reduce_op)
+            reduced.extend(out[ix] for ix in range(nnew))
+        return list(zip(self._steps, reduced))
+
+    def close(self):
+        """
+        Wait for outstanding analysis and shut down the default executor.
+        """
+        self.wait()
+        if self._own_executor:
+            self._executor.shutdown()
@@ -4,11 +4,14 @@ __copyright__ = "Copyright 2016, W.R.Saunders"
 
 __all__ = [
     'c_potential',
-    'sym_potential'
+    'sym_potential',
+    'tab_potential'
 ]
 
 from ppmd.utility.potential import c_potential
 from ppmd.utility.potential import sym_potential
+from ppmd.utility.potential import tab_potential
 
 from ppmd.utility.potential.c_potential import *
 from ppmd.utility.potential.sym_potential import *
+from ppmd.utility.potential.tab_potential import *
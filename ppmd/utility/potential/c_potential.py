@@ -6,6 +6,7 @@ __license__ = "GPL"
 # system level
 import math
 import ctypes
+import numpy as np
 
 # package level
 from ppmd import kernel, data, access
@@ -23,6 +24,30 @@ class BasePotential(object):
     def __init__(self):
         pass
 
+    def potential(self, r2):
+        """
+        Evaluate the potential energy of a pair of particles.
+
+        :arg r2: Squared distance(s) between the particles, float or numpy
+        array.
+        :return: :math:`V(r)`, zero beyond the cutoff.
+        """
+        raise NotImplementedError(
+            type(self).__name__ + ' does not provide a pair potential.')
+
+    def force(self, r2):
+        r"""
+        Evaluate the scalar force factor :math:`f` of a pair of particles such
+        that the force on particle i is :math:`f(\vec{r}_j-\vec{r}_i)`, i.e.
+        :math:`f = r^{-1} dV/dr`.
+
+        :arg r2: Squared distance(s) between the particles, float or numpy
+        array.
+        :return: :math:`f`, zero beyond the cutoff.
+        """
+        raise NotImplementedError(
+            type(self).__name__ + ' does not provide a pair force.')
+
 
 ################################################################################################################
 # LJ 2**(1/6) sigma
@@ -49,6 +74,7 @@ class LennardJonesShifted(BasePotential):
         self._rn = 1.2 * self._rc
         self._rc2 = self._rc ** 2
         self._sigma2 = self._sigma ** 2
+        self._shift_internal = 0.25
 
     @property
     def rc(self):
@@ -111,6 +137,21 @@ class LennardJonesShifted(BasePotential):
     def get_data_map(self, positions=None, forces=None, potential_energy=None):
          return {'P': positions(access.R), 'A': forces(access.INC0), 'u': potential_energy(access.INC0)}
 
+    def potential(self, r2):
+        r2 = np.asarray(r2, dtype=ctypes.c_double)
+        r_m6 = (self._sigma2 / r2) ** 3
+        return np.where(r2 < self._rc2,
+                        self._C_V * ((r_m6 - 1.0) * r_m6 + self._shift_internal),
+                        0.0)
+
+    def force(self, r2):
+        r2 = np.asarray(r2, dtype=ctypes.c_double)
+        r_m2 = self._sigma2 / r2
+        r_m6 = r_m2 ** 3
+        return np.where(r2 < self._rc2,
+                        self._C_F * (r_m6 - 0.5) * r_m6 * r_m2,
+                        0.0)
+
 ################################################################################################################
 # LJ 2.5 sigma
 ################################################################################################################  
@@ -396,6 +437,15 @@ class TestPotential1(LennardJones):
 
         return kernel.Kernel('TestPotential1', kernel_code, constants, ['stdio.h'], None)
 
+    def potential(self, r2):
+        # the kernel does not evaluate a pair potential
+        raise NotImplementedError(
+            type(self).__name__ + ' does not provide a pair potential.')
+
+    def force(self, r2):
+        raise NotImplementedError(
+            type(self).__name__ + ' does not provide a pair force.')
+
 
 class TestPotential2(LennardJones):
     r"""Lennard Jones potential.
@@ -452,6 +502,16 @@ class TestPotential2(LennardJones):
 
         return kernel.Kernel('LJ_accel_U', kernel_code, constants, ['stdio.h'], reductions)
 
+    # the kernel does not apply the cutoff
+    def potential(self, r2):
+        r_m6 = (self._sigma2 / np.asarray(r2, dtype=ctypes.c_double)) ** 3
+        return self._C_V * ((r_m6 - 1.0) * r_m6 + self._shift_internal)
+
+    def force(self, r2):
+        r_m2 = self._sigma2 / np.asarray(r2, dtype=ctypes.c_double)
+        r_m6 = r_m2 ** 3
+        return self._C_F * (r_m6 - 0.5) * r_m6 * r_m2
+
 
 
 
@@ -593,6 +653,17 @@ class TestPotential4(LennardJones):
 
         return kernel.Kernel('LJ_accel_U', kernel_code, constants, ['stdio.h'], reductions)
 
+    def potential(self, r2):
+        # the energy holds an artificial workload
+        raise NotImplementedError(
+            type(self).__name__ + ' does not provide a pair potential.')
+
+    def force(self, r2):
+        # the kernel does not apply the cutoff
+        r_m2 = self._sigma2 / np.asarray(r2, dtype=ctypes.c_double)
+        r_m6 = r_m2 ** 3
+        return self._C_F * (r_m6 - 0.5) * r_m6 * r_m2
+
 
 class TestPotential4p(LennardJones):
     r"""Lennard Jones potential.
@@ -683,6 +754,15 @@ class TestPotential4p(LennardJones):
                              [kernel.Header('stdio.h')],
                              reductions)
 
+    def potential(self, r2):
+        # the kernel uses an unconverged approximation of 1/r^2
+        raise NotImplementedError(
+            type(self).__name__ + ' does not provide a pair potential.')
+
+    def force(self, r2):
+        raise NotImplementedError(
+            type(self).__name__ + ' does not provide a pair force.')
+
 class VLennardJones(LennardJones):
     @property
     def kernel(self):
@@ -847,9 +927,110 @@ class VLennardJones2(LennardJones):
                              constants, [kernel.Header('stdio.h')])
 
 
+class LennardJonesMixture(BasePotential):
+    r"""Lennard Jones potential for a mixture of species, evaluated for all
+    pairs of species in a single pair loop. The parameters of each pair of
+    species are held in a :class:`ppmd.data.TypedDat` indexed by the species
+    of the two particles.
 
-class Buckingham(BasePotential):
+    .. math:
+        V(r) = 4\epsilon_{ab} ((r/\sigma_{ab})^{-6} - (r/\sigma_{ab})^{-12} + u(r_c))
+
+    for :math:`r>r_c` the potential (and force) is set to zero.
+
+    :arg types: Integer ParticleDat holding the species of each particle.
+    :arg epsilon: Per species values of :math:`\epsilon`, shape (ntypes,), or
+    per pair of species values, shape (ntypes, ntypes).
+    :arg sigma: As epsilon for :math:`\sigma`. Per species values are
+    combined with the Lorentz-Berthelot rules.
+    :arg rc: Cutoff, default :math:`(5/2) \max(\sigma_{ab})`.
     """
+
+    def __init__(self, types, epsilon, sigma, rc=None):
+        epsilon = np.array(epsilon, dtype=ctypes.c_double)
+        sigma = np.array(sigma, dtype=ctypes.c_double)
+        assert epsilon.shape == sigma.shape, "epsilon and sigma shapes differ"
+
+        if epsilon.ndim == 1:
+            epsilon = np.sqrt(np.outer(epsilon, epsilon))
+            sigma = 0.5 * np.add.outer(sigma, sigma)
+        ntypes = epsilon.shape[0]
+        assert epsilon.shape == (ntypes, ntypes), "bad parameter shape"
+
+        self._epsilon = epsilon
+        self._sigma = sigma
+        if rc is None:
+            self._rc = float(np.max(self._sigma)) * (5. / 2.)
+        else:
+            self._rc = rc
+        self._rc2 = self._rc ** 2
+        self._types = types
+
+        sr6 = (self._sigma / self._rc) ** 6
+        self.parameters = data.TypedDat(types, ntypes, nparam=4, name='LJP')
+        """Per pair of species parameters: sigma^2, C_V, C_F, shift."""
+        self.parameters.table[:, :, 0] = self._sigma ** 2
+        self.parameters.table[:, :, 1] = 4. * self._epsilon
+        self.parameters.table[:, :, 2] = -48. * self._epsilon / self._sigma ** 2
+        self.parameters.table[:, :, 3] = sr6 - sr6 * sr6
+
+    @property
+    def rc(self):
+        """Value of cufoff distance :math:`r_c`"""
+        return self._rc
+
+    @property
+    def kernel(self):
+        """
+        Returns a kernel class for the potential.
+        """
+
+        kernel_code = '''
+        const double R0 = P.j[0] - P.i[0];
+        const double R1 = P.j[1] - P.i[1];
+        const double R2 = P.j[2] - P.i[2];
+
+        const double r2 = R0*R0 + R1*R1 + R2*R2;
+
+        const double r_m2 = LJP[0]/r2;
+        const double r_m4 = r_m2*r_m2;
+        const double r_m6 = r_m4*r_m2;
+
+        u[0]+= (r2 < rc2) ? 0.5*LJP[1]*((r_m6-1.0)*r_m6 + LJP[3]) : 0.0;
+
+        const double r_m8 = r_m4*r_m4;
+        const double f_tmp = LJP[2]*(r_m6 - 0.5)*r_m8;
+
+        A.i[0]+= (r2 < rc2) ? f_tmp*R0 : 0.0;
+        A.i[1]+= (r2 < rc2) ? f_tmp*R1 : 0.0;
+        A.i[2]+= (r2 < rc2) ? f_tmp*R2 : 0.0;
+        '''
+        constants = (kernel.Constant('rc2', self._rc ** 2),)
+
+        return kernel.Kernel('LJ_mixture_accel_U',
+                             kernel_code,
+                             constants,
+                             [kernel.Header('stdio.h')])
+
+    def get_data_map(self, positions=None, forces=None, potential_energy=None):
+        return {'P': positions(access.R), 'A': forces(access.INC0),
+                'u': potential_energy(access.INC0),
+                'T': self._types(access.R), 'LJP': self.parameters(access.R)}
+
+
+class Buckingham(BasePotential):
+    r"""Buckingham potential.
+
+    .. math:
+        V(r) = A \exp(-Br) - C r^{-6} - V_{rc}
+
+    shifted to zero at :math:`r=r_c`, for :math:`r>r_c` the potential (and
+    force) is set to zero.
+
+    :arg a: Potential parameter :math:`A`
+    :arg b: Potential parameter :math:`B`
+    :arg c: Potential parameter :math:`C`
+    :arg rc: Cutoff distance :math:`r_c`
     """
 
     def __init__(self, a=1.0, b=1.0, c=1.0, rc=2.5):
@@ -862,7 +1043,7 @@ class Buckingham(BasePotential):
         self.ab = self.a * self.b
 
         self.rc = rc
-        self._shift_internal = -1.0 * a * math.exp(b*(-1.0/rc)) + c*(-1.0/(rc**6.0))
+        self._shift_internal = -1.0 * a * math.exp(-1.0 * b * rc) + c/(rc**6.0)
 
         self.rn = 1.2 * self.rc
         self.rc2 = self.rc ** 2
@@ -898,9 +1079,8 @@ class Buckingham(BasePotential):
         // A \\exp{-Br} - \\frac{C}{r^6}
         u[0]+= (r2 < rc2) ? 0.5*(_A*exp_mbr - crm6 + internalshift) : 0.0;
 
-        // = AB \\exp{-Br} - \\frac{C}{r^6}*\\frac{6}{r}
-        const double term2 = crm6*(-6.0)*r_m1;
-        const double f_tmp = _AB * exp_mbr + term2;
+        // \\frac{1}{r}\\frac{dV}{dr} = -AB \\frac{\\exp{-Br}}{r} + \\frac{6C}{r^8}
+        const double f_tmp = (6.0*crm6*r_m1 - _AB*exp_mbr)*r_m1;
 
         A.i[0]+= (r2 < rc2) ? f_tmp*R0 : 0.0;
         A.i[1]+= (r2 < rc2) ? f_tmp*R1 : 0.0;
@@ -934,6 +1114,22 @@ class Buckingham(BasePotential):
     def get_data_map(self, positions=None, forces=None, potential_energy=None):
          return {'P': positions(access.R), 'A': forces(access.INC0), 'u': potential_energy(access.INC0)}
 
+    def potential(self, r2):
+        r2 = np.asarray(r2, dtype=ctypes.c_double)
+        r = np.sqrt(r2)
+        return np.where(r2 < self.rc2,
+                        self.a * np.exp(self.mb * r) - self.c / (r2 ** 3) +
+                        self._shift_internal,
+                        0.0)
+
+    def force(self, r2):
+        r2 = np.asarray(r2, dtype=ctypes.c_double)
+        r = np.sqrt(r2)
+        return np.where(r2 < self.rc2,
+                        6.0 * self.c / (r2 ** 4) -
+                        self.ab * np.exp(self.mb * r) / r,
+                        0.0)
+
 class BuckinghamSymmetric(Buckingham):
     @property
     def kernel(self):
@@ -966,9 +1162,8 @@ class BuckinghamSymmetric(Buckingham):
             // A \\exp{-Br} - \\frac{C}{r^6}
             u(0)+= _A*exp_mbr - crm6 + internalshift;
 
-            // AB \\exp{-Br} - \\frac{C}{r^6}*\\frac{6}{r}
-            const double term2 = crm6*(-6.0)*r_m1;
-            const double f_tmp = _AB * exp_mbr + term2;
+            // \\frac{1}{r}\\frac{dV}{dr} = -AB \\frac{\\exp{-Br}}{r} + \\frac{6C}{r^8}
+            const double f_tmp = (6.0*crm6*r_m1 - _AB*exp_mbr)*r_m1;
 
             A(0,0)+=f_tmp*R0;
             A(0,1)+=f_tmp*R1;
@@ -4,10 +4,27 @@ __copyright__ = "Copyright 2016, W.R.Saunders"
 from ppmd.kernel import Kernel, Constant, Header
 import ppmd.access as access
 
+import ctypes
+import numpy as np
+from scipy import special
+
 import pymbolic as pmbl
 from pymbolic.mapper.c_code import CCodeMapper as CCM
 from pymbolic.mapper.evaluator import EvaluationMapper as EM
 
+# numpy implementations of the C functions that may appear in expressions
+_NUMPY_FUNCTIONS = {
+    'exp': np.exp,
+    'log': np.log,
+    'sqrt': np.sqrt,
+    'pow': np.power,
+    'sin': np.sin,
+    'cos': np.cos,
+    'fabs': np.abs,
+    'erf': special.erf,
+    'erfc': special.erfc
+}
+
 class RadiusSquared(object):
     def __new__(self):
         return pmbl.var('_r2')
@@ -22,6 +39,38 @@ class SymbolicPotential(object):
         self.potential_expr = potential_expr
         self.force_expr = force_expr
 
+    @property
+    def rc(self):
+        """Value of cufoff distance :math:`r_c`"""
+        return self._rc
+
+    def _evaluate(self, expr, r2):
+        r2 = np.asarray(r2, dtype=ctypes.c_double)
+        context = dict(_NUMPY_FUNCTIONS)
+        context['_r2'] = r2
+        v = EM(context=context)(expr) * np.ones_like(r2)
+        return np.where(r2 < self._rc**2, v, 0.0)
+
+    def potential(self, r2):
+        """
+        Evaluate the potential energy of a pair of particles.
+
+        :arg r2: Squared distance(s) between the particles.
+        """
+        return self._evaluate(self.potential_expr, r2)
+
+    def force(self, r2):
+        r"""
+        Evaluate the scalar force factor :math:`f` of a pair of particles such
+        that the force on particle i is :math:`f(\vec{r}_j-\vec{r}_i)`. Note
+        the kernel subtracts force_expr, hence :math:`f` = -force_expr.
+
+        :arg r2: Squared distance(s) between the particles.
+        """
+        if self.force_expr is None:
+            raise NotImplementedError
+        return -1.0 * self._evaluate(self.force_expr, r2)
+
     @property
     def kernel(self):
         """
@@ -0,0 +1,217 @@
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+# system level
+import ctypes
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+# package level
+from ppmd import kernel, data, access
+
+
+class TabulatedPotential(object):
+    r"""
+    Pair potential evaluated through a lookup table. The potential energy
+    :math:`V` and force factor :math:`f` (force on particle i is
+    :math:`f(\vec{r}_j-\vec{r}_i)`) are each represented by a cubic spline in
+    :math:`s=r^2` on a uniform grid between :math:`r_{min}^2` and
+    :math:`r_c^2`, hence the kernel requires no square roots, divisions or
+    transcendental functions. Pairs closer than :math:`r_{min}` are evaluated
+    by extrapolating the first interval.
+
+    The interpolation error against the source potential is measured at
+    construction on a grid finer than the table, see :meth:`error_report`.
+
+    :arg source: Potential to tabulate. Either an object providing
+    ``potential(r2)`` and optionally ``force(r2)``, e.g. a
+    :class:`LennardJones` or :class:`SymbolicPotential` instance, or a callable
+    returning :math:`V` for an array of squared distances.
+    :arg float rc: Cutoff distance, defaults to ``source.rc``.
+    :arg int n: Number of intervals in the table.
+    :arg float r_min: Smallest tabulated distance.
+    :arg force: Optional callable returning :math:`f` for an array of squared
+    distances. If neither this nor ``source.force`` is available the force is
+    taken from the derivative of the potential spline, :math:`f=2dV/ds`.
+    :arg float tol: If not None raise a RuntimeError if the normalised
+    interpolation error of the potential or force exceeds tol.
+    """
+
+    def __init__(self, source, rc=None, n=4096, r_min=0.5, force=None,
+                 tol=None):
+
+        if rc is None:
+            rc = source.rc
+        assert rc > r_min > 0.0, "require 0 < r_min < rc"
+        assert n > 1, "require at least two intervals"
+
+        self._rc = float(rc)
+        self._r_min = float(r_min)
+        self._n = int(n)
+        self._s0 = self._r_min ** 2
+        self._h = (self._rc ** 2 - self._s0) / self._n
+
+        if hasattr(source, 'potential'):
+            self._potential_func = source.potential
+        else:
+            self._potential_func = source
+
+        self._force_func = force
+        if self._force_func is None and hasattr(source, 'force'):
+            try:
+                source.force(np.array((self._rc ** 2,)))
+                self._force_func = source.force
+            except NotImplementedError:
+                pass
+
+        s = self._s0 + self._h * np.arange(self._n + 1, dtype=ctypes.c_double)
+        # evaluate the end point just inside the cutoff
+        s_eval = s.copy()
+        s_eval[-1] = np.nextafter(s_eval[-1], 0.0)
+
+        v_spline = CubicSpline(s, self._potential_func(s_eval))
+        if self._force_func is not None:
+            f_coeffs = CubicSpline(s, self._force_func(s_eval)).c
+        else:
+            f_coeffs = np.zeros((4, self._n), dtype=ctypes.c_double)
+            f_coeffs[1:, :] = 2.0 * v_spline.derivative().c
+
+        table = np.zeros((self._n, 8), dtype=ctypes.c_double)
+        table[:, 0:4] = v_spline.c.T
+        table[:, 4:8] = f_coeffs.T
+        self._table_array = table
+
+        self.table = data.ScalarArray(table.ravel(), dtype=ctypes.c_double,
+                                      name='TAB')
+
+        self._errors = self._compute_errors()
+
+        if tol is not None:
+            for kx in ('potential', 'force'):
+                if self._errors[kx][1] > tol:
+                    raise RuntimeError(
+                        "Tabulated " + kx + " error " +
+                        str(self._errors[kx][1]) + " exceeds tolerance " +
+                        str(tol) + ", increase n or r_min.\n" +
+                        self.error_report()
+                    )
+
+    @property
+    def rc(self):
+        """Value of cufoff distance :math:`r_c`"""
+        return self._rc
+
+    @property
+    def n(self):
+        """Number of intervals in the table."""
+        return self._n
+
+    def evaluate(self, r2):
+        """
+        Evaluate the table in the same manner as the kernel.
+
+        :arg r2: Squared distances, float or numpy array.
+        :return: Tuple (V, f) of numpy arrays, zero beyond the cutoff.
+        """
+        r2 = np.atleast_1d(np.asarray(r2, dtype=ctypes.c_double))
+        ds = r2 - self._s0
+        ix = np.clip(np.floor(ds / self._h), 0, self._n - 1).astype(np.int64)
+        t = ds - ix * self._h
+        c = self._table_array[ix, :]
+        v = ((c[:, 0] * t + c[:, 1]) * t + c[:, 2]) * t + c[:, 3]
+        f = ((c[:, 4] * t + c[:, 5]) * t + c[:, 6]) * t + c[:, 7]
+        inside = r2 < self._rc ** 2
+        return np.where(inside, v, 0.0), np.where(inside, f, 0.0)
+
+    def _compute_errors(self):
+        # sample each interval at points that are not knots
+        m = 4
+        offsets = (np.arange(m, dtype=ctypes.c_double) + 0.5) / m
+        s = self._s0 + self._h * (
+            np.arange(self._n, dtype=ctypes.c_double)[:, None] + offsets
+        ).ravel()
+
+        v_tab, f_tab = self.evaluate(s)
+        v_ref = self._potential_func(s)
+        if self._force_func is not None:
+            f_ref = self._force_func(s)
+        else:
+            # central difference of the source potential
+            d = 1.0e-4 * self._h
+            f_ref = (self._potential_func(s + d) -
+                     self._potential_func(s - d)) / d
+
+        errors = {}
+        for kx, tab, ref in (('potential', v_tab, v_ref),
+                             ('force', f_tab, f_ref)):
+            err = np.abs(tab - ref)
+            ix = np.argmax(err)
+            scale = np.max(np.abs(ref))
+            scale = scale if scale > 0.0 else 1.0
+            errors[kx] = (err[ix], err[ix] / scale, np.sqrt(s[ix]))
+        return errors
+
+    @property
+    def errors(self):
+        """
+        Dictionary with keys 'potential' and 'force' each mapping to a tuple
+        (max absolute error, max absolute error normalised by the largest
+        magnitude over the table, distance r at which the max error occurs).
+        """
+        return self._errors
+
+    def error_report(self):
+        """
+        :return: Human readable summary of the interpolation error.
+        """
+        s = 'TabulatedPotential: n=' + str(self._n) + ', r_min=' + \
+            str(self._r_min) + ', rc=' + str(self._rc) + '\n'
+        for kx in ('potential', 'force'):
+            e = self._errors[kx]
+            s += '\t{:10s} max abs error: {: .4e}, normalised: {: .4e}, ' \
+                 'at r={: .6f}\n'.format(kx, e[0], e[1], e[2])
+        return s
+
+    @property
+    def kernel(self):
+        """
+        Returns a kernel class for the potential.
+        """
+
+        kernel_code = '''
+        const double R0 = P.j[0] - P.i[0];
+        const double R1 = P.j[1] - P.i[1];
+        const double R2 = P.j[2] - P.i[2];
+
+        const double r2 = R0*R0 + R1*R1 + R2*R2;
+
+        if (r2 < TAB_RC2) {
+            const double ds = r2 - TAB_S0;
+            long ix = (long) (ds*TAB_IH);
+            ix = (ix < 0) ? 0 : ((ix > TAB_NM1) ? TAB_NM1 : ix);
+            const double t = ds - ix*TAB_H;
+            const double * c = &TAB[8*ix];
+
+            u[0] += 0.5*(((c[0]*t + c[1])*t + c[2])*t + c[3]);
+            const double f_tmp = ((c[4]*t + c[5])*t + c[6])*t + c[7];
+
+            A.i[0] += f_tmp*R0;
+            A.i[1] += f_tmp*R1;
+            A.i[2] += f_tmp*R2;
+        }
+        '''
+        constants = (kernel.Constant('TAB_RC2', self._rc ** 2),
+                     kernel.Constant('TAB_S0', self._s0),
+                     kernel.Constant('TAB_H', self._h),
+                     kernel.Constant('TAB_IH', 1.0 / self._h),
+                     kernel.Constant('TAB_NM1', self._n - 1))
+
+        return kernel.Kernel('TabulatedPotential',
+                             kernel_code,
+                             constants,
+                             [kernel.Header('stdio.h')])
+
+    def get_data_map(self, positions=None, forces=None, potential_energy=None):
+        return {'P': positions(access.R), 'A': forces(access.INC0),
+                'u': potential_energy(access.INC0), 'TAB': self.table(access.R)}
@@ -0,0 +1,342 @@
+"""
+Compact trajectory files. Positions are quantised relative to the periodic
+box with a user given precision. Frames are either key frames or hold the
+difference to the previous frame. Each rank encodes its particles into one
+zlib compressed block and the blocks of a frame are written in parallel with
+MPI-IO.
+
+File layout: ``FILE_MAGIC`` followed by frames. A frame is a ``_FRAME``
+header, a table with the size in bytes of each block and the blocks.
+"""
+from __future__ import print_function, division, absolute_import
+
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+__license__ = "GPL"
+
+# system level
+import ctypes
+import struct
+import zlib
+import numpy as np
+
+# package level
+from ppmd import mpi, opt, runtime
+
+FILE_MAGIC = b'PPMDTRJ1'
+
+# magic, step, npart, nblock, flags, frame size in bytes, extent, nq
+_FRAME = struct.Struct('<4sqqiiq3d3q')
+_FRAME_MAGIC = b'PFRM'
+_BLOCK_SIZE = struct.Struct('<q')
+# itemsize, size in bytes of an array section of a block
+_SECTION = struct.Struct('<Bq')
+
+_FLAG_DELTA = 1
+_FLAG_IDS = 2
+
+_UINT = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+
+def _zigzag(d):
+    d = d.astype(np.int64)
+    return ((d << 1) ^ (d >> 63)).view(np.uint64)
+
+
+def _unzigzag(u):
+    u = u.astype(np.uint64)
+    return ((u >> np.uint64(1)).view(np.int64) ^
+            -(u & np.uint64(1)).view(np.int64))
+
+
+def _pack_section(u):
+    """
+    Store unsigned integers with the smallest sufficient width, byte
+    shuffled such that the zlib compression sees the planes of equal
+    significance together.
+    """
+    m = int(np.max(u, initial=0))
+    dtype = _UINT[-1]
+    for dx in _UINT:
+        if m <= np.iinfo(dx).max:
+            dtype = dx
+            break
+    b = np.ascontiguousarray(u.astype(dtype).view(np.uint8).reshape(
+        (u.shape[0], np.dtype(dtype).itemsize)).T).tobytes()
+    return _SECTION.pack(np.dtype(dtype).itemsize, len(b)) + b
+
+
+def _unpack_section(buf, offset, count):
+    itemsize, nbytes = _SECTION.unpack_from(buf, offset)
+    offset += _SECTION.size
+    dtype = _UINT[(1, 2, 4, 8).index(itemsize)]
+    b = np.frombuffer(buf, dtype=np.uint8, count=nbytes, offset=offset)
+    u = np.ascontiguousarray(b.reshape((itemsize, count)).T).view(dtype)
+    return u.ravel().astype(np.uint64), offset + nbytes
+
+
+def _encode_block(q, gid, delta, level):
+    """
+    :arg q: (n, 3) quantised positions, sorted by gid if ids are stored.
+    :arg gid: Sorted global ids or None.
+    :arg delta: None for key frames, else a boolean array marking the
+    entries of q that hold zigzagged differences to the previous frame.
+    :return: Compressed block.
+    """
+    n = q.shape[0]
+    parts = [_BLOCK_SIZE.pack(n)]
+    if gid is not None:
+        d = np.diff(gid, prepend=0) if n > 0 else gid
+        parts.append(_pack_section(_zigzag(d)))
+    if delta is not None:
+        parts.append(_pack_section(np.packbits(delta).astype(np.uint64)))
+    for dx in range(3):
+        parts.append(_pack_section(q[:, dx]))
+    return zlib.compress(b''.join(parts), level)
+
+
+def _decode_block(block, has_ids, is_delta):
+    buf = zlib.decompress(block)
+    n = _BLOCK_SIZE.unpack_from(buf, 0)[0]
+    offset = _BLOCK_SIZE.size
+    gid = None
+    delta = None
+    if has_ids:
+        d, offset = _unpack_section(buf, offset, n)
+        gid = np.cumsum(_unzigzag(d))
+    if is_delta:
+        nb = (n + 7) // 8
+        b, offset = _unpack_section(buf, offset, nb)
+        delta = np.unpackbits(b.astype(np.uint8))[:n].astype(bool)
+    q = np.zeros((n, 3), dtype=np.uint64)
+    for dx in range(3):
+        q[:, dx], offset = _unpack_section(buf, offset, n)
+    return q, gid, delta
+
+
+def _quantise(pos, extent, nq):
+    step = extent / nq
+    q = np.floor((pos + 0.5 * extent) / step + 0.5).astype(np.int64)
+    return (q % nq).astype(np.uint64)
+
+
+class TrajectoryWriter(object):
+    """
+    Write the positions of a state to a compressed trajectory file. Calls to
+    write are collective over the domain of the state.
+
+    :arg state: State with a PositionDat.
+    :arg filename: File to write, an existing file is overwritten.
+    :arg precision: Maximum spacing of the quantised positions.
+    :arg gid: Optional integer ParticleDat of unique global ids. Required
+    for delta encoding, the particles of a frame are stored sorted by id.
+    :arg keyframe_interval: Every keyframe_interval frame is a key frame, the
+    other frames store the change to the previous frame. Set to 1 to disable
+    delta encoding.
+    :arg level: zlib compression level.
+    """
+    def __init__(self, state, filename, precision=1.0E-3, gid=None,
+                 keyframe_interval=10, level=6):
+
+        if keyframe_interval > 1 and gid is None:
+            raise RuntimeError('Delta encoding requires a global id dat.')
+        if precision <= 0.0:
+            raise RuntimeError('Bad precision: {}'.format(precision))
+
+        self._s = state
+        self._gid = gid
+        self._precision = float(precision)
+        self._keyframe_interval = max(int(keyframe_interval), 1)
+        self._level = int(level)
+        self._comm = state.domain.comm
+
+        self._nframe = 0
+        self._prev_gid = None
+        self._prev_q = None
+        self._prev_nq = None
+
+        self._fh = mpi.MPI.File.Open(
+            self._comm, filename, mpi.MPI.MODE_WRONLY | mpi.MPI.MODE_CREATE)
+        self._fh.Set_size(0)
+        if self._comm.Get_rank() == 0:
+            self._fh.Write_at(0, FILE_MAGIC)
+        self._offset = len(FILE_MAGIC)
+
+        self.timer = opt.Timer(runtime.TIMER, 0)
+
+    def write(self, step=0):
+        """
+        Append a frame with the current positions.
+        :arg step: Step number stored with the frame.
+        """
+        self.timer.start()
+
+        n = self._s.npart_local
+        extent = np.array(self._s.domain.extent[:], dtype=ctypes.c_double)
+        nq = np.ceil(extent / self._precision).astype(np.int64)
+        q = _quantise(self._s.get_position_dat()[:n:, :], extent, nq)
+
+        gid = None
+        if self._gid is not None:
+            gid = np.array(self._gid[:n:, 0], dtype=np.int64)
+            order = np.argsort(gid, kind='stable')
+            gid = gid[order]
+            q = q[order, :]
+
+        is_delta = (self._nframe % self._keyframe_interval != 0) and \
+            np.all(nq == self._prev_nq)
+
+        delta = None
+        qs = q
+        if is_delta:
+            idx = np.searchsorted(self._prev_gid, gid)
+            idx = np.minimum(idx, max(self._prev_gid.shape[0] - 1, 0))
+            delta = np.zeros(n, dtype=bool)
+            if self._prev_gid.shape[0] > 0:
+                delta = self._prev_gid[idx] == gid
+            d = q.astype(np.int64) - self._prev_q[idx, :].astype(np.int64) \
+                if self._prev_gid.shape[0] > 0 else np.zeros((n, 3), np.int64)
+            d = ((d + nq // 2) % nq) - nq // 2
+            qs = np.where(delta.reshape((n, 1)), _zigzag(d).reshape((n, 3)), q)
+
+        if gid is not None:
+            self._prev_gid = gid
+            self._prev_q = q
+        self._prev_nq = nq
+
+        block = _encode_block(qs, gid, delta, self._level)
+
+        sizes = np.array(self._comm.allgather(len(block)), dtype=np.int64)
+        nblock = sizes.shape[0]
+        npart = int(np.sum(self._comm.allgather(n)))
+        head = _FRAME.size + nblock * _BLOCK_SIZE.size
+        frame_size = head + int(np.sum(sizes))
+
+        if self._comm.Get_rank() == 0:
+            flags = (_FLAG_DELTA if is_delta else 0) | \
+                (_FLAG_IDS if gid is not None else 0)
+            header = _FRAME.pack(_FRAME_MAGIC, int(step), npart, nblock,
+                                 flags, frame_size, *(tuple(extent) +
+                                                      tuple(nq)))
+            self._fh.Write_at(self._offset, header + sizes.tobytes())
+
+        rank = self._comm.Get_rank()
+        self._fh.Write_at(self._offset + head + int(np.sum(sizes[:rank])),
+                          block)
+
+        self._offset += frame_size
+        self._nframe += 1
+        opt.PROFILE[self.__class__.__name__ + ':bytes'] = self._offset
+
+        self.timer.pause()
+
+    def close(self):
+        """
+        Close the file, collective.
+        """
+        if self._fh is not None:
+            self._fh.Close()
+            self._fh = None
+
+
+class TrajectoryReader(object):
+    """
+    Random access reader for files written by TrajectoryWriter.
+    :arg filename: File to read.
+    """
+    def __init__(self, filename):
+        self._fh = open(filename, 'rb')
+        if self._fh.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise RuntimeError('Not a trajectory file: {}'.format(filename))
+
+        self._frames = []
+        offset = len(FILE_MAGIC)
+        while True:
+            self._fh.seek(offset)
+            b = self._fh.read(_FRAME.size)
+            if len(b) < _FRAME.size:
+                break
+            h = _FRAME.unpack(b)
+            if h[0] != _FRAME_MAGIC:
+                raise RuntimeError('Corrupt frame at byte {}'.format(offset))
+            self._frames.append((offset,) + h[1:])
+            offset += h[5]
+
+        self._last = None
+
+    def __len__(self):
+        return len(self._frames)
+
+    def step(self, index):
+        """
+        :return: The step number of a frame.
+        """
+        return self._frames[index][1]
+
+    def extent(self, index):
+        """
+        :return: The domain extent of a frame.
+        """
+        return np.array(self._frames[index][6:9])
+
+    def _decode(self, index):
+        offset, step, npart, nblock, flags, size = self._frames[index][:6]
+        self._fh.seek(offset + _FRAME.size)
+        sizes = np.frombuffer(self._fh.read(nblock * _BLOCK_SIZE.size),
+                              dtype=np.int64)
+        q = []
+        gid = []
+        delta = []
+        for sx in sizes:
+            qx, gx, dx = _decode_block(self._fh.read(int(sx)),
+                                       flags & _FLAG_IDS, flags & _FLAG_DELTA)
+            q.append(qx)
+            gid.append(gx)
+            delta.append(dx)
+
+        q = np.concatenate(q) if nblock > 0 else np.zeros((0, 3), np.uint64)
+        if not flags & _FLAG_IDS:
+            return q, None
+        gid = np.concatenate(gid) if nblock > 0 else np.zeros(0, np.int64)
+
+        if flags & _FLAG_DELTA:
+            nq = np.array(self._frames[index][9:12], dtype=np.int64)
+            delta = np.concatenate(delta)
+            pq, pgid = self._last[1]
+            idx = np.searchsorted(pgid, gid[delta])
+            d = _unzigzag(q[delta, :].ravel()).reshape((-1, 3))
+            q[delta, :] = ((pq[idx, :].astype(np.int64) + d) % nq).astype(
+                np.uint64)
+
+        order = np.argsort(gid, kind='stable')
+        return q[order, :], gid[order]
+
+    def read(self, index):
+        """
+        Decode a frame.
+        :arg index: Frame index, negative values count from the end.
+        :return: Tuple of a (npart, 3) array of positions and the global ids
+        of the particles or None if the file holds no ids.
+        """
+        index = range(len(self._frames))[index]
+
+        # decode forward from the last key frame or the last decoded frame
+        last = -1 if self._last is None else self._last[0]
+        start = index
+        if last == index:
+            start = index + 1
+        else:
+            while (self._frames[start][4] & _FLAG_DELTA) and \
+                    (last != start - 1):
+                start -= 1
+        for ix in range(start, index + 1):
+            self._last = (ix, self._decode(ix))
+
+        q, gid = self._last[1]
+        extent = self.extent(index)
+        nq = np.array(self._frames[index][9:12], dtype=np.int64)
+        pos = q.astype(np.float64) * (extent / nq) - 0.5 * extent
+        return pos, (None if gid is None else gid.copy())
+
+    def close(self):
+        self._fh.close()
@@ -310,3 +310,52 @@ def test_fmm_init_2_1():
 
 
 
+
+
+@pytest.mark.parametrize("free_space", (True, '27', False))
+def test_fmm_local_symmetric_1(free_space):
+    E = 4.
+    N = 400
+
+    A = state.State()
+    A.domain = domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = domain.BoundaryTypePeriodic()
+    A.npart = N
+
+    A.P = data.PositionDat(ncomp=3)
+    A.Q = data.ParticleDat(ncomp=1)
+    A.F = data.ParticleDat(ncomp=3)
+    A.U = data.ParticleDat(ncomp=1)
+
+    rng = np.random.RandomState(seed=2718)
+    A.P[:] = rng.uniform(low=-0.5*E, high=0.5*E, size=(N, 3))
+    A.Q[:] = rng.uniform(low=-1., high=1., size=(N, 1))
+    A.Q[:] -= np.sum(A.Q[:N:, 0])/N
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+    n = A.npart_local
+
+    fmm = PyFMM(domain=A.domain, r=3, l=8, free_space=free_space)
+    fmm_sym = PyFMM(domain=A.domain, r=3, l=8, free_space=free_space,
+                    local_symmetric=True)
+
+    A.F[:] = 0.0
+    e0 = fmm(A.P, A.Q, forces=A.F, potential=A.U)
+    f0 = A.F[:n:, :].copy()
+    u0 = A.U[:n:, :].copy()
+
+    A.F[:] = 0.0
+    e1 = fmm_sym(A.P, A.Q, forces=A.F, potential=A.U)
+
+    assert abs(e1 - e0) < 10.**-12 * abs(e0)
+    if n > 0:
+        assert np.max(np.abs(A.F[:n:, :] - f0)) < \
+            10.**-12 * np.max(np.abs(f0))
+        assert np.max(np.abs(A.U[:n:, :] - u0)) < \
+            10.**-12 * np.max(np.abs(u0))
+
+    # each pair is computed once
+    assert fmm_sym._fmm_local.exec_count < fmm._fmm_local.exec_count
+
+    fmm.free()
+    fmm_sym.free()
@@ -0,0 +1,135 @@
+from __future__ import print_function, division
+
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+
+import pytest, ctypes, math, itertools
+from mpi4py import MPI
+import numpy as np
+
+from ppmd import *
+from ppmd.coulomb.fmm import *
+from ppmd.coulomb.fmm_adaptive import AdaptiveFMM
+
+MPISIZE = MPI.COMM_WORLD.Get_size()
+MPIRANK = MPI.COMM_WORLD.Get_rank()
+
+N = 400
+E = 4.
+
+
+def _clustered(seed):
+    # half the particles in a small cluster, half uniform
+    rng = np.random.RandomState(seed=seed)
+    pos = np.vstack((rng.normal(0.8, 0.15, size=(N//2, 3)),
+                     rng.uniform(-0.5*E, 0.5*E, size=(N - N//2, 3))))
+    q = rng.uniform(low=-1., high=1., size=(N, 1))
+    q -= np.sum(q)/N
+    return np.clip(pos, -0.49*E, 0.49*E), q
+
+
+@pytest.fixture
+def charges_state():
+    pos, q = _clustered(1234)
+    A = state.State()
+    A.domain = domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = domain.BoundaryTypePeriodic()
+    A.npart = N
+    A.P = data.PositionDat(ncomp=3)
+    A.Q = data.ParticleDat(ncomp=1)
+    A.F = data.ParticleDat(ncomp=3)
+    A.U = data.ParticleDat(ncomp=1)
+    A.P[:] = pos
+    A.Q[:] = q
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+    return A
+
+
+@pytest.mark.parametrize("free_space", (True, False))
+def test_fmm_adaptive_tree_1(charges_state, free_space):
+    A = charges_state
+    n = A.npart_local
+    R = 5
+    fmm = AdaptiveFMM(domain=A.domain, r=R, l=4, free_space=free_space,
+                      max_leaf=16)
+    fmm(A.P, A.Q)
+    tree = fmm.adaptive_tree
+    lmin = fmm.min_level
+
+    pos, q = _clustered(1234)
+    ns = 2**(R-1)
+
+    def finest(x):
+        return np.clip(np.floor((x + 0.5*E)*ns/E).astype(np.int64), 0, ns-1)
+
+    g = finest(pos)
+    gl = finest(A.P[:n:, :])
+
+    # serial counts of the cells of all particles and the leaf levels of
+    # the local particles
+    leaf = np.zeros(n, dtype=np.int64) + lmin
+    num_cells = 0
+    for lx in range(R):
+        keys = [tuple(kx) for kx in (g >> (R-1-lx)).tolist()]
+        counts = {}
+        for kx in keys:
+            counts[kx] = counts.get(kx, 0) + 1
+        parents = {}
+        for kx, cx in counts.items():
+            px = tuple(k//2 for k in kx)
+            parents[px] = parents.get(px, 0) + cx
+        num_cells += sum(1 for kx in counts.keys() if lx <= lmin or
+                         parents[tuple(k//2 for k in kx)] > 16)
+        if lmin <= lx < R-1:
+            local = [tuple(kx) for kx in (gl >> (R-1-lx)).tolist()]
+            leaf += np.array([counts[kx] > 16 for kx in local],
+                             dtype=np.int64)
+
+    assert np.all(fmm.leaf_level == leaf)
+    cells = np.array((sum(cx.shape[0] for cx in tree.cells),))
+    MPI.COMM_WORLD.Allreduce(MPI.IN_PLACE, cells)
+    assert cells[0] == num_cells
+    # the cluster is refined further than the uniform background
+    assert MPI.COMM_WORLD.allreduce(np.max(leaf, initial=0), MPI.MAX) == R - 1
+    assert num_cells < sum(8**lx for lx in range(R))
+
+    fmm.free()
+
+
+def test_fmm_adaptive_1(charges_state):
+    A = charges_state
+    n = A.npart_local
+
+    pos, q = _clustered(1234)
+    d = pos[:, None, :] - pos[None, :, :]
+    r = np.linalg.norm(d, axis=2)
+    np.fill_diagonal(r, np.inf)
+    e_direct = 0.5 * np.sum(q * q.T / r)
+
+    for free_space in (True, '27', False):
+        fmm = AdaptiveFMM(domain=A.domain, r=5, l=12,
+                          free_space=free_space, max_leaf=16)
+        ref = PyFMM(domain=A.domain, r=4, l=12, free_space=free_space)
+
+        A.F[:] = 0.0
+        A.U[:] = 0.0
+        e0 = ref(A.P, A.Q, forces=A.F)
+        f0 = A.F[:n:, :].copy()
+        A.F[:] = 0.0
+        e1 = fmm(A.P, A.Q, forces=A.F, potential=A.U)
+
+        # l = 12 corresponds to eps = 2**-12
+        assert abs(e1 - e0) < 2.**-12 * abs(e0)
+        if n > 0:
+            err = np.max(np.abs(A.F[:n:, :] - f0))
+            assert err < 2.**-12 * np.max(np.abs(f0))
+        u = np.array((np.sum(A.U[:n:, 0]),))
+        MPI.COMM_WORLD.Allreduce(MPI.IN_PLACE, u)
+        assert abs(0.5*u[0] - e1) < 10.**-12 * abs(e1)
+
+        if free_space == True:
+            assert abs(e1 - e_direct) < 2.**-12 * abs(e_direct)
+
+        ref.free()
+        fmm.free()
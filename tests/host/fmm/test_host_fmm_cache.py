@@ -0,0 +1,112 @@
+from __future__ import print_function, division
+
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+
+import pytest, ctypes, math
+from mpi4py import MPI
+import numpy as np
+import tempfile
+import shutil
+
+from ppmd import *
+from ppmd.coulomb.fmm import *
+from ppmd.coulomb.fmm import _compute_tables
+from ppmd.coulomb.fmm_cache import FMMCache
+
+MPISIZE = MPI.COMM_WORLD.Get_size()
+MPIRANK = MPI.COMM_WORLD.Get_rank()
+MPIBARRIER = MPI.COMM_WORLD.Barrier
+
+
+@pytest.fixture
+def cache_dir():
+    d = tempfile.mkdtemp() if MPIRANK == 0 else None
+    d = MPI.COMM_WORLD.bcast(d, root=0)
+    yield d
+    MPIBARRIER()
+    if MPIRANK == 0:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+def test_fmm_cache_1(cache_dir):
+    L = 8
+    ncalls = [0]
+    def compute():
+        ncalls[0] += 1
+        return _compute_tables(L, REAL)
+
+    cache = FMMCache(directory=cache_dir, enabled=True)
+    t0 = cache.get('tables', (L, str(REAL)), compute)
+    assert cache.misses == (1 if MPIRANK == 0 else 0)
+
+    cache2 = FMMCache(directory=cache_dir, enabled=True)
+    t1 = cache2.get('tables', (L, str(REAL)), compute)
+    assert cache2.hits == (1 if MPIRANK == 0 else 0)
+    assert cache2.misses == 0
+    # only rank 0 ever computes and only once
+    assert ncalls[0] == (1 if MPIRANK == 0 else 0)
+
+    direct = _compute_tables(L, REAL)
+    assert set(t1.keys()) == set(direct.keys())
+    for kx in direct.keys():
+        assert np.all(t0[kx] == direct[kx])
+        assert np.all(t1[kx] == direct[kx])
+        assert t1[kx].dtype == direct[kx].dtype
+
+    # loaded arrays are copy on write
+    t1['a'][:] = 0.0
+    t2 = cache2.get('tables', (L, str(REAL)), compute)
+    assert np.all(t2['a'] == direct['a'])
+
+    # a different key is a different entry
+    t3 = cache2.get('tables', (L+1, str(REAL)), lambda: _compute_tables(L+1, REAL))
+    assert t3['a'].shape == ((L+1)*2, (L+1)*4+1)
+
+    # disabled caches compute on every rank
+    cache3 = FMMCache(directory=cache_dir, enabled=False)
+    t4 = cache3.get('tables', (L, str(REAL)), compute)
+    assert ncalls[0] == (2 if MPIRANK == 0 else 1)
+    assert np.all(t4['yab'] == direct['yab'])
+
+
+def test_fmm_cache_2():
+    R = 3
+    L = 10
+    N = 50
+    E = 4.
+
+    A = state.State()
+    A.domain = domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = domain.BoundaryTypePeriodic()
+
+    rng = np.random.RandomState(seed=1234)
+    pos = rng.uniform(low=-0.5*E, high=0.5*E, size=(N, 3))
+    q = rng.uniform(low=-1., high=1., size=(N, 1))
+    q -= np.sum(q)/N
+
+    A.npart = N
+    A.P = data.PositionDat(ncomp=3)
+    A.Q = data.ParticleDat(ncomp=1)
+    A.P[:] = pos
+    A.Q[:] = q
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    fmm0 = PyFMM(domain=A.domain, r=R, l=L, free_space=False)
+    e0 = fmm0(A.P, A.Q)
+
+    fmm1 = PyFMM(domain=A.domain, r=R, l=L, free_space=False)
+    e1 = fmm1(A.P, A.Q)
+
+    if MPIRANK == 0 and fmm1._cache.enabled:
+        # tables, wigner matrices and lattice sums are all loaded from disk
+        assert fmm1._cache.hits == 3
+        assert fmm1._cache.misses == 0
+
+    assert np.all(fmm0._boundary_terms == fmm1._boundary_terms)
+    assert np.all(fmm0._interaction_p == fmm1._interaction_p)
+    assert abs(e0 - e1) < 10.**-12 * abs(e0)
+
+    fmm0.free()
+    fmm1.free()
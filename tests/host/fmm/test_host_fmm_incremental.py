@@ -0,0 +1,126 @@
+from __future__ import print_function, division
+
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+
+import pytest, ctypes, math
+from mpi4py import MPI
+import numpy as np
+
+from ppmd import *
+from ppmd.coulomb.fmm import *
+from ppmd.coulomb.ewald import EwaldOrthoganal
+
+MPISIZE = MPI.COMM_WORLD.Get_size()
+MPIRANK = MPI.COMM_WORLD.Get_rank()
+
+N = 200
+E = 4.
+
+
+@pytest.fixture
+def charges_state():
+    A = state.State()
+    A.domain = domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = domain.BoundaryTypePeriodic()
+    A.npart = N
+    A.P = data.PositionDat(ncomp=3)
+    A.Q = data.ParticleDat(ncomp=1)
+    A.F = data.ParticleDat(ncomp=3)
+
+    rng = np.random.RandomState(seed=8472)
+    A.P[:] = rng.uniform(low=-0.5*E, high=0.5*E, size=(N, 3))
+    A.Q[:] = rng.uniform(low=-1., high=1., size=(N, 1))
+    A.Q[:] -= np.sum(A.Q[:N:, 0])/N
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+    return A
+
+
+def _moves(n):
+    rng = np.random.RandomState(seed=1123)
+    return [(rng.randint(N), rng.uniform(-0.6, 0.6, 3)) for mx in range(n)]
+
+
+def test_fmm_incremental_1(charges_state):
+    A = charges_state
+    ewald = EwaldOrthoganal(domain=A.domain, real_cutoff=1.9, eps=10.**-8)
+    fmm = PyFMM(domain=A.domain, r=3, l=16, free_space=False)
+
+    with pytest.raises(RuntimeError):
+        fmm.propose(0, (0., 0., 0.))
+
+    ewald(A.P, A.Q, A.F)
+    e0 = ewald.last_recip_energy + ewald.last_real_energy + \
+        ewald.last_self_energy
+    f0 = fmm(A.P, A.Q)
+
+    inc_ewald = ewald.setup_incremental(A.P, A.Q)
+    inc_fmm = fmm.setup_incremental(A.P, A.Q)
+    # only the local particles are held
+    assert inc_fmm.positions.shape == (A.npart_local, 3)
+    assert inc_fmm.offsets[-1] == N
+
+    for mx, (i, dx) in enumerate(_moves(6)):
+        y = inc_ewald.get_position(i) + dx
+        de_ewald = ewald.propose(i, y)
+        de_fmm = fmm.propose(i, y)
+        assert abs(de_ewald - de_fmm) < 10.**-5 * abs(e0)
+
+        if mx % 3 == 2:
+            # rejected moves do not modify the cached state
+            ewald.reject()
+            fmm.reject()
+            continue
+
+        ewald.accept()
+        fmm.accept()
+        yw = inc_ewald.get_position(i)
+        assert np.all(np.abs(yw) <= 0.5*E)
+        assert np.all(inc_fmm.get_position(i) == yw)
+
+        if MPISIZE == 1:
+            # compare with recomputing the energy from scratch
+            A.P[i, :] = yw
+            A.F[:] = 0.0
+            e1 = ewald(A.P, A.Q, A.F)
+            f1 = fmm(A.P, A.Q)
+            assert abs((e1 - e0) - de_ewald) < 10.**-10 * abs(e0)
+            assert abs((f1 - f0) - de_fmm) < 10.**-6 * abs(f0)
+            e0 = e1
+            f0 = f1
+
+    fmm.free()
+
+
+def test_fmm_incremental_2(charges_state):
+    A = charges_state
+    fmm = PyFMM(domain=A.domain, r=4, l=12, free_space=True)
+    inc = fmm.setup_incremental(A.P, A.Q)
+
+    def direct_phi(i, y):
+        # sum over the local particles of each rank
+        d = np.linalg.norm(inc.positions - y, axis=1)
+        ix = i - inc.offsets[MPIRANK]
+        if 0 <= ix < d.shape[0]:
+            d[ix] = np.inf
+        return MPI.COMM_WORLD.allreduce(np.sum(inc.charges / d))
+
+    def charge(i):
+        ix = i - inc.offsets[MPIRANK]
+        q = inc.charges[ix] if 0 <= ix < inc.charges.shape[0] else 0.0
+        return MPI.COMM_WORLD.allreduce(q)
+
+    for i, dx in _moves(4):
+        x = inc.get_position(i)
+        y = np.clip(x + dx, -0.49*E, 0.49*E)
+        de = fmm.propose(i, y)
+        de_direct = charge(i) * (direct_phi(i, y) - direct_phi(i, x))
+        # l = 12 corresponds to eps = 2**-12
+        assert abs(de - de_direct) < 2.**-12 * abs(de_direct)
+        fmm.accept()
+
+    with pytest.raises(RuntimeError):
+        fmm.propose(0, (E, 0., 0.))
+
+    fmm.free()
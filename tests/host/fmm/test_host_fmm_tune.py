@@ -0,0 +1,113 @@
+from __future__ import print_function, division
+
+__author__ = "W.R.Saunders"
+__copyright__ = "Copyright 2016, W.R.Saunders"
+
+import pytest, ctypes, math
+from mpi4py import MPI
+import numpy as np
+import tempfile
+import shutil
+
+from ppmd import *
+from ppmd.coulomb.fmm import *
+from ppmd.coulomb.fmm_cache import FMMCache
+from ppmd.coulomb.fmm_tune import FMMCostModel, tuned_fmm
+
+MPISIZE = MPI.COMM_WORLD.Get_size()
+MPIRANK = MPI.COMM_WORLD.Get_rank()
+MPIBARRIER = MPI.COMM_WORLD.Barrier
+
+
+@pytest.fixture
+def cache_dir():
+    d = tempfile.mkdtemp() if MPIRANK == 0 else None
+    d = MPI.COMM_WORLD.bcast(d, root=0)
+    yield d
+    MPIBARRIER()
+    if MPIRANK == 0:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+def test_fmm_tune_1(cache_dir):
+    cache = FMMCache(directory=cache_dir, enabled=True)
+    model = FMMCostModel(n=1000, r=3, l=8, ncall=1, cache=cache)
+    costs = model.calibrate()
+    assert cache.misses == (1 if MPIRANK == 0 else 0)
+    for cx in ('p2p', 'p2m', 'm2m', 'm2l', 'comm'):
+        assert costs[cx] > 0.0
+
+    # the calibration is loaded from disk and identical on all ranks
+    cache2 = FMMCache(directory=cache_dir, enabled=True)
+    model2 = FMMCostModel(n=1000, r=3, l=8, ncall=1, cache=cache2)
+    assert model2.calibrate() == costs
+    assert cache2.hits == (1 if MPIRANK == 0 else 0)
+    assert MPI.COMM_WORLD.bcast(costs, root=0) == costs
+
+    N = 100000
+    # more terms or more particles always cost more
+    t0 = model.predict(N, 4, 10)
+    assert model.predict(N, 4, 20)['total'] > t0['total']
+    assert model.predict(2*N, 4, 10)['total'] > t0['total']
+    # more levels trade near field for far field work
+    t1 = model.predict(N, 5, 10)
+    assert t1['p2p'] < t0['p2p']
+    assert t1['m2l'] > t0['m2l']
+
+    eps = 10.**-6
+    R, L, cuda_levels, t = model.select(N, eps=eps)
+    assert model.error(R, L) <= eps
+    assert cuda_levels == 0
+    # the cheapest of all candidates that meet the accuracy
+    for rx in range(3, 8):
+        for lx in range(2, 40):
+            if model.error(rx, lx) <= eps:
+                assert t <= model.predict(N, rx, lx)['total']
+    assert abs(t - model.predict(N, R, L)['total']) < 10.**-15
+    # the smallest sufficient L is the cheapest for the selected R
+    assert model.error(R, L - 1) > eps
+
+    # a higher accuracy requires more terms
+    assert model.select(N, eps=eps*eps)[1] > L
+    assert model.select(N, eps=eps, r_range=(3,))[1] <= \
+        model.select(N, eps=eps, r_range=(6,))[1]
+    with pytest.raises(RuntimeError):
+        model.select(N, eps=eps, l_range=(2,))
+
+    # the cheapest level count grows with the number of particles
+    assert model.select(100*N, l=10)[0] >= model.select(N, l=10)[0]
+
+
+def test_fmm_tune_2(cache_dir):
+    N = 200
+    E = 4.
+
+    A = state.State()
+    A.domain = domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = domain.BoundaryTypePeriodic()
+
+    rng = np.random.RandomState(seed=4321)
+    A.npart = N
+    A.P = data.PositionDat(ncomp=3)
+    A.Q = data.ParticleDat(ncomp=1)
+    A.P[:] = rng.uniform(low=-0.5*E, high=0.5*E, size=(N, 3))
+    A.Q[:] = rng.uniform(low=-1., high=1., size=(N, 1))
+    A.Q[:] -= np.sum(A.Q[:N:, 0])/N
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    model = FMMCostModel(A.domain.comm, n=1000, r=3, l=8, ncall=1,
+                         cache=FMMCache(directory=cache_dir, enabled=True))
+    fmm = tuned_fmm(A.domain, N, eps=10.**-4, model=model)
+    R, L, cuda_levels, t = model.select(N, eps=10.**-4)
+    assert fmm.R == R
+    assert fmm.L == L
+    assert fmm.predicted_time == t
+
+    fmm_ref = PyFMM(domain=A.domain, r=R, l=L, free_space=False)
+    e0 = fmm(A.P, A.Q)
+    e1 = fmm_ref(A.P, A.Q)
+    assert abs(e0 - e1) < 10.**-12 * abs(e1)
+
+    fmm.free()
+    fmm_ref.free()
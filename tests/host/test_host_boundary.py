@@ -559,3 +559,38 @@ def test_host_boundary_y1(state):
 
 
 
+
+
+@pytest.mark.parametrize("dtype", (ctypes.c_int, ctypes.c_int64))
+def test_host_boundary_images(dtype):
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.img = ParticleDat(ncomp=3, dtype=dtype)
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic(
+        image_dat=A.img)
+    A.p = PositionDat(ncomp=3)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+
+    rng = np.random.RandomState(seed=87)
+    u = rng.uniform(-1*Eo2, Eo2, [N,3])
+    A.p[:] = u
+    A.gid[:,0] = np.arange(N)
+    A.scatter_data_from(0)
+
+    for tx in range(40):
+        d = rng.uniform(-1.5, 1.5, [N,3])
+        u += d
+        n = A.npart_local
+        A.p[:n:, :] += d[A.gid[:n:, 0], :]
+        A.domain.boundary_condition.apply()
+
+        n = A.npart_local
+        gid = A.gid[:n:, 0]
+        unwrapped = A.p[:n:, :] + E * A.img[:n:, :]
+        assert np.max(np.abs(unwrapped - u[gid, :]), initial=0.0) < 10.**-10
+
+    assert A.sum_npart_local() == N
+    # particles crossed the boundaries in both directions
+    nimg = md.mpi.MPI.COMM_WORLD.allreduce(np.sum(np.abs(A.img[:A.npart_local:, :])))
+    assert nimg > 0
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import numpy as np
+
+
+import ppmd as md
+from ppmd.access import *
+
+crN = 8
+N = crN**3
+rho = 0.8
+E = (N/rho)**(1./3.)
+
+rc = 2.5
+delta = 0.3
+dt = 0.002
+nstep = 200
+nout = 50
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+GlobalArray = md.data.GlobalArray
+State = md.state.State
+ParticleLoop = md.loop.ParticleLoopOMP
+PairLoop = md.pairloop.CellByCellOMP
+Kernel = md.kernel.Kernel
+Constant = md.kernel.Constant
+
+
+def _make_state():
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+
+    A.p = PositionDat(ncomp=3)
+    A.v = ParticleDat(ncomp=3)
+    A.f = ParticleDat(ncomp=3)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+
+    rng = np.random.RandomState(seed=1618)
+    A.p[:] = md.utility.lattice.cubic_lattice((crN, crN, crN), (E, E, E)) + \
+        rng.uniform(-0.05, 0.05, [N, 3])
+    v = rng.normal(0.0, 1.0, [N, 3])
+    A.v[:] = v - np.mean(v, axis=0)
+    A.gid[:,0] = np.arange(N)
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    return A
+
+
+def _loops(state, k, pair_loop=PairLoop):
+    force = pair_loop(Kernel('test_host_compiled_step_lj', '''
+        const double r0 = P.j[0] - P.i[0];
+        const double r1 = P.j[1] - P.i[1];
+        const double r2 = P.j[2] - P.i[2];
+        const double rr = r0*r0 + r1*r1 + r2*r2;
+        if (rr < RC2) {
+            const double r_m2 = 1.0/rr;
+            const double r_m6 = r_m2*r_m2*r_m2;
+            const double f_tmp = -48.0*(r_m6 - 0.5)*r_m6*r_m2;
+            F.i[0] += f_tmp*r0;
+            F.i[1] += f_tmp*r1;
+            F.i[2] += f_tmp*r2;
+        }
+        ''', (Constant('RC2', rc*rc),)),
+        dat_dict={'P': state.p(READ), 'F': state.f(INC_ZERO)},
+        shell_cutoff=rc+delta
+    )
+    vv1 = ParticleLoop(Kernel('test_host_compiled_step_vv1', '''
+        V.i[0] += HDT*F.i[0];
+        V.i[1] += HDT*F.i[1];
+        V.i[2] += HDT*F.i[2];
+        P.i[0] += DT*V.i[0];
+        P.i[1] += DT*V.i[1];
+        P.i[2] += DT*V.i[2];
+        ''', (Constant('DT', dt), Constant('HDT', 0.5*dt))),
+        dat_dict={'P': state.p(INC), 'V': state.v(INC), 'F': state.f(READ)}
+    )
+    vv2 = ParticleLoop(Kernel('test_host_compiled_step_vv2', '''
+        V.i[0] += HDT*F.i[0];
+        V.i[1] += HDT*F.i[1];
+        V.i[2] += HDT*F.i[2];
+        ''', (Constant('HDT', 0.5*dt),)),
+        dat_dict={'V': state.v(INC), 'F': state.f(READ)}
+    )
+    ke = ParticleLoop(Kernel('test_host_compiled_step_ke', '''
+        K[0] += 0.5*(V.i[0]*V.i[0] + V.i[1]*V.i[1] + V.i[2]*V.i[2]);
+        '''),
+        dat_dict={'V': state.v(READ), 'K': k(INC_ZERO)}
+    )
+    return force, vv1, vv2, ke
+
+
+def _sorted(state):
+    n = state.npart_local
+    order = np.argsort(state.gid[:n:, 0])
+    return state.gid[:n:, 0][order], state.p[:n:, :][order, :], \
+        state.v[:n:, :][order, :]
+
+
+@pytest.mark.parametrize('pair_loop', (
+    PairLoop, md.pairloop.PairLoopNeighbourListNS,
+    md.pairloop.PairLoopNeighbourListNSOMP))
+def test_host_compiled_step_1(pair_loop):
+    s0 = _make_state()
+    k0 = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    force, vv1, vv2, ke = _loops(s0, k0, pair_loop)
+
+    ke0 = []
+    force.execute()
+    for it in md.method.IntegratorRange(nstep, dt, s0.v, 10, delta,
+                                        verbose=False):
+        vv1.execute()
+        force.execute()
+        vv2.execute()
+        if (it + 1) % nout == 0:
+            ke.execute()
+            ke0.append(k0[0])
+
+    s1 = _make_state()
+    k1 = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    force, vv1, vv2, ke = _loops(s1, k1, pair_loop)
+
+    ke1 = []
+    def output(it):
+        assert (it + 1) % nout == 0
+        ke1.append(k1[0])
+
+    force.execute()
+    r = md.method.CompiledIntegratorRange(
+        nstep, dt, s1.v, (vv1, force, vv2), 10, delta,
+        output_loops=(ke,), output_interval=nout, output=output,
+        verbose=False)
+    r.run()
+
+    assert r.native_steps + r.python_steps == nstep
+    assert r.native_steps > r.python_steps
+    assert len(ke1) == nstep // nout
+    assert np.allclose(ke0, ke1, rtol=10.**-10, atol=0)
+
+    assert s0.npart_local == s1.npart_local
+    g0, p0, v0 = _sorted(s0)
+    g1, p1, v1 = _sorted(s1)
+    assert np.all(g0 == g1)
+    assert np.max(np.abs(p0 - p1), initial=0.0) < 10.**-10
+    assert np.max(np.abs(v0 - v1), initial=0.0) < 10.**-10
+
+
+def test_host_compiled_step_pair_loop_first():
+    # the native driver stops before the first loop of a step that rebuilds
+    # the cell list, the step is continued in Python and counted once
+    s0 = _make_state()
+    k0 = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    force, vv1, vv2, ke = _loops(s0, k0)
+
+    vv1.execute()
+    c0 = s0.get_cell_to_particle_map().version_id
+    r0 = md.method.IntegratorRange(nstep, dt, s0.v, 10, delta, verbose=False)
+    for it in r0:
+        force.execute()
+        vv2.execute()
+        vv1.execute()
+    c0 = s0.get_cell_to_particle_map().version_id - c0
+
+    s1 = _make_state()
+    k1 = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    force, vv1, vv2, ke = _loops(s1, k1)
+
+    vv1.execute()
+    c1 = s1.get_cell_to_particle_map().version_id
+    r1 = md.method.CompiledIntegratorRange(
+        nstep, dt, s1.v, (force, vv2, vv1), 10, delta, verbose=False)
+    r1.run()
+    c1 = s1.get_cell_to_particle_map().version_id - c1
+
+    assert r1.native_steps + r1.python_steps == nstep
+    assert r1.native_steps > r1.python_steps
+    assert r0._update_controller._step_counter == \
+        r1._update_controller._step_counter
+    assert c0 == c1
+
+    assert s0.npart_local == s1.npart_local
+    g0, p0, v0 = _sorted(s0)
+    g1, p1, v1 = _sorted(s1)
+    assert np.all(g0 == g1)
+    assert np.max(np.abs(p0 - p1), initial=0.0) < 10.**-10
+    assert np.max(np.abs(v0 - v1), initial=0.0) < 10.**-10
+
+
+def test_host_compiled_step_2():
+    s0 = _make_state()
+    k0 = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    force, vv1, vv2, ke = _loops(s0, k0)
+
+    with pytest.raises(RuntimeError):
+        md.method.CompiledIntegratorRange(nstep, dt, s0.v, (vv1, ke))
+    with pytest.raises(RuntimeError):
+        md.method.CompiledIntegratorRange(nstep, dt, s0.v, (lambda: None,))
+
+    r = md.method.CompiledIntegratorRange(nstep, dt, s0.v, (vv1, force, vv2))
+    with pytest.raises(RuntimeError):
+        iter(r)
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import numpy as np
+
+import ppmd as md
+
+N = 50
+E = 8.
+Eo2 = E/2.
+NSAMPLE = 150
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+State = md.state.State
+MultipleTauCorrelator = md.utility.correlator.MultipleTauCorrelator
+
+
+def _state(soa):
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+    A.p = PositionDat(ncomp=3)
+    A.a = ParticleDat(ncomp=3, soa=soa)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+
+    rng = np.random.RandomState(seed=1234)
+    A.p[:] = rng.uniform(-1*Eo2, Eo2, [N,3])
+    A.gid[:,0] = np.arange(N)
+    A.scatter_data_from(0)
+    return A
+
+
+def _reference(x, mode, levels, p, m, average):
+    """
+    Direct evaluation of the multiple-tau estimate from the full series
+    x[t, particle, component].
+    """
+    lags = []
+    corr = []
+    y = x
+    for lx in range(levels):
+        if lx > 0:
+            nb = y.shape[0] // m
+            y = y[:nb*m].reshape((nb, m) + y.shape[1:])
+            y = np.mean(y, axis=1) if average else y[:, -1]
+        j0 = 0 if lx == 0 else p // m
+        for j in range(j0, p):
+            if j >= y.shape[0]:
+                break
+            a = y[j:]
+            b = y[:y.shape[0]-j]
+            if mode == 'dot':
+                c = np.sum(a * b, axis=2)
+            else:
+                c = np.sum((a - b)**2, axis=2)
+            lags.append(j * m**lx)
+            corr.append(np.mean(c))
+    return np.array(lags), np.array(corr)
+
+
+@pytest.mark.parametrize("mode", ('dot', 'msd'))
+@pytest.mark.parametrize("soa", (False, True))
+def test_host_correlator_1(mode, soa):
+    A = _state(soa)
+    levels = 4
+    p = 8
+    m = 2
+    c = MultipleTauCorrelator(A, A.a, mode=mode, levels=levels, p=p, m=m,
+                              dt=0.5)
+
+    rng = np.random.RandomState(seed=9)
+    x = np.cumsum(rng.normal(0, 1.0, (NSAMPLE, N, 3)), axis=0)
+    rng = np.random.RandomState(seed=10 + rank)
+    for tx in range(NSAMPLE):
+        # the history moves with the particles between ranks
+        n = A.npart_local
+        A.p[:n:, :] += rng.uniform(-0.5, 0.5, (n, 3))
+        A.domain.boundary_condition.apply()
+
+        n = A.npart_local
+        A.a[:n:, :] = x[tx, A.gid[:n:, 0], :]
+        c.sample()
+
+    tau, corr = c.correlation()
+    lags, ref = _reference(x, mode, levels, p, m, mode == 'dot')
+
+    assert np.all(tau == 0.5 * lags)
+    assert np.allclose(corr, ref, rtol=10.**-12, atol=10.**-12)
+    assert tau[-1] == 0.5 * (p - 1) * m**(levels - 1)
+
+
+def test_host_correlator_images():
+    A = _state(False)
+    A.img = ParticleDat(ncomp=3, dtype=ctypes.c_int)
+    A.domain.boundary_condition.image_dat = A.img
+    c = MultipleTauCorrelator(A, A.p, mode='msd', levels=3, p=8, m=2,
+                              image_dat=A.img)
+
+    rng = np.random.RandomState(seed=11)
+    x = md.mpi.MPI.COMM_WORLD.allgather(
+        (A.gid[:A.npart_local:, 0], A.p[:A.npart_local:, :]))
+    u = np.zeros((N, 3))
+    for gx, px in x:
+        u[gx, :] = px
+
+    traj = []
+    for tx in range(40):
+        d = rng.uniform(-0.8, 0.8, (N, 3))
+        u = u + d
+        traj.append(u)
+        n = A.npart_local
+        A.p[:n:, :] += d[A.gid[:n:, 0], :]
+        A.domain.boundary_condition.apply()
+        c.sample()
+
+    tau, corr = c.correlation()
+    lags, ref = _reference(np.array(traj), 'msd', 3, 8, 2, False)
+    assert np.all(tau == lags)
+    assert np.allclose(corr, ref, rtol=10.**-10, atol=0)
+
+
+def test_host_correlator_2():
+    A = _state(False)
+    with pytest.raises(RuntimeError):
+        MultipleTauCorrelator(A, A.a, mode='foo')
+    with pytest.raises(RuntimeError):
+        MultipleTauCorrelator(A, A.a, p=9, m=2)
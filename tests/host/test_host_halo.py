@@ -484,3 +484,240 @@ def test_host_halo_cube_non_position_2(state_int_dat):
 
 
 
+
+
+def _halo_contents(shared_mem, multi=False, small_window=False):
+    shared_mem_orig = md.runtime.HALO_SHARED_MEM
+    md.runtime.HALO_SHARED_MEM = shared_mem
+
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+    A.p = PositionDat(ncomp=3)
+    A.v = ParticleDat(ncomp=3)
+    A.s = ParticleDat(ncomp=2, soa=True)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+
+    rng = np.random.RandomState(seed=4242)
+    A.p[:] = rng.uniform(-0.5*E, 0.5*E, [N, 3])
+    A.v[:] = rng.normal(0.0, 1.0, [N, 3])
+    A.s[:] = rng.normal(0.0, 1.0, [N, 2])
+    A.gid[:, 0] = np.arange(N)
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    A.domain.cell_decompose(E/crN)
+    A.get_cell_to_particle_map().create()
+    A.get_cell_to_particle_map().update_required = True
+    A.get_cell_to_particle_map().check()
+
+    node_comm = A._halo_manager.get_node_comm()
+    if small_window and node_comm is not None:
+        # the first exchange does not fit and falls back to messages
+        for dx in (A.p, A.v, A.s, A.gid):
+            dx._shm_halo_space = md.mpi.SharedMem((2, 1), dx.dtype, node_comm)
+
+    contents = []
+    for step in range(3):
+        if multi:
+            A.halo_exchange((A.p, A.v, A.s, A.gid))
+        else:
+            for dx in (A.p, A.v, A.s, A.gid):
+                dx.halo_exchange()
+        n0 = A.npart_local
+        n1 = n0 + A.p.npart_local_halo
+        h = np.hstack((A.gid[n0:n1:, :], A.p[n0:n1:, :], A.v[n0:n1:, :],
+                       A.s[n0:n1:, :]))
+        # particles may be ordered differently within a cell
+        contents.append(h[np.lexsort(h.T[::-1]), :])
+        A.v[:n0:, :] += 1.0
+        A.s[:n0:, :] -= 1.0
+        A.v.mark_halos_old()
+        A.s.mark_halos_old()
+
+    md.runtime.HALO_SHARED_MEM = shared_mem_orig
+    return node_comm, contents
+
+
+def test_host_halo_shared_mem_1():
+    """
+    Check the node shared memory halo exchange against the message based
+    exchange.
+    """
+    node_comm, c0 = _halo_contents(True)
+    node_comm_off, c1 = _halo_contents(False)
+
+    assert node_comm_off is None
+
+    if nproc > 1:
+        assert node_comm is not None
+    for h0, h1 in zip(c0, c1):
+        assert h0.shape == h1.shape
+        assert np.all(h0 == h1)
+
+    _, c2 = _halo_contents(True, small_window=True)
+    for h0, h2 in zip(c0, c2):
+        assert h0.shape == h2.shape
+        assert np.all(h0 == h2)
+
+
+def test_host_halo_multi_1():
+    """
+    Check the aggregated halo exchange of several dats against the exchange
+    of each dat.
+    """
+    _, c0 = _halo_contents(False, multi=True)
+    _, c1 = _halo_contents(False)
+
+    for h0, h1 in zip(c0, c1):
+        assert h0.shape == h1.shape
+        assert np.all(h0 == h1)
+
+
+@pytest.mark.parametrize('loop_type', (
+    'CellByCellOMP', 'PairLoopNeighbourListNS', 'PairLoopNeighbourListNSOMP'))
+def test_host_halo_multi_2(loop_type):
+    """
+    Check a pair loop reading several dats exchanges their halos together.
+    """
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+    A.p = PositionDat(ncomp=3)
+    A.v = ParticleDat(ncomp=3)
+    A.f = ParticleDat(ncomp=3)
+
+    rng = np.random.RandomState(seed=4243)
+    A.p[:] = rng.uniform(-0.5*E, 0.5*E, [N, 3])
+    A.v[:] = rng.normal(0.0, 1.0, [N, 3])
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    rc = E/crN
+    loop = getattr(md.pairloop, loop_type)(md.kernel.Kernel(
+        'test_host_halo_multi_2', """
+        const double r0 = P.j[0] - P.i[0];
+        const double r1 = P.j[1] - P.i[1];
+        const double r2 = P.j[2] - P.i[2];
+        if ((r0*r0 + r1*r1 + r2*r2) < RC2) {
+            F.i[0] += V.j[0];
+            F.i[1] += V.j[1];
+            F.i[2] += V.j[2];
+        }
+        """, (md.kernel.Constant('RC2', rc*rc),)),
+        dat_dict={'P': A.p(md.access.READ), 'V': A.v(md.access.READ),
+                  'F': A.f(md.access.INC_ZERO)},
+        shell_cutoff=rc
+    )
+
+    key = 'MultiHaloExchange:halo_exchange:count'
+    loop.execute()
+    c0 = md.opt.PROFILE.get(key, 0)
+    f0 = A.f[:A.npart_local:, :].copy()
+
+    A.v.mark_halos_old()
+    A.p.mark_halos_old()
+    loop.execute()
+    assert md.opt.PROFILE.get(key, 0) > c0
+    assert np.allclose(A.f[:A.npart_local:, :], f0, rtol=10.**-12,
+                       atol=10.**-12)
+
+
+def _trimmed_md(trim):
+    trim_orig = md.runtime.HALO_TRIM
+    md.runtime.HALO_TRIM = trim
+
+    n = 10
+    e = (n**3 / 0.8)**(1./3.)
+    rc = 2.5
+    delta = 0.3
+    dt = 0.002
+
+    A = State()
+    A.npart = n**3
+    A.domain = md.domain.BaseDomainHalo(extent=(e,e,e))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+    A.p = PositionDat(ncomp=3)
+    A.v = ParticleDat(ncomp=3)
+    A.f = ParticleDat(ncomp=3)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+
+    rng = np.random.RandomState(seed=4244)
+    A.p[:] = md.utility.lattice.cubic_lattice((n, n, n), (e, e, e)) + \
+        rng.uniform(-0.05, 0.05, [n**3, 3])
+    A.v[:] = rng.normal(0.0, 1.0, [n**3, 3])
+    A.gid[:, 0] = np.arange(n**3)
+    A.npart_local = n**3
+    A.filter_on_domain_boundary()
+
+    force = md.pairloop.CellByCellOMP(md.kernel.Kernel(
+        'test_host_halo_trim_lj', """
+        const double r0 = P.j[0] - P.i[0];
+        const double r1 = P.j[1] - P.i[1];
+        const double r2 = P.j[2] - P.i[2];
+        const double rr = r0*r0 + r1*r1 + r2*r2;
+        if (rr < RC2) {
+            const double r_m2 = 1.0/rr;
+            const double r_m6 = r_m2*r_m2*r_m2;
+            const double f_tmp = -48.0*(r_m6 - 0.5)*r_m6*r_m2;
+            F.i[0] += f_tmp*r0;
+            F.i[1] += f_tmp*r1;
+            F.i[2] += f_tmp*r2;
+        }
+        """, (md.kernel.Constant('RC2', rc*rc),)),
+        dat_dict={'P': A.p(md.access.READ), 'F': A.f(md.access.INC_ZERO)},
+        shell_cutoff=rc+delta
+    )
+    vv1 = md.loop.ParticleLoopOMP(md.kernel.Kernel(
+        'test_host_halo_trim_vv1', """
+        V.i[0] += HDT*F.i[0];
+        V.i[1] += HDT*F.i[1];
+        V.i[2] += HDT*F.i[2];
+        P.i[0] += DT*V.i[0];
+        P.i[1] += DT*V.i[1];
+        P.i[2] += DT*V.i[2];
+        """, (md.kernel.Constant('DT', dt),
+              md.kernel.Constant('HDT', 0.5*dt))),
+        dat_dict={'P': A.p(md.access.INC), 'V': A.v(md.access.INC),
+                  'F': A.f(md.access.READ)}
+    )
+    vv2 = md.loop.ParticleLoopOMP(md.kernel.Kernel(
+        'test_host_halo_trim_vv2', """
+        V.i[0] += HDT*F.i[0];
+        V.i[1] += HDT*F.i[1];
+        V.i[2] += HDT*F.i[2];
+        """, (md.kernel.Constant('HDT', 0.5*dt),)),
+        dat_dict={'V': A.v(md.access.INC), 'F': A.f(md.access.READ)}
+    )
+
+    nhalo = []
+    force.execute()
+    for it in md.method.IntegratorRange(100, dt, A.v, 10, delta,
+                                        verbose=False):
+        vv1.execute()
+        force.execute()
+        vv2.execute()
+        nhalo.append(A.npart_halo)
+
+    md.runtime.HALO_TRIM = trim_orig
+
+    nl = A.npart_local
+    order = np.argsort(A.gid[:nl:, 0])
+    return A.gid[:nl:, 0][order], A.p[:nl:, :][order, :], \
+        A.v[:nl:, :][order, :], max(nhalo)
+
+
+def test_host_halo_trim_1():
+    """
+    Check trimming the halos to the cutoff of the neighbouring subdomains does
+    not change the trajectory and reduces the number of halo particles.
+    """
+    g0, p0, v0, h0 = _trimmed_md(True)
+    g1, p1, v1, h1 = _trimmed_md(False)
+
+    assert h0 < h1
+    assert np.all(g0 == g1)
+    assert np.max(np.abs(p0 - p1), initial=0.0) < 10.**-10
+    assert np.max(np.abs(v0 - v1), initial=0.0) < 10.**-10
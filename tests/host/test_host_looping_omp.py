@@ -317,3 +317,60 @@ def test_host_looping_5(DTYPE):
 
     assert SR[0] == cast(SRi[0]), "read only data has changed"
 
+
+
+def test_host_looping_6():
+    """
+    Launch plans are reused between launches with the same dats and rebuilt
+    when different dats are passed.
+    """
+    PA = ParticleDat(npart=N, ncomp=1, dtype=ctypes.c_double)
+    PB = ParticleDat(npart=N, ncomp=1, dtype=ctypes.c_double)
+    PC = ParticleDat(npart=N, ncomp=1, dtype=ctypes.c_double)
+    GA = GlobalArray(size=1, dtype=ctypes.c_double)
+
+    kernel = Kernel(
+        'test_host_looping_omp_6',
+        '''
+        PB.i[0] = PA.i[0] * A1;
+        GA[0] += PA.i[0];
+        ''',
+        static_args={'A1': ctypes.c_double}
+    )
+    loop = md.loop.ParticleLoopOMP(
+        kernel,
+        dat_dict={'PA': PA(READ), 'PB': PB(WRITE), 'GA': GA(INC_ZERO)}
+    )
+
+    PA[:] = rng.uniform(size=(N, 1))
+    loop.execute(static_args={'A1': 2.0})
+    plan = loop._launch_plan
+    assert np.all(PB[:N:, 0] == 2.0 * PA[:N:, 0])
+
+    PA[:] = rng.uniform(size=(N, 1))
+    loop.execute(static_args={'A1': 3.0})
+    assert loop._launch_plan is plan
+    assert np.all(PB[:N:, 0] == 3.0 * PA[:N:, 0])
+    assert abs(GA[0] - nproc * np.sum(PA[:N:, 0])) < 10.**-10 * N
+
+    # alternate dats create a new plan
+    loop.execute(dat_dict={'PA': PA(READ), 'PB': PC(WRITE),
+                           'GA': GA(INC_ZERO)},
+                 static_args={'A1': 4.0})
+    assert loop._launch_plan is not plan
+    assert np.all(PC[:N:, 0] == 4.0 * PA[:N:, 0])
+    assert np.all(PB[:N:, 0] == 3.0 * PA[:N:, 0])
+
+    # a reallocated dat and a different particle count are picked up
+    PA.resize(4*N)
+    PB.resize(4*N)
+    PA.npart_local = 2*N
+    PB.npart_local = 2*N
+    PA[:2*N:, :] = rng.uniform(size=(2*N, 1))
+    loop.execute(static_args={'A1': 5.0})
+    assert np.all(PB[:2*N:, 0] == 5.0 * PA[:2*N:, 0])
+    assert abs(GA[0] - nproc * np.sum(PA[:2*N:, 0])) < 10.**-10 * N
+
+    loop.execute(n=N, static_args={'A1': 6.0})
+    assert np.all(PB[:N:, 0] == 6.0 * PA[:N:, 0])
+    assert np.all(PB[N:2*N:, 0] == 5.0 * PA[N:2*N:, 0])
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import numpy as np
+
+
+import ppmd as md
+from ppmd.access import *
+
+crN = 10
+N = crN**3
+rho = 0.8
+E = (N/rho)**(1./3.)
+Eo2 = E/2.
+
+rc = 2.5
+delta = 0.3
+dt = 0.001
+nstep = 400
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+GlobalArray = md.data.GlobalArray
+State = md.state.State
+ParticleLoop = md.loop.ParticleLoopOMP
+PairLoop = md.pairloop.PairLoopNeighbourListNSOMP
+Kernel = md.kernel.Kernel
+Constant = md.kernel.Constant
+
+
+def _make_state(dtype):
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+
+    A.p = PositionDat(ncomp=3, dtype=dtype)
+    A.v = ParticleDat(ncomp=3, dtype=dtype)
+    A.f = ParticleDat(ncomp=3, dtype=dtype)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+
+    rng = np.random.RandomState(seed=2718)
+    A.p[:] = md.utility.lattice.cubic_lattice((crN, crN, crN), (E, E, E)) + \
+        rng.uniform(-0.05, 0.05, [N, 3])
+    v = rng.normal(0.0, 1.0, [N, 3])
+    A.v[:] = v - np.mean(v, axis=0)
+    A.gid[:,0] = np.arange(N)
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    return A
+
+
+def _lj_loop(state, u):
+    kernel_code = '''
+    const double r0 = P.j[0] - P.i[0];
+    const double r1 = P.j[1] - P.i[1];
+    const double r2 = P.j[2] - P.i[2];
+    const double rr = r0*r0 + r1*r1 + r2*r2;
+    if (rr < RC2) {
+        const double r_m2 = 1.0/rr;
+        const double r_m6 = r_m2*r_m2*r_m2;
+        U[0] += 2.0*((r_m6 - 1.0)*r_m6 + SHIFT);
+        const double f_tmp = -48.0*(r_m6 - 0.5)*r_m6*r_m2;
+        F.i[0] += f_tmp*r0;
+        F.i[1] += f_tmp*r1;
+        F.i[2] += f_tmp*r2;
+    }
+    '''
+    consts = (Constant('RC2', rc*rc),
+              Constant('SHIFT', rc**-6 - rc**-12))
+    return PairLoop(
+        kernel=Kernel('test_host_mixed_precision_lj', kernel_code, consts),
+        dat_dict={
+            'P': state.p(READ),
+            'F': state.f(INC_ZERO),
+            'U': u(INC_ZERO)
+        },
+        shell_cutoff=rc+delta
+    )
+
+
+def _run(dtype):
+    state = _make_state(dtype)
+    u = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    k = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+
+    force = _lj_loop(state, u)
+
+    vv1 = ParticleLoop(Kernel('test_host_mixed_precision_vv1', '''
+        V.i[0] += HDT*F.i[0];
+        V.i[1] += HDT*F.i[1];
+        V.i[2] += HDT*F.i[2];
+        P.i[0] += DT*V.i[0];
+        P.i[1] += DT*V.i[1];
+        P.i[2] += DT*V.i[2];
+        ''', (Constant('DT', dt), Constant('HDT', 0.5*dt))),
+        dat_dict={'P': state.p(INC), 'V': state.v(INC), 'F': state.f(READ)}
+    )
+    vv2 = ParticleLoop(Kernel('test_host_mixed_precision_vv2', '''
+        V.i[0] += HDT*F.i[0];
+        V.i[1] += HDT*F.i[1];
+        V.i[2] += HDT*F.i[2];
+        ''', (Constant('HDT', 0.5*dt),)),
+        dat_dict={'V': state.v(INC), 'F': state.f(READ)}
+    )
+    ke = ParticleLoop(Kernel('test_host_mixed_precision_ke', '''
+        K[0] += 0.5*((double)V.i[0]*V.i[0] + (double)V.i[1]*V.i[1] +
+                     (double)V.i[2]*V.i[2]);
+        '''),
+        dat_dict={'V': state.v(READ), 'K': k(INC_ZERO)}
+    )
+
+    def energy():
+        force.execute()
+        ke.execute()
+        return u[0] + k[0]
+
+    e0 = energy()
+    for it in md.method.IntegratorRange(nstep, dt, state.v, 10, delta,
+                                        verbose=False):
+        vv1.execute()
+        force.execute()
+        vv2.execute()
+    e1 = energy()
+
+    return e0, e1, state
+
+
+def test_host_mixed_precision_lists():
+    s64 = _make_state(ctypes.c_double)
+    s32 = _make_state(ctypes.c_float)
+
+    assert s32.p.dtype is ctypes.c_float
+    assert s32.p.view.dtype == np.float32
+    assert s32.npart_local == s64.npart_local
+
+    nl64 = md.pairloop.list_controller.nlist_controller.get_neighbour_list(
+        s64.p, rc)
+    nl32 = md.pairloop.list_controller.nlist_controller.get_neighbour_list(
+        s32.p, rc)
+    assert nl32.total_num_neighbours == nl64.total_num_neighbours
+
+    with pytest.raises(RuntimeError):
+        PositionDat(ncomp=3, dtype=ctypes.c_int)
+
+
+def test_host_mixed_precision_energy_drift():
+    e0_64, e1_64, s64 = _run(ctypes.c_double)
+    e0_32, e1_32, s32 = _run(ctypes.c_float)
+
+    drift_64 = abs(e1_64 - e0_64)/abs(e0_64)
+    drift_32 = abs(e1_32 - e0_32)/abs(e0_32)
+
+    # the initial states differ only by the rounding of the positions
+    assert abs(e0_32 - e0_64)/abs(e0_64) < 10.**-5
+    assert drift_64 < 10.**-4, \
+        "double energy drift over {} steps: {}".format(nstep, drift_64)
+    assert drift_32 < 10.**-3, \
+        "mixed energy drift over {} steps: {}".format(nstep, drift_32)
+    assert s32.npart_local == s64.npart_local or nproc > 1
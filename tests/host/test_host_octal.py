@@ -859,3 +859,22 @@ def test_octal_data_tree_7():
                     assert ex == 8**(nlevels-1) * (nx+1)
 
 
+
+
+def test_octal_interior_cells_1():
+    local_size = (6, 8, 10)
+    interior, boundary = compute_interior_cells(local_size)
+    assert interior.dtype == INT64
+    assert interior.shape[0] + boundary.shape[0] == 480
+    assert len(set(interior) | set(boundary)) == 480
+
+    nz, ny, nx = local_size
+    offsets = {}
+    for ix in itertools.product((0, 1), repeat=3):
+        offsets[ix] = compute_interaction_offsets(ix)
+
+    for cx in range(480):
+        c = np.array((cx % nx, (cx // nx) % ny, cx // (nx * ny)))
+        src = c + offsets[tuple(c % 2)]
+        inside = np.all((src >= 0) & (src < (nx, ny, nz)))
+        assert inside == (cx in interior)
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import numpy as np
+
+
+import ppmd as md
+from ppmd.access import *
+from ppmd.modules import philox
+
+N = 4000
+E = 8.
+Eo2 = E/2.
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+State = md.state.State
+ParticleLoopOMP = md.loop.ParticleLoopOMP
+Kernel = md.kernel.Kernel
+
+
+@pytest.fixture
+def state():
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+
+    A.p = PositionDat(ncomp=3)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int64)
+    A.u = ParticleDat(ncomp=2)
+    A.z = ParticleDat(ncomp=2)
+
+    rng = np.random.RandomState(seed=1234)
+    A.p[:] = rng.uniform(-Eo2, Eo2, [N,3])
+    # global ids need not be contiguous
+    A.gid[:,0] = np.arange(N) * 3 + 2**33
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    return A
+
+
+def test_host_philox_known_answers():
+    # Random123 known answer test vectors for philox4x32-10
+    r = philox.philox4x32([[0]]*4, [0, 0])[:, 0]
+    assert tuple(r) == (0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8)
+    r = philox.philox4x32([[0xffffffff]]*4, [0xffffffff]*2)[:, 0]
+    assert tuple(r) == (0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd)
+    r = philox.philox4x32(
+        [[0x243f6a88], [0x85a308d3], [0x13198a2e], [0x03707344]],
+        [0xa4093822, 0x299f31d0])[:, 0]
+    assert tuple(r) == (0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1)
+
+
+def test_host_philox_kernel(state):
+    rng = philox.PhiloxRNG(seed=987654321987)
+    assert rng.seed == 987654321987
+    assert rng.step == 0
+
+    kernel_code = '''
+    philox_uniform(RNG[0], GID.i[0], RNG[1], 3, U.i);
+    philox_normal(RNG[0], GID.i[0], RNG[1], 4, Z.i);
+    '''
+    loop = ParticleLoopOMP(
+        Kernel('test_host_philox_kernel', kernel_code, headers=(rng.header,)),
+        dat_dict={'GID': state.gid(READ), 'U': state.u(WRITE),
+                  'Z': state.z(WRITE), 'RNG': rng.counter(READ)}
+    )
+
+    nl = state.npart_local
+    gids = state.gid[:nl:, 0]
+    for stepx in range(3):
+        loop.execute()
+        assert np.linalg.norm(
+            state.u[:nl:, :] - rng.uniform(gids, stream=3), np.inf) < 10.**-15
+        assert np.linalg.norm(
+            state.z[:nl:, :] - rng.normal(gids, stream=4), np.inf) < 10.**-12
+        assert np.all(state.u[:nl:, :] > 0.0)
+        assert np.all(state.u[:nl:, :] < 1.0)
+
+        u_old = state.u[:nl:, :].copy()
+        rng.advance()
+        assert rng.step == stepx + 1
+        loop.execute()
+        assert np.all(state.u[:nl:, :] != u_old)
+        rng.step = stepx + 1
+
+
+def test_host_philox_statistics():
+    rng = philox.PhiloxRNG(seed=42)
+    ids = np.arange(100000)
+
+    u = rng.uniform(ids).ravel()
+    assert abs(np.mean(u) - 0.5) < 0.005
+    assert abs(np.var(u) - 1./12.) < 0.005
+
+    z = rng.normal(ids, step=7, stream=1)
+    assert abs(np.mean(z)) < 0.01
+    assert abs(np.var(z) - 1.0) < 0.01
+    # the two deviates of a pair are uncorrelated
+    assert abs(np.corrcoef(z[:, 0], z[:, 1])[0, 1]) < 0.01
+    # streams are uncorrelated
+    z2 = rng.normal(ids, step=7, stream=2)
+    assert abs(np.corrcoef(z[:, 0], z2[:, 0])[0, 1]) < 0.01
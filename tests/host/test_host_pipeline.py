@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import time
+import concurrent.futures
+import numpy as np
+
+import ppmd as md
+
+N = 100
+E = 8.
+Eo2 = E/2.
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+State = md.state.State
+AnalysisPipeline = md.utility.pipeline.AnalysisPipeline
+
+
+@pytest.fixture
+def state():
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+    A.p = PositionDat(ncomp=3)
+    A.v = ParticleDat(ncomp=3)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+
+    rng = np.random.RandomState(seed=1234)
+    A.p[:] = rng.uniform(-1*Eo2, Eo2, [N,3])
+    A.v[:] = rng.normal(0, 1.0, [N,3])
+    A.gid[:,0] = np.arange(N)
+    A.scatter_data_from(0)
+    return A
+
+
+def _kinetic_energy(step, snapshot):
+    # slow stage such that the integration overtakes the analysis
+    time.sleep(0.01)
+    return 0.5 * np.sum(snapshot['v'] ** 2)
+
+
+def _count(step, snapshot):
+    return np.array((snapshot['v'].shape[0], step))
+
+
+def test_host_pipeline_1(state):
+
+    p = AnalysisPipeline(state, {'v': state.v}, (_kinetic_energy, _count),
+                         interval=2)
+
+    ke = []
+    n = state.npart_local
+    for it in range(20):
+        state.v[:n:, :] *= 0.9
+        if (it + 1) % 2 == 0:
+            ke.append(0.5 * np.sum(state.v[:n:, :] ** 2))
+        p.tick()
+
+    r0 = p.results(0)
+    r1 = p.results(1)
+    p.close()
+
+    ke = md.mpi.MPI.COMM_WORLD.allreduce(np.array(ke))
+    assert [rx[0] for rx in r0] == list(range(2, 21, 2))
+    assert np.allclose([rx[1] for rx in r0], ke, rtol=10.**-14, atol=0)
+    for rx in r1:
+        assert rx[1][0] == N
+        assert rx[1][1] == nproc * rx[0]
+
+    # results are only reduced once
+    assert p.results(0) == r0
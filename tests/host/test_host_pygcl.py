@@ -159,3 +159,61 @@ def test2():
 
 
 
+
+
+def _non_blocking_exchange(dims):
+
+    width = 2
+
+    cc = MPI.COMM_WORLD.Create_cart(dims, (1,1,1), True)
+    top = cc.Get_topo()[2]
+
+    M = 3
+    dtype = ctypes.c_double
+
+    grid_size = (12, 16, 20)
+    rng = np.random.RandomState(seed=1827364)
+    orig = np.array(rng.uniform(0., 100., size=list(grid_size)+[M]),
+                    dtype=dtype)
+
+    s = [top[dx]*(grid_size[dx]//dims[dx]) for dx in range(3)]
+    e = [(top[dx]+1)*(grid_size[dx]//dims[dx]) if top[dx] < dims[dx]-1
+         else grid_size[dx] for dx in range(3)]
+    works_size = tuple(e[dx] - s[dx] + 2*width for dx in range(3))
+
+    he = pygcl.HaloExchange3D(cc, works_size, (width, width, width))
+
+    a = np.zeros(shape=list(works_size) + [M], dtype=dtype)
+    a[width:-1*width:, width:-1*width:, width:-1*width, :] = \
+        orig[s[0]:e[0]:, s[1]:e[1]:, s[2]:e[2]:, :]
+    b = a.copy()
+
+    he.exchange_start(a)
+    with pytest.raises(RuntimeError):
+        he.exchange_start(a)
+    # halo cells are only written when the exchange is finished
+    assert np.all(a == b)
+    he.exchange_finish()
+    with pytest.raises(RuntimeError):
+        he.exchange_finish()
+
+    iz, iy, ix = np.meshgrid(*[np.arange(wx) for wx in works_size],
+                             indexing='ij')
+    expected = orig[(iz+s[0]-width) % grid_size[0],
+                    (iy+s[1]-width) % grid_size[1],
+                    (ix+s[2]-width) % grid_size[2], :]
+    assert np.all(a == expected)
+
+    # the blocking exchange gives the same result
+    he.exchange(b)
+    assert np.all(a == b)
+
+
+def test3():
+    _non_blocking_exchange(MPI.Compute_dims(MPISIZE, 3))
+
+
+@pytest.mark.skipif(MPISIZE < 3, reason="MPI::Get_size()<3")
+def test4():
+    # the neighbours in -x and +x differ only with at least 3 ranks along x
+    _non_blocking_exchange((MPISIZE, 1, 1))
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import numpy as np
+
+import ppmd as md
+
+ParticleDat = md.data.ParticleDat
+Array = md.host.Array
+
+
+def _addr(a):
+    return ctypes.cast(a.ctypes_data, ctypes.c_void_p).value
+
+
+def test_host_realloc_array():
+    a = Array(ncomp=10, dtype=ctypes.c_int)
+    a[:] = np.arange(10)
+
+    a.realloc(11)
+    assert a.ncomp == 11
+    assert np.all(a[:10] == np.arange(10))
+    assert a[10] == 0
+    p0 = _addr(a)
+
+    # growth within the capacity and moderate shrinking keep the storage
+    c0 = md.opt.PROFILE.get('host:realloc:copy:count', 0)
+    a[10] = 10
+    a.realloc(14)
+    assert _addr(a) == p0
+    assert np.all(a[:11] == np.arange(11))
+    assert np.all(a[11:] == 0)
+    a.realloc(6)
+    assert _addr(a) == p0
+    a.realloc(12)
+    assert _addr(a) == p0
+    assert np.all(a[:6] == np.arange(6))
+    assert np.all(a[6:] == 0)
+    assert md.opt.PROFILE.get('host:realloc:copy:count', 0) == c0
+
+    # growth beyond the capacity is geometric
+    a.realloc(16)
+    assert md.opt.PROFILE['host:realloc:copy:count'] == c0 + 1
+    assert a._buf.shape[0] >= int(md.runtime.REALLOC_GROWTH * 15)
+    assert _addr(a) % 64 == 0
+
+    # large shrinks release the storage
+    a.realloc(2)
+    assert md.opt.PROFILE['host:realloc:copy:count'] == c0 + 2
+    assert a._buf.shape[0] < 16
+    assert np.all(a[:2] == np.arange(2))
+
+
+@pytest.mark.parametrize("soa", (False, True))
+def test_host_realloc_particle_dat(soa):
+    n = 100
+    a = ParticleDat(npart=n, ncomp=3, soa=soa)
+    a[:n:, :] = np.arange(3*n).reshape((n, 3))
+
+    c0 = md.opt.PROFILE.get('host:realloc:copy:count', 0)
+    capacity = a._buf.shape[0]
+    a.resize(capacity + 1)
+    assert md.opt.PROFILE['host:realloc:copy:count'] == c0 + 1
+    p0 = _addr(a)
+    s0 = a.soa_stride
+
+    for nx in range(capacity + 2,
+                    int(md.runtime.REALLOC_GROWTH * capacity) + 1):
+        a.resize(nx)
+        assert a.max_npart == nx
+        assert _addr(a) == p0
+        assert a.soa_stride == s0
+
+    assert md.opt.PROFILE['host:realloc:copy:count'] == c0 + 1
+    assert np.all(a[:n:, :] == np.arange(3*n).reshape((n, 3)))
+    assert np.all(a[n::, :] == 0)
+
+
+@pytest.mark.parametrize("row_axis", (0, 1))
+def test_host_realloc_first_touch(row_axis):
+    md.state.State()
+    if md.host._FIRST_TOUCH_LIB is None:
+        pytest.skip('first touch is disabled')
+
+    min_bytes = md.runtime.FIRST_TOUCH_MIN_BYTES
+    md.runtime.FIRST_TOUCH_MIN_BYTES = 0
+    shape = (3, 1001) if row_axis == 1 else (1001, 3)
+
+    c0 = md.opt.PROFILE.get('host:first_touch:count', 0)
+    for tx in range(8):
+        # leave non zero memory for the allocator to hand out
+        dirty = np.ones(8*3*1001 + 64, dtype=ctypes.c_uint8)
+        del dirty
+        a = md.host._create_aligned_zeros(shape, ctypes.c_double, 64,
+                                          row_axis=row_axis)
+        assert a.shape == shape
+        assert a.ctypes.data % 64 == 0
+        assert np.all(a == 0.0)
+
+    md.runtime.FIRST_TOUCH_MIN_BYTES = min_bytes
+    assert md.opt.PROFILE['host:first_touch:count'] == c0 + 8
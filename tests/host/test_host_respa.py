@@ -0,0 +1,225 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import numpy as np
+
+
+import ppmd as md
+from ppmd.access import *
+
+crN = 8
+N = crN**3
+rho = 0.8
+E = (N/rho)**(1./3.)
+
+rc = 2.5
+rs = 4.0
+delta = 0.3
+dt = 0.001
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+GlobalArray = md.data.GlobalArray
+State = md.state.State
+ParticleLoop = md.loop.ParticleLoop
+PairLoop = md.pairloop.PairLoopNeighbourListNSOMP
+Kernel = md.kernel.Kernel
+Constant = md.kernel.Constant
+IntegratorRESPA = md.utility.high_method.IntegratorRESPA
+
+
+class _Counter(object):
+    def __init__(self, obj):
+        self.obj = obj
+        self.count = 0
+    def execute(self):
+        self.count += 1
+        self.obj.execute()
+
+
+def _make_state():
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+
+    A.p = PositionDat(ncomp=3)
+    A.v = ParticleDat(ncomp=3)
+    A.m = ParticleDat(ncomp=1)
+    A.ff = ParticleDat(ncomp=3)
+    A.fs = ParticleDat(ncomp=3)
+    A.ft = ParticleDat(ncomp=3)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+
+    rng = np.random.RandomState(seed=1618)
+    A.p[:] = md.utility.lattice.cubic_lattice((crN, crN, crN), (E, E, E)) + \
+        rng.uniform(-0.05, 0.05, [N, 3])
+    v = rng.normal(0.0, 1.0, [N, 3])
+    A.v[:] = v - np.mean(v, axis=0)
+    A.m[:] = 1.0
+    A.gid[:,0] = np.arange(N)
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    return A
+
+
+_FAST = '''
+const double r0 = P.j[0] - P.i[0];
+const double r1 = P.j[1] - P.i[1];
+const double r2 = P.j[2] - P.i[2];
+const double rr = r0*r0 + r1*r1 + r2*r2;
+if (rr < RC2) {
+    const double r_m2 = 1.0/rr;
+    const double r_m6 = r_m2*r_m2*r_m2;
+    U[0] += 2.0*((r_m6 - 1.0)*r_m6 + SHIFT);
+    const double f_tmp = -48.0*(r_m6 - 0.5)*r_m6*r_m2;
+    F.i[0] += f_tmp*r0;
+    F.i[1] += f_tmp*r1;
+    F.i[2] += f_tmp*r2;
+}
+'''
+
+# smooth soft repulsion A(1 - r^2/rs^2)^2 for r < rs
+_SLOW = '''
+const double r0 = P.j[0] - P.i[0];
+const double r1 = P.j[1] - P.i[1];
+const double r2 = P.j[2] - P.i[2];
+const double rr = r0*r0 + r1*r1 + r2*r2;
+if (rr < RS2) {
+    const double s = 1.0 - rr*IRS2;
+    U[0] += 0.5*A*s*s;
+    const double f_tmp = -4.0*A*s*IRS2;
+    F.i[0] += f_tmp*r0;
+    F.i[1] += f_tmp*r1;
+    F.i[2] += f_tmp*r2;
+}
+'''
+
+
+def _pair_loop(name, code, consts, state, f, u, cutoff):
+    return PairLoop(
+        kernel=Kernel(name, code, consts),
+        dat_dict={'P': state.p(READ), 'F': f(INC_ZERO), 'U': u(INC_ZERO)},
+        shell_cutoff=cutoff
+    )
+
+
+def _fast_loop(state, f, u):
+    return _pair_loop('test_host_respa_fast', _FAST,
+                      (Constant('RC2', rc*rc),
+                       Constant('SHIFT', rc**-6 - rc**-12)),
+                      state, f, u, rc+delta)
+
+
+def _slow_loop(state, f, u):
+    return _pair_loop('test_host_respa_slow', _SLOW,
+                      (Constant('RS2', rs*rs), Constant('IRS2', rs**-2),
+                       Constant('A', 0.5)),
+                      state, f, u, rs+delta)
+
+
+def _energy(state, fast, slow, uf, us):
+    k = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    ke = ParticleLoop(Kernel('test_host_respa_ke', '''
+        K[0] += 0.5*M.i[0]*(V.i[0]*V.i[0] + V.i[1]*V.i[1] + V.i[2]*V.i[2]);
+        '''),
+        dat_dict={'V': state.v(READ), 'M': state.m(READ), 'K': k(INC_ZERO)}
+    )
+    fast.execute()
+    slow.execute()
+    ke.execute()
+    return uf[0] + us[0] + k[0]
+
+
+def test_host_respa_single_step():
+    """
+    With one inner step r-RESPA reduces to velocity Verlet with the sum of the
+    fast and slow forces.
+    """
+    nstep = 20
+
+    sa = _make_state()
+    uf = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    us = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    respa = IntegratorRESPA(
+        sa.p, sa.v, sa.m,
+        sa.ff, (_fast_loop(sa, sa.ff, uf),),
+        sa.fs, (_slow_loop(sa, sa.fs, us),),
+        slow_step_count=1, list_reuse_count=10, list_reuse_distance=delta
+    )
+    respa.integrate(dt, nstep*dt)
+
+    sb = _make_state()
+    ub = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    fast = _fast_loop(sb, sb.ff, ub)
+    slow = _slow_loop(sb, sb.fs, ub)
+    total = ParticleLoop(Kernel('test_host_respa_total', '''
+        FT.i[0] = FF.i[0] + FS.i[0];
+        FT.i[1] = FF.i[1] + FS.i[1];
+        FT.i[2] = FF.i[2] + FS.i[2];
+        '''),
+        dat_dict={'FT': sb.ft(WRITE), 'FF': sb.ff(READ), 'FS': sb.fs(READ)}
+    )
+
+    class _Forces(object):
+        shell_cutoff = rs + delta
+        def execute(self):
+            fast.execute()
+            slow.execute()
+            total.execute()
+
+    vv = md.utility.high_method.IntegratorVelocityVerlet(
+        sb.p, sb.ft, sb.v, sb.m, _Forces(), rs, 10
+    )
+    vv.integrate(dt, nstep*dt)
+
+    def _sorted(state):
+        gids = state.gid[:state.npart_local:,0]
+        p = state.p[:state.npart_local:,:]
+        v = state.v[:state.npart_local:,:]
+        return p[np.argsort(gids),:], v[np.argsort(gids),:]
+
+    assert sa.npart_local == sb.npart_local
+    pa, va = _sorted(sa)
+    pb, vb = _sorted(sb)
+    assert np.linalg.norm(pa - pb, np.inf) < 10.**-10
+    assert np.linalg.norm(va - vb, np.inf) < 10.**-10
+
+
+def test_host_respa_energy():
+    k = 4
+    nstep = 200
+
+    state = _make_state()
+    uf = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    us = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    fast = _Counter(_fast_loop(state, state.ff, uf))
+    slow = _Counter(_slow_loop(state, state.fs, us))
+
+    respa = IntegratorRESPA(
+        state.p, state.v, state.m,
+        state.ff, (fast,),
+        state.fs, (slow,),
+        slow_step_count=k, list_reuse_count=10, list_reuse_distance=delta
+    )
+
+    e0 = _energy(state, fast, slow, uf, us)
+    fast.count = 0
+    slow.count = 0
+
+    respa.integrate(dt, nstep*dt)
+
+    assert fast.count == nstep + 1
+    assert slow.count == nstep//k + 1
+
+    e1 = _energy(state, fast, slow, uf, us)
+    assert abs(e1 - e0)/abs(e0) < 10.**-4
+
+    with pytest.raises(RuntimeError):
+        respa.integrate(dt, (k*10 + 1)*dt)
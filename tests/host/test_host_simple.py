@@ -167,6 +167,66 @@ def test_host_scatter_gather(state, base_rank):
         assert np.sum(sv == vi) == N*3
 
 
+def test_host_scatter_chunked(state, base_rank):
+
+    pi = np.random.uniform(-1*Eo2, Eo2, [N,3])
+    pi = md.mpi.MPI.COMM_WORLD.bcast(pi, root=base_rank)
+
+    state.p[:] = pi
+    state.v[:] = 2.0 * pi
+    state.gid[:,0] = np.arange(N)
+
+    chunk = md.runtime.SCATTER_CHUNK
+    md.runtime.SCATTER_CHUNK = 3
+    state.scatter_data_from(base_rank)
+    md.runtime.SCATTER_CHUNK = chunk
+
+    # each rank holds exactly the particles inside its subdomain
+    b = state.domain.boundary
+    lo = np.all((b[0::2] <= pi) & (pi < b[1::2]), axis=1)
+    gids = np.nonzero(lo)[0]
+
+    n = state.npart_local
+    assert n == len(gids)
+    assert np.all(np.sort(state.gid[:n:, 0]) == gids)
+    assert np.all(state.p[:n:, :] == pi[state.gid[:n:, 0], :])
+    assert np.all(state.v[:n:, :] == 2.0 * pi[state.gid[:n:, 0], :])
+
+
+@pytest.mark.parametrize("sort", (False, True))
+def test_host_gather_chunks(state, base_rank, sort):
+
+    pi = np.random.uniform(-1*Eo2, Eo2, [N,3])
+    pi = md.mpi.MPI.COMM_WORLD.bcast(pi, root=base_rank)
+
+    state.p[:] = pi
+    state.v[:] = 2.0 * pi
+    state.gid[:,0] = np.arange(N)
+    state.scatter_data_from(base_rank)
+    n = state.npart_local
+    p0 = state.p[:n:, :].copy()
+
+    order = state.gid if sort else None
+    chunks = list(state.gather_data_chunks((state.gid, state.v), base_rank,
+                                           chunk_size=5, order=order))
+
+    # local storage is untouched
+    assert state.npart_local == n
+    assert np.all(state.p[:n:, :] == p0)
+
+    if rank == base_rank:
+        assert all(cx[0].shape[0] <= 5 for cx in chunks)
+        gid = np.concatenate([cx[0][:, 0] for cx in chunks])
+        v = np.concatenate([cx[1] for cx in chunks])
+        assert gid.shape[0] == N
+        if sort:
+            assert np.all(gid == np.arange(N))
+        assert np.all(np.sort(gid) == np.arange(N))
+        assert np.all(v == 2.0 * pi[gid, :])
+    else:
+        assert len(chunks) == 0
+
+
 def test_host_1_norm():
     N2 = 1000
     a = np.random.uniform(size=[N2,3])
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import numpy as np
+
+
+import ppmd as md
+from ppmd.access import *
+
+N = 1000
+E = 8.
+Eo2 = E/2.
+rc = 1.1
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+GlobalArray = md.data.GlobalArray
+State = md.state.State
+ParticleLoop = md.loop.ParticleLoop
+ParticleLoopOMP = md.loop.ParticleLoopOMP
+PairLoop = md.pairloop.PairLoopNeighbourListNSOMP
+Kernel = md.kernel.Kernel
+
+
+@pytest.fixture
+def state():
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+
+    A.p = PositionDat(ncomp=3)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+    A.q = ParticleDat(ncomp=2, soa=True)
+    A.qa = ParticleDat(ncomp=2)
+    A.f = ParticleDat(ncomp=3, soa=True)
+    A.fa = ParticleDat(ncomp=3)
+
+    rng = np.random.RandomState(seed=1234)
+    A.p[:] = rng.uniform(-Eo2, Eo2, [N,3])
+    A.gid[:,0] = np.arange(N)
+    A.q[:] = rng.uniform(-1., 1., [N,2])
+    A.qa[:] = A.q[:N:,:]
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    return A
+
+
+def test_host_soa_storage():
+    A = ParticleDat(npart=13, ncomp=3, soa=True)
+    assert A.soa
+    assert A.soa_stride >= 13
+    assert A.ctypes_data.contents is not None
+    assert ctypes.addressof(A.ctypes_data.contents) % 64 == 0
+
+    v = np.arange(39, dtype=ctypes.c_double).reshape([13,3])
+    A[:13:,:] = v
+    assert np.sum(np.abs(A[:13:,:] - v)) == 0
+    assert np.sum(np.abs(A.view - v)) == 0
+
+    A.realloc(50, 3)
+    assert A.soa_stride >= 50
+    assert np.sum(np.abs(A[:13:,:] - v)) == 0
+
+    B = A.copy()
+    assert B.soa
+    assert np.sum(np.abs(B[:13:,:] - v)) == 0
+
+    C = ParticleDat(npart=13, ncomp=3)
+    assert not C.soa
+    assert C.soa_stride == 1
+
+    with pytest.raises(RuntimeError):
+        PositionDat(ncomp=3, soa=True)
+
+
+@pytest.mark.parametrize("loop_type", (ParticleLoop, ParticleLoopOMP))
+def test_host_soa_particle_loop(state, loop_type):
+    kernel_code = '''
+    F.i[0] = Q.i[0] * P.i[0];
+    F.i[1] = Q.i[1] * P.i[1];
+    F.i[2] = Q.i[0] + Q.i[1] + P.i[2];
+    '''
+    kernel = Kernel('test_host_soa_particle_loop', kernel_code)
+
+    loop_soa = loop_type(kernel=kernel, dat_dict={
+        'P': state.p(READ),
+        'Q': state.q(READ),
+        'F': state.f(WRITE)
+    })
+    loop_aos = loop_type(kernel=kernel, dat_dict={
+        'P': state.p(READ),
+        'Q': state.qa(READ),
+        'F': state.fa(WRITE)
+    })
+
+    loop_soa.execute()
+    loop_aos.execute()
+
+    nl = state.npart_local
+    assert np.sum(np.abs(state.q[:nl:,:] - state.qa[:nl:,:])) == 0
+    assert np.sum(np.abs(state.f[:nl:,:] - state.fa[:nl:,:])) == 0
+
+    # dats with different layouts cannot be swapped in at execute time
+    with pytest.raises(AssertionError):
+        loop_soa.execute(dat_dict={
+            'P': state.p(READ),
+            'Q': state.qa(READ),
+            'F': state.f(WRITE)
+        })
+
+
+def test_host_soa_pair_loop(state):
+    kernel_code = '''
+    const double r0 = P.j[0] - P.i[0];
+    const double r1 = P.j[1] - P.i[1];
+    const double r2 = P.j[2] - P.i[2];
+    const double r2i = 1.0/(r0*r0 + r1*r1 + r2*r2);
+    const double s = (r0*r0 + r1*r1 + r2*r2) < %(RC2)s ?
+        Q.i[0]*Q.j[0]*r2i + Q.i[1]*Q.j[1] : 0.0;
+    F.i[0] += s*r0;
+    F.i[1] += s*r1;
+    F.i[2] += s*r2;
+    U[0] += 0.5*s;
+    ''' % {'RC2': str(rc*rc)}
+    kernel = Kernel('test_host_soa_pair_loop', kernel_code)
+
+    ua = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    ub = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+
+    loop_soa = PairLoop(kernel=kernel, dat_dict={
+        'P': state.p(READ),
+        'Q': state.q(READ),
+        'F': state.f(INC_ZERO),
+        'U': ua(INC_ZERO)
+    }, shell_cutoff=rc)
+    loop_aos = PairLoop(kernel=kernel, dat_dict={
+        'P': state.p(READ),
+        'Q': state.qa(READ),
+        'F': state.fa(INC_ZERO),
+        'U': ub(INC_ZERO)
+    }, shell_cutoff=rc)
+
+    loop_soa.execute()
+    loop_aos.execute()
+
+    nl = state.npart_local
+    assert abs(ua[0]) > 0
+    assert abs(ua[0] - ub[0]) < 10.**-10 * abs(ub[0])
+    assert np.linalg.norm(state.f[:nl:,:] - state.fa[:nl:,:], np.inf) < 10.**-10
+    # the second loop may rebuild the cell list which reorders the halo,
+    # exchange both dats with the same cell list before comparing
+    state.q.halo_exchange()
+    state.qa.halo_exchange()
+    nh = state.q.halo_start - nl
+    assert nh > 0 or nproc > 1
+    assert state.qa.halo_start - nl == nh
+    assert np.sum(np.abs(state.q[nl:nl+nh:,:] - state.qa[nl:nl+nh:,:])) == 0
+
+
+def test_host_soa_move(state):
+    rng = np.random.RandomState(seed=4321 + rank)
+
+    for stepx in range(4):
+        nl = state.npart_local
+        with state.p.modify_view() as m:
+            m[:] += rng.uniform(-0.5, 0.5, [nl, 3])
+            m[:] = np.mod(m[:] + Eo2, E) - Eo2
+
+        nl = state.npart_local
+        assert np.sum(np.abs(state.q[:nl:,:] - state.qa[:nl:,:])) == 0
+
+    gids = state.gid[:state.npart_local:,0]
+    q = state.q[:state.npart_local:,:]
+    gids = md.mpi.MPI.COMM_WORLD.gather(gids, root=0)
+    q = md.mpi.MPI.COMM_WORLD.gather(q, root=0)
+    if rank == 0:
+        gids = np.concatenate(gids)
+        q = np.concatenate(q)
+        assert gids.shape[0] == N
+        order = np.argsort(gids)
+        assert np.sum(np.abs(gids[order] - np.arange(N))) == 0
+
+        rng = np.random.RandomState(seed=1234)
+        rng.uniform(-Eo2, Eo2, [N,3])
+        q_orig = rng.uniform(-1., 1., [N,2])
+        assert np.sum(np.abs(q[order, :] - q_orig)) == 0
+
+
+def test_host_soa_unsupported_loop(state):
+    kernel = Kernel('test_host_soa_unsupported_loop', 'F.i[0] += Q.j[0];')
+    with pytest.raises(RuntimeError):
+        md.pairloop.CellByCellOMP(kernel=kernel, dat_dict={
+            'P': state.p(READ),
+            'Q': state.q(READ),
+            'F': state.f(INC_ZERO)
+        }, shell_cutoff=rc)
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import numpy as np
+
+
+import ppmd as md
+from ppmd.access import *
+
+crN = 8
+N = crN**3
+rho = 0.8
+E = (N/rho)**(1./3.)
+
+rc = 2.5
+delta = 0.3
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+GlobalArray = md.data.GlobalArray
+State = md.state.State
+PairLoop = md.pairloop.PairLoopNeighbourListNSOMP
+potential = md.utility.potential
+
+
+@pytest.fixture
+def state():
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+
+    A.p = PositionDat(ncomp=3)
+    A.fa = ParticleDat(ncomp=3)
+    A.fb = ParticleDat(ncomp=3)
+
+    rng = np.random.RandomState(seed=3141)
+    A.p[:] = md.utility.lattice.cubic_lattice((crN, crN, crN), (E, E, E)) + \
+        rng.uniform(-0.1, 0.1, [N, 3])
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    return A
+
+
+def test_host_tabulated_potential_error():
+    lj = potential.LennardJones(rc=rc)
+
+    t1 = potential.TabulatedPotential(lj, n=512, r_min=0.8)
+    t2 = potential.TabulatedPotential(lj, n=2048, r_min=0.8)
+
+    assert t1.rc == rc
+    assert t2.errors['potential'][1] < t1.errors['potential'][1]
+    assert t2.errors['force'][1] < t1.errors['force'][1]
+    assert t2.errors['potential'][1] < 10.**-6
+    assert t2.errors['force'][1] < 10.**-6
+    assert 'force' in t2.error_report()
+
+    r2 = np.linspace(0.9, rc*rc + 1.0, 1000)
+    v, f = t2.evaluate(r2)
+    assert np.linalg.norm(v - lj.potential(r2), np.inf) < 10.**-5
+    assert np.linalg.norm(f - lj.force(r2), np.inf) < 10.**-4
+
+    with pytest.raises(RuntimeError):
+        potential.TabulatedPotential(lj, n=16, r_min=0.8, tol=10.**-8)
+
+
+def test_host_tabulated_potential_symbolic():
+    r2 = potential.RadiusSquared()
+    # soft repulsion, (1 - r^2/rc^2)^2 has no force expression given
+    sym = potential.SymbolicPotential(rc, (1.0 - r2/(rc*rc))**2, shift=False)
+    tab = potential.TabulatedPotential(sym, n=256, r_min=0.1, tol=10.**-8)
+
+    s = np.linspace(0.5, 6.0, 100)
+    v, f = tab.evaluate(s)
+    assert np.linalg.norm(v - (1.0 - s/(rc*rc))**2, np.inf) < 10.**-10
+    assert np.linalg.norm(f + 4.0*(1.0 - s/(rc*rc))/(rc*rc), np.inf) < \
+        10.**-10
+
+
+def test_host_tabulated_potential_pair_loop(state):
+    lj = potential.VLennardJones(rc=rc)
+    tab = potential.TabulatedPotential(lj, n=4096, r_min=0.7)
+
+    ua = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    ub = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+
+    loop_lj = PairLoop(
+        kernel=lj.kernel,
+        dat_dict=lj.get_data_map(state.p, state.fa, ua),
+        shell_cutoff=rc+delta
+    )
+    loop_tab = PairLoop(
+        kernel=tab.kernel,
+        dat_dict=tab.get_data_map(state.p, state.fb, ub),
+        shell_cutoff=rc+delta
+    )
+
+    loop_lj.execute()
+    loop_tab.execute()
+
+    nl = state.npart_local
+    fmax = np.linalg.norm(state.fa[:nl:,:], np.inf)
+    assert fmax > 0
+    assert abs(ua[0] - ub[0]) < 10.**-8 * abs(ua[0])
+    assert np.linalg.norm(state.fa[:nl:,:] - state.fb[:nl:,:], np.inf) < \
+        10.**-8 * fmax
+
+
+def test_host_tabulated_potential_buckingham(state):
+    buck = potential.Buckingham(a=200.0, b=4.0, c=1.0, rc=rc)
+    tab = potential.TabulatedPotential(buck, n=4096, r_min=0.7, tol=10.**-8)
+
+    # the force is consistent with the potential and both vanish at rc
+    s = np.linspace(0.6, rc*rc - 0.1, 1000)
+    d = 10.**-6
+    dvds = (buck.potential(s + d) - buck.potential(s - d)) / (2.0 * d)
+    assert np.linalg.norm(buck.force(s) - 2.0 * dvds, np.inf) < 10.**-6
+    assert abs(buck.potential(np.nextafter(rc*rc, 0.0))) < 10.**-12
+    assert buck.potential(rc*rc) == 0.0
+
+    ua = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    ub = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+
+    loop_buck = PairLoop(
+        kernel=buck.kernel,
+        dat_dict=buck.get_data_map(state.p, state.fa, ua),
+        shell_cutoff=rc+delta
+    )
+    loop_tab = PairLoop(
+        kernel=tab.kernel,
+        dat_dict=tab.get_data_map(state.p, state.fb, ub),
+        shell_cutoff=rc+delta
+    )
+
+    loop_buck.execute()
+    loop_tab.execute()
+
+    nl = state.npart_local
+    fmax = np.linalg.norm(state.fa[:nl:,:], np.inf)
+    assert fmax > 0
+    assert abs(ua[0] - ub[0]) < 10.**-8 * abs(ua[0])
+    assert np.linalg.norm(state.fa[:nl:,:] - state.fb[:nl:,:], np.inf) < \
+        10.**-8 * fmax
+
+
+def test_host_tabulated_potential_not_pair():
+    with pytest.raises(NotImplementedError):
+        potential.TabulatedPotential(potential.TestPotential1(rc=rc))
+    # the kernel applies no cutoff
+    t2 = potential.TestPotential2(rc=rc)
+    assert t2.potential(rc*rc + 1.0) != 0.0
+    assert t2.force(rc*rc + 1.0) != 0.0
+
+
+def test_host_buckingham_pair():
+    # two particles at r = 1.1, V = 200 exp(-4r) - r^-6 shifted to zero at
+    # rc and the force on each is dV/dr towards the other particle.
+    r = 1.1
+    v_ref = 1.8860100646074132
+    dvdr_ref = -6.74292321307051
+
+    buck = potential.Buckingham(a=200.0, b=4.0, c=1.0, rc=rc)
+    assert abs(buck.potential(r*r) - v_ref) < 10.**-12
+    assert abs(buck.force(r*r)*r - dvdr_ref) < 10.**-12
+
+    A = State()
+    A.npart = 2
+    A.domain = md.domain.BaseDomainHalo(extent=(8., 8., 8.))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+    A.p = PositionDat(ncomp=3)
+    A.f = ParticleDat(ncomp=3)
+    A.p[:] = ((0.0, 0.0, 0.0), (r, 0.0, 0.0))
+    A.npart_local = 2
+    A.filter_on_domain_boundary()
+
+    u = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    loop = PairLoop(
+        kernel=buck.kernel,
+        dat_dict=buck.get_data_map(A.p, A.f, u),
+        shell_cutoff=rc+delta
+    )
+    loop.execute()
+
+    assert abs(u[0] - v_ref) < 10.**-12
+    for ix in range(A.npart_local):
+        # the particle at the origin is pushed away along -x
+        sign = -1.0 if A.p[ix, 0] < 0.5*r else 1.0
+        assert abs(A.f[ix, 0] + sign*dvdr_ref) < 10.**-12
+        assert abs(A.f[ix, 1]) < 10.**-14
+        assert abs(A.f[ix, 2]) < 10.**-14
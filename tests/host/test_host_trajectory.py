@@ -0,0 +1,91 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import os
+import shutil
+import tempfile
+import numpy as np
+
+import ppmd as md
+
+N = 200
+E = 8.
+Eo2 = E/2.
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+State = md.state.State
+TrajectoryWriter = md.utility.trajectory.TrajectoryWriter
+TrajectoryReader = md.utility.trajectory.TrajectoryReader
+
+
+@pytest.fixture
+def state():
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+    A.p = PositionDat(ncomp=3)
+    A.v = ParticleDat(ncomp=3)
+    A.gid = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+
+    rng = np.random.RandomState(seed=1234)
+    A.p[:] = rng.uniform(-1*Eo2, Eo2, [N,3])
+    A.v[:] = rng.normal(0, 1.0, [N,3])
+    A.gid[:,0] = np.arange(N)
+    A.scatter_data_from(0)
+    return A
+
+
+@pytest.fixture
+def dirname():
+    d = tempfile.mkdtemp() if rank == 0 else None
+    d = md.mpi.MPI.COMM_WORLD.bcast(d, root=0)
+    yield d
+    md.mpi.MPI.COMM_WORLD.Barrier()
+    if rank == 0:
+        shutil.rmtree(d)
+
+
+@pytest.mark.parametrize("keyframe_interval", (1, 4))
+def test_host_trajectory_1(state, dirname, keyframe_interval):
+    filename = os.path.join(dirname, 'traj.ppmd')
+    precision = 10.**-3
+    nframe = 10
+
+    w = TrajectoryWriter(state, filename, precision=precision, gid=state.gid,
+                         keyframe_interval=keyframe_interval)
+    ref = []
+    for fx in range(nframe):
+        # move particles through the periodic boundaries and between ranks
+        n = state.npart_local
+        state.p[:n:, :] += 0.7 * state.v[:n:, :]
+        state.domain.boundary_condition.apply()
+
+        w.write(step=10*fx)
+        chunks = list(state.gather_data_chunks((state.p,), order=state.gid))
+        if rank == 0:
+            ref.append(np.concatenate([cx[0] for cx in chunks]))
+    w.close()
+
+    if rank == 0:
+        r = TrajectoryReader(filename)
+        assert len(r) == nframe
+        assert os.path.getsize(filename) < nframe * N * 3 * 8
+
+        for fx in (3, 9, 0, 5, 6, 7, -1, 2):
+            pos, gid = r.read(fx)
+            assert r.step(fx) == 10 * (fx % nframe)
+            assert np.all(gid == np.arange(N))
+            err = np.abs(((pos - ref[fx] + Eo2) % E) - Eo2)
+            assert np.max(err) <= 0.5 * precision + 10.**-10
+        r.close()
+
+
+def test_host_trajectory_2(state, dirname):
+    with pytest.raises(RuntimeError):
+        TrajectoryWriter(state, os.path.join(dirname, 'traj.ppmd'))
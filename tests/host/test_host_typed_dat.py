@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+import pytest
+import ctypes
+import numpy as np
+
+
+import ppmd as md
+from ppmd.access import *
+
+crN = 8
+N = crN**3
+rho = 0.7
+E = (N/rho)**(1./3.)
+
+delta = 0.3
+
+rank = md.mpi.MPI.COMM_WORLD.Get_rank()
+nproc = md.mpi.MPI.COMM_WORLD.Get_size()
+
+
+PositionDat = md.data.PositionDat
+ParticleDat = md.data.ParticleDat
+GlobalArray = md.data.GlobalArray
+TypedDat = md.data.TypedDat
+State = md.state.State
+Kernel = md.kernel.Kernel
+Constant = md.kernel.Constant
+potential = md.utility.potential
+
+epsilon = (1.0, 0.5, 2.0)
+sigma = (1.0, 0.8, 1.1)
+
+
+@pytest.fixture
+def state():
+    A = State()
+    A.npart = N
+    A.domain = md.domain.BaseDomainHalo(extent=(E,E,E))
+    A.domain.boundary_condition = md.domain.BoundaryTypePeriodic()
+
+    A.p = PositionDat(ncomp=3)
+    A.t = ParticleDat(ncomp=1, dtype=ctypes.c_int)
+    A.fa = ParticleDat(ncomp=3)
+    A.fb = ParticleDat(ncomp=3)
+
+    rng = np.random.RandomState(seed=1729)
+    A.p[:] = md.utility.lattice.cubic_lattice((crN, crN, crN), (E, E, E)) + \
+        rng.uniform(-0.1, 0.1, [N, 3])
+    A.t[:, 0] = rng.randint(0, len(epsilon), N)
+    A.npart_local = N
+    A.filter_on_domain_boundary()
+
+    return A
+
+
+def _branching_kernel(rc):
+    # reference: one kernel with the mixture parameters selected by branches
+    code = '''
+    const int ti = T.i[0];
+    const int tj = T.j[0];
+    const double eps_i = (ti == 0) ? E0 : ((ti == 1) ? E1 : E2);
+    const double eps_j = (tj == 0) ? E0 : ((tj == 1) ? E1 : E2);
+    const double sig_i = (ti == 0) ? S0 : ((ti == 1) ? S1 : S2);
+    const double sig_j = (tj == 0) ? S0 : ((tj == 1) ? S1 : S2);
+    const double eps = sqrt(eps_i*eps_j);
+    const double sig = 0.5*(sig_i + sig_j);
+
+    const double R0 = P.j[0] - P.i[0];
+    const double R1 = P.j[1] - P.i[1];
+    const double R2 = P.j[2] - P.i[2];
+    const double r2 = R0*R0 + R1*R1 + R2*R2;
+    if (r2 < RC2) {
+        const double x = sig*sig/r2;
+        const double x3 = x*x*x;
+        const double xc = sig*sig/RC2;
+        const double xc3 = xc*xc*xc;
+        u[0] += 2.0*eps*((x3 - 1.0)*x3 - (xc3 - 1.0)*xc3);
+        const double f_tmp = -48.0*eps*(x3 - 0.5)*x3/r2;
+        A.i[0] += f_tmp*R0;
+        A.i[1] += f_tmp*R1;
+        A.i[2] += f_tmp*R2;
+    }
+    '''
+    consts = [Constant('RC2', rc*rc)]
+    for ix in range(3):
+        consts.append(Constant('E' + str(ix), epsilon[ix]))
+        consts.append(Constant('S' + str(ix), sigma[ix]))
+    return Kernel('test_host_typed_dat_branching', code, consts,
+                  [md.kernel.Header('math.h')])
+
+
+def test_host_typed_dat_table(state):
+    T = TypedDat(state.t, 3, nparam=2)
+    assert T.ncomp == 18
+    assert T.table.shape == (3, 3, 2)
+
+    T.set_pair(0, 2, (1.0, 2.0))
+    assert np.all(T.table[2, 0, :] == (1.0, 2.0))
+    assert np.all(T.table[0, 2, :] == (1.0, 2.0))
+    # the table is a view of the array passed to loops
+    assert T.data[2*(0*3 + 2) + 1] == 2.0
+
+    T.set_pair(1, 2, (3.0, 4.0), symmetric=False)
+    assert np.all(T.table[1, 2, :] == (3.0, 4.0))
+    assert np.all(T.table[2, 1, :] == (0.0, 0.0))
+
+    with pytest.raises(RuntimeError):
+        TypedDat(state.fa, 3)
+
+
+@pytest.mark.parametrize("loop_type", (
+    md.pairloop.PairLoopNeighbourListNS,
+    md.pairloop.PairLoopNeighbourListNSOMP
+))
+def test_host_typed_dat_mixture(state, loop_type):
+    lj = potential.LennardJonesMixture(state.t, epsilon, sigma)
+    rc = lj.rc
+
+    ua = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+    ub = GlobalArray(ncomp=1, dtype=ctypes.c_double)
+
+    loop_typed = loop_type(
+        kernel=lj.kernel,
+        dat_dict=lj.get_data_map(state.p, state.fa, ua),
+        shell_cutoff=rc+delta
+    )
+    loop_branch = loop_type(
+        kernel=_branching_kernel(rc),
+        dat_dict={'P': state.p(READ), 'T': state.t(READ),
+                  'A': state.fb(INC_ZERO), 'u': ub(INC_ZERO)},
+        shell_cutoff=rc+delta
+    )
+
+    loop_typed.execute()
+    loop_branch.execute()
+
+    nl = state.npart_local
+    fmax = np.linalg.norm(state.fb[:nl:,:], np.inf)
+    assert fmax > 0
+    assert abs(ua[0] - ub[0]) < 10.**-10 * abs(ub[0])
+    assert np.linalg.norm(state.fa[:nl:,:] - state.fb[:nl:,:], np.inf) < \
+        10.**-10 * fmax
+
+    # the species dat is required for the lookup
+    dat_dict = lj.get_data_map(state.p, state.fa, ua)
+    del dat_dict['T']
+    with pytest.raises(RuntimeError):
+        loop_type(kernel=lj.kernel, dat_dict=dat_dict, shell_cutoff=rc+delta)